@@ -140,7 +140,7 @@ def save_lattice(lattice, filename):
         f.write('# from custom_lattice import CUSTOM_LATTICE\n') 
         f.write('# my_core = TestLattice(lattice_str=CUSTOM_LATTICE)\n')
 
-def gui_demo():
+def gui_demo(surrogate=None, diffusion=False):
     """Launch the GUI version"""
     print("Launching VR-1 Lattice Builder GUI...")
     try:
@@ -149,7 +149,8 @@ def gui_demo():
         os.environ.setdefault('PYTHONPATH', '/home/runner/work/VR1-openmc/VR1-openmc')
         
         from vr1.utils import launch_lattice_builder
-        launch_lattice_builder()
+        from vr1.evaluator import default_estimator
+        launch_lattice_builder(default_estimator(surrogate, diffusion))
     except ImportError as e:
         print(f"GUI not available: {e}")
         print("This may be because tkinter is not installed.")
@@ -164,13 +165,17 @@ def main():
     parser = argparse.ArgumentParser(description="VR-1 Lattice Builder Demo")
     parser.add_argument('--cli', action='store_true', 
                        help='Run CLI demonstration instead of GUI')
+    parser.add_argument('--surrogate', default=None,
+                       help='Saved k-eff surrogate for instant estimates of edited layouts')
+    parser.add_argument('--diffusion', action='store_true',
+                       help='Estimate k-eff and power of edited layouts with the diffusion solver')
     
     args = parser.parse_args()
     
     if args.cli:
         cli_demo()
     else:
-        success = gui_demo()
+        success = gui_demo(args.surrogate, args.diffusion)
         if not success:
             print("\nFalling back to CLI demonstration...")
             cli_demo()
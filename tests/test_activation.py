@@ -0,0 +1,63 @@
+"""Test the dosimetry collapse and the vectorized folding of channel spectra"""
+import numpy as np
+import pytest
+from vr1.activation import (group_average, activity, channel_positions, circle_in_square, DosimetryLibrary,
+                            ChannelActivation)
+
+edges = np.array([1e-5, 0.625, 1e5, 2e7])
+
+
+def test_group_average():
+    """1/E-weighted averages of constant and 1/v cross sections"""
+    assert np.allclose(group_average([1e-5, 2e7], [3.0, 3.0], edges), 3.0)
+    energy = np.logspace(-5, np.log10(2e7), 20000)
+    one_over_v = 10.0 * np.sqrt(0.0253 / energy)
+    got = group_average(energy, one_over_v, edges)
+    # <E^-1/2> over dE/E is 2 (a^-1/2 - b^-1/2) / ln(b/a)
+    exact = [20 * np.sqrt(0.0253) * (a ** -0.5 - b ** -0.5) / np.log(b / a) for a, b in zip(edges[:-1], edges[1:])]
+    assert np.allclose(got, exact, rtol=1e-3)
+    with pytest.raises(ValueError):
+        group_average([2.0, 1.0], [1.0, 1.0], edges)
+
+
+def test_channel_rates(tmp_path):
+    """Rates of two channels from one spectrum tally, activities and the library cache"""
+    library = DosimetryLibrary(edges)
+    library.add('A(n,g)', [1e-5, 2e7], [2.0, 2.0], half_life=100.0)
+    library.add('B(n,p)', [1e-5, 1e5, 1e5 + 1, 2e7], [0.0, 0.0, 1.0, 1.0])
+    library.add('A(n,g)', [1e-5, 2e7], [1.0, 1.0], half_life=100.0)
+    assert library.names == ['A(n,g)', 'B(n,p)']
+    library.save('lib', str(tmp_path))
+    loaded = DosimetryLibrary.load('lib', str(tmp_path))
+    assert loaded.names == library.names and np.array_equal(loaded.xs, library.xs)
+    layout = [['w'] * 8 for _ in range(8)]
+    layout[0][1], layout[7][6] = 'v56', 'v12_6'
+    assert channel_positions(layout) == [(0, 1, 'v56'), (7, 6, 'v12_6')]
+    act = ChannelActivation(layout, library, z_range=(0.0, 10.0), pitch=7.15)
+    mean = np.zeros((2, 1, 8, 8, 3))  # two channel cells, mesh (z, y, x), groups
+    mean[0, 0, 7, 1] = [1.0, 2.0, 3.0]  # row 0 is the top mesh row
+    mean[1, 0, 0, 6] = [4.0, 0.0, 0.0]
+    spectra = act.spectra(mean.ravel(), 0.1 * mean.ravel())
+    v56, v12 = np.pi * 2.8 ** 2 * 10, np.pi * 0.6 ** 2 * 10
+    assert np.allclose(spectra['flux'][0, 0], [1 / v56, 2 / v56, 3 / v56])
+    assert np.isclose(spectra['flux'][1, 0, 0], 4 / v12)
+    rates = act.rates(spectra)
+    assert np.allclose(rates['rate'][:, 0, 0] / 1e-24, [6 / v56, 4 / v12]) and rates['rate'][1, 0, 1] == 0.0
+    assert np.isclose(rates['rel_err'][1, 0, 0], 0.1)
+    foils = act.foil_activities(spectra, [{'name': 'f1', 'reaction': 'A(n,g)', 'atoms': 1e20, 'position': 'v56'}],
+                                t_irradiation=100.0)
+    assert np.isclose(foils[0]['activity'], 1e20 * foils[0]['rate'] * 0.5)
+    assert np.isclose(activity(1.0, 1.0, 100.0, 1e9, 100.0), 0.5)
+
+
+def test_clipped_channel_volume():
+    """The 90 mm channel is clipped by the 7.15 cm lattice element, narrower ones are not"""
+    assert np.isclose(circle_in_square(2.8, 3.575), np.pi * 2.8 ** 2)
+    assert np.isclose(circle_in_square(6.0, 3.575), 7.15 ** 2)
+    xy = np.random.default_rng(3).uniform(-3.575, 3.575, (400000, 2))
+    inside = np.mean(np.hypot(xy[:, 0], xy[:, 1]) < 4.5) * 7.15 ** 2
+    assert np.isclose(circle_in_square(4.5, 3.575), inside, rtol=5e-3) and inside < np.pi * 4.5 ** 2
+    layout = [['w'] * 8 for _ in range(8)]
+    layout[2][2] = 'v90'
+    act = ChannelActivation(layout, DosimetryLibrary(edges), z_range=(0.0, 2.0), pitch=7.15)
+    assert np.isclose(act.layer_volume('v90'), 2.0 * circle_in_square(4.5, 3.575))
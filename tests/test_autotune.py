@@ -0,0 +1,58 @@
+"""Test the choice of the best calibration run and the autotuner cache"""
+import types
+import pytest
+import vr1.autotune
+from vr1.autotune import AutoTuner
+
+
+class DeckWriter:
+    """ Writer stand-in writing a fixed model.xml, enough for the model hash """
+    def __init__(self, output_dir: str) -> None:
+        self.output_dir = output_dir
+
+    def write_openmc_XML(self) -> int:
+        with open(f'{self.output_dir}/model.xml', 'w') as f:
+            f.write('<model><materials/><geometry/></model>')
+        return 0
+
+
+def result(threads: int, npg: int, event_based: bool, rate: (float, None), error: (str, None) = None) -> dict:
+    return {'threads': threads, 'npg': npg, 'event_based': event_based, 'rate': rate,
+            'rate_per_thread': rate / threads if rate else None, 'max_rss_mb': 100.0, 'error': error}
+
+
+def test_best_and_apply():
+    """Per-core and total objectives pick different runs; failed runs are never picked"""
+    tuner = AutoTuner(None, threads=[1, 4], npgs=[1000])
+    tuner.results = [result(1, 1000, False, 1000.0), result(4, 1000, False, 3000.0),
+                     result(4, 1000, True, None, 'OpenMC failed')]
+    assert tuner.best()['threads'] == 1
+    tuner.objective = 'total'
+    assert tuner.best()['threads'] == 4
+    settings = tuner.apply(types.SimpleNamespace(parm={'npg': 10}, threads=None, event_based=True))
+    assert settings.parm['npg'] == 1000 and settings.threads == 4 and settings.event_based is False
+    tuner.results = [result(4, 1000, True, None, 'OpenMC failed')]
+    with pytest.raises(RuntimeError, match='OpenMC failed'):
+        tuner.best()
+    with pytest.raises(ValueError):
+        AutoTuner(None, objective='fastest')
+
+
+def test_tune_cache(tmp_path, monkeypatch):
+    """Calibration results are cached per machine and model; only new candidates run"""
+    monkeypatch.setenv('VR1_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(vr1.autotune, 'machine_id', lambda: 'machine')
+    runs: list = []
+
+    def calibration_run(self, threads: int, npg: int, event_based: bool) -> dict:
+        runs.append((threads, npg, event_based))
+        return result(threads, npg, event_based, None if event_based else 100.0 * threads * npg ** 0.1,
+                      'no event mode' if event_based else None)
+
+    monkeypatch.setattr(AutoTuner, 'calibration_run', calibration_run)
+    writer = DeckWriter(str(tmp_path))
+    best = AutoTuner(writer, threads=[1, 2], npgs=[1000]).tune()
+    assert len(runs) == 4 and best['event_based'] is False and best['npg'] == 1000
+    AutoTuner(writer, threads=[1, 2], npgs=[1000, 5000]).tune()
+    assert len(runs) == 8 and all(npg == 5000 for _, npg, _ in runs[4:])
+    assert AutoTuner(writer, threads=[1, 2], npgs=[1000]).tune(use_cache=False) == best and len(runs) == 12
@@ -0,0 +1,38 @@
+"""Test the screening of lattice sources and batch deck compilation"""
+import os
+import pytest
+from vr1.batch import BatchCompiler, collect_configs, compile_config
+from vr1.latlib import write_lat, write_layouts
+
+
+def test_collect_and_screen(tmp_path):
+    """.lat directories and stream files are collected; bad codes, shapes and duplicate names are rejected"""
+    good = [['w'] * 8 for _ in range(8)]
+    good[3][3] = '8'
+    bad = [row[:] for row in good]
+    bad[1][1] = 'q'
+    (tmp_path / 'lats').mkdir()
+    write_lat(tmp_path / 'lats' / 'good.lat', good)
+    write_lat(tmp_path / 'lats' / 'bad.lat', bad)
+    configs = collect_configs(str(tmp_path / 'lats'))
+    assert [n for n, _ in configs] == ['bad', 'good']
+    write_layouts(tmp_path / 'cores.txt', [good, good, bad])
+    configs += collect_configs(str(tmp_path / 'cores.txt')) + [('short', good[:7])]
+    todo, rejected = BatchCompiler(str(tmp_path / 'decks')).screen(configs)
+    assert [layout for _, layout in todo] == [good, good] and todo[0][0] == 'good'
+    assert rejected['bad'] == 'unknown lattice codes' and rejected['short'] == 'not 8x8'
+    assert list(rejected.values()).count('duplicate name') == 1
+
+
+def test_compile(tmp_path):
+    """A real layout is written by a worker; a layout the lattice cannot build is reported as failed"""
+    pytest.importorskip('openmc')
+    from vr1.settings import VR1Settings
+    good = [['w'] * 8 for _ in range(8)]
+    good[3][3], good[3][4] = '8', '6'
+    compiler = BatchCompiler(str(tmp_path / 'decks'), VR1Settings(xs_xml_root_path=None), workers=1)
+    report = compiler.compile([('good', good)], verbose=False)
+    assert report['n_written'] == 1 and report['failed'] == {}
+    assert os.path.isfile(tmp_path / 'decks' / 'good' / 'model.xml')
+    result = compile_config('long', [['w'] * 9] + good[1:], str(tmp_path / 'decks'))
+    assert not result['ok'] and result['error'].startswith('ValueError')
@@ -0,0 +1,70 @@
+"""Test checkpoint batches, the choice of restart statepoint and the record of a restarted run"""
+import json
+import types
+import pytest
+from vr1.checkpoint import checkpoint_batches, register_checkpoint_dir, find_latest_checkpoint
+from vr1.monitor import RunMonitor, restart_point, monitor_json_name
+
+
+def test_checkpoint_batches():
+    """Every interval batches and always the last one"""
+    assert checkpoint_batches(100, 25) == [25, 50, 75, 100]
+    assert checkpoint_batches(110, 25) == [25, 50, 75, 100, 110]
+    assert checkpoint_batches(10, 20) == [10]
+    with pytest.raises(ValueError):
+        checkpoint_batches(100, 0)
+
+
+def test_restart_point(tmp_path):
+    """Only statepoints before the requested batch count are restart points"""
+    assert restart_point(str(tmp_path), 100) is None
+    for batch in (25, 50, 100):
+        (tmp_path / f'statepoint.{batch:03d}.h5').touch()
+    assert restart_point(str(tmp_path), 100).endswith('statepoint.050.h5')
+    assert restart_point(str(tmp_path), 120).endswith('statepoint.100.h5')
+    assert restart_point(str(tmp_path), 25) is None
+
+
+def test_latest_resumable_checkpoint(tmp_path, monkeypatch):
+    """A finished run does not hide an interrupted one of the same model"""
+    monkeypatch.setenv('VR1_CACHE_DIR', str(tmp_path / 'cache'))
+    for name, batches, statepoints in (('finished', 100, (50, 100)), ('interrupted', 100, (25, 50)),
+                                       ('longer', 200, (60,)), ('empty', 100, ())):
+        run_dir = tmp_path / name
+        run_dir.mkdir()
+        (run_dir / 'model.xml').write_text(f'<model><settings><batches>{batches}</batches></settings></model>')
+        for batch in statepoints:
+            (run_dir / f'statepoint.{batch:03d}.h5').touch()
+        register_checkpoint_dir('abc', str(run_dir))
+    run_dir, sp_file = find_latest_checkpoint('abc')
+    assert run_dir == str(tmp_path / 'longer') and sp_file.endswith('statepoint.060.h5')
+    (tmp_path / 'longer' / 'statepoint.200.h5').touch()
+    run_dir, sp_file = find_latest_checkpoint('abc')
+    assert run_dir == str(tmp_path / 'interrupted') and sp_file.endswith('statepoint.050.h5')
+    assert find_latest_checkpoint('unknown') is None
+
+
+def monitor(run_dir: str, resume: bool = False, metadata: (dict, None) = None) -> RunMonitor:
+    settings = types.SimpleNamespace(particles=1000, batches=4, inactive=1, generations_per_batch=1,
+                                     keff_trigger=None)
+    writer = types.SimpleNamespace(output_dir=run_dir, openmc_settings=settings)
+    return RunMonitor(writer, poll_statepoints=False, metadata=metadata, resume=resume)
+
+
+def test_resumed_record(tmp_path):
+    """A restart appends its batches to the earlier record, with time running on"""
+    first = monitor(str(tmp_path), metadata={'lattice_str': 'x'})
+    first.feed('        1/1    1.04018', 1.0)
+    first.feed('        2/1    1.03000    1.03000 +/- 0.00100', 3.0)
+    first.write_json()
+    second = monitor(str(tmp_path), resume=True, metadata={'restarted_from': 'statepoint.002.h5'})
+    second.feed('        3/1    1.02000    1.02500 +/- 0.00200', 2.0)
+    second.feed('        4/1    1.01000    1.02000 +/- 0.00300', 4.0)
+    summary = second.write_json()
+    with open(tmp_path / monitor_json_name) as f:
+        record = json.load(f)
+    assert record['series']['batch'] == [1, 2, 3, 4] and record['series']['time'] == [1.0, 3.0, 5.0, 7.0]
+    assert record['metadata'] == {'lattice_str': 'x', 'restarted_from': 'statepoint.002.h5'}
+    assert record['restarts'] == [{'batch': 3, 'restarted_from': 'statepoint.002.h5'}]
+    assert summary['wall_time'] == 7.0 and summary['keff'] == 1.02 and summary['batches_done'] == 4
+    assert not monitor(str(tmp_path)).to_dict()['series']['batch']
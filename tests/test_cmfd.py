@@ -0,0 +1,53 @@
+"""Test the CMFD coarse mesh, its acceleration map and the entropy convergence detection"""
+import numpy as np
+import pytest
+from vr1.cmfd import lattice_xy_grid, axial_grid, coremap, entropy_converged_batch, cmfd_z_planes
+
+planes = dict(zip(cmfd_z_planes, [0.0, 2.0, 5.0, 8.0, 10.0, 70.0, 80.0]))
+
+
+def test_mesh_grid():
+    """Lattice-aligned x-y boundaries; axial planes plus equal active zones between FAZ.4 and FAZ.3"""
+    assert np.allclose(lattice_xy_grid(8, pitch=7.15), 7.15 * (np.arange(9) - 4))
+    z = axial_grid(3, planes)
+    assert np.allclose(z, [0.0, 2.0, 5.0, 8.0, 10.0, 30.0, 50.0, 70.0, 80.0])
+    assert axial_grid(1, planes).size == 7
+    with pytest.raises(ValueError):
+        axial_grid(0, planes)
+
+
+def test_coremap():
+    """Row 0 of the layout is the top (largest y) mesh row; excluded codes are not accelerated"""
+    layout = [['w'] * 8 for _ in range(8)]
+    layout[0][2], layout[7][5] = '8', 'v56'
+    cmap = coremap(layout, 3, exclude_codes=['v56'])
+    assert cmap.shape == (3, 8, 8) and cmap.sum() == 3 * 63
+    assert np.all(cmap[:, 0, 5] == 0) and np.all(cmap[:, 7, 2] == 1)
+    assert coremap(layout, 2).ravel().tolist() == [1] * 128
+
+
+def test_entropy_converged_batch():
+    """Detects the end of an exponential drift in a noisy entropy series, None if it leaves its band late"""
+    rng = np.random.default_rng(2)
+    generations = np.arange(200)
+    entropy = 7.0 - 1.0 * np.exp(-generations / 8.0) + rng.normal(0.0, 0.002, generations.size)
+    batch = entropy_converged_batch(entropy)
+    # the drift falls below 3 sigma of the noise (0.006) after about 8 ln(1/0.006) = 41 generations
+    assert 30 <= batch <= 55
+    assert entropy_converged_batch(entropy, gens_per_batch=2) == int(np.ceil(batch / 2))
+    late = entropy.copy()
+    late[150:155] -= 0.1
+    assert entropy_converged_batch(late) is None
+    assert entropy_converged_batch([7.0, 7.0, 7.0]) is None
+
+
+def test_cmfd_spec():
+    """The spec of a real layout covers the lattice box and maps every cell"""
+    pytest.importorskip('openmc')
+    from vr1.cmfd import cmfd_spec
+    layout = [['w'] * 8 for _ in range(8)]
+    spec = cmfd_spec(layout, {'active_zones': 4})
+    x, y, z = spec['grid']
+    assert len(x) == len(y) == 9 and len(spec['map']) == 64 * (len(z) - 1)
+    with pytest.raises(ValueError):
+        cmfd_spec(layout, {'unknown': 1})
@@ -0,0 +1,52 @@
+"""Test the reactivity coefficient arithmetic and the material perturbations of direct-perturbation runs"""
+import numpy as np
+import pytest
+from vr1.coefficients import (reactivity_coefficient, central_difference, agreement, coefficient_specs, perturb,
+                              parameter_value)
+
+
+def test_coefficients():
+    """pcm units, error propagation and the comparison with a central difference"""
+    c = reactivity_coefficient(1.0, 0.0, 0.2, 0.01, 0.9982)
+    assert np.isclose(c['drho_dp'], 2e4) and np.isclose(c['drho_dp_std'], 1e3)
+    assert np.isclose(c['drho_dlnp'], 0.2 * 0.9982 * 1e3)
+    c = reactivity_coefficient(1.1, 1e-3, -0.05, 0.0, 293.15)
+    assert c['drho_dp'] < 0 and np.isclose(c['drho_dp_std'] / -c['drho_dp'], 2e-3 / 1.1)
+    dk, dk_std = central_difference(1.002, 3e-4, 0.998, 4e-4, 0.01)
+    assert np.isclose(dk, 0.2) and np.isclose(dk_std, 0.025)
+    assert np.isclose(agreement(0.2, 0.03, dk, 0.04), 0.0) and np.isclose(agreement(0.25, 0.03, 0.2, 0.04), 1.0)
+
+
+def test_perturb_nuclide_density():
+    """Only U235 of the VR1 fuel changes, by delta in atom/b-cm; all other atom densities stay as they were"""
+    pytest.importorskip('openmc')
+    from vr1.materials import VR1Materials
+    fuel = VR1Materials().fuel
+    spec = coefficient_specs['U235 density']
+    before = dict(fuel.get_nuclide_atom_densities())
+    delta = spec['step'] * before['U235']
+    perturb(fuel, spec, delta)
+    after = fuel.get_nuclide_atom_densities()
+    assert set(after) == set(before) and np.isclose(after['U235'], before['U235'] + delta, rtol=1e-12)
+    assert all(np.isclose(after[n], d, rtol=1e-12) for n, d in before.items() if n != 'U235')
+    assert np.isclose(parameter_value(fuel, spec), before['U235'] + delta, rtol=1e-12)
+    assert np.isclose(fuel.density, sum(after.values()), rtol=1e-12)
+
+
+def test_perturb_density_and_temperature():
+    """Mass density in g/cm3 keeps the composition; temperature changes in K"""
+    openmc = pytest.importorskip('openmc')
+    water = openmc.Material(name='water', temperature=293.15)
+    water.add_nuclide('H1', 2.0, 'ao')
+    water.add_nuclide('O16', 1.0, 'ao')
+    water.set_density('g/cm3', 0.9982)
+    before = water.get_nuclide_atom_densities()
+    perturb(water, coefficient_specs['moderator density'], 0.01)
+    assert water.density_units == 'g/cm3' and np.isclose(water.density, 1.0082)
+    after = water.get_nuclide_atom_densities()
+    assert all(np.isclose(after[n] / d, 1.0082 / 0.9982) for n, d in before.items())
+    perturb(water, coefficient_specs['fuel temperature'], 50.0)
+    assert np.isclose(water.temperature, 343.15)
+    water.set_density('atom/b-cm', 0.1)
+    with pytest.raises(ValueError):
+        perturb(water, coefficient_specs['moderator density'], 0.01)
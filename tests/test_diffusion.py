@@ -0,0 +1,39 @@
+"""Test the few-group diffusion solver on layouts with known answers"""
+import numpy as np
+from vr1.diffusion import DiffusionSolver
+
+# Two-group fuel and water cross sections [1/cm] representative of a light water research reactor
+xs = {
+    'f': {'total': [0.25, 1.2], 'absorption': [0.009, 0.08], 'nu_fission': [0.006, 0.13],
+          'fission': [0.0025, 0.053], 'chi': [1.0, 0.0], 'scatter': [[0.22, 0.021], [0.0, 1.12]]},
+    'w': {'total': [0.24, 1.4], 'absorption': [0.0005, 0.02], 'nu_fission': [0.0, 0.0],
+          'fission': [0.0, 0.0], 'chi': [0.0, 0.0], 'scatter': [[0.2, 0.0395], [0.0, 1.38]]},
+}
+
+
+def test_infinite_medium():
+    """A reflective all-fuel lattice without buckling is an infinite medium with the two-group k-infinity"""
+    solver = DiffusionSolver(xs, pitch=7.15, height=80.0, boundary='reflective', axial_buckling=0.0)
+    f = xs['f']
+    removal_1 = f['absorption'][0] + f['scatter'][0][1]
+    k_inf = (f['nu_fission'][0] + f['nu_fission'][1] * f['scatter'][0][1] / f['absorption'][1]) / removal_1
+    result = solver.solve([['f'] * 8] * 8, tol=1.0e-9)
+    assert abs(result['keff'] - k_inf) < 1.0e-6
+    assert np.allclose(result['power'], 1.0)
+
+
+def test_batch_matches_sparse():
+    """Batched dense solution equals the sparse one, and leakage and symmetry behave"""
+    solver = DiffusionSolver(xs, pitch=7.15, height=80.0)
+    core = [['w'] * 8 for _ in range(8)]
+    for i in range(2, 6):
+        core[i][2:6] = ['f'] * 4
+    small = [row[:] for row in core]
+    small[2][2] = small[5][5] = 'w'
+    single = [solver.solve(layout, tol=1.0e-9)['keff'] for layout in (core, small)]
+    batch = solver.solve_batch([core, small], tol=1.0e-9)
+    assert np.allclose(batch['keff'], single, atol=1.0e-6)
+    assert single[1] < single[0]
+    power = solver.solve(core, tol=1.0e-9)['power']
+    assert np.allclose(power, power[::-1, ::-1]) and np.allclose(power, power.T)
+    assert np.isnan(solver.solve_batch([[['w'] * 8] * 8])['keff'][0])
@@ -0,0 +1,78 @@
+"""Test debouncing, cancellation and streaming of the background layout evaluator"""
+import sys
+import time
+import types
+from vr1.evaluator import BackgroundEvaluator, staged_estimator
+from vr1.monitor import RunMonitor
+
+# Stands in for a long OpenMC run: one batch line, then a minute of transport
+slow_openmc: str = "import time; print('        1/1    1.00000', flush=True); time.sleep(60)"
+
+
+def test_debounce_and_stale_results():
+    """A burst of edits evaluates only the last layout; streamed results of superseded layouts are dropped"""
+    calls = []
+
+    def slow(layout):
+        calls.append(layout[0][0])
+        for step in range(3):
+            time.sleep(0.02)
+            yield {'keff': float(layout[0][0]), 'step': step}
+
+    evaluator = BackgroundEvaluator(staged_estimator(lambda layout: {'keff': 0.0, 'step': -1}, slow), debounce=0.05)
+    for i in range(20):
+        evaluator.request([[str(i)] * 8] * 8)
+    assert evaluator.poll() == [] and calls == []
+    results = []
+    deadline = time.monotonic() + 5.0
+    while evaluator.busy and time.monotonic() < deadline:
+        results += evaluator.poll()
+        time.sleep(0.005)
+    assert calls == ['19']
+    assert [r.get('step') for r in results] == [-1, 0, 1, 2, None] and results[-1]['final']
+    assert evaluator.latest['keff'] == 19.0
+    # An edit while a job streams: the old job stops, only the new layout's results arrive
+    evaluator.request([['1'] * 8] * 8)
+    time.sleep(0.06)
+    evaluator.poll()
+    time.sleep(0.03)
+    evaluator.request([['2'] * 8] * 8)
+    results = []
+    while evaluator.busy and time.monotonic() < deadline:
+        results += evaluator.poll()
+        time.sleep(0.005)
+    assert {r['keff'] for r in results if 'keff' in r} <= {0.0, 2.0} and evaluator.latest['keff'] == 2.0
+    evaluator.shutdown()
+
+
+def test_cancel_terminates_run(tmp_path):
+    """Superseding a layout terminates its running process, the next layout does not wait for it"""
+    started = []
+
+    def estimate(layout, cancel=None):
+        started.append(layout[0][0])
+        settings = types.SimpleNamespace(particles=100, batches=1, inactive=0, generations_per_batch=1,
+                                         keff_trigger=None)
+        run_dir = tmp_path / layout[0][0]
+        run_dir.mkdir()
+        monitor = RunMonitor(types.SimpleNamespace(output_dir=str(run_dir), openmc_settings=settings),
+                             poll_statepoints=False)
+        code = slow_openmc if layout[0][0] == 'slow' else "print('        1/1    1.01000')"
+        monitor.run(command_line=[sys.executable, '-c', code], cancel=cancel)
+        return {'keff': monitor.records[-1]['k']}
+    estimate.cancellable = True
+
+    evaluator = BackgroundEvaluator(staged_estimator(estimate), debounce=0.0)
+    t_start = time.monotonic()
+    evaluator.request([['slow'] * 8] * 8)
+    while not started:
+        evaluator.poll()
+        time.sleep(0.01)
+    time.sleep(0.2)
+    evaluator.request([['fast'] * 8] * 8)
+    while evaluator.busy and time.monotonic() - t_start < 30.0:
+        evaluator.poll()
+        time.sleep(0.01)
+    assert started == ['slow', 'fast'] and evaluator.latest['keff'] == 1.01
+    assert time.monotonic() - t_start < 10.0
+    evaluator.shutdown()
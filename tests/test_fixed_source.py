@@ -0,0 +1,76 @@
+"""Test the numerical parts of fixed-source runs: positions, multiplication and biasing"""
+import numpy as np
+import pytest
+from vr1.fixed_source import (ambe_spectrum, ambe_density, lattice_position, multiplication, importance_map,
+                              weight_window_bounds, AmBeSource, Detector, FixedSourceRun)
+
+
+def core() -> list[list[str]]:
+    layout = [['w'] * 8 for _ in range(8)]
+    layout[7][2:6] = ['wrc'] * 4
+    layout[3][3], layout[3][4], layout[4][3] = '8', '8', '6'
+    layout[4][6] = 'v56'
+    return layout
+
+
+def bin_probabilities(edges: np.ndarray, density: np.ndarray) -> tuple[np.ndarray, float]:
+    """ Probability of each histogram bin and the mean energy [MeV] """
+    p = density[:len(edges) - 1] * np.diff(edges)
+    return p, float((p * (edges[1:] + edges[:-1]) / 2).sum()) / 1.0e6
+
+
+def test_source_setup():
+    """Spectrum density on bins of unequal width, position lookup and multiplication"""
+    p, mean = bin_probabilities(*ambe_density())
+    table = np.array(ambe_spectrum['p'])
+    assert np.isclose(p.sum(), 1.0) and np.allclose(p, table / table.sum())
+    assert np.isclose(p[:2].sum(), 0.13 / 1.01) and np.isclose(mean, 4.2252, atol=1e-3)
+    layout = [['w'] * 8 for _ in range(8)]
+    layout[4][6] = 'v56'
+    assert lattice_position(layout, 'v56') == (4, 6) and lattice_position(layout, (1, 2)) == (1, 2)
+    with pytest.raises(ValueError):
+        lattice_position(layout, 'v90')
+    m = multiplication(9.0, 0.1)
+    assert m['M'] == 10.0 and np.isclose(m['k_source'], 0.9) and np.isclose(m['k_source_std'], 0.001)
+
+
+def test_weight_windows():
+    """Importance is 1 at the source and grows toward the targets, bounds fall with importance"""
+    centers = np.array([[0.0, 0, 0], [10, 0, 0], [20, 0, 0], [-30, 0, 0]])
+    importance = importance_map(centers, (0.0, 0, 0), np.array([[20.0, 0, 0]]), length=5.0, floor=1e-2)
+    assert np.isclose(importance[0], 1.0) and importance[2] > importance[1] > 1.0 and importance[3] == 1e-2
+    bounds = weight_window_bounds(importance, [4.0, 1.0])
+    assert bounds.shape == (4, 2) and np.isclose(bounds[0, 1], 0.5) and np.isclose(bounds[0, 0], 0.125)
+    assert np.all(np.diff(bounds[:3, 1]) < 0)
+
+
+def test_sampled_spectrum():
+    """The Tabular handed to OpenMC samples the normalized histogram, not the per-bin table as a density"""
+    pytest.importorskip('openmc')
+    source = AmBeSource(z=0.0).get(core())
+    assert source.energy.interpolation == 'histogram'
+    p, mean = bin_probabilities(np.asarray(source.energy.x), np.asarray(source.energy.p))
+    assert np.isclose(p.sum(), 1.0) and np.isclose(p[:2].sum(), 0.13 / 1.01) and np.isclose(mean, 4.2252, atol=1e-3)
+    custom = AmBeSource(energy=source.energy).get(core())
+    assert custom.energy is source.energy
+
+
+def test_fixed_source_model():
+    """Weight windows cover the lattice mesh in the energy groups; the writer runs a biased fixed-source deck"""
+    pytest.importorskip('openmc')
+    from vr1.settings import VR1Settings
+    run = FixedSourceRun(core(), detectors=[Detector('counter', (3, 5))],
+                         settings=VR1Settings(parm={'npg': 100, 'batches': 10, 'inactive': 5}), output_dir='fs')
+    ww = run.weight_windows()
+    lower = np.asarray(ww.lower_ww_bounds)
+    assert lower.shape == (8, 8, len(ww.mesh.z_grid) - 1, 3) and np.all(lower > 0)
+    # The thermal group is the most important one everywhere
+    assert np.all(lower[..., 0] < lower[..., 2])
+    writer = run.make_writer()
+    settings = writer.settings
+    assert settings.run_mode == 'fixed source' and settings.parm['inactive'] == 0 and not settings.cmfd
+    assert [t.name for t in settings.tallies] == ['counter', 'source multiplication']
+    assert len(settings.weight_windows) == 1 and writer.output_dir == 'fs'
+    assert run.settings.parm['inactive'] == 5 and run.settings.run_mode != 'fixed source'
+    unbiased = FixedSourceRun(core(), biasing=False).make_writer()
+    assert unbiased.settings.weight_windows is None
@@ -0,0 +1,39 @@
+"""Test relative errors, figures of merit, energy collapse and run comparison on synthetic tallies"""
+import numpy as np
+import pytest
+from vr1.fom import relative_error, figure_of_merit, collapse_bins, compare_runs
+
+
+def test_relative_error_and_fom():
+    """R = std/mean and FOM = 1/(R^2 T), NaN where nothing was scored"""
+    rel = relative_error([2.0, 0.0, 4.0], [0.2, 0.0, 0.1])
+    assert np.allclose(rel[[0, 2]], [0.1, 0.025]) and np.isnan(rel[1])
+    fom = figure_of_merit(rel, 10.0)
+    assert np.allclose(fom[[0, 2]], [10.0, 160.0]) and np.isnan(fom[1])
+    assert np.isnan(figure_of_merit([0.0], 10.0)[0])
+
+
+def test_collapse_bins():
+    """Fine bins are summed into groups by their lethargy mid-point, errors in quadrature"""
+    bins = np.array([[1e-5, 0.1], [0.1, 0.625], [0.625, 1e3], [1e3, 1e5], [1e5, 2e7]])
+    mean = np.arange(10.0).reshape(2, 5)  # cells x energy
+    std = np.ones((2, 5))
+    got = collapse_bins(mean, std, bins, axis=1)
+    assert list(got) == ['thermal', 'epithermal', 'fast']
+    assert np.allclose(got['thermal'][0], [1.0, 11.0]) and np.allclose(got['thermal'][1], np.sqrt(2.0))
+    assert np.allclose(got['epithermal'][0], [5.0, 15.0]) and np.allclose(got['fast'][0], [4.0, 9.0])
+    two = collapse_bins(mean.T, std.T, bins, axis=0, collapse={'all': (1e-5, 2e7)})
+    assert np.allclose(two['all'][0], mean.sum(axis=1)) and np.allclose(two['all'][1], np.sqrt(5.0))
+    with pytest.raises(KeyError):
+        collapse_bins(mean, std, bins, axis=1, collapse='nine_group')
+
+
+def test_compare_runs():
+    """FOM ratios against the first run; tallies without scores in either run get no ratio"""
+    reports = {
+        'analog': {'tallies': {'a': {'fom_median': 2.0}, 'b': {'n_bins': 1, 'n_scored': 0}, 'c': {'fom_median': 1.0}}},
+        'vr': {'tallies': {'a': {'fom_median': 10.0}, 'b': {'fom_median': 5.0}, 'c': {'n_bins': 1, 'n_scored': 0}}},
+    }
+    ratios = compare_runs(reports)
+    assert ratios['analog'] == {'a': 1.0, 'c': 1.0}
+    assert ratios['vr'] == {'a': 5.0}
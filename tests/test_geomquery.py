@@ -0,0 +1,65 @@
+"""Test vectorized point location on a hand-compiled two by two lattice and against OpenMC"""
+import numpy as np
+import pytest
+from vr1.geomquery import GeometryModel, plate_number
+
+
+def model() -> GeometryModel:
+    # Surfaces: x = -2, x = 2, y = -2, y = 2, cylinder r = 0.5, plane z = 0
+    surfaces = [[0] * 6 + [1, 0, 0, 2], [0] * 6 + [1, 0, 0, -2], [0] * 6 + [0, 1, 0, 2], [0] * 6 + [0, 1, 0, -2],
+                [1, 1, 0, 0, 0, 0, 0, 0, 0, -0.25], [0] * 6 + [0, 0, 1, 0]]
+    cell = {'region': None, 'material': -1, 'universe': None, 'lattice': None, 'translation': None}
+    box = ['and', ['h', 0, '+'], ['h', 1, '-'], ['h', 2, '+'], ['h', 3, '-']]
+    universes = [
+        [{**cell, 'cell': 0, 'region': box, 'lattice': 0}],
+        # Overlapping cells: the first one listed wins, as in OpenMC
+        [{**cell, 'cell': 1, 'region': ['and', ['h', 4, '-'], ['h', 5, '+']], 'material': 1},
+         {**cell, 'cell': 2, 'region': ['not', ['h', 4, '+']], 'material': 3},
+         {**cell, 'cell': 3, 'material': 2}],
+        [{**cell, 'cell': 4, 'material': 2}],
+    ]
+    return GeometryModel({'root': 0, 'surfaces': surfaces, 'universes': universes, 'cell_names':
+                          ['core', 'mid_f_2', 'plug', 'water', 'water'],
+                          'lattices': [{'lower_left': [-2, -2], 'pitch': [2, 2], 'universes': [[1, 2], [2, 1]],
+                                        'outer': None}],
+                          'materials': {1: 'fuel', 2: 'water', 3: 'steel'}, 'codes': [['a', 'b'], ['b', 'a']]})
+
+
+def test_locate(tmp_path):
+    """Lattice indices, overlaps, plates and save/load round trip"""
+    geometry = model()
+    x = np.array([-1.1, -1.0, 1.0, 1.0, -1.0, 3.0])
+    y = np.array([1.0, 1.0, 1.0, -1.0, -1.0, 0.0])
+    z = np.array([1.0, -1.0, -0.5, -0.5, -0.5, 0.0])
+    result = geometry.locate(x, y, z)
+    assert list(result['row']) == [0, 0, 0, 1, 1, -1] and list(result['col']) == [0, 0, 1, 1, 0, -1]
+    assert list(result['code']) == ['a', 'a', 'b', 'a', 'b', '']
+    assert list(result['material']) == [1, 3, 2, 3, 2, -1]
+    assert list(result['plate']) == [2, -1, -1, -1, -1, -1]
+    assert list(geometry.material_names(result['material'])) == ['fuel', 'steel', 'water', 'steel', 'water', '']
+    geometry.save(tmp_path / 'model.json')
+    points = np.random.default_rng(0).uniform(-2.5, 2.5, (3, 1000))
+    loaded = GeometryModel.load(tmp_path / 'model.json').locate(*points)
+    expected = geometry.locate(*points)
+    assert all(np.array_equal(loaded[k], expected[k]) for k in expected)
+    inside = np.hypot(*(np.mod(points[:2] + 2, 2) - 1)) < 0.5
+    assert np.all(expected['material'][inside & (expected['code'] == 'a')] != 2)
+    assert plate_number('top_c_4') == 4 and plate_number('water1') == -1
+
+
+def test_cross_check_openmc():
+    """A compiled VR1 lattice with fuel, a channel and a control rod locates points as OpenMC does"""
+    pytest.importorskip('openmc')
+    from vr1.geomquery import cross_check
+    from vr1.lattice_units import lattice_pitch
+    layout = [['w'] * 8 for _ in range(8)]
+    layout[3][3], layout[3][4], layout[4][3], layout[4][4] = '8', '6', 'X', '4'
+    layout[4][6] = 'v56'
+    check = cross_check(layout, n_points=3000)
+    assert check['n_points'] == 3000 and check['n_mismatch'] == 0, check['points']
+    geometry = GeometryModel.from_lattice(layout)
+    centers = (np.arange(8) - 3.5) * lattice_pitch
+    # Row 0 is the top row, at positive y
+    result = geometry.locate(centers[[3, 4, 6]], -centers[[3, 4, 4]], np.zeros(3))
+    assert list(result['row']) == [3, 4, 4] and list(result['col']) == [3, 4, 6]
+    assert list(result['code']) == ['8', '4', 'v56']
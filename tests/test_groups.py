@@ -0,0 +1,59 @@
+"""Test group structures, binning and the cached collapse matrices"""
+import numpy as np
+import pytest
+from vr1.groups import GroupStructure, group_structure
+
+
+def test_structures_and_binning():
+    """SCALE 252 is ascending and cached; energies fall in the right groups"""
+    scale = group_structure('SCALE-252')
+    assert scale.n_groups == 252 and np.all(np.diff(scale.edges) > 0) and group_structure('SCALE-252') is scale
+    three = group_structure('three_group')
+    assert three.group_names == ['thermal', 'epithermal', 'fast']
+    assert np.array_equal(three.find([1e-6, 0.0253, 0.625, 2e6, 2e7, 3e7]), [-1, 0, 1, 2, 2, -1])
+    assert np.array_equal(three.histogram([0.0253, 0.1, 2e6], [1.0, 2.0, 4.0]), [3.0, 0.0, 4.0])
+    assert np.allclose(three.per_lethargy(three.lethargy_widths), 1.0)
+    with pytest.raises(ValueError):
+        GroupStructure([1.0, 1.0, 2.0])
+    with pytest.raises(ValueError):
+        group_structure('WIMS-69')
+
+
+def test_collapse():
+    """Collapse conserves totals, splits straddling groups by lethargy and weights cross sections by flux"""
+    scale, three = group_structure('SCALE-252'), group_structure('three_group')
+    spectra = np.random.default_rng(1).uniform(size=(5, 4, 252))
+    coarse = scale.collapse(spectra, three)
+    assert coarse.shape == (5, 4, 3) and np.allclose(coarse.sum(axis=-1), spectra.sum(axis=-1))
+    thermal = scale.edges[1:] <= 0.625
+    assert np.allclose(coarse[..., 0], spectra[..., thermal].sum(axis=-1))
+    assert scale.collapse_matrix(three) is scale.collapse_matrix(three)
+    split = GroupStructure([1.0, 100.0]).collapse(np.array([2.0]), GroupStructure([1.0, 10.0, 100.0]))
+    assert np.allclose(split, [1.0, 1.0])
+    std = scale.collapse_variance(np.full(252, 0.1), three)
+    assert np.isclose(std[0], 0.1 * np.sqrt(thermal.sum()))
+    xs = np.where(thermal, 2.0, 1.0)
+    assert np.allclose(scale.collapse_xs(xs, np.ones(252), three), [2.0, 1.0, 1.0])
+    assert np.array_equal(scale.snap([1e-5, 0.62, 2e7]).edges, [1e-5, 0.625, 2e7])
+
+
+def test_zero_lower_edge():
+    """Structures starting at 0 eV bin from 0 and use the lethargy floor for lethargies"""
+    casmo_like = GroupStructure([0.0, 0.625, 2e7])
+    assert np.array_equal(casmo_like.find([0.0, 1e-6, 1.0]), [0, 0, 1])
+    assert np.isclose(casmo_like.lethargy_widths[0], np.log(0.625 / 1e-5))
+    three = group_structure('three_group')
+    coarse = GroupStructure([0.0, 1e5, 2e7]).collapse(np.array([1.0, 1.0]), three)
+    assert np.isclose(coarse.sum(), 2.0) and np.isclose(coarse[2], 1.0)
+    with pytest.raises(ValueError):
+        GroupStructure([-1.0, 1.0])
+
+
+def test_casmo_70():
+    """CASMO-70 from OpenMC starts at 0 eV and collapses to two groups"""
+    pytest.importorskip('openmc')
+    casmo = group_structure('CASMO-70')
+    assert casmo.n_groups == 70 and casmo.edges[0] == 0.0 and np.all(np.isfinite(casmo.lethargy_widths))
+    two = casmo.snap([1e-5, 0.625, 2e7])
+    assert two.n_groups == 2
+    assert np.allclose(casmo.collapse(np.ones(70), two).sum(), 70.0)
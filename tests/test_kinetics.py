@@ -0,0 +1,24 @@
+"""Test kinetics parameters from IFP tallies and their cached form"""
+import numpy as np
+import pytest
+from vr1.kinetics import kinetics_parameters, params_to_json, params_from_json
+
+
+def test_kinetics_parameters():
+    """beta_eff, decay constants and Lambda in the PointKineticsEquationSolver params layout"""
+    beta = np.array([0.000215, 0.00142, 0.00127, 0.00257, 0.00075, 0.00027])
+    decay = np.array([0.0126, 0.0337, 0.139, 0.325, 1.13, 2.50])
+    tallies = {'time_numerator': (np.array([1e-4 * 2.0]), np.array([0.0])),
+               'denominator': (np.array([2.0]), np.array([0.02])),
+               'beta_numerator': (2.0 * beta, 0.1 * 2.0 * beta),
+               'decay_rate': (decay * 3.0, np.zeros(6)),
+               'delayed_nu_fission': (np.full(6, 3.0), np.zeros(6))}
+    params = kinetics_parameters(tallies, keff=1.0, keff_std=0.0)
+    assert np.allclose(params['beta'], beta) and np.allclose(params['lambda_'], decay)
+    assert np.isclose(params['Lambda'], 1e-4) and np.isclose(params['Lambda_std'], 1e-6)
+    assert np.isclose(params['beta_total'], beta.sum()) and np.allclose(params['beta_std'] / beta, np.hypot(0.1, 0.01))
+    back = params_from_json(params_to_json(params))
+    assert np.array_equal(back['beta'], params['beta']) and back['Lambda'] == params['Lambda']
+    tallies['beta_numerator'] = (np.zeros(6), np.zeros(6))
+    with pytest.raises(ValueError):
+        kinetics_parameters(tallies, keff=1.0)
@@ -0,0 +1,41 @@
+"""Test .lat parsing, the layout stream format and the bulk lattice library"""
+import pytest
+from vr1.latlib import parse_lat, write_lat, read_lat, write_layouts, iter_layouts, LatticeLibrary
+
+
+def core(n_fuel: int, rods: int = 0) -> list[list[str]]:
+    layout = [['w'] * 8 for _ in range(8)]
+    layout[7][2:6] = ['wrc'] * 4
+    for p in range(n_fuel):
+        layout[1 + p // 8][p % 8] = 'X' if p < rods else '8'
+    return layout
+
+
+def test_parse_lat(tmp_path):
+    """Round trip of a .lat file, code in the file is never executed"""
+    layout = core(10, rods=2)
+    layout[3][3] = '6_42.35'
+    write_lat(tmp_path / 'core.lat', layout)
+    assert read_lat(tmp_path / 'core.lat') == layout
+    with pytest.raises(ValueError):
+        parse_lat(f"CUSTOM_LATTICE = [__import__('os').getcwd()] + {layout}")
+    with pytest.raises(ValueError):
+        parse_lat('CUSTOM_LATTICE = [["w"] * 8]')
+
+
+def test_library(tmp_path):
+    """Stream file to library, feature queries and validation"""
+    layouts = [core(n, rods=n % 3) for n in range(12, 24)]
+    bad = core(12)
+    bad[2][2] = 'q'
+    names = [f'c{i}' for i in range(len(layouts))] + ['bad']
+    assert write_layouts(tmp_path / 'cores.txt', layouts + [bad], names) == 13
+    assert [n for _, n in iter_layouts(tmp_path / 'cores.txt')] == names
+    library = LatticeLibrary.from_stream(str(tmp_path / 'lib'), str(tmp_path / 'cores.txt'), chunk=5)
+    library = LatticeLibrary(library.path)
+    assert len(library) == 13 and library.names == names and library[3] == layouts[3]
+    assert list(library.validate()) == [True] * 12 + [False]
+    template = [[''] * 8 for _ in range(7)] + [['', '', 'wrc', 'wrc', 'wrc', 'wrc', '', '']]
+    assert library.validate(template)[:12].all()
+    hits = library.query(n_fuel=(18, 20), n_rod=0)
+    assert list(hits) == [6] and library.layouts(hits)[0] == layouts[6]
@@ -0,0 +1,119 @@
+"""Test loading sequences, the 1/M extrapolation and the pipelined loading engine"""
+import json
+import os
+import threading
+import numpy as np
+from vr1.loading import (loading_steps, loaded_fuel, inverse_multiplication, predict_critical, LoadingSequence,
+                         loading_json_name, warm_source_name)
+
+critical_fuel: float = 30.0
+
+
+class StepWriter:
+    """ Writer stand-in: its run waits for the next step's build and writes a statepoint naming its step """
+    def __init__(self, sequence: 'PipelinedSequence', i: int) -> None:
+        self.sequence = sequence
+        self.i = i
+        self.output_dir = sequence.step_dir(i)
+
+    def run(self, threads=None, echo=False, write=True, poll_statepoints=True) -> dict:
+        seq = self.sequence
+        seq.events.append(('run', self.i, poll_statepoints))
+        if self.i + 1 < len(seq.layouts):
+            # The next step is built while this one runs
+            seq.overlapped.append(seq.built[self.i + 1].wait(timeout=5.0))
+        with open(os.path.join(self.output_dir, 'statepoint.010.h5'), 'w') as f:
+            f.write(f'step {self.i}')
+        k = loaded_fuel(seq.layouts[self.i]) / critical_fuel
+        return {'wall_time': 1.0, 'keff': k, 'keff_std': 1e-4}
+
+
+class StepRun:
+    """ FixedSourceRun stand-in: multiplication 1 / (1 - fuel / critical_fuel) """
+    def __init__(self, fuel: int) -> None:
+        self.fuel = fuel
+
+    def results(self, statepoint: str) -> dict:
+        m = 1.0 / (1.0 - self.fuel / critical_fuel)
+        return {'M': m, 'detectors': {'counter': {'count_rate': 100.0 * m}}}
+
+
+class PipelinedSequence(LoadingSequence):
+    """ Loading sequence whose builds are recorded instead of writing OpenMC decks """
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.events: list = []
+        self.overlapped: list[bool] = []
+        self.built = [threading.Event() for _ in self.layouts]
+
+    def build(self, i: int):
+        os.makedirs(self.step_dir(i), exist_ok=True)
+        self.events.append(('build', i))
+        self.built[i].set()
+        run = StepRun(loaded_fuel(self.layouts[i])) if self.mode == 'fixed source' else None
+        return StepWriter(self, i), run
+
+
+def fuel_edits(n: int) -> list:
+    return [[(3, col, '8')] for col in range(n)]
+
+
+def base_layout() -> list[list[str]]:
+    base = [['w'] * 8 for _ in range(8)]
+    base[4][6] = 'v56'
+    return base
+
+
+def test_inverse_multiplication():
+    """Cumulative edits and the critical loading of an exact 1/M line"""
+    base = [['w'] * 8 for _ in range(8)]
+    base[4][4] = 'v56'
+    layouts = loading_steps(base, [[(3, 3, '8'), (3, 4, '6')], {(4, 3): 'X'}, [(3, 3, 'd')]])
+    assert [loaded_fuel(layout) for layout in layouts] == [0, 14, 20, 12]
+    assert base[3][3] == 'w' and layouts[2][3][3] == '8' and layouts[3][4][3] == 'X'
+    fuel = np.array([20, 40, 60, 80])
+    multiplication = 1.0 / (1.0 - fuel / 100.0)  # 1/M falls linearly to zero at 100 tubes
+    inverse_m = inverse_multiplication(multiplication)
+    assert inverse_m[0] == 1.0 and np.all(np.diff(inverse_m) < 0)
+    assert np.isclose(predict_critical(fuel, inverse_m), 100.0)
+    assert np.isnan(predict_critical(fuel[:1], inverse_m[:1]))
+
+
+def test_pipelined_fixed_source(tmp_path):
+    """Each next step is built during the current run; the sequence stops before a step predicted supercritical"""
+    sequence = PipelinedSequence(base_layout(), fuel_edits(4), output_root=str(tmp_path))
+    curve = sequence.run()
+    # 8 tubes per step, critical at 30 tubes: after step 3 (24 tubes) step 4 (32 tubes) is not run
+    assert curve['fuel'] == [0, 8, 16, 24] and np.allclose(curve['inverse_m'], [1.0, 0.7333, 0.4667, 0.2], atol=1e-4)
+    assert np.isclose(curve['predicted_critical_fuel'][-1], critical_fuel) and 'step 4' in curve['stopped']
+    assert np.allclose(curve['detectors']['counter'], curve['inverse_m'])
+    assert all(sequence.overlapped) and len(sequence.overlapped) == 4
+    runs = [e for e in sequence.events if e[0] == 'run']
+    assert [e[1] for e in runs] == [0, 1, 2, 3] and not any(e[2] for e in runs)
+    with open(tmp_path / loading_json_name) as f:
+        assert json.load(f)['stopped'] == curve['stopped']
+
+
+def test_stop_before():
+    """Fixed-source steps stop below the 1/M limit; eigenvalue steps always run"""
+    sequence = LoadingSequence(base_layout(), fuel_edits(2), min_inverse_m=0.5)
+    assert sequence.stop_before(0) is None
+    sequence.results = [{'inverse_m': 0.4, 'predicted_critical_fuel': float('nan')}]
+    assert '1/M = 0.400' in sequence.stop_before(1)
+    sequence.results[0]['inverse_m'] = 0.6
+    assert sequence.stop_before(1) is None
+    eigenvalue = LoadingSequence(base_layout(), fuel_edits(2), mode='eigenvalue', min_inverse_m=0.5)
+    eigenvalue.results = [{'inverse_m': 0.1, 'predicted_critical_fuel': 1.0}]
+    assert eigenvalue.stop_before(1) is None
+
+
+def test_warm_started_eigenvalue(tmp_path):
+    """Eigenvalue steps start from a copy of the previous step's final statepoint and run to the end"""
+    sequence = PipelinedSequence(base_layout(), fuel_edits(4), mode='eigenvalue', output_root=str(tmp_path))
+    curve = sequence.run()
+    assert curve['stopped'] is None and curve['fuel'] == [0, 8, 16, 24, 32]
+    for i in range(1, 5):
+        with open(os.path.join(sequence.step_dir(i), warm_source_name)) as f:
+            assert f.read() == f'step {i - 1}'
+    assert not os.path.exists(os.path.join(sequence.step_dir(0), warm_source_name))
+    assert curve['M'][-1] == float('inf') and [e[2] for e in sequence.events if e[0] == 'run'][-1]
@@ -0,0 +1,54 @@
+"""Test the MGXS cache keys and the round trip of cached lattice unit cross sections; needs OpenMC"""
+import os
+import numpy as np
+import pytest
+
+openmc = pytest.importorskip('openmc')
+
+
+def test_collapse_edges():
+    """Requested boundaries are snapped to SCALE 252 boundaries"""
+    from vr1.groups import group_structure
+    from vr1.mgxs_cache import collapse_edges
+    edges = collapse_edges([1e-5, 0.62, 2e7])
+    assert np.allclose(edges, [1e-5, 0.625, 2e7])
+    assert set(collapse_edges('eight_group')) <= set(group_structure('SCALE-252').edges)
+
+
+def test_cache_key(tmp_path, monkeypatch):
+    """Keys do not depend on material IDs, but on temperatures, groups and the domain type"""
+    monkeypatch.setenv('VR1_CACHE_DIR', str(tmp_path))
+    from vr1.materials import VR1Materials
+    from vr1.mgxs_cache import MGXSCache, material_signature
+    a, b = MGXSCache('two_group', materials=VR1Materials()), MGXSCache('two_group', materials=VR1Materials())
+    unit_a, unit_b = a.builder.get('8'), b.builder.get('8')
+    assert material_signature(unit_a) == material_signature(unit_b)
+    assert a.key('8', unit_a) == b.key('8', unit_b)
+    assert a.cache_file('8', unit_a).startswith(os.path.join(str(tmp_path), 'mgxs'))
+    assert MGXSCache('four_group', materials=b.materials).key('8', unit_b) != a.key('8', unit_a)
+    assert a.key('6', unit_a) != a.key('8', unit_a)
+    for material in unit_b.get_all_materials().values():
+        material.temperature = 350.0
+    assert b.key('8', unit_b) != a.key('8', unit_a)
+
+
+def test_cache_round_trip(tmp_path, monkeypatch):
+    """A cached unit is read back without a transport run and merged into libraries and diffusion data"""
+    monkeypatch.setenv('VR1_CACHE_DIR', str(tmp_path))
+    from vr1.mgxs_cache import MGXSCache
+    cache = MGXSCache('two_group')
+    groups = openmc.mgxs.EnergyGroups(cache.edges)
+    data = openmc.XSdata('w', groups, temperatures=[294.0])
+    data.order = 0
+    data.set_total(np.array([0.5, 1.5]), 294.0)
+    data.set_absorption(np.array([0.001, 0.02]), 294.0)
+    data.set_scatter_matrix(np.array([[[0.45], [0.049]], [[0.0], [1.48]]]), 294.0)
+    library = openmc.MGXSLibrary(groups)
+    library.add_xsdata(data)
+    cache_file = cache.cache_file('w', cache.builder.get('w'))
+    library.export_to_hdf5(cache_file)
+    assert cache.generate('w') == cache_file
+    assert [x.name for x in cache.library(['w', 'w']).xsdatas] == ['w']
+    xs = cache.diffusion_xs(['w'])['w']
+    assert np.allclose(xs['total'], [0.5, 1.5]) and np.allclose(xs['absorption'], [0.001, 0.02])
+    assert np.allclose(xs['scatter'], [[0.45, 0.049], [0.0, 1.48]]) and not xs['nu_fission'].any()
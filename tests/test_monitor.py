@@ -0,0 +1,74 @@
+"""Test parsing of OpenMC batch output by the run monitor"""
+import json
+import os
+import sys
+import types
+import vr1.monitor
+from vr1.monitor import parse_batch_line, statepoint_batch, RunMonitor
+
+# Stands in for OpenMC: prints the batch lines from the batch given on the command line to batch 3, writing a
+# statepoint for every batch after the first
+fake_openmc: str = """
+import sys
+for batch in range(int(sys.argv[1]), 4):
+    print(f'        {batch}/1    1.0400{batch}', flush=True)
+    if batch > 1:
+        open(f'statepoint.{batch:03d}.h5', 'w').write('new')
+"""
+
+
+def test_parse_batch_lines():
+    """Inactive and active batch lines, with and without Shannon entropy"""
+    rec = parse_batch_line('        1/1    1.04018')
+    assert rec['batch'] == 1 and rec['k'] == 1.04018 and rec['entropy'] is None and rec['k_avg'] is None
+
+    rec = parse_batch_line('        3/1    1.01234    6.12345')
+    assert rec['entropy'] == 6.12345 and rec['k_avg'] is None
+
+    rec = parse_batch_line('       12/1    1.02361    1.01936 +/- 0.00424')
+    assert rec['entropy'] is None and rec['k_avg'] == 1.01936 and rec['k_std'] == 0.00424
+
+    rec = parse_batch_line('       12/1    1.02361    6.12345    1.01936 +/- 0.00424')
+    assert rec['entropy'] == 6.12345 and rec['k_avg'] == 1.01936 and rec['k_std'] == 0.00424
+
+    assert parse_batch_line(' Bat./Gen.      k            Average k') is None
+    assert parse_batch_line(' Total time elapsed            = 1.2345E+01 seconds') is None
+
+
+def run_in(run_dir: str, monkeypatch, first: int = 1) -> tuple[RunMonitor, list[str]]:
+    """ Monitored fake OpenMC run in run_dir, and the statepoints the monitor read """
+    read: list[str] = []
+
+    def tally_errors(sp_file: str, t: float) -> list[dict]:
+        read.append(os.path.basename(sp_file))
+        return [{'batch': statepoint_batch(sp_file), 'time': t, 'tally': 'flux', 'max_rel_err': 0.1,
+                 'mean_rel_err': 0.05}]
+    monkeypatch.setattr(vr1.monitor, 'statepoint_tally_errors', tally_errors)
+    settings = types.SimpleNamespace(particles=100, batches=3, inactive=0, generations_per_batch=1, keff_trigger=None)
+    monitor = RunMonitor(types.SimpleNamespace(output_dir=run_dir, openmc_settings=settings), resume=first > 1)
+    monitor.run(command_line=[sys.executable, '-c', fake_openmc, str(first)])
+    return monitor, read
+
+
+def test_stale_statepoints(tmp_path, monkeypatch):
+    """Statepoints left by an earlier run are not read unless OpenMC writes them again"""
+    for batch in (1, 2):
+        sp_file = tmp_path / f'statepoint.{batch:03d}.h5'
+        sp_file.write_text('old')
+        os.utime(sp_file, (1.0e9, 1.0e9))
+    monitor, read = run_in(str(tmp_path), monkeypatch)
+    assert sorted(set(read)) == ['statepoint.002.h5', 'statepoint.003.h5']
+    assert [r['batch'] for r in monitor.tally_records] == [2, 3]
+
+
+def test_resume_keeps_one_tally_series(tmp_path, monkeypatch):
+    """A run restarted from batch 2 appends only the statepoints it wrote to the earlier tally series"""
+    run_in(str(tmp_path), monkeypatch)
+    record = tmp_path / vr1.monitor.monitor_json_name
+    before = json.loads(record.read_text())['tally_series']['batch']
+    os.remove(tmp_path / 'statepoint.003.h5')
+    _, read = run_in(str(tmp_path), monkeypatch, first=3)
+    after = json.loads(record.read_text())
+    assert before == [2, 3] and set(read) == {'statepoint.003.h5'}
+    assert after['tally_series']['batch'] == [2, 3, 3] and after['series']['batch'] == [1, 2, 3, 3]
+    assert after['restarts'] == [{'batch': 3, 'restarted_from': None}]
@@ -0,0 +1,105 @@
+"""Test the loading constraints and the genetic optimizer with a cheap surrogate score"""
+import os
+import numpy as np
+import pytest
+from vr1.optimizer import LoadingConstraints, CoreOptimizer
+
+reactivity = {'w': 0.0, '8': 0.012, '6': 0.010, '4': 0.008}
+
+
+def core(*fuel: tuple[int, int, str]) -> list[list[str]]:
+    layout = [['w'] * 8 for _ in range(8)]
+    layout[7][2:6] = ['wrc'] * 4
+    for r, c, code in fuel:
+        layout[r][c] = code
+    return layout
+
+
+class CountingScreener:
+    """ k-eff growing with the fuel loaded, recording every batch it screens """
+    def __init__(self) -> None:
+        self.batches: list[list] = []
+
+    def __call__(self, layouts: list) -> dict:
+        self.batches.append(layouts)
+        return {'keff': np.array([0.9 + sum(reactivity.get(code, 0.0) for row in layout for code in row)
+                                  for layout in layouts])}
+
+
+def constraints(min_fuel: int = 4) -> LoadingConstraints:
+    return LoadingConstraints(core((3, 3, '8'), (3, 4, '8'), (4, 3, '6'), (4, 4, '6')),
+                              {'8': 4, '6': 6, '4': 2}, min_fuel=min_fuel)
+
+
+def counts(c: LoadingConstraints, genome: np.ndarray) -> np.ndarray:
+    return np.bincount(genome, minlength=len(c.options))
+
+
+def test_constraints():
+    """The 'wrc' row is fixed, the base layout round-trips, and too strict limits are rejected"""
+    c = constraints()
+    assert len(c.positions) == 60 and c.options == ['w', '8', '6', '4']
+    assert c.layout(c.genome(c.base)) == c.base.tolist()
+    with pytest.raises(ValueError):
+        LoadingConstraints(core(), {'8': 2}, min_fuel=3)
+
+
+def test_repair():
+    """Repair drops fuel beyond the inventory and tops loadings up to min_fuel"""
+    c = constraints(min_fuel=10)
+    rng = np.random.default_rng(3)
+    overfull = c.repair(np.ones(len(c.positions), dtype=int), rng)
+    assert counts(c, overfull)[1] == 4 and (overfull > 0).sum() == 10
+    for genome in (overfull, np.zeros(len(c.positions), dtype=int)):
+        repaired = c.repair(genome, rng)
+        assert (repaired > 0).sum() >= 10 and np.all(counts(c, repaired) <= [len(c.positions), 4, 6, 2])
+    for _ in range(20):
+        genome = c.random_genome(rng)
+        assert (genome > 0).sum() >= 10 and np.all(counts(c, genome)[1:] <= c.inventory[1:])
+
+
+def test_seen_deduplicates_mirror_images():
+    """A loading and its mirror image are screened once and kept as one entry of `seen`"""
+    c, screener = constraints(), CountingScreener()
+    optimizer = CoreOptimizer(c, screener, population=4)
+    left = c.genome(core((3, 1, '8'), (4, 2, '6'), (2, 2, '6'), (5, 1, '4')))
+    right = c.genome(core((3, 6, '8'), (4, 5, '6'), (2, 5, '6'), (5, 6, '4')))
+    scores = optimizer.evaluate([left, right, left])
+    assert len(screener.batches[-1]) == 1 and len(optimizer.seen) == 1
+    assert scores[0] == scores[1] == scores[2]
+    optimizer.evaluate([c.genome(c.base)])
+    assert len(optimizer.seen) == 2
+    asymmetric = CoreOptimizer(c, CountingScreener(), symmetric=False)
+    asymmetric.evaluate([left, right])
+    assert len(asymmetric.seen) == 2
+
+
+def test_run_selects_within_constraints():
+    """Seeded runs repeat, the elite keeps the best score from rising, and the best loading is feasible"""
+    c = constraints()
+    runs = [CoreOptimizer(c, CountingScreener(), k_bounds=(1.0, 1.01), population=16, seed=7) for _ in range(2)]
+    results = [optimizer.run(generations=15) for optimizer in runs]
+    assert results[0][0] == results[1][0] and runs[0].history == runs[1].history
+    history = np.array(runs[0].history)
+    assert np.all(np.diff(history) <= 0.0)
+    best = results[0][0]
+    base_score = abs((1.0 - 1 / (0.9 + 2 * 0.012 + 2 * 0.010)) - 0.003) + 100 * (1.0 - 0.944)
+    assert best['score'] == min(s['score'] for s in runs[0].seen.values()) and best['score'] < base_score
+    assert 1.0 <= best['keff'] <= 1.01
+    genome = c.genome(best['lattice_str'])
+    assert (genome > 0).sum() >= c.min_fuel and np.all(counts(c, genome)[1:] <= c.inventory[1:])
+    assert best['lattice_str'][-1][2:6] == ['wrc'] * 4
+
+
+def test_confirm_writes_decks(tmp_path, monkeypatch):
+    """Confirmation writes one deck per layout hash; the OpenMC runs return a fixed summary"""
+    pytest.importorskip('openmc')
+    from vr1.writer import WriterOpenMC
+    monkeypatch.setattr(WriterOpenMC, 'run', lambda self, threads=None, write=True:
+                        {'keff': 1.005, 'keff_std': 1e-4, 'threads': threads})
+    optimizer = CoreOptimizer(constraints(), CountingScreener(), population=8, seed=2)
+    optimizer.run(generations=2)
+    confirmed = optimizer.confirm(n_top=2, output_dir=str(tmp_path), threads_per_run=1)
+    assert [t['keff_mc'] for t in confirmed] == [1.005, 1.005]
+    assert len(os.listdir(tmp_path)) == 2
+    assert all(os.path.isfile(tmp_path / d / 'model.xml') for d in os.listdir(tmp_path))
@@ -0,0 +1,48 @@
+"""Test the statistical merge of replica runs"""
+import copy
+import types
+import numpy as np
+import pytest
+from vr1.replicas import replica_seeds, merge_keff, pool_results, merge_tallies
+
+
+def batch_statistics(batches: np.ndarray) -> tuple:
+    """ Mean and standard deviation of the mean over the first axis, as OpenMC reports them """
+    return batches.mean(axis=0), batches.std(axis=0, ddof=1) / np.sqrt(len(batches))
+
+
+def test_merge_keff():
+    """Inverse-variance weighting, the chi^2 of the replicas around it, and reproducible distinct seeds"""
+    k, std, chi2 = merge_keff([1.0, 1.002], [0.001, 0.002])
+    assert np.isclose(k, 1.0004) and np.isclose(std, 1 / np.sqrt(1e6 + 2.5e5)) and np.isclose(chi2, 0.8)
+    seeds = replica_seeds(4, 7)
+    assert len(set(seeds)) == 4 and seeds == replica_seeds(4, 7)
+
+
+def test_pool_results():
+    """Pooling replicas from their means and standard deviations equals one run over all their batches"""
+    rng = np.random.default_rng(5)
+    runs = [rng.normal(10.0, 2.0, (n, 3)) for n in (20, 35, 50)]
+    mean, std, n = pool_results(*zip(*[batch_statistics(r) for r in runs]), [len(r) for r in runs])
+    all_mean, all_std = batch_statistics(np.concatenate(runs))
+    assert n == 105 and np.allclose(mean, all_mean) and np.allclose(std, all_std)
+    with pytest.raises(ValueError):
+        pool_results([[1.0]], [[0.0]], [1])
+
+
+def test_merge_tallies():
+    """The merged copy carries the pooled results; the replicas' tallies are untouched"""
+    rng = np.random.default_rng(6)
+    runs = [rng.uniform(size=(n, 2, 1, 1)) for n in (10, 30)]
+    tallies = []
+    for r in runs:
+        mean, std = batch_statistics(r)
+        tallies.append(types.SimpleNamespace(mean=mean, std_dev=std, num_realizations=len(r), name='t'))
+    original = copy.deepcopy(tallies[0])
+    merged = merge_tallies(tallies)
+    all_mean, all_std = batch_statistics(np.concatenate(runs))
+    assert merged.num_realizations == 40 and merged.name == 't'
+    assert np.allclose(merged._mean, all_mean) and np.allclose(merged._std_dev, all_std)
+    assert np.allclose(merged._sum, np.concatenate(runs).sum(axis=0))
+    assert np.allclose(merged._sum_sq, (np.concatenate(runs) ** 2).sum(axis=0))
+    assert tallies[0].num_realizations == 10 and np.array_equal(tallies[0].mean, original.mean)
@@ -0,0 +1,30 @@
+"""Test the fuel meat source decomposition"""
+import numpy as np
+from vr1.sources import fuel_pieces, sample_pieces, in_fuel
+
+# Five square tubes and a central cylindrical one, like the IRT4M nFT.2/nFT.3 surfaces
+tubes = {i: {'shape': 'square', 'outer': (6.87 - 0.69 * (i - 1), 0.885 - 0.08 * (i - 1)),
+             'inner': (6.73 - 0.69 * (i - 1), 0.815 - 0.08 * (i - 1))} for i in range(1, 6)}
+tubes[6] = {'shape': 'cylinder', 'outer': 1.02, 'inner': 0.95}
+geometry = {'pitch': 7.15, 'z': (7.5975, 66.4025), 'tubes': tubes}
+
+
+def test_fuel_pieces():
+    """Pieces add up to the fuel volume and every sampled site is in fuel"""
+    layout = [['w'] * 8 for _ in range(8)]
+    layout[2][3], layout[4][5], layout[5][5] = '4', 'X', 'v12_8'
+    weights = np.ones((8, 8))
+    weights[4][5] = 3.0
+    pieces = fuel_pieces(layout, weights, geometry=geometry)
+    assert {p['position'] for p in pieces} == {(2, 3), (4, 5)}
+    height = geometry['z'][1] - geometry['z'][0]
+    area = sum(w1 ** 2 - w0 ** 2 - (4 - np.pi) * (r1 ** 2 - r0 ** 2)
+               for (w1, r1), (w0, r0) in [(tubes[i]['outer'], tubes[i]['inner']) for i in range(1, 5)])
+    assert np.isclose(sum(p['volume'] for p in pieces if p['position'] == (2, 3)), area * height)
+    points = sample_pieces(pieces, 20000, np.random.default_rng(3))
+    assert in_fuel(points, layout, geometry).all()
+    share = np.mean(points[:, 0] > 0)  # (4, 5) is right of the center, (2, 3) left of it
+    expected = sum(p['strength'] for p in pieces if p['position'] == (4, 5)) / sum(p['strength'] for p in pieces)
+    assert abs(share - expected) < 0.02
+    box = np.random.default_rng(4).uniform([-28.6, -28.6, 7.6], [28.6, 28.6, 66.4], (20000, 3))
+    assert in_fuel(box, layout, geometry).mean() < 0.02
@@ -0,0 +1,49 @@
+"""Test surface source filtering, compact storage and resampling"""
+import numpy as np
+import pytest
+from vr1.surface_source import source_dtype, outgoing, compact, expand, resample, SurfaceSourceStore
+
+
+def make_bank(n: int, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    bank = np.zeros(n, dtype=source_dtype)
+    phi = rng.uniform(0, 2 * np.pi, n)
+    u = rng.normal(size=(n, 3))
+    u /= np.linalg.norm(u, axis=1, keepdims=True)
+    for i, c in enumerate('xyz'):
+        bank['u'][c] = u[:, i]
+    bank['r']['x'], bank['r']['y'], bank['r']['z'] = 115 * np.cos(phi), 115 * np.sin(phi), rng.uniform(0, 60, n)
+    bank['E'] = rng.uniform(1e-3, 2e7, n)
+    bank['wgt'] = rng.uniform(0.5, 1.5, n)
+    return bank
+
+
+def test_outgoing_and_roundtrip():
+    """Radial and planar outward crossings; compact storage keeps positions on the boundary"""
+    bank = make_bank(1000)
+    out = outgoing(bank, 'radial')
+    assert 0.4 < out.mean() < 0.6
+    assert np.all(outgoing(bank, (0.0, -1.0, 0.0)) == (bank['u']['y'] < 0))
+    with pytest.raises(ValueError):
+        outgoing(bank, 'spherical')
+    back = expand(compact(bank[out]), offset=0.0)
+    assert np.array_equal(back['r']['x'], bank['r']['x'][out])
+    assert np.allclose(back['u']['z'], bank['u']['z'][out], atol=1e-6) and np.all(outgoing(back, 'radial'))
+    assert np.allclose(back['E'], bank['E'][out], rtol=1e-6)
+
+
+def test_resample_and_store(tmp_path):
+    """Resampling preserves the total weight and follows the weights; the store indexes sources"""
+    data = compact(make_bank(4))
+    data['wgt'] = np.array([1.0, 0.0, 3.0, 0.0], dtype=np.float32)
+    sample = resample(data, 40000, np.random.default_rng(2))
+    assert np.isclose(sample['wgt'].sum(), 4.0, rtol=1e-5)
+    picked = np.isin(sample['r'][:, 0], data['r'][2, 0])
+    assert abs(picked.mean() - 0.75) < 0.01 and np.all(np.isin(sample['r'][:, 0], data['r'][[0, 2], 0]))
+    store = SurfaceSourceStore(str(tmp_path))
+    store.add('abc', data, {'boundary': 'pool wall', 'source_particles': 100})
+    loaded, entry = store.get('abc')
+    assert entry['n_sites'] == 4 and entry['total_weight'] == 4.0 and store.find(boundary='pool wall') == ['abc']
+    assert np.array_equal(loaded['r'], data['r'])
+    with pytest.raises(ValueError):
+        store.get('missing')
@@ -0,0 +1,39 @@
+"""Test the k-eff surrogate on a synthetic response of the layout"""
+import numpy as np
+from vr1.surrogate import featurize, feature_names, KeffSurrogate
+
+
+def random_layout(rng: np.random.Generator, n_fuel: int) -> list[list[str]]:
+    layout = [['w'] * 8 for _ in range(8)]
+    layout[7][2:6] = ['wrc'] * 4
+    positions = rng.choice(48, size=n_fuel, replace=False)  # rows 1-6
+    for p in positions:
+        layout[1 + p // 8][p % 8] = str(rng.choice(['8', '6', '4', 'X']))
+    return layout
+
+
+def test_featurize():
+    """Counts, tubes and rod insertion of a small layout"""
+    layout = [['w'] * 8 for _ in range(8)]
+    layout[7][2:6] = ['wrc'] * 4
+    layout[3][3], layout[3][4], layout[4][3] = '8', '6_42.35', 'X'
+    f = dict(zip(feature_names, featurize(layout)[0]))
+    assert f['n_8'] == 1 and f['n_rod'] == 2 and f['n_wrc'] == 4 and f['fuel_tubes'] == 20
+    assert abs(f['rod_inserted'] - 1.5) < 1.0e-12
+    assert f['wrc_dist_min'] == 3.0
+
+
+def test_surrogate_fit_and_extrapolation():
+    """Interpolation is accurate, a layout far from the training data is flagged"""
+    rng = np.random.default_rng(2)
+    truth = lambda x: 0.6 + 0.004 * x[:, feature_names.index('fuel_importance')] \
+        - 0.01 * x[:, feature_names.index('rod_inserted')]
+    layouts = [random_layout(rng, n) for n in rng.integers(14, 22, size=120)]
+    keff = truth(featurize(layouts))
+    model = KeffSurrogate().fit([{'lattice_str': l, 'keff': k, 'keff_std': 5.0e-4}
+                                 for l, k in zip(layouts, keff)])
+    test = [random_layout(rng, 18) for _ in range(20)]
+    pred = model.predict(test)
+    assert np.abs(pred['keff'] - truth(featurize(test))).max() < 0.005
+    full = [['8'] * 8 for _ in range(8)]
+    assert model.predict(full)['extrapolating'][0]
@@ -0,0 +1,36 @@
+"""Test symmetry groups, canonical forms and deduplication of lattice layouts"""
+import numpy as np
+from vr1.symmetry import symmetry_group, canonical, deduplicate, expand_results, transform
+
+
+def core(*fuel: tuple[int, int], wrc: bool = True) -> list[list[str]]:
+    layout = [['w'] * 8 for _ in range(8)]
+    if wrc:
+        layout[7][2:6] = ['wrc'] * 4
+    for r, c in fuel:
+        layout[r][c] = '8'
+    return layout
+
+
+def test_groups():
+    """The 'wrc' row leaves only the left-right mirror, an empty template has all of D4"""
+    assert symmetry_group(core((3, 3))) == ['identity', 'flip_cols']
+    assert len(symmetry_group(core(wrc=False))) == 8
+    channel = core()
+    channel[2][1] = 'v56'
+    assert symmetry_group(channel) == ['identity']
+
+
+def test_deduplicate_and_map_back():
+    """Mirror images share one canonical layout, position maps come back mirrored"""
+    left, right, other = core((3, 1), (4, 2)), core((3, 6), (4, 5)), core((3, 3), (3, 4))
+    assert canonical(left)[0] == canonical(right)[0]
+    dedup = deduplicate([left, right, other])
+    assert len(dedup['unique']) == 2 and dedup['index'][0] == dedup['index'][1]
+    # A per-position result computed on the canonical layouts: 1 where fuel is
+    results = [{'power': (np.array(u) == '8').astype(float), 'keff': 1.0} for u in dedup['unique']]
+    expanded = expand_results(results, dedup)
+    for layout, r in zip([left, right, other], expanded):
+        assert np.array_equal(r['power'], (np.array(layout) == '8').astype(float)) and r['keff'] == 1.0
+    free = deduplicate([transform(core((1, 2), wrc=False), name).tolist() for name in ('identity', 'rot90', 'transpose')])
+    assert len(free['unique']) == 1
@@ -0,0 +1,51 @@
+"""Test the MAGIC weight window update and the mesh tally ordering"""
+import types
+import numpy as np
+from vr1.weight_windows import mesh_flux, magic_bounds, coverage, FacilityWeightWindows
+
+
+def test_mesh_flux_ordering():
+    """Tally bins with x fastest and groups innermost end up at [ix, iy, iz, group]"""
+    dimension, n_groups = (3, 2, 2), 2
+    flux = np.arange(1, 3 * 2 * 2 * 2 + 1, dtype=float).reshape(3, 2, 2, 2)
+    mean = np.array([flux[ix, iy, iz, g] for iz in range(2) for iy in range(2) for ix in range(3)
+                     for g in range(2)])
+    std = 0.1 * mean
+    std[0] = 0.0
+    got, rel = mesh_flux(mean.reshape(-1, n_groups, 1), std, dimension, n_groups)
+    assert np.array_equal(got, flux) and np.allclose(rel[1:, ...], 0.1) and rel[0, 0, 0, 0] == 0.0
+
+
+def test_magic_bounds():
+    """Bounds follow the flux per group, unknown cells keep the previous bound or get none"""
+    flux = np.array([[[[1.0, 10.0]], [[0.1, 1.0]], [[0.0, 0.01]]]])
+    rel = np.array([[[[0.01, 0.01]], [[0.2, 0.2]], [[np.inf, 0.9]]]])
+    lower = magic_bounds(flux, rel, ratio=5.0)
+    assert np.isclose(lower[0, 0, 0, 0], 1 / 3) and np.isclose(lower[0, 0, 0, 1], 1 / 3)
+    assert np.isclose(lower[0, 1, 0, 0], 1 / 30) and np.all(lower[0, 2, 0] == -1.0)
+    assert np.isclose(coverage(lower), 4 / 6)
+    previous = np.full(flux.shape, 1e-4)
+    assert np.all(magic_bounds(flux, rel, previous)[0, 2, 0] == 1e-4)
+
+
+def test_cache_key():
+    """The key follows the source shape, not its normalization"""
+    layout = [['w'] * 8 for _ in range(8)]
+    power = np.ones((8, 8))
+    power[3, 3] = 2.0
+    uniform = FacilityWeightWindows(layout).key('model')
+    shaped = FacilityWeightWindows(layout, power=power).key('model')
+    assert shaped != uniform and FacilityWeightWindows(layout, power=3 * power).key('model') == shaped
+    assert FacilityWeightWindows(layout).key('other model') != uniform
+
+
+def test_cache_key_run_parameters():
+    """More iterations, a tighter threshold or more histories give new windows"""
+    layout = [['w'] * 8 for _ in range(8)]
+    uniform = FacilityWeightWindows(layout).key('model')
+    assert FacilityWeightWindows(layout, iterations=4).key('model') != uniform
+    assert FacilityWeightWindows(layout, threshold=0.3).key('model') != uniform
+    settings = [types.SimpleNamespace(parm={'npg': n, 'batches': b, 'inactive': 0}) for n, b in
+                ((1000, 50), (2000, 50), (1000, 60), (1000, 50))]
+    keys = [FacilityWeightWindows(layout, settings=s).key('model') for s in settings]
+    assert len(set(keys[:3])) == 3 and keys[3] == keys[0] and uniform not in keys
@@ -0,0 +1,34 @@
+"""Test writing complete OpenMC decks of a VR1 lattice; needs OpenMC"""
+import os
+import pytest
+
+openmc = pytest.importorskip('openmc')
+
+
+def test_settings_cross_sections():
+    """The cross-section library and its cross_sections.xml follow the root path"""
+    from vr1.settings import VR1Settings
+    settings = VR1Settings(xs_xml_root_path='/data', xs_lib='endf8.0')
+    assert settings.xs_lib == 'endf8.0'
+    assert settings.xs_xml == os.path.join('/data', 'endfb-viii.0-hdf5', 'cross_sections.xml')
+    assert VR1Settings(xs_xml_root_path=None).xs_xml is None
+    with pytest.raises(ValueError):
+        VR1Settings(xs_lib='jeff3.3')
+
+
+def test_write_lattice_deck(tmp_path):
+    """A lattice deck is written end to end into model.xml, with the chosen cross sections"""
+    from vr1.core import Lattice
+    from vr1.settings import VR1Settings
+    from vr1.utils import model_xml_hash
+    from vr1.writer import WriterOpenMC
+    layout = [['w'] * 8 for _ in range(8)]
+    layout[3][3], layout[3][4] = '8', '6'
+    settings = VR1Settings(xs_xml_root_path=str(tmp_path / 'data'), parm={'npg': 100, 'gen': 20, 'nsk': 5})
+    writer = WriterOpenMC(settings, Lattice(lattice_str=layout))
+    writer.output_dir = str(tmp_path / 'deck')
+    assert writer.write_openmc_XML() == 0
+    model = openmc.Model.from_model_xml(os.path.join(writer.output_dir, 'model.xml'))
+    assert model.settings.batches == 20 and model.settings.inactive == 5
+    assert model.materials.cross_sections == settings.xs_xml
+    assert len(model_xml_hash(writer.output_dir)) == 64
@@ -0,0 +1,290 @@
+""" Activation rates in the vertical irradiation channels: 252-group channel spectra folded with a dosimetry library """
+
+import json
+import os
+import numpy as np
+from vr1.groups import group_structure
+from vr1.utils import cache_dir
+
+channel_codes: list[str] = ['v90', 'v56', 'v30', 'v25', 'v12']
+channel_spectrum_tally_name: str = 'channel spectrum'
+power_tally_name: str = 'channel power normalization'
+barn: float = 1.0e-24  # [cm2]
+ev_to_joule: float = 1.602176634e-19
+
+
+def channel_diameter(code: str) -> (float, None):
+    """ Inner diameter [cm] of the vertical channel of a lattice code, e.g. 5.6 for 'v56' and 1.2 for 'v12_6' """
+    if code[:3] not in channel_codes:
+        return None
+    return int(code[1:3]) / 10.0
+
+
+def channel_positions(lattice_str: list[list[str]]) -> list[tuple[int, int, str]]:
+    """ (row, col, code) of every vertical channel of a layout """
+    return [(i, j, code) for i, row in enumerate(lattice_str) for j, code in enumerate(row)
+            if channel_diameter(code) is not None]
+
+
+def circle_in_square(radius: float, half_width: float) -> float:
+    """ Area [cm2] of a circle clipped by a concentric square of side 2 * half_width """
+    if radius <= half_width:
+        return np.pi * radius ** 2
+    if radius >= np.sqrt(2.0) * half_width:
+        return 4.0 * half_width ** 2
+    # Four disjoint circular segments beyond the sides are cut off
+    segment = radius ** 2 * np.arccos(half_width / radius) - half_width * np.sqrt(radius ** 2 - half_width ** 2)
+    return np.pi * radius ** 2 - 4.0 * segment
+
+
+def group_average(energy: np.ndarray, xs: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """1/E-weighted group cross sections of a pointwise (lin-lin) cross section.
+    Parameters:
+        - energy (np.ndarray): Ascending energies [eV].
+        - xs (np.ndarray): Cross section at the energies.
+        - edges (np.ndarray): Ascending group boundaries [eV].
+    Returns:
+        - np.ndarray: One value per group; the cross section is 0 outside the tabulated range."""
+    energy, xs, edges = (np.asarray(a, dtype=float) for a in (energy, xs, edges))
+    if energy.size < 2 or np.any(np.diff(energy) < 0) or np.any(np.diff(edges) <= 0):
+        raise ValueError('Pointwise energies and group boundaries must be ascending')
+    grid = np.union1d(energy, edges)
+    grid = grid[(grid >= edges[0]) & (grid <= edges[-1])]
+    values = np.interp(grid, energy, xs, left=0.0, right=0.0)
+    du = np.diff(np.log(grid))
+    integral = np.concatenate([[0.0], np.cumsum(0.5 * (values[1:] + values[:-1]) * du)])
+    at_edges = np.searchsorted(grid, edges)
+    return np.diff(integral[at_edges]) / np.diff(np.log(edges))
+
+
+def fold(flux: np.ndarray, xs: np.ndarray) -> np.ndarray:
+    """Reaction rates of every spectrum with every reaction at once.
+    Parameters:
+        - flux (np.ndarray): (..., G) group fluxes [1/cm2/s, or per source particle].
+        - xs (np.ndarray): (R, G) group cross sections [b].
+    Returns:
+        - np.ndarray: (..., R) rates per target atom, in the time unit of the flux."""
+    return np.asarray(flux) @ np.asarray(xs).T * barn
+
+
+def activity(rate: np.ndarray, atoms: np.ndarray, half_life: np.ndarray, t_irradiation: float,
+             t_decay: float = 0.0) -> np.ndarray:
+    """Activity of the reaction products after an irradiation at constant flux.
+    Parameters:
+        - rate (np.ndarray): Reaction rate per target atom [1/s], any shape broadcasting with atoms and half_life.
+        - atoms (np.ndarray): Target atoms of each foil.
+        - half_life (np.ndarray): Product half-lives [s]; inf for stable products.
+        - t_irradiation (float): Irradiation time [s].
+        - t_decay (float): Cooling time after the irradiation [s].
+    Returns:
+        - np.ndarray: Activity [Bq]: atoms * rate * (1 - exp(-lambda t_irr)) * exp(-lambda t_decay)."""
+    decay = np.log(2.0) / np.asarray(half_life, dtype=float)
+    return np.asarray(atoms) * rate * -np.expm1(-decay * t_irradiation) * np.exp(-decay * t_decay)
+
+
+class DosimetryLibrary:
+    """
+    Group cross sections of dosimetry reactions, collapsed once and cached on disk.
+    Parameters:
+        - edges (np.ndarray, None): Ascending group boundaries [eV]; SCALE 252 if None.
+    Processing Logic:
+        - Each reaction is added from pointwise data (e.g. IRDFF through openmc.data) and kept only as one row of
+            1/E-weighted group cross sections with its product half-life, so folding never touches the pointwise
+            data again.
+        - save()/load() keep the library as one .npz in cache_dir('dosimetry'); adding a reaction or a foil needs
+            neither a new collapse of the others nor a transport run.
+    """
+    def __init__(self, edges: (np.ndarray, None) = None) -> None:
+        self.edges: np.ndarray = group_structure('SCALE-252').edges if edges is None else np.asarray(edges, dtype=float)
+        self.names: list[str] = []
+        self.xs: np.ndarray = np.zeros((0, len(self.edges) - 1))
+        self.half_lives: np.ndarray = np.zeros(0)
+
+    def add(self, name: str, energy: np.ndarray, xs: np.ndarray, half_life: float = np.inf) -> np.ndarray:
+        """Adds or replaces a reaction from pointwise data.
+        Parameters:
+            - name (str): Reaction name, e.g. 'Au197(n,g)Au198'.
+            - energy (np.ndarray): Ascending energies [eV].
+            - xs (np.ndarray): Cross section [b].
+            - half_life (float): Product half-life [s].
+        Returns:
+            - np.ndarray: The group cross sections."""
+        row = group_average(energy, xs, self.edges)
+        if name in self.names:
+            i = self.names.index(name)
+            self.xs[i], self.half_lives[i] = row, half_life
+        else:
+            self.names.append(name)
+            self.xs = np.vstack([self.xs, row])
+            self.half_lives = np.append(self.half_lives, half_life)
+        return row
+
+    def add_openmc(self, name: str, path: str, mt: int, half_life: float = np.inf, temperature: str = '294K'):
+        """ Adds reaction MT of an OpenMC HDF5 incident-neutron file, e.g. converted from IRDFF """
+        import openmc.data
+        data = openmc.data.IncidentNeutron.from_hdf5(path)
+        xs = data[mt].xs[temperature]
+        return self.add(name, xs.x, xs.y, half_life)
+
+    def matrix(self, names: (list[str], None) = None) -> tuple:
+        """ (names, (R, G) group cross sections, half-lives) of the given reactions, all if None """
+        names = self.names if names is None else list(names)
+        missing = [n for n in names if n not in self.names]
+        if missing:
+            raise ValueError(f'Reactions {missing} are not in the dosimetry library')
+        idx = [self.names.index(n) for n in names]
+        return names, self.xs[idx], self.half_lives[idx]
+
+    def save(self, name: str = 'dosimetry', directory: (str, None) = None) -> str:
+        path = os.path.join(cache_dir('dosimetry') if directory is None else directory, f'{name}.npz')
+        np.savez_compressed(path, edges=self.edges, xs=self.xs, half_lives=self.half_lives,
+                            names=json.dumps(self.names))
+        return path
+
+    @classmethod
+    def load(cls, name: str = 'dosimetry', directory: (str, None) = None) -> 'DosimetryLibrary':
+        path = os.path.join(cache_dir('dosimetry') if directory is None else directory, f'{name}.npz')
+        with np.load(path) as data:
+            library = cls(data['edges'])
+            library.xs, library.half_lives = data['xs'], data['half_lives']
+            library.names = json.loads(str(data['names']))
+        return library
+
+
+class ChannelActivation:
+    """
+    Channel spectrum tallies and activation rates of foils in the vertical channels.
+    Parameters:
+        - lattice_str (list[list[str]]): Core layout with 'v..' channels.
+        - library (DosimetryLibrary): Group cross sections on the tally groups.
+        - power (float, None): Reactor power [W] for absolute rates; per source particle if None.
+        - n_axial (int): Axial layers of every channel spectrum.
+        - z_range (tuple, None): Bottom and top [cm] of the layers; the fuel height FAZ.4 to FAZ.3 if None.
+        - pitch (float, None): Lattice pitch [cm]; vr1.lattice_units.lattice_pitch if None.
+    Processing Logic:
+        - One tally scores the flux in the air of all channels on an 8x8 x n_axial lattice mesh and the library
+            groups, whatever the number of foils; a second one scores kappa-fission for the power normalization.
+        - Rates of all positions, layers and reactions come from a single matrix product with the library.
+        - Channel air volumes are clipped by the lattice element: the 90 mm channel is wider than the pitch.
+    """
+    def __init__(self, lattice_str: list[list[str]], library: DosimetryLibrary, power: (float, None) = None,
+                 n_axial: int = 1, z_range: (tuple, None) = None, pitch: (float, None) = None) -> None:
+        self.lattice_str = [list(row) for row in lattice_str]
+        self.positions = channel_positions(self.lattice_str)
+        if not self.positions:
+            raise ValueError('The layout has no vertical channels')
+        self.library = library
+        self.power = power
+        self.n_axial = n_axial
+        self.z_range = z_range
+        self.pitch = pitch
+
+    def lattice_pitch(self) -> float:
+        if self.pitch is not None:
+            return self.pitch
+        from vr1.lattice_units import lattice_pitch
+        return lattice_pitch
+
+    def axial_range(self) -> tuple[float, float]:
+        if self.z_range is not None:
+            return self.z_range
+        from vr1.lattice_units import plane_zs
+        return plane_zs['FAZ.4'], plane_zs['FAZ.3']
+
+    def mesh_spec(self) -> dict:
+        half = 8 * self.lattice_pitch() / 2.0
+        z0, z1 = self.axial_range()
+        return {'lower_left': [-half, -half, z0], 'upper_right': [half, half, z1], 'dimension': [8, 8, self.n_axial]}
+
+    def tallies(self, core) -> list:
+        """ Channel spectrum and power tallies of a Lattice or Reactor core """
+        import openmc
+        spec = self.mesh_spec()
+        mesh = openmc.RegularMesh()
+        mesh.lower_left, mesh.upper_right, mesh.dimension = spec['lower_left'], spec['upper_right'], spec['dimension']
+        cells = [c for c in core.model.get_all_cells().values() if (c.name or '').startswith('channel_air')]
+        spectrum = openmc.Tally(name=channel_spectrum_tally_name)
+        spectrum.filters = [openmc.CellFilter(cells), openmc.MeshFilter(mesh), openmc.EnergyFilter(self.library.edges)]
+        spectrum.scores = ['flux']
+        power = openmc.Tally(name=power_tally_name)
+        power.scores = ['kappa-fission']
+        return [spectrum, power]
+
+    def layer_volume(self, code: str) -> float:
+        """ Air volume [cm3] of one axial layer of a channel, inside its lattice element """
+        z0, z1 = self.axial_range()
+        dz = (z1 - z0) / self.n_axial
+        return circle_in_square(channel_diameter(code) / 2.0, self.lattice_pitch() / 2.0) * dz
+
+    def spectra(self, mean: np.ndarray, std_dev: np.ndarray, kappa_fission: (float, None) = None) -> dict:
+        """Channel group fluxes from the spectrum tally.
+        Parameters:
+            - mean (np.ndarray): Spectrum tally mean, (cells x mesh x groups) bins.
+            - std_dev (np.ndarray): Its standard deviation.
+            - kappa_fission (float, None): Power tally [eV per source particle], needed with a power.
+        Returns:
+            - dict: 'flux' (P, n_axial, G) [1/cm2/s, or 1/cm2 per source particle], 'rel_err' and 'positions'."""
+        n_groups = len(self.library.edges) - 1
+        shape = (-1, self.n_axial, 8, 8, n_groups)
+        track = np.asarray(mean, dtype=float).reshape(shape).sum(axis=0)
+        var = (np.asarray(std_dev, dtype=float).reshape(shape) ** 2).sum(axis=0)
+        rows = np.array([7 - r for r, _, _ in self.positions])
+        cols = np.array([c for _, c, _ in self.positions])
+        volumes = np.array([self.layer_volume(code) for _, _, code in self.positions])
+        flux = track[:, rows, cols, :].transpose(1, 0, 2) / volumes[:, None, None]
+        std = np.sqrt(var[:, rows, cols, :]).transpose(1, 0, 2) / volumes[:, None, None]
+        if self.power is not None:
+            if not kappa_fission:
+                raise ValueError('Absolute channel fluxes need the kappa-fission tally')
+            flux, std = (a * self.power / (kappa_fission * ev_to_joule) for a in (flux, std))
+        rel = np.full(flux.shape, np.inf)
+        np.divide(std, flux, out=rel, where=flux > 0)
+        return {'positions': self.positions, 'flux': flux, 'rel_err': rel}
+
+    def read(self, statepoint: str) -> dict:
+        """ spectra() of a finished run """
+        import openmc
+        with openmc.StatePoint(statepoint) as sp:
+            tally = sp.get_tally(name=channel_spectrum_tally_name)
+            kappa = float(sp.get_tally(name=power_tally_name).mean.sum())
+            return self.spectra(tally.mean, tally.std_dev, kappa)
+
+    def rates(self, spectra: dict, reactions: (list[str], None) = None) -> dict:
+        """Reaction rates of library reactions at every channel position and layer.
+        Parameters:
+            - spectra (dict): From spectra() or read().
+            - reactions (list[str], None): Reactions to fold; the whole library if None.
+        Returns:
+            - dict: 'reactions', 'positions', 'rate' (P, n_axial, R) per target atom and 'rel_err' of it."""
+        names, xs, _ = self.library.matrix(reactions)
+        rate = fold(spectra['flux'], xs)
+        var = (spectra['flux'] * np.where(np.isfinite(spectra['rel_err']), spectra['rel_err'], 0.0)) ** 2
+        std = np.sqrt(fold(var, xs ** 2) * barn)  # groups independent
+        rel = np.full(rate.shape, np.inf)
+        np.divide(std, rate, out=rel, where=rate > 0)
+        return {'reactions': names, 'positions': spectra['positions'], 'rate': rate, 'rel_err': rel}
+
+    def foil_activities(self, spectra: dict, foils: list[dict], t_irradiation: float, t_decay: float = 0.0) -> list:
+        """Activities of irradiated foils.
+        Parameters:
+            - spectra (dict): From spectra() or read() with a power.
+            - foils (list[dict]): Each with 'name', 'reaction', 'atoms' (target atoms), 'position' ((row, col) or
+                channel code) and optionally 'layer' (axial layer, 0 at the bottom).
+            - t_irradiation (float): Irradiation time [s].
+            - t_decay (float): Cooling time [s].
+        Returns:
+            - list[dict]: Per foil its reaction rate per atom and activity [Bq]."""
+        from vr1.fixed_source import lattice_position
+        names = sorted({f['reaction'] for f in foils})
+        rates = self.rates(spectra, names)
+        _, _, half_lives = self.library.matrix(names)
+        keys = [(r, c) for r, c, _ in self.positions]
+        result: list[dict] = []
+        for foil in foils:
+            p = keys.index(lattice_position(self.lattice_str, foil['position']))
+            k = names.index(foil['reaction'])
+            rate = rates['rate'][p, foil.get('layer', 0), k]
+            result.append({'name': foil['name'], 'reaction': foil['reaction'], 'position': keys[p],
+                           'rate': float(rate), 'rel_err': float(rates['rel_err'][p, foil.get('layer', 0), k]),
+                           'activity': float(activity(rate, foil['atoms'], half_lives[k], t_irradiation, t_decay))})
+        return result
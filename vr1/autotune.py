@@ -0,0 +1,143 @@
+""" Throughput autotuner for threads, particles per generation and transport mode of a VR1 model """
+
+import copy
+import hashlib
+import json
+import os
+import platform
+import types
+from vr1.monitor import RunMonitor
+from vr1.utils import cache_dir, model_xml_hash
+
+
+def machine_id() -> str:
+    """ Short identifier of the local machine and OpenMC build used as part of the cache key """
+    import openmc
+    info = f'{os.uname()[1]}|{platform.machine()}|{platform.processor()}|{os.cpu_count()}|{openmc.__version__}'
+    return hashlib.sha256(info.encode()).hexdigest()[:16]
+
+
+def default_thread_counts() -> list[int]:
+    """ 1, a quarter, a half and all of the available cores """
+    n = os.cpu_count() or 1
+    return sorted({1, max(n // 4, 1), max(n // 2, 1), n})
+
+
+class AutoTuner:
+    """
+    Finds the threads / particles-per-generation / event-mode combination with the highest throughput for a model.
+    Parameters:
+        - writer (WriterOpenMC): Writer of the model to tune; its XML deck is (re)written by tune().
+        - threads (list[int], None): Thread counts to try; defaults to default_thread_counts().
+        - npgs (list[int], None): Particles per generation to try.
+        - event_modes (tuple[bool]): Transport modes to try, False is history-based, True event-based.
+        - batches (int): Batches of each calibration run.
+        - inactive (int): Inactive batches of each calibration run.
+        - objective (str): 'per_core' maximizes particles/s per thread, 'total' maximizes particles/s.
+    Processing Logic:
+        - Each candidate is a short eigenvalue run of the writer's own model in its own sub-directory,
+          measured by RunMonitor (active particles/s and peak memory of the OpenMC process).
+        - Results are cached per machine and model hash, so re-tuning an unchanged model is free.
+        - A failed calibration (e.g. event-based transport in an OpenMC build without it) is kept with its error
+            and shown by print_results(); best() only considers measured candidates.
+    """
+    def __init__(self, writer, threads: (list[int], None) = None, npgs: (list[int], None) = None,
+                 event_modes: tuple = (False, True), batches: int = 6, inactive: int = 3,
+                 objective: str = 'per_core') -> None:
+        if objective not in ('per_core', 'total'):
+            raise ValueError(f'Unknown objective {objective}')
+        self.writer = writer
+        self.threads: list[int] = threads if threads is not None else default_thread_counts()
+        self.npgs: list[int] = npgs if npgs is not None else [1000, 5000, 20000]
+        self.event_modes: tuple = event_modes
+        self.batches: int = batches
+        self.inactive: int = inactive
+        self.objective: str = objective
+        self.results: list[dict] = []
+
+    def cache_file(self) -> str:
+        """ Cache file of this machine and model """
+        return os.path.join(cache_dir('autotune'), f'{machine_id()}_{model_xml_hash(self.writer.output_dir)}.json')
+
+    def calibration_run(self, threads: int, npg: int, event_based: bool) -> dict:
+        """ Runs one short calibration of the writer's model and returns its measured throughput """
+        calib = copy.deepcopy(self.writer.openmc_model.settings)
+        calib.particles = npg
+        calib.batches = self.batches
+        calib.inactive = self.inactive
+        calib.event_based = event_based
+        calib.trigger_active = False
+        calib.statepoint = {'batches': [self.batches]}
+        run_dir = os.path.join(self.writer.output_dir, 'autotune',
+                               f't{threads}_n{npg}_{"event" if event_based else "history"}')
+        os.makedirs(run_dir, exist_ok=True)
+        model = copy.copy(self.writer.openmc_model)
+        model.settings = calib
+        model.export_to_model_xml(run_dir)
+        monitor = RunMonitor(types.SimpleNamespace(output_dir=run_dir, openmc_settings=calib),
+                             poll_statepoints=False)
+        error = None
+        try:
+            summary = monitor.run(threads=threads, event_based=event_based)
+        except RuntimeError as e:
+            # OpenMC exited with an error; the candidate is kept as failed, with the reason
+            error = str(e)
+            summary = monitor.summary()
+        rate = summary['rate_active'] if error is None else None
+        return {'threads': threads, 'npg': npg, 'event_based': event_based, 'rate': rate,
+                'rate_per_thread': rate / threads if rate else None, 'max_rss_mb': summary['max_rss_mb'],
+                'error': error}
+
+    def tune(self, use_cache: bool = True) -> dict:
+        """Runs (or loads from cache) all calibration runs.
+        Parameters:
+            - use_cache (bool): Reuse earlier results for the same machine and model.
+        Returns:
+            - dict: The recommended settings, see best()."""
+        self.writer.write_openmc_XML()
+        cache_file = self.cache_file()
+        cached: dict = {}
+        if use_cache and os.path.isfile(cache_file):
+            with open(cache_file) as f:
+                cached = {(r['threads'], r['npg'], r['event_based']): r for r in json.load(f)['results']}
+        self.results = []
+        for event_based in self.event_modes:
+            for npg in self.npgs:
+                for threads in self.threads:
+                    key = (threads, npg, event_based)
+                    if key not in cached:
+                        cached[key] = self.calibration_run(threads, npg, event_based)
+                    self.results.append(cached[key])
+        with open(cache_file, 'w') as f:
+            json.dump({'machine_id': machine_id(), 'model_hash': model_xml_hash(self.writer.output_dir),
+                       'results': list(cached.values())}, f, indent=1)
+        return self.best()
+
+    def best(self) -> dict:
+        """ Calibration result with the highest throughput according to the objective """
+        key = 'rate_per_thread' if self.objective == 'per_core' else 'rate'
+        measured = [r for r in self.results if r[key] and not r.get('error')]
+        if not measured:
+            errors = sorted({r['error'] for r in self.results if r.get('error')})
+            raise RuntimeError(f'No successful calibration runs{": " + "; ".join(errors) if errors else ""}, '
+                               f'call tune() first')
+        return max(measured, key=lambda r: r[key])
+
+    def apply(self, settings):
+        """ Writes the recommended npg, threads and transport mode into VR1Settings and returns them """
+        best = self.best()
+        settings.parm['npg'] = best['npg']
+        settings.threads = best['threads']
+        settings.event_based = best['event_based']
+        return settings
+
+    def print_results(self) -> None:
+        """ Prints all calibration results, best first """
+        key = 'rate_per_thread' if self.objective == 'per_core' else 'rate'
+        print(f'{"threads":>8} {"npg":>8} {"mode":>8} {"n/s":>12} {"n/s/thread":>12} {"MB":>8}')
+        for r in sorted(self.results, key=lambda r: r[key] or 0.0, reverse=True):
+            mode = 'event' if r['event_based'] else 'history'
+            rate = f'{r["rate"]:12.4g}' if r['rate'] else f'{"failed":>12}'
+            per_thread = f'{r["rate_per_thread"]:12.4g}' if r['rate_per_thread'] else f'{"":>12}'
+            error = f'  {r["error"]}' if r.get('error') else ''
+            print(f'{r["threads"]:>8} {r["npg"]:>8} {mode:>8} {rate} {per_thread} {r["max_rss_mb"] or 0:8.0f}{error}')
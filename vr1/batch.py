@@ -0,0 +1,207 @@
+""" Headless parallel compilation of many lattice layouts into OpenMC decks """
+
+import argparse
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import numpy as np
+from vr1.latlib import read_lat, iter_layouts, encode, validate, base_codes, LatticeLibrary, library_files
+from vr1.surrogate import layout_key
+
+batch_report_name: str = 'batch_report.json'
+# Per-process state of a worker: run settings, and the materials and universes shared by all decks it writes
+_worker: dict = {}
+
+
+def collect_configs(source: str) -> list[tuple[str, list[list[str]]]]:
+    """Named layouts from a lattice source.
+    Parameters:
+        - source (str): A LatticeLibrary directory, a directory of .lat files, a single .lat file, or a layout
+            stream file with one layout per line.
+    Returns:
+        - list[tuple]: (name, 8x8 layout) pairs; unnamed layouts are named by their layout_key()."""
+    if os.path.isdir(source):
+        if os.path.exists(os.path.join(source, library_files['codes'])):
+            library = LatticeLibrary(source)
+            names = library.names or [None] * len(library)
+            return [(n, library[i]) for i, n in enumerate(names)]
+        files = sorted(f for f in os.listdir(source) if f.endswith('.lat'))
+        return [(f[:-4], read_lat(os.path.join(source, f))) for f in files]
+    if source.endswith('.lat'):
+        return [(os.path.basename(source)[:-4], read_lat(source))]
+    return list((name, layout) for layout, name in iter_layouts(source))
+
+
+def deck_name(name: (str, None), layout: list[list[str]]) -> str:
+    """ Directory name of a configuration's deck: its name with unsafe characters replaced, or its layout key """
+    if not name:
+        return layout_key(layout)
+    return re.sub(r'[^\w.-]', '_', name)
+
+
+def _init_worker(settings) -> None:
+    """ Pool initializer: every worker keeps one settings object, one materials set and a universe cache """
+    _worker['settings'] = settings
+    _worker['universes'] = {}
+    _worker['materials'] = None
+
+
+def compile_config(name: str, layout: list[list[str]], output_root: str) -> dict:
+    """Builds one Lattice and writes its deck, reusing the worker's cached materials and universes.
+    Parameters:
+        - name (str): Deck directory name under output_root.
+        - layout (list[list[str]]): 8x8 layout.
+        - output_root (str): Directory of all decks.
+    Returns:
+        - dict: 'name', 'ok', 'seconds', 'pid' and, if the layout could not be built or written, 'error'.
+            Other exceptions are bugs of the writer, not of the configuration, and propagate."""
+    from vr1.core import Lattice
+    from vr1.materials import vr1_materials
+    from vr1.settings import VR1Settings
+    from vr1.writer import WriterOpenMC
+    start = time.perf_counter()
+    result = {'name': name, 'ok': True, 'pid': os.getpid()}
+    try:
+        if _worker.get('materials') is None:
+            # First deck of this process, or called outside a pool
+            _worker.setdefault('universes', {})
+            _worker['materials'] = vr1_materials.get_materials()
+            if _worker.get('settings') is None:
+                _worker['settings'] = VR1Settings()
+        core = Lattice(lattice_str=layout, universe_cache=_worker['universes'])
+        writer = WriterOpenMC(_worker['settings'], core, materials=_worker['materials'])
+        writer.output_dir = os.path.join(output_root, name)
+        writer.write_openmc_XML()
+    except (ValueError, OSError) as e:
+        result.update(ok=False, error=f'{type(e).__name__}: {e}')
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+class BatchCompiler:
+    """Compiles many lattice layouts into OpenMC decks with a pool of worker processes.
+    Parameters:
+        - output_dir (str): Directory receiving one deck directory per configuration and the batch report.
+        - settings (VR1Settings, None): Run settings of every deck; VR1Settings() if None.
+        - workers (int, None): Worker processes; os.cpu_count() if None.
+        - chunksize (int): Configurations handed to a worker at a time.
+    Processing Logic:
+        - Layouts are validated together (latlib.validate) before any OpenMC object is built; invalid ones are reported.
+        - Duplicate deck names are compiled once.
+        - Each worker builds its materials once and reuses a universe per lattice code across all of its decks,
+            instead of rebuilding every unit at every position in a fresh process per deck."""
+
+    def __init__(self, output_dir: str = 'decks', settings=None, workers: (int, None) = None, chunksize: int = 8):
+        self.output_dir = output_dir
+        self.settings = settings
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.chunksize = chunksize
+
+    def screen(self, configs: list[tuple[str, list[list[str]]]]) -> tuple[list, dict]:
+        """Splits configurations into unique valid ones and rejects.
+        Parameters:
+            - configs (list[tuple]): (name, layout) pairs, name may be None.
+        Returns:
+            - tuple: (list of (deck name, layout) to compile, dict of rejected deck name -> reason)."""
+        rejected: dict[str, str] = {}
+        shaped, todo = [], []
+        for i, (name, layout) in enumerate(configs):
+            if len(layout) != 8 or any(len(row) != 8 for row in layout):
+                rejected[name or f'#{i}'] = 'not 8x8'
+            else:
+                shaped.append((deck_name(name, layout), layout))
+        codes = list(base_codes)
+        ok = validate(encode([layout for _, layout in shaped], codes), codes) if shaped else []
+        seen: set = set()
+        for (name, layout), valid in zip(shaped, ok):
+            if not valid:
+                rejected[name] = 'unknown lattice codes'
+            elif name in seen:
+                rejected[name] = 'duplicate name'
+            else:
+                seen.add(name)
+                todo.append((name, layout))
+        return todo, rejected
+
+    def compile(self, configs: list[tuple[str, list[list[str]]]], verbose: bool = True) -> dict:
+        """Writes the decks of all valid configurations.
+        Parameters:
+            - configs (list[tuple]): (name, layout) pairs, e.g. from collect_configs().
+            - verbose (bool): Print progress and the throughput summary.
+        Returns:
+            - dict: Report with counts, rejects and failures, wall time and configurations per second;
+                also written to output_dir/batch_report.json."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        todo, rejected = self.screen(configs)
+        start = time.perf_counter()
+        results: list[dict] = []
+        if todo:
+            names, layouts = zip(*todo)
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                     initargs=(self.settings,)) as pool:
+                for r in pool.map(compile_config, names, layouts, repeat(self.output_dir), chunksize=self.chunksize):
+                    results.append(r)
+                    if verbose and len(results) % 100 == 0:
+                        rate = len(results) / (time.perf_counter() - start)
+                        print(f'{len(results)}/{len(todo)} decks, {rate:.1f} configs/s')
+        wall = time.perf_counter() - start
+        written = [r for r in results if r['ok']]
+        report = {
+            'output_dir': self.output_dir,
+            'workers': self.workers,
+            'n_configs': len(configs),
+            'n_written': len(written),
+            'n_failed': len(results) - len(written),
+            'n_rejected': len(rejected),
+            'wall_seconds': wall,
+            'configs_per_second': len(written) / wall if wall > 0 else float('nan'),
+            'mean_deck_seconds': float(np.mean([r['seconds'] for r in written])) if written else float('nan'),
+            'decks_per_worker': {str(pid): sum(r['pid'] == pid for r in results)
+                                 for pid in {r['pid'] for r in results}},
+            'rejected': rejected,
+            'failed': {r['name']: r['error'] for r in results if not r['ok']},
+        }
+        with open(os.path.join(self.output_dir, batch_report_name), 'w') as f:
+            json.dump(report, f, indent=2)
+        if verbose:
+            print_report(report)
+        return report
+
+
+def print_report(report: dict) -> None:
+    """ Prints the throughput summary of a batch """
+    print(f"{report['n_written']}/{report['n_configs']} decks written to {report['output_dir']} "
+          f"in {report['wall_seconds']:.1f} s with {report['workers']} workers: "
+          f"{report['configs_per_second']:.2f} configs/s, {report['mean_deck_seconds']:.3f} s per deck in a worker")
+    for name, reason in list(report['rejected'].items())[:20]:
+        print(f'  rejected {name}: {reason}')
+    for name, error in list(report['failed'].items())[:20]:
+        print(f'  failed {name}: {error}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile VR1 lattice layouts into OpenMC decks in parallel')
+    parser.add_argument('source', help='Lattice library directory, directory of .lat files, .lat file or layout stream')
+    parser.add_argument('-o', '--output', default='decks', help='Output directory, one deck directory per layout')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='Worker processes (default: all CPUs)')
+    parser.add_argument('--chunksize', type=int, default=8)
+    parser.add_argument('--particles', type=int, default=None)
+    parser.add_argument('--batches', type=int, default=None)
+    parser.add_argument('--inactive', type=int, default=None)
+    args = parser.parse_args()
+    from vr1.settings import VR1Settings
+    settings = VR1Settings()
+    for key, value in (('npg', args.particles), ('batches', args.batches), ('inactive', args.inactive)):
+        if value is not None:
+            settings.parm[key] = value
+    report = BatchCompiler(args.output, settings, args.workers, args.chunksize).compile(collect_configs(args.source))
+    if report['n_failed']:
+        raise SystemExit(f"{report['n_failed']} of {report['n_configs']} configurations failed, "
+                         f"see {os.path.join(args.output, batch_report_name)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+""" Checkpoint registry and restart of interrupted VR1 OpenMC runs
+
+Usage:
+    python -m vr1.checkpoint list <model_hash>
+    python -m vr1.checkpoint restart <model_hash or run directory> [--threads N] [--event]
+"""
+
+import argparse
+import json
+import os
+import types
+import xml.etree.ElementTree as ET
+from vr1.monitor import RunMonitor, latest_statepoint, restart_point, statepoint_batch
+from vr1.utils import cache_dir
+
+
+def checkpoint_batches(batches: int, interval: int) -> list[int]:
+    """ Batches at which a statepoint is written: every `interval` batches and the last one """
+    if interval < 1:
+        raise ValueError(f'Checkpoint interval must be a positive number of batches, not {interval}')
+    return sorted(set(range(interval, batches + 1, interval)) | {batches})
+
+
+def registry_file(model_hash: str) -> str:
+    """ JSON file listing the run directories of a model """
+    return os.path.join(cache_dir('checkpoints'), f'{model_hash}.json')
+
+
+def register_checkpoint_dir(model_hash: str, run_dir: str) -> None:
+    """ Records that the model with this hash is being run in run_dir """
+    run_dirs = registered_dirs(model_hash)
+    run_dir = os.path.abspath(run_dir)
+    if run_dir not in run_dirs:
+        run_dirs.append(run_dir)
+        with open(registry_file(model_hash), 'w') as f:
+            json.dump(run_dirs, f, indent=1)
+
+
+def registered_dirs(model_hash: str) -> list[str]:
+    """ Run directories recorded for a model hash """
+    if not os.path.isfile(registry_file(model_hash)):
+        return []
+    with open(registry_file(model_hash)) as f:
+        return json.load(f)
+
+
+def find_latest_checkpoint(model_hash: str) -> (tuple[str, str], None):
+    """Finds the most advanced statepoint a run of a model can continue from, among its registered run directories.
+    Parameters:
+        - model_hash (str): vr1.utils.model_xml_hash() of the model.
+    Returns:
+        - tuple or None: (run directory, statepoint file), or None if every run finished or none has a checkpoint.
+            Finished runs are skipped, so a completed directory does not hide an interrupted one."""
+    best = None
+    for run_dir in registered_dirs(model_hash):
+        if not os.path.isfile(os.path.join(run_dir, 'model.xml')):
+            continue
+        sp_file = restart_point(run_dir, deck_batches(run_dir))
+        if sp_file is None or sp_file != latest_statepoint(run_dir):
+            # No checkpoint, or the run already wrote its final statepoint
+            continue
+        if best is None or statepoint_batch(sp_file) > statepoint_batch(best[1]):
+            best = (run_dir, sp_file)
+    return best
+
+
+def deck_batches(run_dir: str) -> int:
+    """ Number of batches set in the model.xml deck of a run directory """
+    return int(ET.parse(os.path.join(run_dir, 'model.xml')).getroot().find('settings').findtext('batches'))
+
+
+def read_settings(run_dir: str):
+    """ openmc.Settings of the model.xml deck in a run directory """
+    import openmc
+    tree = ET.parse(os.path.join(run_dir, 'model.xml'))
+    return openmc.Settings.from_xml_element(tree.getroot().find('settings'))
+
+
+def restart(target: str, threads: (int, None) = None, event_based: bool = False, echo: bool = True) -> dict:
+    """Continues a run from its latest checkpoint.
+    Parameters:
+        - target (str): Model hash, or a run directory.
+        - threads (int, None): Number of OpenMP threads.
+        - event_based (bool): Use event-based transport.
+        - echo (bool): Print OpenMC output.
+    Returns:
+        - dict: RunMonitor summary of the continued run; its batches are appended to the run's record."""
+    from vr1.cmfd import cmfd_command, read_spec
+    if os.path.isdir(target):
+        run_dir, sp_file = target, latest_statepoint(target)
+        if sp_file is None:
+            raise ValueError(f'No statepoint in {target} to restart from')
+    else:
+        found = find_latest_checkpoint(target)
+        if found is None:
+            raise ValueError(f'No interrupted run with a checkpoint found for model {target}')
+        run_dir, sp_file = found
+    settings = read_settings(run_dir)
+    if statepoint_batch(sp_file) >= settings.batches:
+        print(f'{sp_file} is the final statepoint, nothing to restart')
+        return {}
+    print(f'Restarting {run_dir} from {os.path.basename(sp_file)}')
+    monitor = RunMonitor(types.SimpleNamespace(output_dir=run_dir, openmc_settings=settings),
+                         metadata={'restarted_from': os.path.basename(sp_file)}, resume=True)
+    command_line = None
+    if read_spec(run_dir) is not None:
+        command_line = cmfd_command(threads=threads, event_based=event_based, restart_file=os.path.basename(sp_file))
+    return monitor.run(threads=threads, event_based=event_based, restart_file=os.path.basename(sp_file), echo=echo,
+                       command_line=command_line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Checkpoints of VR1 OpenMC runs')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_list = sub.add_parser('list', help='List run directories and their latest statepoint for a model hash')
+    p_list.add_argument('model_hash')
+    p_restart = sub.add_parser('restart', help='Continue a run from its latest checkpoint')
+    p_restart.add_argument('target', help='Model hash or run directory')
+    p_restart.add_argument('--threads', type=int, default=None)
+    p_restart.add_argument('--event', action='store_true', help='Event-based transport')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for run_dir in registered_dirs(args.model_hash):
+            sp_file = latest_statepoint(run_dir)
+            print(f'{run_dir}: {os.path.basename(sp_file) if sp_file else "no statepoint"}')
+    else:
+        restart(args.target, threads=args.threads, event_based=args.event)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+""" CMFD acceleration of VR1 eigenvalue runs on a coarse mesh aligned with the core lattice
+
+Usage (normally started by WriterOpenMC.run() in the run directory):
+    python -m vr1.cmfd <run directory> [--threads N] [--event] [--restart statepoint.h5]
+"""
+
+import argparse
+import copy
+import json
+import os
+import sys
+import types
+import numpy as np
+from vr1.monitor import RunMonitor, latest_statepoint
+
+cmfd_spec_name: str = 'cmfd.json'
+# Axial zone boundaries of the coarse mesh, from the bottom of the lattice box to its top
+cmfd_z_planes: list[str] = ['H01.sc', 'GRD.zd', 'GRD.zt', 'FAZ.5', 'FAZ.4', 'FAZ.3', 'FAZ.2']
+# Default CMFD options, any of them can be overridden through VR1Settings(cmfd={...})
+cmfd_defaults: dict = {
+    'active_zones': 6,          # axial zones the active fuel height is split into
+    'energy': [0.0, 0.625, 2.0e7],
+    'albedo': None,             # (x-, x+, y-, y+, z-, z+), vacuum lattice box if None
+    'exclude_codes': [],        # lattice codes left out of the acceleration map
+    'tally_begin': 1,
+    'solver_begin': 3,
+    'feedback': True,
+    'window_type': 'expanding',
+    'entropy_zones': 8,         # axial bins of the Shannon entropy mesh
+}
+
+
+def lattice_xy_grid(n: int = 8, pitch: (float, None) = None) -> np.ndarray:
+    """ Lattice cell boundaries in x (and y), the same grid as Lattice.build(); pitch from vr1.lattice_units if None """
+    if pitch is None:
+        from vr1.lattice_units import lattice_pitch
+        pitch = lattice_pitch
+    xy_corner = float(n) * pitch / 2.0
+    return -xy_corner + pitch * np.arange(n + 1)
+
+
+def axial_grid(active_zones: int = 6, planes: (dict, None) = None) -> np.ndarray:
+    """Axial boundaries of the coarse mesh.
+    Parameters:
+        - active_zones (int): Number of equal zones the active fuel height (FAZ.4 to FAZ.3) is split into.
+        - planes (dict, None): Heights [cm] of the cmfd_z_planes; vr1.lattice_units.plane_zs if None.
+    Returns:
+        - np.ndarray: Increasing z boundaries from the bottom to the top of the lattice box."""
+    if active_zones < 1:
+        raise ValueError(f'Need at least one active fuel zone, not {active_zones}')
+    if planes is None:
+        from vr1.lattice_units import plane_zs as planes
+    zs = {planes[p] for p in cmfd_z_planes}
+    zs |= set(np.linspace(planes['FAZ.4'], planes['FAZ.3'], active_zones + 1))
+    return np.array(sorted(zs))
+
+
+def coremap(lattice_str: list[list[str]], nz: int, exclude_codes: (list, tuple) = ()) -> np.ndarray:
+    """Acceleration map of the coarse mesh.
+    Parameters:
+        - lattice_str (list[list[str]]): 8x8 lattice layout, row 0 at the top (largest y).
+        - nz (int): Number of axial zones.
+        - exclude_codes (list, tuple): Lattice codes whose mesh cells are not accelerated.
+    Returns:
+        - np.ndarray: (nz, ny, nx) array of 1 (accelerated) and 0, in the order CMFDMesh.map expects when flattened."""
+    flags = np.array([[0 if code in exclude_codes else 1 for code in row] for row in lattice_str], dtype=int)
+    # Mesh index iy = 0 is the bottom row of the lattice
+    return np.broadcast_to(flags[::-1, :], (nz,) + flags.shape).copy()
+
+
+def cmfd_spec(lattice_str: list[list[str]], options: (dict, None) = None) -> dict:
+    """JSON-serializable description of the CMFD setup of a lattice.
+    Parameters:
+        - lattice_str (list[list[str]]): 8x8 lattice layout of the core.
+        - options (dict, None): Overrides of `cmfd_defaults`.
+    Returns:
+        - dict: Mesh grid, albedo, map and the CMFDRun options."""
+    spec = dict(cmfd_defaults)
+    if options:
+        unknown = set(options) - set(cmfd_defaults)
+        if unknown:
+            raise ValueError(f'Unknown CMFD options {sorted(unknown)}')
+        spec.update(options)
+    xy = lattice_xy_grid(len(lattice_str))
+    z = axial_grid(spec['active_zones'])
+    if spec['albedo'] is None:
+        # The lattice box has vacuum boundaries on all six faces
+        spec['albedo'] = [0.0] * 6
+    if len(spec['albedo']) != 6:
+        raise ValueError('CMFD albedo needs 6 values (x-, x+, y-, y+, z-, z+)')
+    spec['grid'] = [xy.tolist(), xy.tolist(), z.tolist()]
+    spec['map'] = coremap(lattice_str, len(z) - 1, spec['exclude_codes']).ravel().tolist()
+    return spec
+
+
+def cmfd_mesh(spec: dict):
+    """ openmc.cmfd.CMFDMesh of a spec made by cmfd_spec() """
+    from openmc.cmfd import CMFDMesh
+    mesh = CMFDMesh()
+    mesh.mesh_type = 'rectilinear'
+    mesh.grid = [np.array(g) for g in spec['grid']]
+    mesh.energy = spec['energy']
+    mesh.albedo = spec['albedo']
+    mesh.map = spec['map']
+    return mesh
+
+
+def entropy_mesh(spec: dict):
+    """ Shannon entropy openmc.RegularMesh over the lattice box: lattice cells radially, uniform zones axially """
+    import openmc
+    x, y, z = spec['grid']
+    mesh = openmc.RegularMesh(name='cmfd entropy')
+    mesh.lower_left = (x[0], y[0], z[0])
+    mesh.upper_right = (x[-1], y[-1], z[-1])
+    mesh.dimension = (len(x) - 1, len(y) - 1, spec['entropy_zones'])
+    return mesh
+
+
+def write_spec(spec: dict, run_dir: str) -> None:
+    """ Stores the CMFD spec next to model.xml """
+    with open(os.path.join(run_dir, cmfd_spec_name), 'w') as f:
+        json.dump(spec, f, indent=1)
+
+
+def read_spec(run_dir: str) -> (dict, None):
+    """ CMFD spec of a run directory, None if the run does not use CMFD """
+    spec_file = os.path.join(run_dir, cmfd_spec_name)
+    if not os.path.isfile(spec_file):
+        return None
+    with open(spec_file) as f:
+        return json.load(f)
+
+
+def cmfd_command(run_dir: str = '.', threads: (int, None) = None, event_based: bool = False,
+                 restart_file: (str, None) = None) -> list[str]:
+    """ Command line running this module's driver, used by RunMonitor in place of the OpenMC executable """
+    cmd: list[str] = [sys.executable, '-m', 'vr1.cmfd', run_dir]
+    if threads:
+        cmd += ['--threads', str(threads)]
+    if event_based:
+        cmd.append('--event')
+    if restart_file:
+        cmd += ['--restart', restart_file]
+    return cmd
+
+
+def run_cmfd(run_dir: str, threads: (int, None) = None, event_based: bool = False,
+             restart_file: (str, None) = None) -> None:
+    """Runs the model in run_dir in-process with CMFD feedback through openmc.lib.
+    Parameters:
+        - run_dir (str): Directory with model.xml and cmfd.json.
+        - threads (int, None): Number of OpenMP threads.
+        - event_based (bool): Use event-based transport.
+        - restart_file (str, None): Statepoint to restart the run from."""
+    from openmc.cmfd import CMFDRun
+    spec = read_spec(run_dir)
+    if spec is None:
+        raise ValueError(f'No {cmfd_spec_name} in {run_dir}')
+    cmfd_run = CMFDRun()
+    cmfd_run.mesh = cmfd_mesh(spec)
+    cmfd_run.tally_begin = spec['tally_begin']
+    cmfd_run.solver_begin = spec['solver_begin']
+    cmfd_run.feedback = spec['feedback']
+    cmfd_run.window_type = spec['window_type']
+    cmfd_run.display = {'balance': False, 'dominance': True, 'entropy': True, 'source': False}
+    args: list[str] = [run_dir]
+    if threads:
+        args += ['-s', str(threads)]
+    if event_based:
+        args.append('-e')
+    if restart_file:
+        args += ['-r', restart_file]
+    cmfd_run.run(args=args)
+
+
+def entropy_converged_batch(entropy: np.ndarray, gens_per_batch: int = 1, n_sigma: float = 3.0,
+                            rel_tol: float = 1.0e-3) -> (int, None):
+    """First batch after which the Shannon entropy stays within its stationary band.
+    Parameters:
+        - entropy (np.ndarray): Entropy of every generation.
+        - gens_per_batch (int): Generations per batch.
+        - n_sigma (float): Width of the band in standard deviations of the entropy over the second half of the run.
+        - rel_tol (float): Minimum relative half-width of the band.
+    Returns:
+        - int or None: Batch number, None if the entropy is still drifting at the end of the run."""
+    entropy = np.asarray(entropy, dtype=float)
+    if entropy.size < 4:
+        return None
+    tail = entropy[entropy.size // 2:]
+    band = max(n_sigma * tail.std(), rel_tol * abs(tail.mean()))
+    outside = np.nonzero(np.abs(entropy - tail.mean()) > band)[0]
+    first = int(outside[-1]) + 1 if outside.size else 0
+    if first >= entropy.size // 2:
+        return None
+    return int(np.ceil((first + 1) / gens_per_batch))
+
+
+def statepoint_entropy(run_dir: str) -> np.ndarray:
+    """ Entropy of every generation stored in the latest statepoint of a run directory """
+    import openmc
+    sp_file = latest_statepoint(run_dir)
+    if sp_file is None:
+        raise ValueError(f'No statepoint in {run_dir}')
+    with openmc.StatePoint(sp_file, autolink=False) as sp:
+        if sp.entropy is None:
+            raise ValueError(f'{sp_file} has no Shannon entropy, set an entropy mesh')
+        return np.array(sp.entropy)
+
+
+def inactive_report(reference_dir: str, cmfd_dir: str, gens_per_batch: int = 1, margin: int = 2) -> dict:
+    """Compares fission source convergence of a run without and with CMFD.
+    Parameters:
+        - reference_dir (str): Run directory without CMFD.
+        - cmfd_dir (str): Run directory of the same model with CMFD.
+        - gens_per_batch (int): Generations per batch of both runs.
+        - margin (int): Batches added to the converged batch for the recommended number of inactive batches.
+    Returns:
+        - dict: Entropy-converged batch of both runs, batches saved and the recommended inactive batches with CMFD."""
+    ref = entropy_converged_batch(statepoint_entropy(reference_dir), gens_per_batch)
+    acc = entropy_converged_batch(statepoint_entropy(cmfd_dir), gens_per_batch)
+    return {'reference_converged_batch': ref, 'cmfd_converged_batch': acc,
+            'saved_batches': ref - acc if ref is not None and acc is not None else None,
+            'recommended_inactive': acc + margin if acc is not None else None}
+
+
+def compare_cmfd(writer, threads: (int, None) = None, batches: (int, None) = None) -> dict:
+    """Runs the writer's model without and with CMFD and reports the reduction of inactive batches.
+    Parameters:
+        - writer (WriterOpenMC): Writer of a Lattice model; settings.cmfd gives the CMFD options.
+        - threads (int, None): Number of OpenMP threads of both runs.
+        - batches (int, None): All-inactive batches of both runs; the writer's batch count if None.
+    Returns:
+        - dict: inactive_report() of the two runs."""
+    writer.write_openmc_XML()
+    spec = cmfd_spec(writer.core.lattice_str, writer.settings.cmfd if isinstance(writer.settings.cmfd, dict) else None)
+    settings = copy.deepcopy(writer.openmc_model.settings)
+    if batches is not None:
+        settings.batches = batches
+    # Only the source convergence is compared, so no batch is active except the last one
+    settings.inactive = settings.batches - 1
+    settings.trigger_active = False
+    settings.statepoint = {'batches': [settings.batches]}
+    settings.entropy_mesh = entropy_mesh(spec)
+    run_dirs: dict = {}
+    for mode in ('reference', 'cmfd'):
+        run_dir = os.path.join(writer.output_dir, f'cmfd_compare_{mode}')
+        os.makedirs(run_dir, exist_ok=True)
+        model = copy.copy(writer.openmc_model)
+        model.settings = settings
+        model.export_to_model_xml(run_dir)
+        monitor = RunMonitor(types.SimpleNamespace(output_dir=run_dir, openmc_settings=settings),
+                             poll_statepoints=False)
+        if mode == 'cmfd':
+            write_spec(spec, run_dir)
+            monitor.run(threads=threads, command_line=cmfd_command(threads=threads))
+        else:
+            monitor.run(threads=threads)
+        run_dirs[mode] = run_dir
+    return inactive_report(run_dirs['reference'], run_dirs['cmfd'], settings.generations_per_batch or 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a VR1 OpenMC model with CMFD acceleration')
+    parser.add_argument('run_dir', help='Directory with model.xml and cmfd.json')
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--event', action='store_true', help='Event-based transport')
+    parser.add_argument('--restart', default=None, help='Statepoint to restart from')
+    args = parser.parse_args()
+    run_cmfd(args.run_dir, threads=args.threads, event_based=args.event, restart_file=args.restart)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+""" Reactivity coefficients of VR1 from OpenMC tally derivatives in one eigenvalue run """
+
+import copy
+import json
+import os
+import numpy as np
+
+# Coefficients: VR1Materials attribute, openmc.TallyDerivative variable (and nuclide), direct-perturbation step
+coefficient_specs: dict[str, dict] = {
+    'moderator density': {'material': 'water', 'variable': 'density', 'step': 0.01, 'relative': True},
+    'fuel density': {'material': 'fuel', 'variable': 'density', 'step': 0.01, 'relative': True},
+    'U235 density': {'material': 'fuel', 'variable': 'nuclide_density', 'nuclide': 'U235', 'step': 0.02,
+                     'relative': True},
+    'fuel temperature': {'material': 'fuel', 'variable': 'temperature', 'step': 50.0, 'relative': False},
+}
+# d(water density)/dT [g/cm3/K] at 20 C, turning the moderator density coefficient into its temperature part
+water_density_slope: float = -2.07e-4
+base_tally_name: str = 'k nu-fission'
+validation_json_name: str = 'coefficients_validation.json'
+
+
+def parameter_value(material, spec: dict) -> float:
+    """ Current value of the perturbed parameter: g/cm3, atom/b-cm or K """
+    if spec['variable'] == 'density':
+        if material.density_units != 'g/cm3':
+            raise ValueError(f'Density derivative of {material.name} needs a density in g/cm3')
+        return float(material.density)
+    if spec['variable'] == 'nuclide_density':
+        return float(material.get_nuclide_atom_densities()[spec['nuclide']])
+    return float(material.temperature)
+
+
+def perturb(material, spec: dict, delta: float) -> None:
+    """Changes the perturbed parameter of a material in place.
+    Parameters:
+        - material (openmc.Material): Material of a private VR1Materials copy.
+        - spec (dict): Entry of coefficient_specs.
+        - delta (float): Absolute change in the parameter's unit."""
+    value = parameter_value(material, spec) + delta
+    if spec['variable'] == 'density':
+        material.set_density('g/cm3', value)
+    elif spec['variable'] == 'nuclide_density':
+        densities = material.get_nuclide_atom_densities()
+        densities[spec['nuclide']] = value
+        for nuclide in list(densities):
+            material.remove_nuclide(nuclide)
+        for nuclide, density in densities.items():
+            material.add_nuclide(nuclide, density, 'ao')
+        material.set_density('sum')
+    else:
+        material.temperature = value
+
+
+def reactivity_coefficient(k: float, k_std: float, dk: float, dk_std: float, value: float) -> dict:
+    """First-order reactivity coefficient from dk/dp.
+    Parameters:
+        - k (float): Multiplication factor of the base state.
+        - k_std (float): Its standard deviation.
+        - dk (float): dk/dp, per unit of the parameter p.
+        - dk_std (float): Its standard deviation.
+        - value (float): Base value of p.
+    Returns:
+        - dict: 'dk_dp', 'drho_dp' in pcm per unit of p and 'drho_dlnp' in pcm per % change of p, with standard
+            deviations; k and dk are taken as uncorrelated."""
+    drho = dk / k ** 2
+    rel = np.hypot(dk_std / dk if dk else 0.0, 2.0 * k_std / k)
+    drho_std = abs(drho) * rel if dk else dk_std / k ** 2
+    return {'dk_dp': dk, 'dk_dp_std': dk_std, 'drho_dp': 1e5 * drho, 'drho_dp_std': 1e5 * drho_std,
+            'drho_dlnp': 1e3 * drho * value, 'drho_dlnp_std': 1e3 * drho_std * abs(value), 'value': value}
+
+
+def central_difference(k_plus: float, std_plus: float, k_minus: float, std_minus: float, delta: float) -> tuple:
+    """ dk/dp and its standard deviation from two runs at p + delta and p - delta """
+    return (k_plus - k_minus) / (2.0 * delta), np.hypot(std_plus, std_minus) / (2.0 * delta)
+
+
+def agreement(a: float, a_std: float, b: float, b_std: float) -> float:
+    """ Difference of two estimates in combined standard deviations """
+    sigma = np.hypot(a_std, b_std)
+    return float((a - b) / sigma) if sigma > 0 else float('inf') if a != b else 0.0
+
+
+class ReactivityCoefficients:
+    """
+    Reactivity coefficients from tally derivatives of one eigenvalue run, with validation by direct perturbation.
+    Parameters:
+        - lattice_str (list[list[str]]): Core layout.
+        - coefficients (list[str], None): Keys of coefficient_specs; all if None.
+        - settings (VR1Settings, None): Base eigenvalue settings, copied for every run.
+        - output_dir (str): Directory of the derivative run; validation runs go to sub-directories.
+        - threads (int, None): OpenMP threads.
+    Processing Logic:
+        - Every source particle of an eigenvalue run ends in absorption or leakage, so the nu-fission tally per
+            source particle estimates k and its derivative tally estimates dk/dp, neglecting the perturbation of
+            the fission source shape (first order).
+        - Each run has its own VR1Materials, so perturbations never touch the shared vr1_materials.
+        - Temperature derivatives cover the resonance (Doppler) part through multipole data; S(a,b) temperature
+            effects of water are not differentiable, and the moderator temperature coefficient is given through
+            its density part instead.
+    """
+    def __init__(self, lattice_str: list[list[str]], coefficients: (list[str], None) = None, settings=None,
+                 output_dir: str = 'coefficients', threads: (int, None) = None) -> None:
+        self.coefficients: list[str] = list(coefficient_specs) if coefficients is None else list(coefficients)
+        unknown = [c for c in self.coefficients if c not in coefficient_specs]
+        if unknown:
+            raise ValueError(f'Unknown coefficients {unknown}, use {list(coefficient_specs)}')
+        self.lattice_str = [list(row) for row in lattice_str]
+        self.settings = settings
+        self.output_dir = output_dir
+        self.threads = threads
+        self.values: dict[str, float] = {}
+
+    def tallies(self, materials) -> list:
+        """ Base nu-fission tally and one derivative tally per coefficient, for a VR1Materials instance """
+        import openmc
+        base = openmc.Tally(name=base_tally_name)
+        base.scores = ['nu-fission']
+        tallies = [base]
+        for name in self.coefficients:
+            spec = coefficient_specs[name]
+            tally = openmc.Tally(name=f'd{base_tally_name} / d {name}')
+            tally.scores = ['nu-fission']
+            tally.derivative = openmc.TallyDerivative(variable=spec['variable'],
+                                                      material=getattr(materials, spec['material']).id,
+                                                      nuclide=spec.get('nuclide'))
+            tallies.append(tally)
+        return tallies
+
+    def writer(self, output_dir: str, derivatives: bool = True, name: (str, None) = None, delta: float = 0.0):
+        """Writes one eigenvalue deck.
+        Parameters:
+            - output_dir (str): Run directory.
+            - derivatives (bool): Add the base and derivative tallies.
+            - name (str, None): Coefficient whose parameter is perturbed by delta, none if None.
+            - delta (float): Absolute change of the parameter.
+        Returns:
+            - WriterOpenMC: Writer whose deck is written."""
+        from vr1.core import Lattice
+        from vr1.materials import VR1Materials
+        from vr1.settings import VR1Settings
+        from vr1.writer import WriterOpenMC
+        materials = VR1Materials()
+        for c in self.coefficients:
+            self.values[c] = parameter_value(getattr(materials, coefficient_specs[c]['material']),
+                                             coefficient_specs[c])
+        if name is not None:
+            perturb(getattr(materials, coefficient_specs[name]['material']), coefficient_specs[name], delta)
+        settings = copy.copy(self.settings) if self.settings is not None else VR1Settings()
+        settings.run_mode = 'eigenvalue'
+        if derivatives:
+            settings.tallies = list(settings.tallies or []) + self.tallies(materials)
+            if any(coefficient_specs[c]['variable'] == 'temperature' for c in self.coefficients):
+                settings.multipole = True
+        writer = WriterOpenMC(settings, Lattice(materials, lattice_str=self.lattice_str), materials.get_materials())
+        writer.output_dir = output_dir
+        writer.write_openmc_XML()
+        return writer
+
+    def results(self, statepoint: str) -> dict:
+        """Coefficients of a finished derivative run.
+        Parameters:
+            - statepoint (str): Final statepoint.
+        Returns:
+            - dict: {coefficient: reactivity_coefficient()} and 'k' of the base tally; with the density part of the
+                moderator temperature coefficient in pcm/K if the moderator density coefficient was tallied."""
+        import openmc
+        with openmc.StatePoint(statepoint) as sp:
+            base = sp.get_tally(name=base_tally_name)
+            k, k_std = float(base.mean.sum()), float(np.sqrt((base.std_dev ** 2).sum()))
+            result: dict = {'k': k, 'k_std': k_std}
+            for name in self.coefficients:
+                tally = sp.get_tally(name=f'd{base_tally_name} / d {name}')
+                dk, dk_std = float(tally.mean.sum()), float(np.sqrt((tally.std_dev ** 2).sum()))
+                result[name] = reactivity_coefficient(k, k_std, dk, dk_std, self.values[name])
+        if 'moderator density' in result:
+            c = result['moderator density']
+            result['moderator temperature (density part)'] = {
+                'drho_dT': c['drho_dp'] * water_density_slope, 'drho_dT_std': c['drho_dp_std'] * -water_density_slope}
+        return result
+
+    def run(self) -> dict:
+        """ Runs the derivative deck and returns results() """
+        from vr1.monitor import latest_statepoint
+        writer = self.writer(self.output_dir)
+        writer.run(threads=self.threads, write=False)
+        return self.results(latest_statepoint(self.output_dir))
+
+    def validate(self, derivative_results: (dict, None) = None, steps: (dict, None) = None) -> dict:
+        """Direct-perturbation check of the derivatives: two runs per coefficient at p +- step.
+        Parameters:
+            - derivative_results (dict, None): results() of the derivative run; run() first if None.
+            - steps (dict, None): {coefficient: step} overriding coefficient_specs, relative or absolute as there.
+        Returns:
+            - dict: {coefficient: derivative and direct dk/dp with standard deviations and their difference in
+                sigmas}; also written to output_dir/coefficients_validation.json."""
+        derivative_results = self.run() if derivative_results is None else derivative_results
+        steps = steps if steps is not None else {}
+        validation: dict = {}
+        for name in self.coefficients:
+            spec = coefficient_specs[name]
+            step = steps.get(name, spec['step'])
+            delta = step * self.values[name] if spec['relative'] else step
+            k: dict = {}
+            for sign, label in ((1.0, 'plus'), (-1.0, 'minus')):
+                writer = self.writer(os.path.join(self.output_dir, f'{name.replace(" ", "_")}_{label}'),
+                                     derivatives=False, name=name, delta=sign * delta)
+                summary = writer.run(threads=self.threads, write=False)
+                k[label] = (summary['keff'], summary['keff_std'])
+            direct, direct_std = central_difference(*k['plus'], *k['minus'], delta)
+            c = derivative_results[name]
+            validation[name] = {'delta': delta, 'k_plus': k['plus'], 'k_minus': k['minus'],
+                                'derivative': c['dk_dp'], 'derivative_std': c['dk_dp_std'],
+                                'direct': direct, 'direct_std': direct_std,
+                                'sigmas': agreement(c['dk_dp'], c['dk_dp_std'], direct, direct_std)}
+        with open(os.path.join(self.output_dir, validation_json_name), 'w') as f:
+            json.dump({'derivative': derivative_results, 'validation': validation}, f, indent=2, default=float)
+        return validation
@@ -114,15 +114,19 @@ class Lattice(VR1core):
             new_lattice_str[-1][i] = 'wrc'
         return new_lattice_str
 
-    def __init__(self, materials : VR1Materials = vr1_materials, lattice_str: list[list[str]] = None, preset=False):
+    def __init__(self, materials : VR1Materials = vr1_materials, lattice_str: list[list[str]] = None, preset=False,
+                 universe_cache: (dict, None) = None):
         """Initializes an instance of a lattice-based geometry with specified or preset configurations.
         Parameters:
             - materials (VR1Materials): The materials to be used within the lattice structure.
             - lattice_str (list[list[str]], optional): A 2D list representing the layout of the lattice. Defaults to None.
             - preset (bool, optional): If True and lattice_str is None, uses a preset lattice configuration. Defaults to False.
+            - universe_cache (dict, None): Lattice code -> universe, shared between positions and Lattice objects;
+                every position gets its own universe if None.
         Returns:
             - None: This is a constructor method; it initializes the instance and does not return a value."""
         super().__init__(materials)
+        self.universe_cache = universe_cache
         if lattice_str is None:
             if preset is False:
                 raise ValueError('Must specify lattice string or provide a preset lattice')
@@ -145,7 +149,13 @@ class Lattice(VR1core):
         for i in range(n):
             _l: list[openmc.UniverseBase] = []
             for j in range(n):
-                _l.append(lattice_builder.get(self.lattice_str[i][j]))
+                code = self.lattice_str[i][j]
+                if self.universe_cache is None:
+                    _l.append(lattice_builder.get(code))
+                else:
+                    if code not in self.universe_cache:
+                        self.universe_cache[code] = lattice_builder.get(code)
+                    _l.append(self.universe_cache[code])
             lattice_array.append(_l)
 
             z += 1
@@ -156,7 +166,7 @@ class Lattice(VR1core):
         lattice_box = openmc.model.RectangularParallelepiped(-xy_corner, xy_corner, -xy_corner, xy_corner, z0, z1,boundary_type='vacuum')
         lattice_cell = openmc.Cell(fill=self.lattice, region=-lattice_box)
         self.model = openmc.Universe(cells=[lattice_cell])
-        # TODO: Create an AmBe fixed starter source definition
+        # Box of the default eigenvalue source; fixed start-up sources are in vr1.fixed_source
         self.source_lower_left = (-xy_corner, -xy_corner, lattice_lower_left[2])
         self.source_upper_right = (xy_corner, xy_corner, lattice_upper_right[2])
 
@@ -172,4 +182,32 @@ class Lattice(VR1core):
             for j in range(8):
                 if any(x in self.lattice_str[i][j] for x in ['_','X']):
                     self.lattice_str[i][j] = 'O'
-        self.build()
\ No newline at end of file
+        self.build()
+
+
+class Reactor(VR1core):
+    """
+    The core lattice inside the reactor facility: pool, vessel, radial channels and concrete shielding.
+    Parameters:
+        - materials (VR1Materials): Materials of the core and the facility.
+        - lattice_str (list[list[str]]): Core layout, as Lattice takes it.
+        - universe_cache (dict, None): Lattice universes by code, see Lattice.
+    Processing Logic:
+        - The box of a core-only Lattice is the model boundary; here particles must cross it into the facility,
+            so its surfaces become transmission surfaces. Rebuild the Reactor rather than the Lattice after changes.
+        - The facility cells stay available by name in self.cells, e.g. for deep-penetration tallies.
+    """
+    def __init__(self, materials: VR1Materials = vr1_materials, lattice_str: (list[list[str]], None) = None,
+                 universe_cache: (dict, None) = None):
+        from vr1.VR1facility import Facility
+        super().__init__(materials)
+        self.lattice = Lattice(materials, lattice_str=lattice_str, universe_cache=universe_cache)
+        self.lattice_str = self.lattice.lattice_str
+        for cell in self.lattice.model.cells.values():
+            for surface in cell.region.get_surfaces().values():
+                surface.boundary_type = 'transmission'
+        facility = Facility(materials)
+        self.model = facility.build(self.lattice)
+        self.cells: dict = facility.cells
+        self.source_lower_left = self.lattice.source_lower_left
+        self.source_upper_right = self.lattice.source_upper_right
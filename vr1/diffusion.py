@@ -0,0 +1,359 @@
+""" Few-group finite-difference diffusion solver for VR1 lattice layouts
+
+Each lattice position takes the homogenized cross sections of its lattice code (see MGXSCache.diffusion_xs()),
+so a layout is solved in a fraction of a second and thousands of layouts in one vectorized batch.
+"""
+
+import json
+import os
+import time
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+
+# Cross sections of one lattice code, each indexed by energy group (fast to thermal, as in openmc.XSdata)
+diffusion_xs_keys: list[str] = ['total', 'absorption', 'nu_fission', 'fission', 'chi', 'scatter']
+diffusion_boundaries: list[str] = ['vacuum', 'reflective']
+
+
+class DiffusionMesh:
+    """
+    Nodes of the finite-difference mesh over an n x n lattice.
+    Parameters:
+        - n (int): Lattice positions per side.
+        - refine (int): Mesh nodes per lattice position and direction.
+        - pitch (float): Lattice pitch [cm].
+        - nz (int): Axial nodes, 1 for a 2-D calculation.
+        - height (float): Axial extent of the 3-D mesh [cm].
+    Processing Logic:
+        - Nodes are numbered z-major, then row (row 0 at the top, as in lattice_str), then column.
+        - Every interior face is stored once as a node pair with its 1/h^2, every boundary face with its node and h.
+    """
+    def __init__(self, n: int = 8, refine: int = 1, pitch: float = 7.15, nz: int = 1, height: float = 1.0) -> None:
+        if refine < 1 or nz < 1:
+            raise ValueError('Mesh refinement and axial node count must be positive')
+        self.n: int = n
+        self.nx: int = n * refine
+        self.nz: int = nz
+        self.hx: float = pitch / refine
+        self.hz: float = height / nz
+        self.n_nodes: int = self.nx * self.nx * nz
+        idx = np.arange(self.n_nodes).reshape(nz, self.nx, self.nx)
+        rows, cols = np.indices((self.nx, self.nx))
+        # Lattice position (row * n + col) of every node
+        self.position: np.ndarray = np.broadcast_to((rows // refine) * n + cols // refine, idx.shape).ravel()
+        pairs: list = [(idx[:, :, :-1], idx[:, :, 1:], self.hx), (idx[:, :-1, :], idx[:, 1:, :], self.hx)]
+        faces: list = [(idx[:, :, 0], self.hx), (idx[:, :, -1], self.hx), (idx[:, 0, :], self.hx),
+                       (idx[:, -1, :], self.hx)]
+        if nz > 1:
+            pairs.append((idx[:-1], idx[1:], self.hz))
+            faces += [(idx[0], self.hz), (idx[-1], self.hz)]
+        self.pair_i: np.ndarray = np.concatenate([a.ravel() for a, _, _ in pairs])
+        self.pair_j: np.ndarray = np.concatenate([b.ravel() for _, b, _ in pairs])
+        self.pair_h: np.ndarray = np.concatenate([np.full(a.size, h) for a, _, h in pairs])
+        self.face_node: np.ndarray = np.concatenate([a.ravel() for a, _ in faces])
+        self.face_h: np.ndarray = np.concatenate([np.full(a.size, h) for a, h in faces])
+
+    def assembly_sum(self, values: np.ndarray) -> np.ndarray:
+        """ Sums node values (..., n_nodes) into lattice positions (..., n, n) """
+        out = np.zeros(values.shape[:-1] + (self.n * self.n,))
+        np.add.at(out, (..., self.position), values)
+        return out.reshape(values.shape[:-1] + (self.n, self.n))
+
+
+class DiffusionSolver:
+    """
+    Few-group diffusion eigenvalue solver of VR1 lattice layouts.
+    Parameters:
+        - xs (dict): {lattice code: {key: array}} with the keys in `diffusion_xs_keys`; 'scatter' is [g_in, g_out].
+        - refine (int): Mesh nodes per lattice position and direction.
+        - nz (int): Axial nodes; 1 solves the 2-D problem with an axial buckling.
+        - height (float, None): Height of the lattice box [cm]; H01.sc to FAZ.2 if None.
+        - pitch (float, None): Lattice pitch [cm]; vr1.lattice_units.lattice_pitch if None.
+        - boundary (str): Radial boundary of the lattice, 'vacuum' (Marshak) or 'reflective'.
+        - axial_buckling (float, None): B_z^2 [1/cm^2] of the 2-D problem; (pi/height)^2 if None.
+    Processing Logic:
+        - Mesh-centered finite differences with harmonic-mean face coefficients and Marshak vacuum faces.
+        - solve() runs power iteration on the fission source, with a sparse LU of the loss operator, or
+          group-wise conjugate gradients for large 3-D meshes.
+        - solve_batch() builds dense operators for many layouts at once and iterates them together.
+    """
+    def __init__(self, xs: dict, refine: int = 1, nz: int = 1, height: (float, None) = None,
+                 pitch: (float, None) = None, boundary: str = 'vacuum', axial_buckling: (float, None) = None) -> None:
+        if boundary not in diffusion_boundaries:
+            raise ValueError(f'Unknown boundary {boundary}, use one of {diffusion_boundaries}')
+        if height is None or pitch is None:
+            from vr1.lattice_units import lattice_pitch, plane_zs
+            height = plane_zs['FAZ.2'] - plane_zs['H01.sc'] if height is None else height
+            pitch = lattice_pitch if pitch is None else pitch
+        self.codes: list[str] = sorted(xs)
+        self.code_index: dict[str, int] = {c: i for i, c in enumerate(self.codes)}
+        self.n_groups: int = len(np.atleast_1d(xs[self.codes[0]]['total']))
+        table = {k: np.array([np.asarray(xs[c][k], dtype=float) for c in self.codes]) for k in diffusion_xs_keys}
+        for k in diffusion_xs_keys:
+            expected = (len(self.codes), self.n_groups, self.n_groups) if k == 'scatter' else \
+                (len(self.codes), self.n_groups)
+            if table[k].shape != expected:
+                raise ValueError(f'Cross section "{k}" has shape {table[k].shape[1:]}, expected {expected[1:]}')
+        self.diffusion_coef: np.ndarray = 1.0 / (3.0 * table['total'])
+        out_scatter = table['scatter'].sum(axis=2) - np.diagonal(table['scatter'], axis1=1, axis2=2)
+        self.removal: np.ndarray = table['absorption'] + out_scatter
+        self.nu_fission: np.ndarray = table['nu_fission']
+        self.fission: np.ndarray = table['fission']
+        self.chi: np.ndarray = table['chi']
+        self.scatter: np.ndarray = table['scatter']
+        self.mesh = DiffusionMesh(8, refine, pitch, nz, height)
+        self.boundary: str = boundary
+        if nz > 1:
+            self.axial_buckling: float = 0.0
+        else:
+            self.axial_buckling = (np.pi / height) ** 2 if axial_buckling is None else axial_buckling
+
+    def layout_indices(self, layouts: (list, np.ndarray)) -> np.ndarray:
+        """ Code indices (B, 64) of one 8x8 layout or a list of them """
+        layouts = np.asarray(layouts, dtype=object)
+        if layouts.ndim == 2:
+            layouts = layouts[None]
+        if layouts.shape[1:] != (8, 8):
+            raise ValueError(f'Layouts must be 8x8, not {layouts.shape[1:]}')
+        try:
+            return np.array([[self.code_index[c] for c in layout.ravel()] for layout in layouts])
+        except KeyError as e:
+            raise ValueError(f'No cross sections for lattice code {e}') from None
+
+    def operator_terms(self, layout_idx: np.ndarray) -> tuple:
+        """Sparse entries of the loss (M) and production (F) operators of a batch of layouts.
+        Parameters:
+            - layout_idx (np.ndarray): Code indices (B, 64) from layout_indices().
+        Returns:
+            - tuple: (M rows, M cols, M values (B, nnz), F rows, F cols, F values (B, nnz)); unknowns are g * n_nodes + node."""
+        mesh, G, N = self.mesh, self.n_groups, self.mesh.n_nodes
+        node_code = layout_idx[:, mesh.position]  # (B, N)
+        d = self.diffusion_coef[node_code]  # (B, N, G)
+        i, j = mesh.pair_i, mesh.pair_j
+        coupling = 2.0 * d[:, i] * d[:, j] / (d[:, i] + d[:, j]) / mesh.pair_h[None, :, None] ** 2
+        diag = self.removal[node_code] + d * self.axial_buckling
+        np.add.at(diag, (slice(None), i), coupling)
+        np.add.at(diag, (slice(None), j), coupling)
+        if self.boundary == 'vacuum':
+            dn, h = d[:, mesh.face_node], mesh.face_h[None, :, None]
+            np.add.at(diag, (slice(None), mesh.face_node), 2.0 * dn / (h + 4.0 * dn) / h)
+        g = np.arange(G)
+        m_rows = [(g[:, None] * N + np.arange(N)).ravel()]
+        m_cols = [m_rows[0]]
+        m_vals = [diag.transpose(0, 2, 1).reshape(len(layout_idx), -1)]
+        for a, b in ((i, j), (j, i)):
+            m_rows.append((g[:, None] * N + a).ravel())
+            m_cols.append((g[:, None] * N + b).ravel())
+            m_vals.append(-coupling.transpose(0, 2, 1).reshape(len(layout_idx), -1))
+        scatter = self.scatter[node_code]  # (B, N, g_in, g_out)
+        chi = self.chi[node_code]
+        nu_fission = self.nu_fission[node_code]
+        f_rows, f_cols, f_vals = [], [], []
+        nodes = np.arange(N)
+        for g_out in range(G):
+            for g_in in range(G):
+                if g_in != g_out:
+                    m_rows.append(g_out * N + nodes)
+                    m_cols.append(g_in * N + nodes)
+                    m_vals.append(-scatter[:, :, g_in, g_out])
+                f_rows.append(g_out * N + nodes)
+                f_cols.append(g_in * N + nodes)
+                f_vals.append(chi[:, :, g_out] * nu_fission[:, :, g_in])
+        return (np.concatenate(m_rows), np.concatenate(m_cols), np.concatenate(m_vals, axis=1),
+                np.concatenate(f_rows), np.concatenate(f_cols), np.concatenate(f_vals, axis=1))
+
+    def power_map(self, flux: np.ndarray, layout_idx: np.ndarray) -> np.ndarray:
+        """ Fission rate per lattice position (B, 8, 8), normalized to a mean of 1 over the fuelled positions """
+        node_code = layout_idx[:, self.mesh.position]
+        phi = flux.reshape(len(layout_idx), self.n_groups, self.mesh.n_nodes).transpose(0, 2, 1)
+        power = self.mesh.assembly_sum((self.fission[node_code] * phi).sum(axis=2))
+        fuelled = power > 0
+        mean = np.array([p[f].mean() if f.any() else 1.0 for p, f in zip(power, fuelled)])
+        return power / mean[:, None, None]
+
+    def flux_map(self, flux: np.ndarray, layout_idx: np.ndarray) -> np.ndarray:
+        """ Group flux averaged over each lattice position (B, G, 8, 8), per unit total fission rate of the core """
+        node_code = layout_idx[:, self.mesh.position]
+        phi = flux.reshape(len(layout_idx), self.n_groups, self.mesh.n_nodes)
+        total_fission = (self.fission[node_code].transpose(0, 2, 1) * phi).sum(axis=(1, 2))
+        nodes_per_position = self.mesh.n_nodes / self.mesh.n ** 2
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.mesh.assembly_sum(phi) / nodes_per_position / total_fission[:, None, None, None]
+
+    def group_sweep(self, loss: sp.csr_matrix) -> callable:
+        """Inner solver of large (3-D) problems: one Gauss-Seidel sweep over the groups, each group by Jacobi-
+        preconditioned conjugate gradients warm-started from the previous flux.
+        Parameters:
+            - loss (sp.csr_matrix): Loss operator M.
+        Returns:
+            - callable: f(rhs, flux) returning an approximate solution of M flux = rhs."""
+        N = self.mesh.n_nodes
+        blocks = [[loss[g * N:(g + 1) * N, h * N:(h + 1) * N] for h in range(self.n_groups)]
+                  for g in range(self.n_groups)]
+        preconditioners = [spla.LinearOperator((N, N), matvec=lambda x, d=1.0 / blocks[g][g].diagonal(): d * x)
+                           for g in range(self.n_groups)]
+
+        def sweep(rhs: np.ndarray, flux: np.ndarray) -> np.ndarray:
+            flux = flux.copy()
+            for g in range(self.n_groups):
+                b = rhs[g * N:(g + 1) * N].copy()
+                for h in range(self.n_groups):
+                    if h != g and blocks[g][h].nnz:
+                        b -= blocks[g][h] @ flux[h * N:(h + 1) * N]
+                flux[g * N:(g + 1) * N] = spla.cg(blocks[g][g], b, x0=flux[g * N:(g + 1) * N], rtol=1.0e-9,
+                                                  M=preconditioners[g])[0]
+            return flux
+        return sweep
+
+    def solve(self, lattice_str: list[list[str]], tol: float = 1.0e-6, source_tol: float = 1.0e-5,
+              max_iter: int = 1000, direct_limit: int = 2000) -> dict:
+        """Solves one layout by power iteration on the fission source.
+        Parameters:
+            - lattice_str (list[list[str]]): 8x8 layout, as Lattice.lattice_str.
+            - tol (float): Convergence criterion on k-eff.
+            - source_tol (float): Convergence criterion on the L1 change of the normalized fission source.
+            - max_iter (int): Maximum number of power iterations.
+            - direct_limit (int): Problems with up to this many unknowns use a sparse LU factorization of the loss
+                operator, larger ones group-wise conjugate gradients.
+        Returns:
+            - dict: 'keff', 'power' (8x8), 'flux' (groups, nz, rows, cols), 'iterations' and 'time' [s]."""
+        t0 = time.perf_counter()
+        layout_idx = self.layout_indices(lattice_str)
+        m_rows, m_cols, m_vals, f_rows, f_cols, f_vals = self.operator_terms(layout_idx)
+        n = self.n_groups * self.mesh.n_nodes
+        loss = sp.csr_matrix((m_vals[0], (m_rows, m_cols)), shape=(n, n))
+        production = sp.csr_matrix((f_vals[0], (f_rows, f_cols)), shape=(n, n))
+        if production.nnz == 0 or not production.data.any():
+            raise ValueError('Layout has no fissionable lattice units')
+        if n <= direct_limit:
+            lu = spla.splu(loss.tocsc())
+            inner = lambda rhs, flux: lu.solve(rhs)
+        else:
+            inner = self.group_sweep(loss)
+        flux = np.ones(n)
+        source = production @ flux
+        keff = 1.0
+        iterations = 0
+        for iterations in range(1, max_iter + 1):
+            flux = inner(source / keff, flux)
+            new_source = production @ flux
+            new_keff = keff * new_source.sum() / source.sum()
+            # L1 change of the normalized fission source
+            change = np.abs(new_source / new_source.sum() - source / source.sum()).sum()
+            converged = abs(new_keff - keff) < tol and change < source_tol
+            source, keff = new_source, new_keff
+            if converged:
+                break
+        flux /= flux.max()
+        return {'keff': float(keff), 'power': self.power_map(flux[None], layout_idx)[0],
+                'flux': flux.reshape(self.n_groups, self.mesh.nz, self.mesh.nx, self.mesh.nx),
+                'iterations': iterations, 'time': time.perf_counter() - t0}
+
+    def solve_batch(self, layouts: list, tol: float = 1.0e-6, max_iter: int = 2000,
+                    max_bytes: int = 2 ** 28) -> dict:
+        """Solves many layouts together with dense batched linear algebra.
+        Parameters:
+            - layouts (list): 8x8 layouts.
+            - tol (float): Convergence criterion on k-eff.
+            - max_iter (int): Maximum number of power iterations.
+            - max_bytes (int): Memory budget of one chunk of dense operators.
+        Returns:
+            - dict: 'keff' (B,), NaN for layouts without fuel, 'power' (B, 8, 8), 'flux' (B, groups, 8, 8) from
+                flux_map(), and 'time' [s]."""
+        t0 = time.perf_counter()
+        layout_idx = self.layout_indices(layouts)
+        n = self.n_groups * self.mesh.n_nodes
+        chunk = max(1, int(max_bytes // (3 * 8 * n * n)))
+        keff = np.empty(len(layout_idx))
+        power = np.empty((len(layout_idx), 8, 8))
+        position_flux = np.empty((len(layout_idx), self.n_groups, 8, 8))
+        for start in range(0, len(layout_idx), chunk):
+            idx = layout_idx[start:start + chunk]
+            m_rows, m_cols, m_vals, f_rows, f_cols, f_vals = self.operator_terms(idx)
+            loss = np.zeros((len(idx), n, n))
+            loss[:, m_rows, m_cols] = m_vals
+            production = np.zeros((len(idx), n, n))
+            production[:, f_rows, f_cols] = f_vals
+            # Fission matrix M^-1 F, its dominant eigenvalue is k-eff
+            fission_matrix = np.linalg.solve(loss, production)
+            weight = production.sum(axis=1)  # neutrons produced per unit flux in each unknown
+            flux = np.ones((len(idx), n))
+            k = np.ones(len(idx))
+            for _ in range(max_iter):
+                new_flux = np.einsum('bij,bj->bi', fission_matrix, flux)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    new_k = np.einsum('bi,bi->b', weight, new_flux) / np.einsum('bi,bi->b', weight, flux)
+                    flux = new_flux / new_flux.max(axis=1, keepdims=True)
+                converged = np.all(np.abs(new_k - k)[np.isfinite(new_k)] < tol)
+                k = new_k
+                if converged:
+                    break
+            keff[start:start + len(idx)] = k
+            power[start:start + len(idx)] = self.power_map(flux, idx)
+            position_flux[start:start + len(idx)] = self.flux_map(flux, idx)
+        return {'keff': keff, 'power': power, 'flux': position_flux, 'time': time.perf_counter() - t0}
+
+
+def mc_results(run_dirs: list[str]) -> list[dict]:
+    """ Name, layout and Monte Carlo k-eff of finished RunMonitor runs whose metadata has a lattice_str """
+    from vr1.monitor import monitor_json_name
+    results: list[dict] = []
+    for run_dir in run_dirs:
+        with open(os.path.join(run_dir, monitor_json_name)) as f:
+            record = json.load(f)
+        if 'lattice_str' in record['metadata'] and record['summary']['keff'] is not None:
+            results.append({'name': record['name'], 'lattice_str': record['metadata']['lattice_str'],
+                            'keff': record['summary']['keff'], 'keff_std': record['summary']['keff_std']})
+    return results
+
+
+def validation_report(solver: DiffusionSolver, run_dirs: list[str]) -> dict:
+    """Compares diffusion k-eff with the Monte Carlo k-eff of finished runs.
+    Parameters:
+        - solver (DiffusionSolver): Solver with cross sections of all lattice codes of the runs.
+        - run_dirs (list[str]): Run directories with RunMonitor records.
+    Returns:
+        - dict: 'cases' with both k-eff and the reactivity difference in pcm, and its 'rms_pcm' and 'max_abs_pcm'."""
+    cases: list[dict] = []
+    for mc in mc_results(run_dirs):
+        result = solver.solve(mc['lattice_str'])
+        cases.append({'name': mc['name'], 'keff_mc': mc['keff'], 'keff_mc_std': mc['keff_std'],
+                      'keff_diffusion': result['keff'], 'time': result['time'],
+                      'delta_rho_pcm': (1.0 / mc['keff'] - 1.0 / result['keff']) * 1.0e5})
+    delta = np.array([c['delta_rho_pcm'] for c in cases])
+    return {'cases': cases, 'rms_pcm': float(np.sqrt(np.mean(delta ** 2))) if delta.size else None,
+            'max_abs_pcm': float(np.abs(delta).max()) if delta.size else None}
+
+
+def validate_core_designs(solver: DiffusionSolver, output_dir: str = 'diffusion_validation',
+                          settings=None, threads: (int, None) = None) -> dict:
+    """Runs (or reuses) CE Monte Carlo for every entry of core_designs and compares it with the diffusion solver.
+    Parameters:
+        - solver (DiffusionSolver): Solver with cross sections of all lattice codes in core_designs.
+        - output_dir (str): Parent directory of the Monte Carlo runs, one sub-directory per design.
+        - settings (VR1Settings, None): Settings of the Monte Carlo runs; VR1Settings() if None.
+        - threads (int, None): OpenMP threads of the Monte Carlo runs.
+    Returns:
+        - dict: validation_report() of the designs."""
+    from vr1.core import Lattice, core_designs
+    from vr1.monitor import run_or_resume
+    from vr1.settings import VR1Settings
+    from vr1.writer import WriterOpenMC
+    run_dirs: list[str] = []
+    for name, design in core_designs.items():
+        writer = WriterOpenMC(settings if settings is not None else VR1Settings(), Lattice(lattice_str=design))
+        writer.output_dir = os.path.join(output_dir, name)
+        run_or_resume(writer, threads=threads)
+        run_dirs.append(writer.output_dir)
+    return validation_report(solver, run_dirs)
+
+
+def print_validation(report: dict) -> None:
+    """ Prints a validation report """
+    print(f'{"design":<24} {"k MC":>16} {"k diffusion":>12} {"drho [pcm]":>11} {"t [ms]":>8}')
+    for c in report['cases']:
+        print(f'{c["name"]:<24} {c["keff_mc"]:>8.5f} +/- {c["keff_mc_std"] or 0:.5f} {c["keff_diffusion"]:>12.5f} '
+              f'{c["delta_rho_pcm"]:>11.0f} {c["time"] * 1.0e3:>8.1f}')
+    if report['cases']:
+        print(f'RMS {report["rms_pcm"]:.0f} pcm, max {report["max_abs_pcm"]:.0f} pcm')
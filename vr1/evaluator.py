@@ -0,0 +1,204 @@
+""" Background evaluation of lattice layouts for interactive editing: debounced, cancellable, streaming """
+
+import copy
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BackgroundEvaluator:
+    """Runs an estimator on the latest requested layout in a worker thread, never blocking the caller.
+    Parameters:
+        - estimator (callable): estimator(layout) -> dict, or an iterator of dicts streaming refined estimates
+            (e.g. from staged_estimator()); dicts typically hold 'keff' and an 8x8 'power' map. An estimator with a
+            true `cancellable` attribute is called as estimator(layout, cancel=event) and should stop its work once
+            the event is set.
+        - debounce (float): Seconds a layout must stay unchanged before it is evaluated.
+        - workers (int): Worker threads.
+    Processing Logic:
+        - request() only records the layout and bumps a generation counter; poll(), called periodically by the GUI
+            (e.g. from tkinter's root.after), starts the job once the debounce time has passed.
+        - Requests made meanwhile supersede older ones: queued jobs are cancelled, running ones are told to stop and
+            quit at their next streamed result (cancellable estimators, e.g. openmc_estimator(), stop at once), and
+            results of stale generations are dropped by poll().
+    """
+    def __init__(self, estimator: callable, debounce: float = 0.3, workers: int = 1) -> None:
+        self.estimator = estimator
+        self.debounce: float = debounce
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='vr1-evaluator')
+        self.results: queue.Queue = queue.Queue()
+        self.generation: int = 0
+        self.pending: (tuple, None) = None  # (generation, layout, start time)
+        self.jobs: dict[int, tuple] = {}  # generation -> (future, cancel event)
+        self.latest: (dict, None) = None
+
+    def request(self, layout: list[list[str]]) -> int:
+        """ Queues a layout for evaluation after the debounce time and cancels all older requests """
+        self.generation += 1
+        self.pending = (self.generation, copy.deepcopy(layout), time.monotonic() + self.debounce)
+        self.cancel_stale()
+        return self.generation
+
+    def cancel(self) -> None:
+        """ Drops the pending request and cancels all jobs, e.g. when the layout cannot be evaluated """
+        self.generation += 1
+        self.pending = None
+        self.cancel_stale()
+
+    def cancel_stale(self) -> None:
+        """ Cancels queued jobs and signals running jobs of every generation older than the current one """
+        for generation, (future, cancel) in list(self.jobs.items()):
+            if generation < self.generation:
+                cancel.set()
+                if future.cancel() or future.done():
+                    del self.jobs[generation]
+
+    def work(self, generation: int, layout: list[list[str]], cancel: threading.Event) -> None:
+        """ Worker thread body: streams the estimator's results into the result queue until cancelled """
+        try:
+            if getattr(self.estimator, 'cancellable', False):
+                estimates = self.estimator(layout, cancel=cancel)
+            else:
+                estimates = self.estimator(layout)
+            for estimate in [estimates] if isinstance(estimates, dict) else estimates:
+                if cancel.is_set():
+                    return
+                self.results.put((generation, {**estimate, 'final': False}))
+        except Exception as e:
+            self.results.put((generation, {'error': f'{type(e).__name__}: {e}'}))
+        finally:
+            self.results.put((generation, {'final': True}))
+
+    def poll(self) -> list[dict]:
+        """Starts the pending job once it is due and collects results; call it regularly from the GUI thread.
+        Returns:
+            - list[dict]: New results of the current generation, oldest first; the last one of a job has 'final' True
+                (it carries no estimate)."""
+        if self.pending is not None and time.monotonic() >= self.pending[2]:
+            generation, layout, _ = self.pending
+            self.pending = None
+            cancel = threading.Event()
+            self.jobs[generation] = (self.executor.submit(self.work, generation, layout, cancel), cancel)
+        fresh: list[dict] = []
+        while True:
+            try:
+                generation, result = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if result.get('final'):
+                self.jobs.pop(generation, None)
+            if generation != self.generation:
+                continue
+            if not result.get('final') and 'error' not in result:
+                self.latest = result
+            fresh.append(result)
+        return fresh
+
+    @property
+    def busy(self) -> bool:
+        """ True while the current generation is waiting or running """
+        return self.pending is not None or self.generation in self.jobs
+
+    def shutdown(self) -> None:
+        """ Cancels everything and stops the worker threads without waiting for a running job """
+        self.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def staged_estimator(*estimators: callable) -> callable:
+    """ Estimator streaming the results of several estimators in turn, e.g. a surrogate before a diffusion solve """
+    def estimate(layout: list[list[str]], cancel: (threading.Event, None) = None):
+        for estimator in estimators:
+            if getattr(estimator, 'cancellable', False):
+                result = estimator(layout, cancel=cancel)
+            else:
+                result = estimator(layout)
+            yield from [result] if isinstance(result, dict) else result
+    estimate.cancellable = any(getattr(e, 'cancellable', False) for e in estimators)
+    return estimate
+
+
+def default_estimator(surrogate_file: (str, None) = None, diffusion: bool = False) -> (callable, None):
+    """Estimator for the lattice builder GUI.
+    Parameters:
+        - surrogate_file (str, None): Saved KeffSurrogate giving an instant first k-eff.
+        - diffusion (bool): Follow with a diffusion solve on eight-group MGXSCache cross sections, which also gives the
+            power map; cross sections of lattice codes not in the cache are generated on first use.
+    Returns:
+        - callable, None: Staged estimator, None if neither is requested."""
+    stages: list = []
+    if surrogate_file is not None:
+        from vr1.surrogate import KeffSurrogate
+        stages.append(surrogate_estimator(KeffSurrogate.load(surrogate_file)))
+    if diffusion:
+        from vr1.mgxs_cache import MGXSCache
+        stages.append(diffusion_estimator(MGXSCache()))
+    return staged_estimator(*stages) if stages else None
+
+
+def surrogate_estimator(model) -> callable:
+    """ Estimator from a fitted KeffSurrogate: k-eff and its standard deviation """
+    def estimate(layout: list[list[str]]) -> dict:
+        prediction = model.predict(layout)
+        return {'method': 'surrogate', 'keff': float(prediction['keff'][0]), 'keff_std': float(prediction['std'][0]),
+                'extrapolating': bool(prediction['extrapolating'][0])}
+    return estimate
+
+
+def diffusion_estimator(xs_source, **solver_args) -> callable:
+    """Estimator solving each layout with DiffusionSolver.
+    Parameters:
+        - xs_source (dict, MGXSCache): Diffusion cross sections by lattice code, or an MGXSCache generating them on
+            first use of a code.
+        - **solver_args: Further DiffusionSolver arguments, e.g. refine or nz.
+    Returns:
+        - callable: estimator(layout) -> dict with 'keff', 'power' (8x8) and 'time'."""
+    from vr1.diffusion import DiffusionSolver
+    state: dict = {'xs': dict(xs_source) if isinstance(xs_source, dict) else {}, 'solver': None}
+    lock = threading.Lock()
+
+    def estimate(layout: list[list[str]]) -> dict:
+        with lock:
+            missing = {c for row in layout for c in row} - state['xs'].keys()
+            if missing:
+                if isinstance(xs_source, dict):
+                    raise ValueError(f'No cross sections for lattice codes {sorted(missing)}')
+                state['xs'].update(xs_source.diffusion_xs(missing))
+                state['solver'] = None
+            if state['solver'] is None:
+                state['solver'] = DiffusionSolver(state['xs'], **solver_args)
+            solver = state['solver']
+        result = solver.solve(layout)
+        return {'method': 'diffusion', 'keff': result['keff'], 'power': result['power'], 'time': result['time']}
+    return estimate
+
+
+def openmc_estimator(settings=None, output_dir: str = 'gui_estimate', threads: (int, None) = None) -> callable:
+    """Estimator running a short OpenMC calculation of each layout.
+    Parameters:
+        - settings (VR1Settings, None): Run settings; 2000 particles, 30 batches, 10 inactive if None.
+        - output_dir (str): Parent directory of the runs; every run gets its own sub-directory, removed when it ends.
+        - threads (int, None): OpenMP threads.
+    Returns:
+        - callable: estimator(layout, cancel=None) -> dict with 'keff' and 'keff_std'; OpenMC is terminated once the
+            cancel event is set."""
+    def estimate(layout: list[list[str]], cancel: (threading.Event, None) = None) -> dict:
+        from vr1.core import Lattice
+        from vr1.settings import VR1Settings
+        from vr1.writer import WriterOpenMC
+        writer = WriterOpenMC(settings if settings is not None else
+                              VR1Settings(parm={'npg': 2000, 'batches': 30, 'inactive': 10}), Lattice(lattice_str=layout))
+        os.makedirs(output_dir, exist_ok=True)
+        # A fresh directory per run: a superseded run still writing its statepoints cannot leak into this one
+        writer.output_dir = tempfile.mkdtemp(prefix='run_', dir=output_dir)
+        try:
+            summary = writer.run(threads=threads, cancel=cancel)
+        finally:
+            shutil.rmtree(writer.output_dir, ignore_errors=True)
+        return {'method': 'openmc', 'keff': summary['keff'], 'keff_std': summary['keff_std']}
+    estimate.cancellable = True
+    return estimate
@@ -0,0 +1,314 @@
+""" Fixed-source subcritical runs of VR1 with an AmBe start-up source """
+
+import copy
+import numpy as np
+
+# Coarse histogram of the ISO 8529-1 AmBe neutron spectrum: bin edges [MeV] and relative probability per bin, the
+# bins are of unequal width (mean ~4.2 MeV); see ambe_density()
+ambe_spectrum: dict = {
+    'edges': [0.0, 0.5, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0, 11.0],
+    'p': [0.06, 0.07, 0.11, 0.12, 0.13, 0.14, 0.12, 0.10, 0.07, 0.05, 0.03, 0.01],
+}
+# Default biasing: energy group bounds [eV] and the relative importance of each group to a thermal detector
+bias_energy_bounds: list[float] = [0.0, 0.625, 1.0e5, 2.0e7]
+bias_energy_importance: list[float] = [4.0, 2.0, 1.0]
+multiplication_tally_name: str = 'source multiplication'
+
+
+def ambe_density() -> tuple[np.ndarray, np.ndarray]:
+    """Probability density of the AmBe histogram, as openmc.stats.Tabular with histogram interpolation expects.
+    Returns:
+        - tuple: Bin edges [eV] and the density of each bin [1/eV], normalized to 1 over the spectrum."""
+    edges = np.array(ambe_spectrum['edges']) * 1.0e6
+    p = np.array(ambe_spectrum['p'], dtype=float)
+    return edges, p / p.sum() / np.diff(edges)
+
+
+def lattice_position(lattice_str: list[list[str]], position: (tuple, str)) -> tuple[int, int]:
+    """Row and column of a lattice position.
+    Parameters:
+        - lattice_str (list[list[str]]): 8x8 layout.
+        - position (tuple, str): (row, col), or a lattice code whose first occurrence (row by row) is taken.
+    Returns:
+        - tuple: (row, col)."""
+    if isinstance(position, str):
+        for row, codes in enumerate(lattice_str):
+            if position in codes:
+                return row, codes.index(position)
+        raise ValueError(f'No lattice position holds "{position}"')
+    row, col = (int(p) for p in position)
+    if not (0 <= row < len(lattice_str) and 0 <= col < len(lattice_str[row])):
+        raise ValueError(f'Lattice position {position} is outside the lattice')
+    return row, col
+
+
+def position_xy(row: int, col: int, n: int = 8) -> tuple[float, float]:
+    """ (x, y) of the center of a lattice position of the VR1 core """
+    from vr1.lattice_units import lattice_pitch
+    from vr1.sources import position_center
+    return position_center(row, col, lattice_pitch, n)
+
+
+def core_midplane() -> float:
+    """ Height of the middle of the active fuel [cm] """
+    from vr1.lattice_units import plane_zs
+    return (plane_zs['FAZ.4'] + plane_zs['FAZ.3']) / 2.0
+
+
+class AmBeSource:
+    """
+    AmBe start-up source in a lattice position, typically a vertical channel.
+    Parameters:
+        - position (tuple, str): (row, col) or the lattice code of the position, e.g. 'v56'.
+        - z (float, None): Height of the source center [cm]; the core midplane if None.
+        - radius (float): Radius of the source capsule [cm].
+        - height (float): Height of the source capsule [cm].
+        - emission (float): Neutron emission rate [n/s], scales detector count rates.
+        - energy (openmc.stats.Univariate, None): Energy distribution; the ISO 8529-1 AmBe histogram if None.
+    Processing Logic:
+        - Neutrons start uniformly in a cylinder at the position center; the capsule itself is not modelled, the
+            channel keeps its materials.
+    """
+    def __init__(self, position: (tuple, str) = 'v56', z: (float, None) = None, radius: float = 1.0,
+                 height: float = 4.0, emission: float = 1.0e7, energy=None) -> None:
+        if radius <= 0 or height <= 0 or emission <= 0:
+            raise ValueError('Source radius, height and emission must be positive')
+        self.position = position
+        self.z = z
+        self.radius = radius
+        self.height = height
+        self.emission = emission
+        self.energy = energy
+
+    def center(self, lattice_str: list[list[str]]) -> tuple[float, float, float]:
+        """ (x, y, z) of the source center in the given layout """
+        row, col = lattice_position(lattice_str, self.position)
+        x, y = position_xy(row, col, len(lattice_str))
+        return x, y, core_midplane() if self.z is None else self.z
+
+    def get(self, lattice_str: list[list[str]]):
+        """ openmc.IndependentSource of the capsule in the given layout """
+        import openmc
+        x, y, z = self.center(lattice_str)
+        energy = self.energy
+        if energy is None:
+            edges, density = ambe_density()
+            energy = openmc.stats.Tabular(edges, np.append(density, 0.0), interpolation='histogram')
+        space = openmc.stats.CylindricalIndependent(
+            r=openmc.stats.PowerLaw(0.0, self.radius, 1), phi=openmc.stats.Uniform(0.0, 2 * np.pi),
+            z=openmc.stats.Uniform(z - self.height / 2, z + self.height / 2), origin=(x, y, 0.0))
+        return openmc.IndependentSource(space=space, energy=energy, strength=1.0)
+
+
+class Detector:
+    """
+    Thermal neutron counter in a lattice position, scored as the 1/v reaction rate in a cylinder.
+    Parameters:
+        - name (str): Detector name, also the name of its tally.
+        - position (tuple, str): (row, col) or the lattice code of the position.
+        - z (float, None): Height of the detector center [cm]; the core midplane if None.
+        - length (float): Sensitive length [cm].
+        - radius (float): Sensitive radius [cm].
+        - density (float): Atom density of the absorber [atoms/b-cm]; He-3 at 4 bar by default.
+        - sigma_2200 (float): Absorber cross section at 0.0253 eV [b]; He-3 (n,p) by default.
+    Processing Logic:
+        - The counter is not part of the geometry: the tally integrates the track-length flux over the sensitive
+            cylinder, weighted by N sigma_2200 sqrt(0.0253 eV / E), giving reactions per source neutron.
+    """
+    def __init__(self, name: str, position: (tuple, str), z: (float, None) = None, length: float = 20.0,
+                 radius: float = 1.0, density: float = 1.07e-4, sigma_2200: float = 5333.0) -> None:
+        self.name = name
+        self.position = position
+        self.z = z
+        self.length = length
+        self.radius = radius
+        self.density = density
+        self.sigma_2200 = sigma_2200
+
+    def center(self, lattice_str: list[list[str]]) -> tuple[float, float, float]:
+        """ (x, y, z) of the detector center in the given layout """
+        row, col = lattice_position(lattice_str, self.position)
+        x, y = position_xy(row, col, len(lattice_str))
+        return x, y, core_midplane() if self.z is None else self.z
+
+    def tally(self, lattice_str: list[list[str]]):
+        """ openmc.Tally of the detector response in the given layout """
+        import openmc
+        x, y, z = self.center(lattice_str)
+        mesh = openmc.CylindricalMesh(r_grid=[0.0, self.radius], phi_grid=[0.0, 2 * np.pi],
+                                      z_grid=[z - self.length / 2, z + self.length / 2], origin=(x, y, 0.0))
+        energy = np.logspace(-5, np.log10(2.0e7), 300)
+        response = self.density * self.sigma_2200 * np.sqrt(0.0253 / energy)
+        tally = openmc.Tally(name=self.name)
+        tally.filters = [openmc.MeshFilter(mesh), openmc.EnergyFunctionFilter(energy, response,
+                                                                              interpolation='log-log')]
+        tally.scores = ['flux']
+        return tally
+
+
+def multiplication(nu_fission: float, nu_fission_std: float) -> dict:
+    """Subcritical multiplication from the fission neutrons produced per source neutron.
+    Parameters:
+        - nu_fission (float): Fission neutrons per source neutron, F.
+        - nu_fission_std (float): Its standard deviation.
+    Returns:
+        - dict: 'M' = 1 + F (neutrons per source neutron), 'k_source' = F / (1 + F), and their standard deviations."""
+    m = 1.0 + nu_fission
+    return {'M': m, 'M_std': nu_fission_std, 'k_source': nu_fission / m, 'k_source_std': nu_fission_std / m ** 2}
+
+
+def importance_map(centers: np.ndarray, source: tuple, targets: np.ndarray, length: float = 6.0,
+                   floor: float = 1.0e-3) -> np.ndarray:
+    """Spatial importance of mesh cells for reaching the targets, 1 at the source.
+    Parameters:
+        - centers (np.ndarray): (N, 3) mesh cell centers [cm].
+        - source (tuple): (x, y, z) of the source [cm].
+        - targets (np.ndarray): (K, 3) points whose response is wanted, e.g. detectors and fuelled positions [cm].
+        - length (float): Attenuation length of the importance with distance from the nearest target [cm], about the
+            neutron migration length in water.
+        - floor (float): Smallest importance relative to the source, limits roulette far from all targets.
+    Returns:
+        - np.ndarray: (N,) importance."""
+    def raw(points: np.ndarray) -> np.ndarray:
+        distance = np.linalg.norm(points[:, None, :] - targets[None, :, :], axis=2).min(axis=1)
+        return np.exp(-distance / length)
+    centers = np.asarray(centers, dtype=float)
+    targets = np.atleast_2d(np.asarray(targets, dtype=float))
+    importance = raw(centers) / raw(np.asarray([source], dtype=float))[0]
+    return np.maximum(importance, floor)
+
+
+def weight_window_bounds(importance: np.ndarray, energy_importance: (list, np.ndarray) = bias_energy_importance,
+                         source_bound: float = 0.5) -> np.ndarray:
+    """Lower weight window bounds from space and energy importances.
+    Parameters:
+        - importance (np.ndarray): (N,) spatial importance, 1 at the source.
+        - energy_importance (list, np.ndarray): (G,) relative importance per energy group.
+        - source_bound (float): Lower bound where importance is 1, below the unit source weight.
+    Returns:
+        - np.ndarray: (N, G) lower bounds, inversely proportional to the importance; OpenMC splits particles that
+            enter more important regions or energies and plays roulette in less important ones."""
+    energy_importance = np.asarray(energy_importance, dtype=float)
+    return source_bound / (np.asarray(importance, dtype=float)[:, None] * energy_importance[None, :])
+
+
+class FixedSourceRun:
+    """
+    Source-driven (fixed source) OpenMC run of a subcritical VR1 layout.
+    Parameters:
+        - lattice_str (list[list[str]]): 8x8 layout.
+        - source (AmBeSource, None): Start-up source; AmBeSource() in the first 'v56' channel if None.
+        - detectors (list[Detector], None): Counters to score.
+        - settings (VR1Settings, None): Base settings, copied; 'npg' particles per batch and 'batches' are used.
+        - biasing (bool): Bias with weight windows on a lattice-aligned mesh toward the detectors and the fuel.
+        - energy_importance (list, None): Importance per group of bias_energy_bounds; bias_energy_importance if None.
+        - length (float): Importance attenuation length [cm], see importance_map().
+        - output_dir (str): Run directory.
+        - universe_cache (dict, None): Lattice universes by code shared with other runs, see Lattice.
+    Processing Logic:
+        - Fission neutrons are followed within each history, so the total nu-fission per source neutron gives the
+            subcritical multiplication M = 1 + F without an eigenvalue calculation.
+        - Deeply subcritical steps spend most histories near the source; the weight windows split neutrons that
+            head for the fuel and the counters, and favour low energies that thermal counters see, so both
+            converge with far fewer histories. Weight windows keep the tallies unbiased.
+    """
+    def __init__(self, lattice_str: list[list[str]], source: (AmBeSource, None) = None,
+                 detectors: (list, None) = None, settings=None, biasing: bool = True,
+                 energy_importance: (list, None) = None, length: float = 6.0, output_dir: str = 'fixed_source',
+                 universe_cache: (dict, None) = None) -> None:
+        self.lattice_str = [list(row) for row in lattice_str]
+        self.source = source if source is not None else AmBeSource()
+        self.detectors: list = detectors if detectors is not None else []
+        self.settings = settings
+        self.biasing = biasing
+        self.energy_importance = energy_importance if energy_importance is not None else bias_energy_importance
+        self.length = length
+        self.output_dir = output_dir
+        self.universe_cache = universe_cache
+        self.writer = None
+
+    def targets(self) -> np.ndarray:
+        """ Points whose response drives the biasing: the detectors and the active fuel of fuelled positions """
+        from vr1.sources import fuel_tubes
+        from vr1.lattice_units import plane_zs
+        points = [d.center(self.lattice_str) for d in self.detectors]
+        zs = np.linspace(plane_zs['FAZ.4'], plane_zs['FAZ.3'], 5)
+        for row, codes in enumerate(self.lattice_str):
+            for col, code in enumerate(codes):
+                if fuel_tubes(code) > 0:
+                    x, y = position_xy(row, col, len(self.lattice_str))
+                    points += [(x, y, z) for z in zs]
+        if not points:
+            raise ValueError('Nothing to bias toward: the layout has no fuel and no detectors are given')
+        return np.array(points)
+
+    def weight_windows(self):
+        """ openmc.WeightWindows on the CMFD coarse mesh, from importance_map() and the energy importances """
+        import openmc
+        from vr1.cmfd import lattice_xy_grid, axial_grid
+        xy = lattice_xy_grid(len(self.lattice_str))
+        z = axial_grid()
+        mesh = openmc.RectilinearMesh()
+        mesh.x_grid, mesh.y_grid, mesh.z_grid = xy, xy, z
+        cx, cy, cz = (xy[1:] + xy[:-1]) / 2, (xy[1:] + xy[:-1]) / 2, (z[1:] + z[:-1]) / 2
+        # openmc.WeightWindows indexes the bounds as [ix, iy, iz, energy group]
+        gx, gy, gz = np.meshgrid(cx, cy, cz, indexing='ij')
+        centers = np.column_stack([gx.ravel(), gy.ravel(), gz.ravel()])
+        importance = importance_map(centers, self.source.center(self.lattice_str), self.targets(), self.length)
+        lower = weight_window_bounds(importance, self.energy_importance)
+        return openmc.WeightWindows(mesh, lower_ww_bounds=lower.reshape(*gx.shape, -1), upper_bound_ratio=5.0,
+                                    energy_bounds=bias_energy_bounds, particle_type='neutron')
+
+    def tallies(self) -> list:
+        """ Detector tallies and the whole-core nu-fission tally """
+        import openmc
+        total = openmc.Tally(name=multiplication_tally_name)
+        total.scores = ['nu-fission']
+        return [d.tally(self.lattice_str) for d in self.detectors] + [total]
+
+    def make_writer(self):
+        """ WriterOpenMC of the fixed-source model """
+        from vr1.core import Lattice
+        from vr1.settings import VR1Settings
+        from vr1.writer import WriterOpenMC
+        settings = copy.copy(self.settings) if self.settings is not None else VR1Settings()
+        settings.parm = {**settings.parm, 'inactive': 0}
+        settings.run_mode = 'fixed source'
+        settings.cmfd = False
+        settings.ext_sources = [self.source.get(self.lattice_str)]
+        settings.tallies = list(settings.tallies or []) + self.tallies()
+        settings.weight_windows = [self.weight_windows()] if self.biasing else None
+        self.writer = WriterOpenMC(settings, Lattice(lattice_str=self.lattice_str, universe_cache=self.universe_cache))
+        self.writer.output_dir = self.output_dir
+        return self.writer
+
+    def run(self, threads: (int, None) = None, echo: bool = False) -> dict:
+        """Writes and runs the model.
+        Parameters:
+            - threads (int, None): OpenMP threads.
+            - echo (bool): Print OpenMC output.
+        Returns:
+            - dict: results() of the final statepoint, with the run summary under 'run'."""
+        from vr1.monitor import latest_statepoint
+        summary = self.make_writer().run(threads=threads, echo=echo)
+        return {**self.results(latest_statepoint(self.output_dir)), 'run': summary}
+
+    def results(self, statepoint) -> dict:
+        """Subcritical multiplication and detector responses of a finished run.
+        Parameters:
+            - statepoint (str, openmc.StatePoint): Final statepoint.
+        Returns:
+            - dict: multiplication() entries and 'detectors': {name: {'response' (reactions per source neutron),
+                'response_std', 'count_rate' [1/s] at the source emission, 'count_rate_std'}}."""
+        import openmc
+        sp = openmc.StatePoint(statepoint) if isinstance(statepoint, str) else statepoint
+        total = sp.get_tally(name=multiplication_tally_name)
+        result = multiplication(float(total.mean.sum()), float(np.sqrt((total.std_dev ** 2).sum())))
+        result['detectors'] = {}
+        for detector in self.detectors:
+            tally = sp.get_tally(name=detector.name)
+            response, std = float(tally.mean.sum()), float(np.sqrt((tally.std_dev ** 2).sum()))
+            result['detectors'][detector.name] = {
+                'response': response, 'response_std': std,
+                'count_rate': response * self.source.emission, 'count_rate_std': std * self.source.emission}
+        return result
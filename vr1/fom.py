@@ -0,0 +1,187 @@
+""" Relative error and figure of merit (FOM = 1/(R^2 T)) of VR1 tallies """
+
+import numpy as np
+
+# Energy group collapses [eV] used to summarize fine-group tallies such as the SCALE 252 group flux
+energy_collapses: dict[str, dict[str, tuple[float, float]]] = {
+    'three_group': {
+        'thermal':    (1.0e-5, 0.625),
+        'epithermal': (0.625, 1.0e5),
+        'fast':       (1.0e5, 2.0e7),
+    },
+    'two_group': {
+        'thermal': (1.0e-5, 0.625),
+        'fast':    (0.625, 2.0e7),
+    },
+}
+
+
+def relative_error(mean: np.ndarray, std_dev: np.ndarray) -> np.ndarray:
+    """ Relative error std/mean, NaN where the mean is zero """
+    mean = np.asarray(mean, dtype=float)
+    rel = np.full(mean.shape, np.nan)
+    np.divide(std_dev, mean, out=rel, where=mean > 0)
+    return rel
+
+
+def figure_of_merit(rel_err: np.ndarray, run_time: float) -> np.ndarray:
+    """ FOM = 1/(R^2 T), NaN for bins without a score """
+    rel_err = np.asarray(rel_err, dtype=float)
+    fom = np.full(rel_err.shape, np.nan)
+    np.divide(1.0, rel_err ** 2 * run_time, out=fom, where=rel_err > 0)
+    return fom
+
+
+def collapse_bins(mean: np.ndarray, std_dev: np.ndarray, bins: np.ndarray, axis: int,
+                  collapse: (str, dict) = 'three_group') -> dict:
+    """Sums energy bins of tally arrays into coarse groups.
+    Parameters:
+        - mean (np.ndarray): Tally mean with the energy bins along axis.
+        - std_dev (np.ndarray): Its standard deviation, same shape.
+        - bins (np.ndarray): (E_low, E_high) of every energy bin [eV].
+        - axis (int): Energy axis of mean and std_dev.
+        - collapse (str, dict): Name of a collapse in `energy_collapses`, or a dict {group name: (E_low, E_high)}.
+    Returns:
+        - dict: {group name: (mean, std_dev)} with the energy axis summed out; a fine bin goes to the group holding
+            its lethargy mid-point. Standard deviations are added in quadrature, i.e. the bins are independent."""
+    groups = energy_collapses[collapse] if isinstance(collapse, str) else collapse
+    mean = np.asarray(mean, dtype=float)
+    var = np.asarray(std_dev, dtype=float) ** 2
+    bins = np.asarray(bins, dtype=float)
+    mid = np.sqrt(bins[:, 0] * bins[:, 1])  # lethargy mid-point of each bin
+    collapsed: dict = {}
+    for name, (e_low, e_high) in groups.items():
+        idx = np.nonzero((mid >= e_low) & (mid < e_high))[0]
+        collapsed[name] = (np.take(mean, idx, axis=axis).sum(axis=axis),
+                           np.sqrt(np.take(var, idx, axis=axis).sum(axis=axis)))
+    return collapsed
+
+
+def collapse_energy(tally, collapse: (str, dict) = 'three_group') -> dict:
+    """Sums the energy bins of a tally into coarse groups.
+    Parameters:
+        - tally (openmc.Tally): Tally with results loaded from a statepoint and one openmc.EnergyFilter.
+        - collapse (str, dict): Name of a collapse in `energy_collapses`, or a dict {group name: (E_low, E_high)}.
+    Returns:
+        - dict: {group name: (mean, std_dev)} with arrays over the remaining filter, nuclide and score bins,
+            see collapse_bins()."""
+    import openmc
+    filter_shape = tuple(f.num_bins for f in tally.filters)
+    axis = [i for i, f in enumerate(tally.filters) if isinstance(f, openmc.EnergyFilter)]
+    if len(axis) != 1:
+        raise ValueError(f'Tally {tally.name} needs exactly one energy filter to collapse')
+    axis = axis[0]
+    shape = filter_shape + tally.mean.shape[1:]
+    return collapse_bins(tally.mean.reshape(shape), tally.std_dev.reshape(shape), tally.filters[axis].bins, axis,
+                         collapse)
+
+
+class TallyFOM:
+    """
+    Statistical efficiency of the tallies of one OpenMC run.
+    Parameters:
+        - statepoint (str, openmc.StatePoint): Statepoint file name or an opened statepoint.
+        - time_key (str): Key of StatePoint.runtime used as T; 'active batches' by default, 'total' for the whole run.
+        - collapse (str, dict): Energy collapse applied to tallies with an energy filter.
+    Processing Logic:
+        - Computes the relative error R and FOM = 1/(R^2 T) per tally bin, per collapsed energy group, and per tally.
+        - The run needs T*(R/R_target)^2 to bring a bin to R_target; bins with the largest R set the run length.
+    """
+    def __init__(self, statepoint, time_key: str = 'active batches', collapse: (str, dict) = 'three_group') -> None:
+        import openmc
+        if isinstance(statepoint, str):
+            statepoint = openmc.StatePoint(statepoint)
+        self.statepoint = statepoint
+        self.run_time: float = float(statepoint.runtime[time_key])
+        self.collapse = collapse
+        self.tallies: dict = statepoint.tallies
+
+    def tally_bins(self, tally) -> dict:
+        """ Relative errors and FOM of every bin of one tally """
+        rel = relative_error(tally.mean, tally.std_dev).ravel()
+        return {'rel_err': rel, 'fom': figure_of_merit(rel, self.run_time)}
+
+    def tally_groups(self, tally) -> dict:
+        """ Relative errors and FOM of the energy-collapsed tally, {} if the tally has no energy filter """
+        import openmc
+        if not any(isinstance(f, openmc.EnergyFilter) for f in tally.filters):
+            return {}
+        groups: dict = {}
+        for name, (mean, std) in collapse_energy(tally, self.collapse).items():
+            rel = relative_error(mean, std)
+            groups[name] = {'max_rel_err': float(np.nanmax(rel)) if np.isfinite(rel).any() else None,
+                            'fom': float(np.nanmin(figure_of_merit(rel, self.run_time)))
+                            if np.isfinite(rel).any() else None}
+        return groups
+
+    def report(self, target_rel_err: float = 0.01, dominant_fraction: float = 0.5) -> dict:
+        """Per-tally, per-group and per-run statistical efficiency.
+        Parameters:
+            - target_rel_err (float): Relative error every bin should reach.
+            - dominant_fraction (float): Bins needing at least this fraction of the longest time-to-target are flagged.
+        Returns:
+            - dict: 'run_time', 'tallies' {name: summary}, 'dominant_bins' list, and the run-level 'time_to_target'."""
+        tallies: dict = {}
+        needed: list[tuple[str, np.ndarray, np.ndarray, np.ndarray]] = []
+        for tally in self.tallies.values():
+            name = tally.name or str(tally.id)
+            b = self.tally_bins(tally)
+            scored = np.isfinite(b['rel_err'])
+            if not scored.any():
+                tallies[name] = {'n_bins': int(b['rel_err'].size), 'n_scored': 0}
+                continue
+            rel = b['rel_err'][scored]
+            tallies[name] = {
+                'n_bins': int(b['rel_err'].size),
+                'n_scored': int(scored.sum()),
+                'max_rel_err': float(rel.max()),
+                'median_rel_err': float(np.median(rel)),
+                'fom_min': float(np.nanmin(b['fom'])),
+                'fom_median': float(np.nanmedian(b['fom'])),
+                'time_to_target': float(self.run_time * (rel.max() / target_rel_err) ** 2),
+                'groups': self.tally_groups(tally),
+            }
+            needed.append((name, np.nonzero(scored)[0], rel, self.run_time * (rel / target_rel_err) ** 2))
+        t_max = max((t.max() for _, _, _, t in needed), default=0.0)
+        dominant: list[dict] = []
+        for name, idx, rel, t in needed:
+            for k in np.nonzero(t >= dominant_fraction * t_max)[0]:
+                dominant.append({'tally': name, 'bin': int(idx[k]), 'rel_err': float(rel[k]),
+                                 'time_to_target': float(t[k])})
+        dominant.sort(key=lambda d: d['time_to_target'], reverse=True)
+        return {'run_time': self.run_time, 'target_rel_err': target_rel_err, 'time_to_target': float(t_max),
+                'tallies': tallies, 'dominant_bins': dominant}
+
+    def print_report(self, target_rel_err: float = 0.01) -> None:
+        """ Prints a short table of the report """
+        rep = self.report(target_rel_err)
+        print(f'Run time T = {rep["run_time"]:.3g} s, time to reach R = {target_rel_err} in all bins: '
+              f'{rep["time_to_target"]:.3g} s')
+        print(f'{"tally":<24} {"bins":>6} {"max R":>10} {"med R":>10} {"min FOM":>10} {"med FOM":>10}')
+        for name, t in rep['tallies'].items():
+            if not t['n_scored']:
+                print(f'{name:<24} {t["n_bins"]:>6}   no scores')
+                continue
+            print(f'{name:<24} {t["n_bins"]:>6} {t["max_rel_err"]:>10.3e} {t["median_rel_err"]:>10.3e} '
+                  f'{t["fom_min"]:>10.3e} {t["fom_median"]:>10.3e}')
+            for g, v in t['groups'].items():
+                if v['max_rel_err'] is not None:
+                    print(f'  {g:<22} {"":>6} {v["max_rel_err"]:>10.3e} {"":>10} {v["fom"]:>10.3e}')
+        print(f'{len(rep["dominant_bins"])} bins dominate the time to target')
+
+
+def compare_runs(reports: dict[str, dict]) -> dict:
+    """Ratios of the median tally FOM of several runs to the first one, e.g. to judge a variance-reduction setup.
+    Parameters:
+        - reports (dict): {run name: TallyFOM.report()}, the first entry is the reference.
+    Returns:
+        - dict: {run name: {tally name: FOM ratio}}."""
+    names = list(reports)
+    ref = reports[names[0]]['tallies']
+    ratios: dict = {}
+    for name in names:
+        ratios[name] = {}
+        for tally, t in reports[name]['tallies'].items():
+            if tally in ref and ref[tally].get('fom_median') and t.get('fom_median'):
+                ratios[name][tally] = t['fom_median'] / ref[tally]['fom_median']
+    return ratios
@@ -0,0 +1,297 @@
+""" Vectorized point location in VR1 lattice geometries with NumPy """
+
+import json
+import re
+import numpy as np
+
+# Monomials of a general quadric a x^2 + b y^2 + c z^2 + d xy + e yz + f xz + g x + h y + j z + k
+quadric_terms: list[str] = ['xx', 'yy', 'zz', 'xy', 'yz', 'xz', 'x', 'y', 'z', '1']
+# Cell names of fuel tube layers in IRT4M: {top,mid,bot}_{cladding,fuel,inner cladding,water}_{tube number}
+_plate_cell = re.compile(r'^(top|mid|bot)_[cfiw]_(\d+)$')
+
+
+def surface_coeffs(surface) -> np.ndarray:
+    """ Quadric coefficients (in quadric_terms order) of a primitive OpenMC surface """
+    coeffs = surface._get_base_coeffs()
+    if len(coeffs) == 4:
+        # Planes: a x + b y + c z = d
+        a, b, c, d = coeffs
+        return np.array([0, 0, 0, 0, 0, 0, a, b, c, -d], dtype=float)
+    if len(coeffs) == 10:
+        return np.array(coeffs, dtype=float)
+    raise ValueError(f'Cannot compile surface {surface} of type {type(surface).__name__}')
+
+
+def plate_number(cell_name: str) -> int:
+    """ Fuel tube number (1 = outermost) of an IRT4M tube layer cell, -1 for other cells """
+    match = _plate_cell.match(cell_name or '')
+    return int(match.group(2)) if match else -1
+
+
+class GeometryModel:
+    """
+    OpenMC CSG geometry compiled into arrays for vectorized point location.
+    Parameters:
+        - data (dict): Compiled model from GeometryModel.compile() or GeometryModel.load().
+    Processing Logic:
+        - Every surface becomes a row of quadric coefficients; every region a tree of ['h', surface, side],
+            ['and', ...], ['or', ...] and ['not', node] lists; universes are ordered lists of cells.
+        - locate() walks the tree for all points at once: the cells of a universe are tested in order on the points not
+            claimed yet, as Universe.find() does, so overlapping cells resolve the same way; lattice fills map points
+            to element indices and local coordinates and recurse per element universe.
+        - A compiled model is plain JSON, so it can be saved and evaluated without OpenMC.
+    """
+    def __init__(self, data: dict) -> None:
+        self.data = data
+        self.surfaces: np.ndarray = np.asarray(data['surfaces'], dtype=float).reshape(-1, len(quadric_terms))
+        self.universes: list = data['universes']
+        self.lattices: list = data['lattices']
+        self.cell_names: list[str] = data['cell_names']
+        self.materials: dict[int, str] = {int(k): v for k, v in data['materials'].items()}
+        self.codes: (np.ndarray, None) = None if data.get('codes') is None else np.asarray(data['codes'], dtype=object)
+        self.cell_plates: np.ndarray = np.array([plate_number(n) for n in self.cell_names] + [-1])
+
+    @classmethod
+    def compile(cls, root, codes: (list[list[str]], None) = None) -> 'GeometryModel':
+        """Compiles an OpenMC universe.
+        Parameters:
+            - root (openmc.Universe): Root universe, e.g. Lattice.model.
+            - codes (list[list[str]], None): Lattice codes of the first lattice met, reported by locate().
+        Returns:
+            - GeometryModel: The compiled model."""
+        import openmc
+        surfaces: dict[int, int] = {}
+        coeffs: list = []
+        universes: dict[int, int] = {}
+        compiled_universes: list = []
+        lattices: list = []
+        cell_names: list[str] = []
+        materials: dict[int, str] = {}
+
+        def region_tree(region):
+            if region is None:
+                return None
+            if isinstance(region, openmc.Halfspace):
+                s = region.surface
+                if s.id not in surfaces:
+                    surfaces[s.id] = len(coeffs)
+                    coeffs.append(surface_coeffs(s).tolist())
+                return ['h', surfaces[s.id], region.side]
+            if isinstance(region, openmc.Intersection):
+                return ['and'] + [region_tree(r) for r in region]
+            if isinstance(region, openmc.Union):
+                return ['or'] + [region_tree(r) for r in region]
+            if isinstance(region, openmc.Complement):
+                return ['not', region_tree(region.node)]
+            raise ValueError(f'Cannot compile region {region}')
+
+        def universe_index(universe) -> int:
+            if universe.id in universes:
+                return universes[universe.id]
+            universes[universe.id] = len(compiled_universes)
+            cells: list = []
+            compiled_universes.append(cells)
+            for cell in universe.cells.values():
+                entry = {'cell': len(cell_names), 'region': region_tree(cell.region), 'material': -1,
+                         'universe': None, 'lattice': None, 'translation': None}
+                cell_names.append(cell.name)
+                if cell.rotation is not None:
+                    raise ValueError(f'Rotated fill of cell {cell.name} is not supported')
+                if cell.translation is not None:
+                    entry['translation'] = [float(t) for t in cell.translation]
+                if isinstance(cell.fill, openmc.Material):
+                    entry['material'] = cell.fill.id
+                    materials[cell.fill.id] = cell.fill.name
+                elif isinstance(cell.fill, openmc.RectLattice):
+                    entry['lattice'] = lattice_index(cell.fill)
+                elif isinstance(cell.fill, openmc.UniverseBase):
+                    entry['universe'] = universe_index(cell.fill)
+                elif cell.fill is not None:
+                    raise ValueError(f'Cannot compile fill {type(cell.fill).__name__} of cell {cell.name}')
+                cells.append(entry)
+            return universes[universe.id]
+
+        def lattice_index(lattice) -> int:
+            if lattice.ndim != 2:
+                raise ValueError('Only 2-D lattices are supported')
+            entry = {'lower_left': [float(v) for v in lattice.lower_left],
+                     'pitch': [float(v) for v in lattice.pitch], 'universes': None,
+                     'outer': None if lattice.outer is None else universe_index(lattice.outer)}
+            lattices.append(entry)
+            entry['universes'] = [[universe_index(u) for u in row] for row in lattice.universes]
+            return len(lattices) - 1
+
+        root_index = universe_index(root)
+        return cls({'root': root_index, 'surfaces': coeffs, 'universes': compiled_universes, 'lattices': lattices,
+                    'cell_names': cell_names, 'materials': materials, 'codes': codes})
+
+    @classmethod
+    def from_lattice(cls, lattice_str: list[list[str]], materials=None) -> 'GeometryModel':
+        """Compiled model of a VR1 core lattice, one compiled universe per lattice code.
+        Parameters:
+            - lattice_str (list[list[str]]): Layout, as Lattice takes it.
+            - materials (VR1Materials, None): Materials; vr1_materials if None.
+        Returns:
+            - GeometryModel: The compiled model, reporting unit codes from the reformatted layout."""
+        from vr1.core import Lattice
+        from vr1.materials import vr1_materials
+        core = Lattice(materials if materials is not None else vr1_materials, lattice_str=lattice_str,
+                       universe_cache={})
+        return cls.compile(core.model, core.lattice_str)
+
+    def save(self, filename: str) -> None:
+        with open(filename, 'w') as f:
+            json.dump(self.data, f)
+
+    @classmethod
+    def load(cls, filename: str) -> 'GeometryModel':
+        with open(filename) as f:
+            return cls(json.load(f))
+
+    def evaluate_region(self, tree, values: dict, points: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """ Boolean membership of points[rows] in a compiled region; `values` caches surface values by surface """
+        if tree is None:
+            return np.ones(len(rows), dtype=bool)
+        kind = tree[0]
+        if kind == 'h':
+            s = tree[1]
+            if s not in values:
+                values[s] = self.surface_values(s, points)
+            return values[s][rows] >= 0 if tree[2] == '+' else values[s][rows] < 0
+        if kind == 'and':
+            mask = self.evaluate_region(tree[1], values, points, rows)
+            for node in tree[2:]:
+                inside = np.flatnonzero(mask)
+                if inside.size == 0:
+                    break
+                mask[inside] = self.evaluate_region(node, values, points, rows[inside])
+            return mask
+        if kind == 'or':
+            mask = self.evaluate_region(tree[1], values, points, rows)
+            for node in tree[2:]:
+                outside = np.flatnonzero(~mask)
+                if outside.size == 0:
+                    break
+                mask[outside] = self.evaluate_region(node, values, points, rows[outside])
+            return mask
+        if kind == 'not':
+            return ~self.evaluate_region(tree[1], values, points, rows)
+        raise ValueError(f'Unknown region node {kind}')
+
+    def surface_values(self, s: int, points: np.ndarray) -> np.ndarray:
+        """ Quadric value of surface s at all points, using only its nonzero terms """
+        x, y, z = points[:, 0], points[:, 1], points[:, 2]
+        terms = {'xx': lambda: x * x, 'yy': lambda: y * y, 'zz': lambda: z * z, 'xy': lambda: x * y,
+                 'yz': lambda: y * z, 'xz': lambda: x * z, 'x': lambda: x, 'y': lambda: y, 'z': lambda: z}
+        value = np.full(len(points), self.surfaces[s, -1])
+        for term, c in zip(quadric_terms[:-1], self.surfaces[s, :-1]):
+            if c != 0.0:
+                value += c * terms[term]()
+        return value
+
+    def locate_universe(self, u: int, points: np.ndarray, out: dict, index: np.ndarray, depth: int) -> None:
+        """ Fills `out` at `index` for points located in universe u """
+        values: dict = {}
+        remaining = np.arange(len(points))
+        for cell in self.universes[u]:
+            if remaining.size == 0:
+                break
+            found = self.evaluate_region(cell['region'], values, points, remaining)
+            hits = remaining[found]
+            if hits.size == 0:
+                continue
+            remaining = remaining[~found]
+            local = points[hits]
+            if cell['translation'] is not None:
+                local = local - np.asarray(cell['translation'])
+            if cell['lattice'] is not None:
+                self.locate_lattice(cell['lattice'], local, out, index[hits], depth)
+            elif cell['universe'] is not None:
+                self.locate_universe(cell['universe'], local, out, index[hits], depth)
+            else:
+                out['cell'][index[hits]] = cell['cell']
+                out['material'][index[hits]] = cell['material']
+
+    def locate_lattice(self, k: int, points: np.ndarray, out: dict, index: np.ndarray, depth: int) -> None:
+        """ Maps points to elements of lattice k and locates them in the element universes """
+        lattice = self.lattices[k]
+        universes = np.asarray(lattice['universes'])
+        ny, nx = universes.shape
+        (x0, y0), (px, py) = lattice['lower_left'][:2], lattice['pitch'][:2]
+        ix = np.floor((points[:, 0] - x0) / px).astype(int)
+        iy = np.floor((points[:, 1] - y0) / py).astype(int)
+        inside = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)
+        row = ny - 1 - iy  # universes[0] is the top row
+        if depth == 0:
+            out['row'][index[inside]] = row[inside]
+            out['col'][index[inside]] = ix[inside]
+        local = points.copy()
+        local[:, 0] -= x0 + (ix + 0.5) * px
+        local[:, 1] -= y0 + (iy + 0.5) * py
+        element = np.where(inside, universes[np.clip(row, 0, ny - 1), np.clip(ix, 0, nx - 1)], -1)
+        for u in np.unique(element):
+            members = np.flatnonzero(element == u)
+            if u >= 0:
+                self.locate_universe(int(u), local[members], out, index[members], depth + 1)
+            elif lattice['outer'] is not None:
+                self.locate_universe(lattice['outer'], points[members], out, index[members], depth + 1)
+
+    def locate(self, x, y, z) -> dict:
+        """Locates points in the geometry.
+        Parameters:
+            - x, y, z (array-like): Point coordinates [cm], broadcast to a common shape.
+        Returns:
+            - dict: Arrays of that shape: 'row' and 'col' of the core lattice position (-1 outside the lattice),
+                'code' (lattice unit code, '' outside), 'cell' (index into cell_names, -1 if no cell), 'region'
+                (cell name), 'plate' (IRT4M fuel tube number, -1 elsewhere) and 'material' (ID, -1 for void)."""
+        x, y, z = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float),
+                                      np.asarray(z, dtype=float))
+        shape = x.shape
+        points = np.column_stack([x.ravel(), y.ravel(), z.ravel()])
+        n = len(points)
+        out = {'row': np.full(n, -1, dtype=np.int8), 'col': np.full(n, -1, dtype=np.int8),
+               'cell': np.full(n, -1, dtype=np.int32), 'material': np.full(n, -1, dtype=np.int32)}
+        self.locate_universe(self.data['root'], points, out, np.arange(n), 0)
+        names = np.array(self.cell_names + [''], dtype=object)
+        out['region'] = names[out['cell']]
+        out['plate'] = self.cell_plates[out['cell']]
+        if self.codes is not None:
+            on_lattice = out['row'] >= 0
+            out['code'] = np.full(n, '', dtype=object)
+            out['code'][on_lattice] = self.codes[out['row'][on_lattice], out['col'][on_lattice]]
+        return {key: value.reshape(shape) for key, value in out.items()}
+
+    def material_names(self, material_ids: np.ndarray) -> np.ndarray:
+        """ Material names of an array of material IDs; '' for void """
+        table = {**self.materials, -1: ''}
+        unique, inverse = np.unique(material_ids, return_inverse=True)
+        return np.array([table.get(int(m), '') for m in unique], dtype=object)[inverse].reshape(np.shape(material_ids))
+
+
+def cross_check(lattice_str: list[list[str]], n_points: int = 2000, seed: int = 1) -> dict:
+    """Compares locate() with OpenMC's own Universe.find() at random points of the lattice box.
+    Parameters:
+        - lattice_str (list[list[str]]): Layout to check.
+        - n_points (int): Number of random points.
+        - seed (int): Random seed.
+    Returns:
+        - dict: 'n_points', 'n_mismatch' of material or cell name, and the first few mismatching 'points'."""
+    from vr1.core import Lattice
+    from vr1.lattice_units import lattice_pitch, plane_zs
+    core = Lattice(lattice_str=lattice_str, universe_cache={})
+    model = GeometryModel.compile(core.model, core.lattice_str)
+    rng = np.random.default_rng(seed)
+    half = 4 * lattice_pitch
+    points = np.column_stack([rng.uniform(-half, half, n_points), rng.uniform(-half, half, n_points),
+                              rng.uniform(plane_zs['H01.sc'], plane_zs['FAZ.2'], n_points)])
+    located = model.locate(points[:, 0], points[:, 1], points[:, 2])
+    mismatches: list = []
+    for i, p in enumerate(points):
+        path = core.model.find(p)
+        cell = path[-1] if path and hasattr(path[-1], 'fill') else None
+        material = cell.fill.id if cell is not None and hasattr(cell.fill, 'density') else -1
+        name = cell.name if cell is not None else ''
+        if material != located['material'][i] or name != located['region'][i]:
+            mismatches.append({'point': p.tolist(), 'openmc': (name, material),
+                               'numpy': (located['region'][i], int(located['material'][i]))})
+    return {'n_points': n_points, 'n_mismatch': len(mismatches), 'points': mismatches[:10]}
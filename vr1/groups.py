@@ -0,0 +1,426 @@
+""" Energy group structures as ascending arrays, with cached collapse matrices between them """
+
+import numpy as np
+import scipy.sparse
+
+# SCALE 252 group energy structure, descending as listed by SCALE; GroupStructure sorts it once
+scale_252_energy_bins: list[float] = [
+    2.0000000000E+07,
+    1.7330000000E+07,
+    1.5680000000E+07,
+    1.4550000000E+07,
+    1.3840000000E+07,
+    1.2840000000E+07,
+    1.0000000000E+07,
+    8.1870000000E+06,
+    6.4340000000E+06,
+    4.8000000000E+06,
+    4.3040000000E+06,
+    3.0000000000E+06,
+    2.4790000000E+06,
+    2.3540000000E+06,
+    1.8500000000E+06,
+    1.5000000000E+06,
+    1.4000000000E+06,
+    1.3560000000E+06,
+    1.3170000000E+06,
+    1.2500000000E+06,
+    1.2000000000E+06,
+    1.1000000000E+06,
+    1.0100000000E+06,
+    9.2000000000E+05,
+    9.0000000000E+05,
+    8.7500000000E+05,
+    8.6110000000E+05,
+    8.2000000000E+05,
+    7.5000000000E+05,
+    6.7900000000E+05,
+    6.7000000000E+05,
+    6.0000000000E+05,
+    5.7300000000E+05,
+    5.5000000000E+05,
+    4.9200000000E+05,
+    4.7000000000E+05,
+    4.4000000000E+05,
+    4.2000000000E+05,
+    4.0000000000E+05,
+    3.3000000000E+05,
+    2.7000000000E+05,
+    2.0000000000E+05,
+    1.4900000000E+05,
+    1.2830000000E+05,
+    1.0000000000E+05,
+    8.5000000000E+04,
+    8.2000000000E+04,
+    7.5000000000E+04,
+    7.3000000000E+04,
+    6.0000000000E+04,
+    5.2000000000E+04,
+    5.0000000000E+04,
+    4.5000000000E+04,
+    3.0000000000E+04,
+    2.0000000000E+04,
+    1.7000000000E+04,
+    1.3000000000E+04,
+    9.5000000000E+03,
+    8.0300000000E+03,
+    5.7000000000E+03,
+    3.9000000000E+03,
+    3.7400000000E+03,
+    3.0000000000E+03,
+    2.5000000000E+03,
+    2.2500000000E+03,
+    2.2000000000E+03,
+    1.8000000000E+03,
+    1.5500000000E+03,
+    1.5000000000E+03,
+    1.1500000000E+03,
+    9.5000000000E+02,
+    6.8300000000E+02,
+    6.7000000000E+02,
+    5.5000000000E+02,
+    3.0500000000E+02,
+    2.8500000000E+02,
+    2.4000000000E+02,
+    2.2000000000E+02,
+    2.0950000000E+02,
+    2.0740000000E+02,
+    2.0200000000E+02,
+    1.9300000000E+02,
+    1.9150000000E+02,
+    1.8850000000E+02,
+    1.8770000000E+02,
+    1.8000000000E+02,
+    1.7000000000E+02,
+    1.4300000000E+02,
+    1.2200000000E+02,
+    1.1900000000E+02,
+    1.1750000000E+02,
+    1.1600000000E+02,
+    1.1300000000E+02,
+    1.0800000000E+02,
+    1.0500000000E+02,
+    1.0120000000E+02,
+    9.7000000000E+01,
+    9.0000000000E+01,
+    8.1700000000E+01,
+    8.0000000000E+01,
+    7.6000000000E+01,
+    7.2000000000E+01,
+    6.7500000000E+01,
+    6.5000000000E+01,
+    6.3000000000E+01,
+    6.1000000000E+01,
+    5.8000000000E+01,
+    5.3400000000E+01,
+    5.0600000000E+01,
+    4.8300000000E+01,
+    4.5200000000E+01,
+    4.4000000000E+01,
+    4.2400000000E+01,
+    4.1000000000E+01,
+    3.9600000000E+01,
+    3.9100000000E+01,
+    3.8000000000E+01,
+    3.7630000000E+01,
+    3.7270000000E+01,
+    3.7130000000E+01,
+    3.7000000000E+01,
+    3.6000000000E+01,
+    3.5500000000E+01,
+    3.5000000000E+01,
+    3.3750000000E+01,
+    3.3250000000E+01,
+    3.1750000000E+01,
+    3.1250000000E+01,
+    3.0000000000E+01,
+    2.7500000000E+01,
+    2.5000000000E+01,
+    2.2500000000E+01,
+    2.1750000000E+01,
+    2.1200000000E+01,
+    2.0500000000E+01,
+    2.0000000000E+01,
+    1.9400000000E+01,
+    1.8500000000E+01,
+    1.7000000000E+01,
+    1.6000000000E+01,
+    1.4400000000E+01,
+    1.2900000000E+01,
+    1.1900000000E+01,
+    1.1500000000E+01,
+    1.0000000000E+01,
+    9.1000000000E+00,
+    8.1000000000E+00,
+    7.1500000000E+00,
+    7.0000000000E+00,
+    6.8750000000E+00,
+    6.7500000000E+00,
+    6.5000000000E+00,
+    6.2500000000E+00,
+    6.0000000000E+00,
+    5.4000000000E+00,
+    5.0000000000E+00,
+    4.7000000000E+00,
+    4.1000000000E+00,
+    3.7300000000E+00,
+    3.5000000000E+00,
+    3.2000000000E+00,
+    3.1000000000E+00,
+    3.0000000000E+00,
+    2.9700000000E+00,
+    2.8700000000E+00,
+    2.7700000000E+00,
+    2.6700000000E+00,
+    2.5700000000E+00,
+    2.4700000000E+00,
+    2.3800000000E+00,
+    2.3000000000E+00,
+    2.2100000000E+00,
+    2.1200000000E+00,
+    2.0000000000E+00,
+    1.9400000000E+00,
+    1.8600000000E+00,
+    1.7700000000E+00,
+    1.6800000000E+00,
+    1.5900000000E+00,
+    1.5000000000E+00,
+    1.4500000000E+00,
+    1.4000000000E+00,
+    1.3500000000E+00,
+    1.3000000000E+00,
+    1.2500000000E+00,
+    1.2250000000E+00,
+    1.2000000000E+00,
+    1.1750000000E+00,
+    1.1500000000E+00,
+    1.1400000000E+00,
+    1.1300000000E+00,
+    1.1200000000E+00,
+    1.1100000000E+00,
+    1.1000000000E+00,
+    1.0900000000E+00,
+    1.0800000000E+00,
+    1.0700000000E+00,
+    1.0600000000E+00,
+    1.0500000000E+00,
+    1.0400000000E+00,
+    1.0300000000E+00,
+    1.0200000000E+00,
+    1.0100000000E+00,
+    1.0000000000E+00,
+    9.7500000000E-01,
+    9.5000000000E-01,
+    9.2500000000E-01,
+    9.0000000000E-01,
+    8.5000000000E-01,
+    8.0000000000E-01,
+    7.5000000000E-01,
+    7.0000000000E-01,
+    6.5000000000E-01,
+    6.2500000000E-01,
+    6.0000000000E-01,
+    5.5000000000E-01,
+    5.0000000000E-01,
+    4.5000000000E-01,
+    4.0000000000E-01,
+    3.7500000000E-01,
+    3.5000000000E-01,
+    3.2500000000E-01,
+    3.0000000000E-01,
+    2.7500000000E-01,
+    2.5000000000E-01,
+    2.2500000000E-01,
+    2.0000000000E-01,
+    1.7500000000E-01,
+    1.5000000000E-01,
+    1.2500000000E-01,
+    1.0000000000E-01,
+    9.0000000000E-02,
+    8.0000000000E-02,
+    7.0000000000E-02,
+    6.0000000000E-02,
+    5.0000000000E-02,
+    4.0000000000E-02,
+    3.0000000000E-02,
+    2.5300000000E-02,
+    1.0000000000E-02,
+    7.5000000000E-03,
+    5.0000000000E-03,
+    4.0000000000E-03,
+    3.0000000000E-03,
+    2.5000000000E-03,
+    2.0000000000E-03,
+    1.5000000000E-03,
+    1.2000000000E-03,
+    1.0000000000E-03,
+    7.5000000000E-04,
+    5.0000000000E-04,
+    1.0000000000E-04,
+    1.0e-5]
+
+# Few-group structures [eV], ascending
+few_group_boundaries: dict[str, list[float]] = {
+    'two_group': [1.0e-5, 0.625, 2.0e7],
+    'three_group': [1.0e-5, 0.625, 1.0e5, 2.0e7],
+    'four_group': [1.0e-5, 0.625, 5.53e3, 8.21e5, 2.0e7],
+    'eight_group': [1.0e-5, 0.058, 0.14, 0.28, 0.625, 4.0, 5.53e3, 8.21e5, 2.0e7],
+}
+few_group_names: dict[str, list[str]] = {
+    'two_group': ['thermal', 'fast'],
+    'three_group': ['thermal', 'epithermal', 'fast'],
+}
+# Structures shipped with OpenMC, read from openmc.mgxs.GROUP_STRUCTURES on first use
+openmc_structures: list[str] = ['CASMO-2', 'CASMO-4', 'CASMO-8', 'CASMO-16', 'CASMO-25', 'CASMO-40', 'CASMO-70',
+                                'XMAS-172', 'VITAMIN-J-175', 'CCFE-709', 'UKAEA-1102', 'ECCO-1968']
+# Lower edge [eV] standing in for a 0 eV group boundary (CASMO structures) wherever lethargy is needed
+lethargy_floor: float = 1.0e-5
+_structures: dict = {}
+_collapse_matrices: dict = {}
+
+
+class GroupStructure:
+    """
+    Energy group boundaries with binning, lethargy and collapse utilities.
+    Parameters:
+        - edges (list, np.ndarray): Group boundaries [eV] in any order.
+        - name (str, None): Name of the structure, e.g. 'SCALE-252'.
+    Processing Logic:
+        - Boundaries are kept once as an ascending float array; group g spans edges[g] to edges[g + 1], so group 0
+            is the lowest energy, as in openmc.EnergyFilter bins.
+        - A 0 eV lower boundary is kept for binning; lethargies use lethargy_floor (or a decade below the next
+            boundary if that is lower) in its place.
+        - Collapse matrices to coarser structures are sparse, built once per pair and cached, so collapsing any
+            number of spectra is one matrix product.
+    """
+    def __init__(self, edges: (list, np.ndarray), name: (str, None) = None) -> None:
+        edges = np.sort(np.asarray(edges, dtype=float))
+        if edges.ndim != 1 or edges.size < 2 or edges[0] < 0.0 or np.any(np.diff(edges) <= 0.0):
+            raise ValueError(f'Group boundaries of {name or "a group structure"} must be non-negative and distinct')
+        self.edges: np.ndarray = edges
+        self.edges.flags.writeable = False
+        self.log_edges: np.ndarray = np.log(np.where(edges > 0.0, edges, min(lethargy_floor, edges[1] / 10.0)))
+        self.log_edges.flags.writeable = False
+        self.name: str = name if name is not None else f'{edges.size - 1}-group'
+
+    def __repr__(self) -> str:
+        return f'GroupStructure({self.name}, {self.n_groups} groups)'
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, GroupStructure) and np.array_equal(self.edges, other.edges)
+
+    def __hash__(self) -> int:
+        return hash(self.edges.tobytes())
+
+    @property
+    def n_groups(self) -> int:
+        return self.edges.size - 1
+
+    @property
+    def lethargy_widths(self) -> np.ndarray:
+        return np.diff(self.log_edges)
+
+    @property
+    def midpoints(self) -> np.ndarray:
+        """ Lethargy mid-points of the groups [eV] """
+        return np.exp(0.5 * (self.log_edges[:-1] + self.log_edges[1:]))
+
+    @property
+    def group_names(self) -> list[str]:
+        return few_group_names.get(self.name, [f'g{g}' for g in range(self.n_groups)])
+
+    def find(self, energies: np.ndarray) -> np.ndarray:
+        """ Group index of every energy, -1 outside the structure """
+        energies = np.asarray(energies, dtype=float)
+        idx = np.searchsorted(self.edges, energies, side='right') - 1
+        idx[energies == self.edges[-1]] = self.n_groups - 1
+        return np.where((energies >= self.edges[0]) & (energies <= self.edges[-1]), idx, -1)
+
+    def histogram(self, energies: np.ndarray, weights: (np.ndarray, None) = None) -> np.ndarray:
+        """ Sum of the weights (1 if None) of the energies in every group, energies outside are dropped """
+        idx = self.find(energies)
+        inside = idx >= 0
+        weights = np.ones(idx.shape) if weights is None else np.broadcast_to(weights, idx.shape)
+        return np.bincount(idx[inside], weights=weights[inside], minlength=self.n_groups)
+
+    def per_lethargy(self, spectra: np.ndarray) -> np.ndarray:
+        """ Group-integrated spectra (..., G) divided by the lethargy widths, for plotting on a log energy axis """
+        return np.asarray(spectra, dtype=float) / self.lethargy_widths
+
+    def snap(self, boundaries: (list, np.ndarray), name: (str, None) = None) -> 'GroupStructure':
+        """ Coarse structure whose boundaries are the boundaries of this one nearest (in lethargy) to the given ones """
+        boundaries = np.asarray(boundaries, dtype=float)
+        idx = np.abs(self.log_edges[:, None] - np.log(boundaries)[None, :]).argmin(axis=0)
+        edges = np.unique(self.edges[idx])
+        if edges.size < 2:
+            raise ValueError(f'Group boundaries {boundaries.tolist()} collapse to less than one group')
+        return GroupStructure(edges, name)
+
+    def collapse_matrix(self, coarse: 'GroupStructure') -> scipy.sparse.csr_matrix:
+        """Sparse (coarse groups x fine groups) matrix summing group-integrated quantities of this structure.
+        Parameters:
+            - coarse (GroupStructure): Target structure.
+        Returns:
+            - scipy.sparse.csr_matrix: Element (j, g) is the lethargy fraction of fine group g inside coarse group j:
+                1 or 0 where the boundaries line up, a flat-per-lethargy split of fine groups that straddle one."""
+        key = (self.edges.tobytes(), coarse.edges.tobytes())
+        if key not in _collapse_matrices:
+            u_fine, u_coarse = self.log_edges, coarse.log_edges
+            rows, cols, values = [], [], []
+            for g in range(self.n_groups):
+                lo = np.maximum(u_coarse[:-1], u_fine[g])
+                hi = np.minimum(u_coarse[1:], u_fine[g + 1])
+                j = np.nonzero(hi > lo)[0]
+                rows.extend(j)
+                cols.extend([g] * j.size)
+                values.extend((hi[j] - lo[j]) / (u_fine[g + 1] - u_fine[g]))
+            _collapse_matrices[key] = scipy.sparse.csr_matrix((values, (rows, cols)),
+                                                              shape=(coarse.n_groups, self.n_groups))
+        return _collapse_matrices[key]
+
+    def collapse(self, spectra: np.ndarray, coarse: 'GroupStructure') -> np.ndarray:
+        """ Group-integrated spectra (..., G fine) collapsed to (..., G coarse), all in one sparse product """
+        spectra = np.asarray(spectra, dtype=float)
+        flat = spectra.reshape(-1, self.n_groups)
+        return np.asarray(self.collapse_matrix(coarse) @ flat.T).T.reshape(spectra.shape[:-1] + (coarse.n_groups,))
+
+    def collapse_variance(self, std_dev: np.ndarray, coarse: 'GroupStructure') -> np.ndarray:
+        """ Standard deviations collapsed in quadrature, treating the fine groups as independent """
+        matrix = self.collapse_matrix(coarse)
+        std_dev = np.asarray(std_dev, dtype=float)
+        flat = std_dev.reshape(-1, self.n_groups) ** 2
+        return np.sqrt(np.asarray(matrix.multiply(matrix) @ flat.T).T).reshape(std_dev.shape[:-1] + (coarse.n_groups,))
+
+    def collapse_xs(self, xs: np.ndarray, flux: np.ndarray, coarse: 'GroupStructure') -> np.ndarray:
+        """ Flux-weighted collapse of group cross sections (..., G fine) with the group fluxes (..., G fine) """
+        rate = self.collapse(np.asarray(xs) * flux, coarse)
+        weight = self.collapse(flux, coarse)
+        out = np.zeros(rate.shape)
+        np.divide(rate, weight, out=out, where=weight > 0)
+        return out
+
+
+def group_structure(structure: (str, list, np.ndarray, GroupStructure)) -> GroupStructure:
+    """Group structure by name, cached, or from boundaries.
+    Parameters:
+        - structure (str, list, np.ndarray, GroupStructure): 'SCALE-252', a key of few_group_boundaries, a name in
+            openmc_structures, boundaries [eV], or a GroupStructure returned as is.
+    Returns:
+        - GroupStructure: The structure; named ones are created once per process."""
+    if isinstance(structure, GroupStructure):
+        return structure
+    if not isinstance(structure, str):
+        return GroupStructure(structure)
+    if structure not in _structures:
+        if structure == 'SCALE-252':
+            edges = scale_252_energy_bins
+        elif structure in few_group_boundaries:
+            edges = few_group_boundaries[structure]
+        elif structure in openmc_structures:
+            import openmc.mgxs
+            edges = openmc.mgxs.GROUP_STRUCTURES[structure]
+        else:
+            raise ValueError(f'Unknown group structure "{structure}", use SCALE-252, one of '
+                             f'{list(few_group_boundaries)} or {openmc_structures}')
+        _structures[structure] = GroupStructure(edges, structure)
+    return _structures[structure]
@@ -4,12 +4,22 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import copy
 from typing import List, Optional
+from vr1.latlib import read_lat, write_lat, code_is_valid
 
 
 class VR1LatticeBuilder:
     """Interactive GUI for building VR1 reactor lattice configurations"""
     
-    def __init__(self):
+    def __init__(self, evaluator=None, poll_interval_ms: int = 100):
+        """Builds the window.
+        Parameters:
+            - evaluator (BackgroundEvaluator, None): Estimates edited layouts in the background; none if None.
+            - poll_interval_ms (int): How often the mainloop collects results of the evaluator."""
+        self.evaluator = evaluator
+        self.poll_interval_ms = poll_interval_ms
+        self.power_map = None  # 8x8 relative power of the last estimate
+        self.previewer = None  # BackgroundEvaluator rendering geometry previews, created on first use
+        self.preview_window = None
         self.root = tk.Tk()
         self.root.title("VR-1 Reactor Lattice Builder")
         self.root.geometry("800x700")
@@ -67,6 +77,9 @@ class VR1LatticeBuilder:
         
         self.setup_ui()
         self.load_default_lattice()
+        if self.evaluator is not None:
+            self.root.after(self.poll_interval_ms, self.poll_evaluation)
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
         
     def setup_ui(self):
         """Set up the user interface"""
@@ -109,6 +122,11 @@ class VR1LatticeBuilder:
         self.status_label = ttk.Label(status_frame, text="Ready - Click on cells to edit")
         self.status_label.grid(row=0, column=0, sticky=tk.W)
         
+        # Background estimate of the current layout
+        self.estimate_label = ttk.Label(status_frame, text="" if self.evaluator is None else "k-eff: -",
+                                        font=('Courier', 10, 'bold'))
+        self.estimate_label.grid(row=1, column=0, sticky=tk.W)
+        
         # Component legend frame
         legend_frame = ttk.LabelFrame(main_frame, text="Component Types", padding="10")
         legend_frame.grid(row=4, column=0, columnspan=8, pady=(0, 10), sticky=(tk.W, tk.E))
@@ -134,6 +152,8 @@ class VR1LatticeBuilder:
                   command=self.save_configuration).grid(row=0, column=2, padx=5)
         ttk.Button(button_frame, text="Load Configuration", 
                   command=self.load_configuration).grid(row=0, column=3, padx=5)
+        ttk.Button(button_frame, text="Preview Geometry", 
+                  command=self.preview_geometry).grid(row=0, column=4, padx=5)
         
         # Configure grid weights for resizing
         self.root.columnconfigure(0, weight=1)
@@ -165,7 +185,10 @@ class VR1LatticeBuilder:
         component = self.current_lattice[row][col]
         btn = self.buttons[row][col]
         
-        btn.config(text=component, bg=self.get_cell_color(component))
+        text = component
+        if self.power_map is not None and self.power_map[row][col] > 0:
+            text = f"{component}\n{self.power_map[row][col]:.2f}"
+        btn.config(text=text, bg=self.get_cell_color(component))
         
         # Add hover tooltip simulation
         description = self.component_descriptions.get(component, component)
@@ -188,12 +211,14 @@ class VR1LatticeBuilder:
         # Update lattice and display
         self.current_lattice[row][col] = new_component
         self.update_button_display(row, col)
+        self.request_evaluation()
     
     def load_default_lattice(self):
         """Load the default lattice template"""
         self.current_lattice = copy.deepcopy(self.default_lattice)
         self.refresh_display()
         self.status_label.config(text="Default lattice loaded")
+        self.request_evaluation()
     
     def reset_to_water(self):
         """Reset all cells to water ('w')"""
@@ -207,6 +232,7 @@ class VR1LatticeBuilder:
                     self.current_lattice[row][col] = 'w'
         self.refresh_display()
         self.status_label.config(text="All cells reset to water")
+        self.request_evaluation()
     
     def refresh_display(self):
         """Refresh the entire grid display"""
@@ -224,19 +250,7 @@ class VR1LatticeBuilder:
             )
             
             if filename:
-                with open(filename, 'w') as f:
-                    # f.write('"""Custom VR-1 reactor lattice configuration"""\n\n')
-                    # f.write('# Generated by VR-1 Lattice Builder GUI\n\n')
-                    f.write('CUSTOM_LATTICE = [\n')
-                    
-                    for row in self.current_lattice:
-                        f.write(f'    {row},\n')
-                    
-                    f.write(']\n\n')
-                    # f.write('# Usage example:\n')
-                    # f.write('# from vr1.core import TestLattice\n')
-                    # f.write('# from custom_lattice import CUSTOM_LATTICE\n')
-                    # f.write('# my_core = TestLattice(lattice_str=CUSTOM_LATTICE)\n')
+                write_lat(filename, self.current_lattice)
                 
                 self.status_label.config(text=f"Configuration saved to {filename}")
                 messagebox.showinfo("Save Successful", f"Lattice configuration saved to:\n{filename}")
@@ -246,7 +260,7 @@ class VR1LatticeBuilder:
             messagebox.showerror("Save Error", f"Failed to save configuration:\n{str(e)}")
     
     def load_configuration(self):
-        """Load lattice configuration from a Python file"""
+        """Load lattice configuration from a .lat file"""
         try:
             filename = filedialog.askopenfilename(
                 filetypes=[("Lattice files", "*.lat"), ("All files", "*.*")],
@@ -254,50 +268,108 @@ class VR1LatticeBuilder:
             )
             
             if filename:
-                # Simple parsing - look for list assignment
-                with open(filename, 'r') as f:
-                    content = f.read()
-                
-                # This is a simple approach - in production, you might use ast.literal_eval
-                # Look for pattern like CUSTOM_LATTICE = [...] or similar
-                import re
-                
-                # Find list assignment pattern
-                pattern = r'(\w+_LATTICE|\w+)\s*=\s*\[(.*?)\]'
-                match = re.search(pattern, content, re.DOTALL)
-                
-                if match:
-                    # Try to evaluate the list
-                    list_content = '[' + match.group(2) + ']'
-                    try:
-                        loaded_lattice = eval(list_content)
-                        
-                        # Validate dimensions
-                        if len(loaded_lattice) == 8 and all(len(row) == 8 for row in loaded_lattice):
-                            self.current_lattice = loaded_lattice
-                            self.refresh_display()
-                            self.status_label.config(text=f"Configuration loaded from {filename}")
-                            messagebox.showinfo("Load Successful", "Lattice configuration loaded successfully!")
-                        else:
-                            raise ValueError("Invalid lattice dimensions - must be 8x8")
-                    
-                    except Exception as eval_error:
-                        raise ValueError(f"Could not parse lattice data: {eval_error}")
-                else:
-                    raise ValueError("Could not find lattice assignment in file")
+                # Parsed without executing the file
+                self.current_lattice = read_lat(filename)
+                self.refresh_display()
+                self.request_evaluation()
+                self.status_label.config(text=f"Configuration loaded from {filename}")
+                messagebox.showinfo("Load Successful", "Lattice configuration loaded successfully!")
         
         except Exception as e:
             self.status_label.config(text=f"Error loading: {str(e)}")
             messagebox.showerror("Load Error", f"Failed to load configuration:\n{str(e)}")
     
+    def request_evaluation(self):
+        """Send the current lattice to the background evaluator; returns at once"""
+        if self.evaluator is None:
+            return
+        if self.power_map is not None:
+            self.power_map = None
+            self.refresh_display()
+        if not all(code_is_valid(c) for row in self.current_lattice for c in row):
+            self.evaluator.cancel()
+            self.estimate_label.config(text="k-eff: - (layout has unknown codes)")
+            return
+        self.evaluator.request(self.current_lattice)
+        self.estimate_label.config(text="k-eff: estimating...")
+    
+    def poll_evaluation(self):
+        """Show streamed estimates of the current lattice; reschedules itself on the mainloop"""
+        for result in self.evaluator.poll():
+            if 'error' in result:
+                self.estimate_label.config(text=f"k-eff: - ({result['error']})")
+            elif 'keff' in result:
+                self.show_estimate(result)
+        self.root.after(self.poll_interval_ms, self.poll_evaluation)
+    
+    def show_estimate(self, result: dict):
+        """Display k-eff and, if present, the power map of an estimate"""
+        text = f"k-eff {result.get('method', '')}: {result['keff']:.5f}"
+        if result.get('keff_std') is not None:
+            text += f" +/- {result['keff_std']:.5f}"
+        if result.get('extrapolating'):
+            text += " (extrapolating)"
+        self.estimate_label.config(text=text)
+        if result.get('power') is not None:
+            self.power_map = result['power']
+            self.refresh_display()
+    
+    def preview_geometry(self):
+        """Render a slice of the current lattice in the background and show it, coarse first, in a separate window"""
+        if not all(code_is_valid(c) for row in self.current_lattice for c in row):
+            self.status_label.config(text="Cannot preview: layout has unknown codes")
+            return
+        if self.previewer is None:
+            from vr1.evaluator import BackgroundEvaluator
+            from vr1.raster import preview_estimator
+            self.previewer = BackgroundEvaluator(preview_estimator(), debounce=0.0)
+            self.root.after(self.poll_interval_ms, self.poll_preview)
+        self.previewer.request(self.current_lattice)
+        self.status_label.config(text="Rendering geometry preview...")
+    
+    def poll_preview(self):
+        """Show streamed preview images; reschedules itself on the mainloop"""
+        for result in self.previewer.poll():
+            if 'error' in result:
+                self.status_label.config(text=f"Preview failed: {result['error']}")
+            elif 'image' in result:
+                self.show_preview(result['image'])
+        self.root.after(self.poll_interval_ms, self.poll_preview)
+    
+    def show_preview(self, image, size: int = 400):
+        """Display an RGB image array, enlarged to about `size` pixels wide"""
+        if self.preview_window is None or not self.preview_window.winfo_exists():
+            self.preview_window = tk.Toplevel(self.root)
+            self.preview_window.title("VR-1 Geometry Preview")
+            self.preview_label = tk.Label(self.preview_window)
+            self.preview_label.pack()
+        scale = max(1, size // image.shape[1])
+        image = image.repeat(scale, axis=0).repeat(scale, axis=1)
+        header = f"P6 {image.shape[1]} {image.shape[0]} 255 ".encode()
+        # Kept on self, tkinter drops images without a Python reference
+        self.preview_photo = tk.PhotoImage(data=header + image.tobytes(), format='PPM')
+        self.preview_label.config(image=self.preview_photo)
+        self.status_label.config(text="Geometry preview updated")
+    
+    def close(self):
+        """Stop the background workers and close the window"""
+        for worker in (self.evaluator, self.previewer):
+            if worker is not None:
+                worker.shutdown()
+        self.root.destroy()
+    
     def run(self):
         """Start the GUI application"""
         self.root.mainloop()
 
 
-def main():
-    """Main function to run the lattice builder"""
-    app = VR1LatticeBuilder()
+def main(estimator=None):
+    """Main function to run the lattice builder, estimating edited layouts in the background if an estimator is given"""
+    evaluator = None
+    if estimator is not None:
+        from vr1.evaluator import BackgroundEvaluator
+        evaluator = BackgroundEvaluator(estimator)
+    app = VR1LatticeBuilder(evaluator=evaluator)
     app.run()
 
 
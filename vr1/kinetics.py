@@ -0,0 +1,153 @@
+""" Kinetics parameters of a VR1 core from iterated fission probability tallies, for the point kinetics solver """
+
+import copy
+import hashlib
+import json
+import os
+import numpy as np
+from vr1.utils import cache_dir, model_xml_hash
+
+n_delayed_groups: int = 6
+ifp_tally_name: str = 'ifp kinetics'
+ifp_group_tally_name: str = 'ifp beta by group'
+decay_tally_name: str = 'precursor decay'
+
+
+def ratio(num: np.ndarray, num_std: np.ndarray, den: np.ndarray, den_std: np.ndarray) -> tuple:
+    """ num / den and its standard deviation, numerator and denominator taken as uncorrelated """
+    num, num_std, den, den_std = (np.asarray(a, dtype=float) for a in (num, num_std, den, den_std))
+    value = num / den
+    rel = np.hypot(np.divide(num_std, num, out=np.zeros(num.shape), where=num != 0), den_std / den)
+    return value, np.abs(value) * rel
+
+
+def kinetics_parameters(tallies: dict, keff: float, keff_std: float = 0.0) -> dict:
+    """PointKineticsEquationSolver parameters from IFP and precursor decay tallies.
+    Parameters:
+        - tallies (dict): (mean, std) arrays of 'time_numerator', 'denominator' (one value each), 'beta_numerator',
+            'decay_rate' and 'delayed_nu_fission' (one value per delayed group).
+        - keff (float): Multiplication factor of the run.
+        - keff_std (float): Its standard deviation.
+    Returns:
+        - dict: 'beta' (beta_eff per group), 'lambda_' (decay constants [1/s]) and 'Lambda' (prompt generation time
+            [s]), as pke.solver.PointKineticsEquationSolver takes them, with 'beta_std', 'lambda_std', 'Lambda_std',
+            'beta_total', 'beta_total_std' and 'keff'."""
+    denominator = tallies['denominator']
+    beta, beta_std = ratio(*tallies['beta_numerator'], *denominator)
+    beta_total, beta_total_std = (float(a[0]) for a in ratio(np.sum(tallies['beta_numerator'][0]),
+                                  np.sqrt(np.sum(np.square(tallies['beta_numerator'][1]))), *denominator))
+    decay, decay_std = ratio(*tallies['decay_rate'], *tallies['delayed_nu_fission'])
+    time, time_std = ratio(*tallies['time_numerator'], *denominator)
+    generation_time, generation_time_std = (float(a[0]) for a in ratio(time, time_std, keff, keff_std))
+    if np.any(beta <= 0) or generation_time <= 0:
+        raise ValueError('IFP tallies gave non-positive kinetics parameters; run more particles or generations')
+    return {'beta': beta, 'lambda_': decay, 'Lambda': generation_time,
+            'beta_std': beta_std, 'lambda_std': decay_std, 'Lambda_std': generation_time_std,
+            'beta_total': beta_total, 'beta_total_std': beta_total_std, 'keff': keff}
+
+
+def params_to_json(params: dict) -> dict:
+    return {k: v.tolist() if isinstance(v, np.ndarray) else v for k, v in params.items()}
+
+
+def params_from_json(data: dict) -> dict:
+    return {k: np.array(v) if isinstance(v, list) else v for k, v in data.items()}
+
+
+class KineticsParameters:
+    """
+    beta_eff per delayed group, decay constants and prompt generation time of a core for point kinetics.
+    Parameters:
+        - lattice_str (list[list[str]]): Core layout.
+        - settings (VR1Settings, None): Eigenvalue settings; at least ifp_n_generation inactive batches.
+        - ifp_n_generation (int): IFP generations, i.e. how far the adjoint weighting looks ahead.
+        - output_dir (str): Run directory.
+        - threads (int, None): OpenMP threads.
+    Processing Logic:
+        - One eigenvalue run scores the IFP time and beta (per delayed group) numerators and the denominator,
+            giving adjoint-weighted beta_eff and Lambda, and the precursor decay and delayed nu-fission rates per
+            delayed group, giving the decay constants.
+        - Results are cached in cache_dir('kinetics') under a hash of the written materials and geometry, the cross
+            section library and the run statistics, so transient studies of a known core start without transport.
+    """
+    def __init__(self, lattice_str: list[list[str]], settings=None, ifp_n_generation: int = 10,
+                 output_dir: str = 'kinetics', threads: (int, None) = None) -> None:
+        self.lattice_str = [list(row) for row in lattice_str]
+        self.settings = settings
+        self.ifp_n_generation = ifp_n_generation
+        self.output_dir = output_dir
+        self.threads = threads
+
+    def tallies(self) -> list:
+        """ IFP and precursor tallies """
+        import openmc
+        ifp = openmc.Tally(name=ifp_tally_name)
+        ifp.scores = ['ifp-time-numerator', 'ifp-denominator']
+        groups = openmc.DelayedGroupFilter(list(range(1, n_delayed_groups + 1)))
+        beta = openmc.Tally(name=ifp_group_tally_name)
+        beta.filters = [groups]
+        beta.scores = ['ifp-beta-numerator']
+        decay = openmc.Tally(name=decay_tally_name)
+        decay.filters = [groups]
+        decay.scores = ['decay-rate', 'delayed-nu-fission']
+        return [ifp, beta, decay]
+
+    def writer(self):
+        """ Writes the IFP eigenvalue deck """
+        from vr1.core import Lattice
+        from vr1.settings import VR1Settings
+        from vr1.writer import WriterOpenMC
+        settings = copy.copy(self.settings) if self.settings is not None else VR1Settings()
+        inactive = settings.parm['inactive'] if 'inactive' in settings.parm else settings.parm['nsk']
+        if inactive < self.ifp_n_generation:
+            raise ValueError(f'IFP over {self.ifp_n_generation} generations needs at least as many inactive '
+                             f'batches, not {inactive}')
+        settings.run_mode = 'eigenvalue'
+        settings.ifp_n_generation = self.ifp_n_generation
+        settings.tallies = list(settings.tallies or []) + self.tallies()
+        writer = WriterOpenMC(settings, Lattice(lattice_str=self.lattice_str))
+        writer.output_dir = self.output_dir
+        writer.write_openmc_XML()
+        return writer
+
+    def key(self, model_hash: str) -> str:
+        """ Cache key of a configuration """
+        settings = self.settings
+        description = {'model': model_hash, 'ifp_n_generation': self.ifp_n_generation,
+                       'parm': settings.parm if settings is not None else None,
+                       'xs': getattr(settings, 'xs_xml', None) if settings is not None else None}
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()[:20]
+
+    def results(self, statepoint: str) -> dict:
+        """ kinetics_parameters() of a finished run """
+        import openmc
+        with openmc.StatePoint(statepoint) as sp:
+            ifp = sp.get_tally(name=ifp_tally_name)
+            beta = sp.get_tally(name=ifp_group_tally_name)
+            decay = sp.get_tally(name=decay_tally_name)
+
+            def score(tally, name: str) -> tuple:
+                return tuple(tally.get_values(scores=[name], value=v).ravel() for v in ('mean', 'std_dev'))
+
+            tallies = {'time_numerator': score(ifp, 'ifp-time-numerator'), 'denominator': score(ifp, 'ifp-denominator'),
+                       'beta_numerator': score(beta, 'ifp-beta-numerator'), 'decay_rate': score(decay, 'decay-rate'),
+                       'delayed_nu_fission': score(decay, 'delayed-nu-fission')}
+            return kinetics_parameters(tallies, float(sp.keff.nominal_value), float(sp.keff.std_dev))
+
+    def params(self, force: bool = False) -> dict:
+        """Kinetics parameters of the core, from the cache or by an IFP run.
+        Parameters:
+            - force (bool): Run even if cached.
+        Returns:
+            - dict: kinetics_parameters(), ready for PointKineticsEquationSolver(params=...)."""
+        from vr1.monitor import latest_statepoint
+        writer = self.writer()
+        cache_file = os.path.join(cache_dir('kinetics'), f'{self.key(model_xml_hash(self.output_dir))}.json')
+        if os.path.isfile(cache_file) and not force:
+            with open(cache_file) as f:
+                return params_from_json(json.load(f))
+        writer.run(threads=self.threads, write=False)
+        params = self.results(latest_statepoint(self.output_dir))
+        with open(cache_file, 'w') as f:
+            json.dump(params_to_json(params), f, indent=2)
+        return params
@@ -0,0 +1,296 @@
+""" Lattice layout files: safe .lat parsing, a one-layout-per-line stream format and an indexed bulk library """
+
+import ast
+import json
+import os
+import re
+import numpy as np
+from vr1.surrogate import featurize_ids, feature_names
+
+# Codes accepted by LatticeUnitVR1.get() without parameters; the library code table starts with these
+base_codes: list[str] = ['w', '8', '6', '4', 'X', 'O', 'd', 'rt', 'wrc', 'v90', 'v56', 'v30', 'v25', 'v12']
+# Parametrized codes: '6_<rod height>' and 'v<diameter>_<assembly type>'
+_param_code = re.compile(r'^(6_\d+(\.\d*)?|v\d\d_[468w])$')
+library_files: dict[str, str] = {'codes': 'codes.json', 'layouts': 'layouts.npy', 'features': 'features.npy',
+                                 'names': 'names.json'}
+# Features that are sums of stored columns
+derived_features: dict[str, list[str]] = {'n_fuel': ['n_8', 'n_6', 'n_4', 'n_rod']}
+
+
+def parse_lat(text: str) -> list[list[str]]:
+    """Layout from the text of a .lat file without executing it.
+    Parameters:
+        - text (str): Python-literal file as written by write_lat() (NAME = [[...], ...]), a bare list literal,
+            or one line of the stream format.
+    Returns:
+        - list[list[str]]: 8x8 layout."""
+    try:
+        tree = ast.parse(text)
+    except SyntaxError:
+        tree = None
+    if tree is not None:
+        for node in tree.body:
+            value = node.value if isinstance(node, (ast.Assign, ast.AnnAssign, ast.Expr)) else None
+            if isinstance(value, ast.List):
+                layout = ast.literal_eval(value)
+                check_shape(layout)
+                return layout
+    lines = [line for line in text.splitlines() if line.strip() and not line.lstrip().startswith('#')]
+    if len(lines) != 1:
+        raise ValueError('Could not find a lattice list in the file')
+    return parse_line(lines[0])[0]
+
+
+def check_shape(layout) -> None:
+    """ Raises ValueError if `layout` is not an 8x8 list of strings """
+    if not (isinstance(layout, list) and len(layout) == 8 and
+            all(isinstance(row, list) and len(row) == 8 and all(isinstance(c, str) for c in row) for row in layout)):
+        raise ValueError('Invalid lattice - must be an 8x8 list of strings')
+
+
+def read_lat(filename: str) -> list[list[str]]:
+    """ Layout stored in a .lat file """
+    with open(filename) as f:
+        return parse_lat(f.read())
+
+
+def write_lat(filename: str, layout: list[list[str]], name: str = 'CUSTOM_LATTICE') -> None:
+    """ Writes a layout as a Python-literal .lat file, readable by read_lat() """
+    check_shape(layout)
+    with open(filename, 'w') as f:
+        f.write(f'{name} = [\n')
+        for row in layout:
+            f.write(f'    {row},\n')
+        f.write(']\n')
+
+
+def format_line(layout: list[list[str]], name: (str, None) = None) -> str:
+    """ One stream line: optional name and tab, then rows separated by '/' with codes separated by spaces """
+    check_shape(layout)
+    line = '/'.join(' '.join(row) for row in layout)
+    return line if name is None else f'{name}\t{line}'
+
+
+def parse_line(line: str) -> tuple[list[list[str]], (str, None)]:
+    """ Layout and name (None if absent) of one stream line """
+    name, _, body = line.rstrip('\n').rpartition('\t')
+    layout = [row.split() for row in body.split('/')]
+    # Split rows always hold strings, only the shape needs checking
+    if len(layout) != 8 or any(len(row) != 8 for row in layout):
+        raise ValueError('Invalid lattice - must be an 8x8 list of strings')
+    return layout, name or None
+
+
+def iter_layouts(filename: str):
+    """Streams (layout, name) pairs from a layout stream file without loading it whole.
+    Parameters:
+        - filename (str): File with one layout per line (see format_line()); blank lines and '#' comments are skipped.
+    Returns:
+        - generator: (list[list[str]], str or None) per layout."""
+    with open(filename) as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip() or line.startswith('#'):
+                continue
+            try:
+                yield parse_line(line)
+            except ValueError as e:
+                raise ValueError(f'{filename}:{number}: {e}') from None
+
+
+def write_layouts(filename: str, layouts, names: (list[str], None) = None, append: bool = False) -> int:
+    """Writes layouts to a stream file, one per line.
+    Parameters:
+        - filename (str): Output file.
+        - layouts (iterable): 8x8 layouts; may be a generator.
+        - names (list[str], None): Optional name of every layout.
+        - append (bool): Append to an existing file instead of overwriting it.
+    Returns:
+        - int: Number of layouts written."""
+    n = 0
+    with open(filename, 'a' if append else 'w') as f:
+        for n, layout in enumerate(layouts, 1):
+            f.write(format_line(layout, None if names is None else names[n - 1]) + '\n')
+    return n
+
+
+def code_is_valid(code: str) -> bool:
+    """ True if LatticeUnitVR1.get() can build the lattice code """
+    return code in base_codes or bool(_param_code.match(code))
+
+
+def encode(layouts, codes: list[str]) -> np.ndarray:
+    """Unit-code IDs of layouts.
+    Parameters:
+        - layouts (list, np.ndarray): One 8x8 layout or a list of them.
+        - codes (list[str]): Code table, extended in place with codes not yet in it.
+    Returns:
+        - np.ndarray: (N, 8, 8) uint8 indices into `codes`."""
+    layouts = np.asarray(layouts, dtype=object)
+    if layouts.ndim == 2:
+        layouts = layouts[None]
+    if layouts.shape[1:] != (8, 8):
+        raise ValueError(f'Layouts must be 8x8, not {layouts.shape[1:]}')
+    index = {c: i for i, c in enumerate(codes)}
+    for c in set(layouts.ravel()) - index.keys():
+        index[c] = len(codes)
+        codes.append(c)
+    if len(codes) > 256:
+        raise ValueError(f'Code table has {len(codes)} entries, at most 256 fit in uint8')
+    # Dictionary lookups avoid sorting the object array as np.unique would
+    return np.fromiter(map(index.__getitem__, layouts.ravel()), dtype=np.uint8,
+                       count=layouts.size).reshape(layouts.shape)
+
+
+def decode(ids: np.ndarray, codes: list[str]) -> list:
+    """ Layouts (list of 8x8 lists) from unit-code IDs (N, 8, 8), or one layout from (8, 8) """
+    layouts = np.asarray(codes, dtype=object)[np.asarray(ids)]
+    return layouts.tolist()
+
+
+def validate(ids: np.ndarray, codes: list[str], template: (np.ndarray, None) = None) -> np.ndarray:
+    """Vectorized validity check of encoded layouts.
+    Parameters:
+        - ids (np.ndarray): (N, 8, 8) unit-code IDs.
+        - codes (list[str]): Code table of `ids`.
+        - template (np.ndarray, None): (8, 8) IDs of fixed positions (e.g. the 'wrc' row), 255 where free; a layout
+            must match it at every fixed position.
+    Returns:
+        - np.ndarray: (N,) bool, True for layouts of buildable codes that match the template."""
+    ids = np.asarray(ids)
+    valid_code = np.zeros(256, dtype=bool)
+    valid_code[:len(codes)] = [code_is_valid(c) for c in codes]
+    ok = valid_code[ids].all(axis=(-2, -1))
+    if template is not None:
+        fixed = template != 255
+        ok &= ((ids == template) | ~fixed).all(axis=(-2, -1))
+    return ok
+
+
+class LatticeLibrary:
+    """Directory of many layouts stored as unit-code IDs with precomputed features, read through memory maps.
+    Parameters:
+        - path (str): Library directory, as written by LatticeLibrary.build().
+    Processing Logic:
+        - codes.json is the code table; layouts.npy holds (N, 8, 8) uint8 IDs into it.
+        - features.npy holds (N, len(feature_names)) surrogate features, so query() filters by fuel or rod count
+            without decoding a single layout; names.json (optional) names the layouts."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, library_files['codes'])) as f:
+            self.codes: list[str] = json.load(f)
+        self.ids = np.load(os.path.join(path, library_files['layouts']), mmap_mode='r')
+        self.features = np.load(os.path.join(path, library_files['features']), mmap_mode='r')
+        names_file = os.path.join(path, library_files['names'])
+        self.names: (list[str], None) = None
+        if os.path.exists(names_file):
+            with open(names_file) as f:
+                self.names = json.load(f)
+
+    @classmethod
+    def build(cls, path: str, layouts, names: (list[str], None) = None, chunk: int = 10000) -> 'LatticeLibrary':
+        """Writes a library from layouts.
+        Parameters:
+            - path (str): Library directory, created if needed; an existing library there is replaced.
+            - layouts (iterable): 8x8 layouts, e.g. a generator over a stream file; encoded `chunk` at a time.
+            - names (list[str], None): Optional name of every layout.
+            - chunk (int): Layouts encoded and featurized per step.
+        Returns:
+            - LatticeLibrary: The written library."""
+        os.makedirs(path, exist_ok=True)
+        codes = list(base_codes)
+        ids, features, block = [], [], []
+
+        def flush():
+            if block:
+                encoded = encode(block, codes)
+                ok = validate(encoded, codes)
+                # Invalid layouts are stored but get NaN features, so no query matches them
+                f = np.full((len(block), len(feature_names)), np.nan)
+                if ok.any():
+                    f[ok] = featurize_ids(encoded[ok], codes)
+                ids.append(encoded)
+                features.append(f)
+                block.clear()
+
+        for layout in layouts:
+            block.append(layout)
+            if len(block) == chunk:
+                flush()
+        flush()
+        ids = np.concatenate(ids) if ids else np.zeros((0, 8, 8), dtype=np.uint8)
+        features = np.concatenate(features) if features else np.zeros((0, len(feature_names)))
+        if names is not None and len(names) != len(ids):
+            raise ValueError(f'{len(names)} names for {len(ids)} layouts')
+        np.save(os.path.join(path, library_files['layouts']), ids)
+        np.save(os.path.join(path, library_files['features']), features)
+        with open(os.path.join(path, library_files['codes']), 'w') as f:
+            json.dump(codes, f)
+        names_file = os.path.join(path, library_files['names'])
+        if names is not None:
+            with open(names_file, 'w') as f:
+                json.dump(list(names), f)
+        elif os.path.exists(names_file):
+            os.remove(names_file)
+        return cls(path)
+
+    @classmethod
+    def from_stream(cls, path: str, filename: str, chunk: int = 10000) -> 'LatticeLibrary':
+        """ Library built from a layout stream file; line names are kept if every line has one """
+        names: list = []
+        library = cls.build(path, (names.append(n) or layout for layout, n in iter_layouts(filename)), chunk=chunk)
+        if names and all(n is not None for n in names):
+            with open(os.path.join(path, library_files['names']), 'w') as f:
+                json.dump(names, f)
+            library.names = names
+        return library
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, index: int) -> list[list[str]]:
+        return decode(self.ids[index], self.codes)
+
+    def layouts(self, indices) -> list:
+        """ Decoded layouts at `indices` """
+        return decode(self.ids[np.asarray(indices)], self.codes)
+
+    def feature(self, name: str) -> np.ndarray:
+        """ One feature column (see surrogate.feature_names, or 'n_fuel') of every layout """
+        if name in derived_features:
+            return sum(self.feature(n) for n in derived_features[name])
+        if name not in feature_names:
+            raise ValueError(f'Unknown feature "{name}", use one of {feature_names + list(derived_features)}')
+        return np.asarray(self.features[:, feature_names.index(name)])
+
+    def query(self, **ranges) -> np.ndarray:
+        """Indices of layouts whose features lie in the given ranges.
+        Parameters:
+            - **ranges: feature=value for an exact match or feature=(low, high) for an inclusive range; None bounds
+                are open, e.g. query(n_fuel=(18, 20), n_rod=4).
+        Returns:
+            - np.ndarray: Matching layout indices."""
+        mask = np.ones(len(self), dtype=bool)
+        for name, bounds in ranges.items():
+            column = self.feature(name)
+            low, high = bounds if isinstance(bounds, (tuple, list)) else (bounds, bounds)
+            if low is not None:
+                mask &= column >= low
+            if high is not None:
+                mask &= column <= high
+        return np.flatnonzero(mask)
+
+    def validate(self, template: (list[list[str]], None) = None) -> np.ndarray:
+        """Validity of every layout (see validate()).
+        Parameters:
+            - template (list[list[str]], None): 8x8 layout with fixed codes and '' at free positions.
+        Returns:
+            - np.ndarray: (N,) bool."""
+        template_ids = None
+        if template is not None:
+            index = {c: i for i, c in enumerate(self.codes)}
+            if any(c != '' and c not in index for row in template for c in row):
+                # A fixed code that no layout uses cannot be matched
+                return np.zeros(len(self), dtype=bool)
+            template_ids = np.array([[255 if c == '' else index[c] for c in row] for row in template], dtype=np.uint8)
+        return validate(self.ids, self.codes, template_ids)
@@ -0,0 +1,248 @@
+""" Approach-to-critical (1/M) simulation of VR1 fuel loading sequences """
+
+import copy
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from vr1.sources import fuel_tubes
+
+loading_modes: list[str] = ['fixed source', 'eigenvalue']
+loading_json_name: str = 'loading.json'
+# Initial source of a warm-started eigenvalue step: copy of the previous step's final statepoint
+warm_source_name: str = 'initial_source.h5'
+
+
+def apply_edit(layout: list[list[str]], edit: (list, dict)) -> list[list[str]]:
+    """Layout after one loading step.
+    Parameters:
+        - layout (list[list[str]]): 8x8 layout before the step.
+        - edit (list, dict): (row, col, code) changes, a {(row, col): code} dict, or a complete 8x8 layout.
+    Returns:
+        - list[list[str]]: New layout; the input is not modified."""
+    if isinstance(edit, dict):
+        edit = [(row, col, code) for (row, col), code in edit.items()]
+    if len(edit) == len(layout) and all(isinstance(row, (list, tuple)) and len(row) == len(layout[0]) and
+                                        all(isinstance(c, str) for c in row) for row in edit):
+        return [list(row) for row in edit]
+    new = [list(row) for row in layout]
+    for row, col, code in edit:
+        if not (0 <= row < len(new) and 0 <= col < len(new[row])):
+            raise ValueError(f'Loading step edits position ({row}, {col}) outside the lattice')
+        new[row][col] = code
+    return new
+
+
+def loading_steps(base_layout: list[list[str]], edits: list) -> list[list[list[str]]]:
+    """ Layouts of a loading sequence: the base layout followed by the cumulative result of every edit """
+    layouts = [[list(row) for row in base_layout]]
+    for edit in edits:
+        layouts.append(apply_edit(layouts[-1], edit))
+    return layouts
+
+
+def loaded_fuel(layout: list[list[str]]) -> int:
+    """ Number of fuel tubes in a layout, the loading measure of the 1/M curve """
+    return sum(fuel_tubes(code) for row in layout for code in row)
+
+
+def inverse_multiplication(values: (list, np.ndarray)) -> np.ndarray:
+    """Normalized 1/M curve.
+    Parameters:
+        - values (list, np.ndarray): Multiplication M of every step, or detector count rates, which are proportional.
+    Returns:
+        - np.ndarray: values[0] / values, 1 at the first step and falling toward 0 at criticality."""
+    values = np.asarray(values, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(values > 0, values[0] / values, np.nan)
+
+
+def predict_critical(fuel: (list, np.ndarray), inverse_m: (list, np.ndarray), n_last: int = 2) -> float:
+    """Critical loading extrapolated from the last points of a 1/M curve, as done after every loading step.
+    Parameters:
+        - fuel (list, np.ndarray): Loaded fuel of each step.
+        - inverse_m (list, np.ndarray): 1/M of each step.
+        - n_last (int): Number of last points of the straight-line fit.
+    Returns:
+        - float: Fuel loading where the line reaches 1/M = 0; NaN if fewer than two points or 1/M is not falling."""
+    fuel = np.asarray(fuel, dtype=float)[-n_last:]
+    inverse_m = np.asarray(inverse_m, dtype=float)[-n_last:]
+    ok = np.isfinite(inverse_m)
+    if ok.sum() < 2 or np.ptp(fuel[ok]) == 0:
+        return float('nan')
+    slope, intercept = np.polyfit(fuel[ok], inverse_m[ok], 1)
+    return float(-intercept / slope) if slope < 0 else float('nan')
+
+
+class LoadingSequence:
+    """
+    Simulates a 1/M approach to criticality through an ordered sequence of loading steps.
+    Parameters:
+        - base_layout (list[list[str]]): 8x8 layout before the first step, e.g. only the start-up source channel.
+        - edits (list): One edit per loading step, see apply_edit().
+        - mode (str): 'fixed source' (FixedSourceRun with an AmBe source) or 'eigenvalue'.
+        - settings (VR1Settings, None): Base run settings, copied for every step.
+        - source (AmBeSource, None): Start-up source of fixed-source steps.
+        - detectors (list[Detector], None): Counters of fixed-source steps; each also gives an inverse count rate curve.
+        - output_root (str): Directory with one run directory per step and the loading.json record.
+        - biasing (bool): Weight-window biasing of fixed-source steps.
+        - warm_inactive (int): Inactive batches of eigenvalue steps that start from the previous step's source.
+        - min_inverse_m (float): Stop before a fixed-source step once 1/M drops below this, or once the predicted
+            critical loading does not exceed the next step's loading: a supercritical fixed-source run never ends.
+        - n_fit (int): Points of the 1/M extrapolation.
+    Processing Logic:
+        - All steps share one universe cache, so each lattice code is built once for the whole sequence.
+        - Eigenvalue steps after the first start from the fission source bank of the previous step's final
+            statepoint and skip most inactive batches.
+        - Step N+1 is built and written by a worker thread while OpenMC transports step N in its own process. The
+            monitor of a step does not read statepoints while the next step is being built, and results are read
+            only once that build is done, so the Python API of OpenMC is only ever used by one thread at a time.
+    """
+    def __init__(self, base_layout: list[list[str]], edits: list, mode: str = 'fixed source', settings=None,
+                 source=None, detectors: (list, None) = None, output_root: str = 'loading', biasing: bool = True,
+                 warm_inactive: int = 5, min_inverse_m: float = 0.05, n_fit: int = 2) -> None:
+        if mode not in loading_modes:
+            raise ValueError(f'Loading mode "{mode}" is not one of {loading_modes}')
+        self.layouts = loading_steps(base_layout, edits)
+        self.mode = mode
+        self.settings = settings
+        self.source = source
+        self.detectors: list = detectors if detectors is not None else []
+        self.output_root = output_root
+        self.biasing = biasing
+        self.warm_inactive = warm_inactive
+        self.min_inverse_m = min_inverse_m
+        self.n_fit = n_fit
+        self.universe_cache: dict = {}
+        self.results: list[dict] = []
+        self.stopped: (str, None) = None
+
+    def step_dir(self, i: int) -> str:
+        return os.path.join(self.output_root, f'step_{i:03d}')
+
+    def build(self, i: int):
+        """Writes the deck of step i.
+        Parameters:
+            - i (int): Step index.
+        Returns:
+            - tuple: (writer, FixedSourceRun or None)."""
+        from vr1.core import Lattice
+        from vr1.settings import VR1Settings
+        from vr1.writer import WriterOpenMC
+        base = self.settings if self.settings is not None else VR1Settings()
+        if self.mode == 'fixed source':
+            from vr1.fixed_source import FixedSourceRun
+            run = FixedSourceRun(self.layouts[i], self.source, self.detectors, base, self.biasing,
+                                 output_dir=self.step_dir(i), universe_cache=self.universe_cache)
+            writer = run.make_writer()
+        else:
+            import openmc
+            run = None
+            settings = copy.copy(base)
+            settings.parm = dict(base.parm)
+            if i > 0:
+                settings.parm['inactive'] = min(self.warm_inactive, settings.parm.get('inactive', self.warm_inactive))
+                warm_file = os.path.abspath(os.path.join(self.step_dir(i), warm_source_name))
+                settings.ext_sources = [openmc.FileSource(path=warm_file)]
+            writer = WriterOpenMC(settings, Lattice(lattice_str=self.layouts[i], universe_cache=self.universe_cache))
+            writer.output_dir = self.step_dir(i)
+        writer.write_openmc_XML()
+        return writer, run
+
+    def step_result(self, i: int, writer, run, summary: dict) -> dict:
+        """ Multiplication, detector responses and the 1/M curve up to step i """
+        from vr1.monitor import latest_statepoint
+        result: dict = {'step': i, 'layout': self.layouts[i], 'fuel': loaded_fuel(self.layouts[i]),
+                        'output_dir': writer.output_dir, 'wall_time': summary.get('wall_time')}
+        if run is not None:
+            result.update(run.results(latest_statepoint(writer.output_dir)))
+        else:
+            k, k_std = summary['keff'], summary['keff_std']
+            result.update(keff=k, keff_std=k_std, M=1.0 / (1.0 - k) if k < 1.0 else float('inf'))
+        multiplications = [r['M'] for r in self.results] + [result['M']]
+        fuel = [r['fuel'] for r in self.results] + [result['fuel']]
+        result['inverse_m'] = float(inverse_multiplication(multiplications)[-1])
+        result['predicted_critical_fuel'] = predict_critical(fuel, inverse_multiplication(multiplications),
+                                                             self.n_fit)
+        for name in result.get('detectors', {}):
+            rates = [r['detectors'][name]['count_rate'] for r in self.results]
+            rates.append(result['detectors'][name]['count_rate'])
+            result['detectors'][name]['inverse_count_rate'] = float(inverse_multiplication(rates)[-1])
+        return result
+
+    def stop_before(self, i: int) -> (str, None):
+        """ Reason not to run fixed-source step i, None if it is safe """
+        if self.mode != 'fixed source' or not self.results:
+            return None
+        last = self.results[-1]
+        if last['inverse_m'] < self.min_inverse_m:
+            return f'1/M = {last["inverse_m"]:.3f} is below {self.min_inverse_m}'
+        predicted = last['predicted_critical_fuel']
+        if np.isfinite(predicted) and loaded_fuel(self.layouts[i]) >= predicted:
+            return f'step {i} loads {loaded_fuel(self.layouts[i])} tubes, critical predicted at {predicted:.1f}'
+        return None
+
+    def run(self, threads: (int, None) = None, echo: bool = False) -> dict:
+        """Runs all steps, building each next step while the current one transports.
+        Parameters:
+            - threads (int, None): OpenMP threads of every run.
+            - echo (bool): Print OpenMC output.
+        Returns:
+            - dict: curve(), also written to output_root/loading.json."""
+        os.makedirs(self.output_root, exist_ok=True)
+        self.results = []
+        self.stopped = None
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='vr1-loading') as builder:
+            built = self.build(0)
+            for i in range(len(self.layouts)):
+                writer, run = built
+                if i > 0 and self.mode == 'eigenvalue':
+                    from vr1.monitor import latest_statepoint
+                    shutil.copyfile(latest_statepoint(self.step_dir(i - 1)),
+                                    os.path.join(self.step_dir(i), warm_source_name))
+                upcoming = builder.submit(self.build, i + 1) if i + 1 < len(self.layouts) else None
+                summary = writer.run(threads=threads, echo=echo, write=False, poll_statepoints=upcoming is None)
+                built = upcoming.result() if upcoming is not None else None
+                self.results.append(self.step_result(i, writer, run, summary))
+                self.stopped = self.stop_before(i + 1) if i + 1 < len(self.layouts) else None
+                if self.stopped:
+                    break
+        curve = self.curve()
+        with open(os.path.join(self.output_root, loading_json_name), 'w') as f:
+            json.dump(curve, f, indent=2, default=float)
+        return curve
+
+    def curve(self) -> dict:
+        """ 1/M curve of the steps run so far: fuel, M, 1/M, predictions and per-detector inverse count rates """
+        curve = {
+            'mode': self.mode,
+            'fuel': [r['fuel'] for r in self.results],
+            'M': [r['M'] for r in self.results],
+            'inverse_m': [r['inverse_m'] for r in self.results],
+            'predicted_critical_fuel': [r['predicted_critical_fuel'] for r in self.results],
+            'detectors': {name: [r['detectors'][name]['inverse_count_rate'] for r in self.results]
+                          for name in (self.results[0].get('detectors', {}) if self.results else {})},
+            'stopped': self.stopped,
+            'steps': self.results,
+        }
+        return curve
+
+    def plot(self, ax=None):
+        """ Plots the 1/M curve against the loaded fuel with the latest extrapolation """
+        import matplotlib.pyplot as plt
+        curve = self.curve()
+        if ax is None:
+            _, ax = plt.subplots()
+        ax.plot(curve['fuel'], curve['inverse_m'], 'o-', label='1/M (multiplication)')
+        for name, values in curve['detectors'].items():
+            ax.plot(curve['fuel'], values, 's--', label=f'1/M ({name})')
+        predicted = curve['predicted_critical_fuel'][-1] if self.results else float('nan')
+        if np.isfinite(predicted):
+            ax.plot([curve['fuel'][-1], predicted], [curve['inverse_m'][-1], 0.0], ':', color='gray')
+            ax.axvline(predicted, color='gray', linewidth=0.5, label=f'predicted critical: {predicted:.0f} tubes')
+        ax.set_xlabel('Loaded fuel tubes')
+        ax.set_ylabel('1/M')
+        ax.set_ylim(bottom=0.0)
+        ax.legend()
+        return ax
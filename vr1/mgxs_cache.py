@@ -0,0 +1,249 @@
+""" Multigroup cross sections of VR1 lattice units with a persistent on-disk cache """
+
+import hashlib
+import json
+import os
+import types
+import numpy as np
+import openmc
+import openmc.mgxs
+from vr1.lattice_units import LatticeUnitVR1, lattice_pitch, plane_zs
+from vr1.materials import VR1Materials, vr1_materials
+from vr1.monitor import RunMonitor, latest_statepoint
+from vr1.groups import few_group_boundaries, group_structure
+from vr1.utils import cache_dir
+
+# Requested group boundaries [eV]; they are snapped to the nearest SCALE 252 group boundary
+mgxs_group_boundaries: dict[str, list[float]] = {k: few_group_boundaries[k]
+                                                 for k in ('two_group', 'four_group', 'eight_group')}
+mgxs_types: list[str] = ['nu-transport', 'absorption', 'nu-fission', 'fission', 'consistent nu-scatter matrix',
+                         'multiplicity matrix', 'chi']
+mgxs_domain_types: list[str] = ['universe', 'material']
+# Lattice unit that drives the colorset of non-multiplying units
+driver_code: str = '8'
+
+
+def collapse_edges(boundaries: (str, list[float])) -> np.ndarray:
+    """Group boundaries as a collapse of the SCALE 252 structure.
+    Parameters:
+        - boundaries (str, list[float]): Name in `mgxs_group_boundaries` or boundaries in eV.
+    Returns:
+        - np.ndarray: Ascending boundaries, each one a SCALE 252 boundary."""
+    if isinstance(boundaries, str):
+        boundaries = mgxs_group_boundaries[boundaries]
+    return np.array(group_structure('SCALE-252').snap(boundaries).edges)
+
+
+def is_fuel(universe: openmc.Universe) -> bool:
+    """ True if the universe contains fissionable material """
+    return any('U235' in m.get_nuclides() for m in universe.get_all_materials().values())
+
+
+def material_signature(universe: openmc.Universe) -> list:
+    """ ID-independent description of the materials of a universe: name, temperature, density and composition """
+    signature: list = []
+    for m in sorted(universe.get_all_materials().values(), key=lambda m: m.name or ''):
+        densities = {n: round(float(d), 10) for n, d in sorted(m.get_nuclide_atom_densities().items())}
+        signature.append([m.name, m.temperature, densities, sorted(m._sab)])
+    return signature
+
+
+class MGXSCache:
+    """
+    Generates multigroup cross sections of VR1 lattice units with continuous-energy OpenMC and caches them.
+    Parameters:
+        - groups (str, list[float]): Group structure, a name in `mgxs_group_boundaries` or boundaries in eV.
+        - domain_type (str): 'universe' homogenizes the whole lattice unit, 'material' gives one set per material.
+        - particles (int): Particles per generation of the CE runs.
+        - batches (int): Batches of the CE runs.
+        - inactive (int): Inactive batches of the CE runs.
+        - materials (VR1Materials): Materials the units are built of.
+        - threads (int, None): OpenMP threads of the CE runs.
+    Processing Logic:
+        - Fuel units are calculated as an infinite lattice: reflective radially, the lattice box height axially.
+        - Non-multiplying units sit in the middle of a 3x3 colorset of '8' fuel assemblies, tallied alone.
+        - Every unit is cached as an MGXS HDF5 file keyed by its code, materials (with temperatures),
+          group structure and domain type, so only new or changed units are recalculated.
+    """
+    def __init__(self, groups: (str, list[float]) = 'eight_group', domain_type: str = 'universe',
+                 particles: int = 20000, batches: int = 80, inactive: int = 20,
+                 materials: VR1Materials = vr1_materials, threads: (int, None) = None) -> None:
+        if domain_type not in mgxs_domain_types:
+            raise ValueError(f'Unknown MGXS domain type {domain_type}, use one of {mgxs_domain_types}')
+        self.edges: np.ndarray = collapse_edges(groups)
+        self.domain_type: str = domain_type
+        self.particles: int = particles
+        self.batches: int = batches
+        self.inactive: int = inactive
+        self.materials: VR1Materials = materials
+        self.threads: (int, None) = threads
+        self.builder = LatticeUnitVR1(materials)
+        self.builder.load()
+
+    def key(self, code: str, universe: openmc.Universe) -> str:
+        """ Cache key of one lattice unit """
+        description = {'code': code, 'materials': material_signature(universe), 'edges': self.edges.tolist(),
+                       'domain_type': self.domain_type, 'mgxs_types': mgxs_types}
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()[:20]
+
+    def cache_file(self, code: str, universe: openmc.Universe) -> str:
+        """ MGXS HDF5 file of one lattice unit in the cache """
+        return os.path.join(cache_dir('mgxs'), f'{code}_{self.key(code, universe)}.h5')
+
+    def unit_geometry(self, code: str, universe: openmc.Universe) -> openmc.Geometry:
+        """Geometry of the CE calculation of one lattice unit.
+        Parameters:
+            - code (str): Lattice code of the unit.
+            - universe (openmc.Universe): The unit built by LatticeUnitVR1.get(code).
+        Returns:
+            - openmc.Geometry: Reflective infinite lattice of a fuel unit, or a colorset around a non-fuel unit."""
+        z0, z1 = plane_zs['H01.sc'], plane_zs['FAZ.2']
+        n = 1 if is_fuel(universe) else 3
+        if n == 3 and self.domain_type == 'material':
+            raise ValueError(f'Material-wise cross sections of the non-fuel unit "{code}" would mix in the '
+                             f'materials of the colorset drivers, use domain_type="universe"')
+        half = n * lattice_pitch / 2.0
+        box = openmc.model.RectangularParallelepiped(-half, half, -half, half, z0, z1, boundary_type='reflective')
+        for surface in (box.zmin, box.zmax):
+            surface.boundary_type = 'vacuum'
+        if n == 1:
+            return openmc.Geometry([openmc.Cell(fill=universe, region=-box)])
+        lattice = openmc.RectLattice(name=f'colorset {code}')
+        lattice.lower_left = (-half, -half)
+        lattice.pitch = (lattice_pitch, lattice_pitch)
+        driver = self.builder.get(driver_code)
+        lattice.universes = [[universe if (i, j) == (1, 1) else driver for j in range(n)] for i in range(n)]
+        return openmc.Geometry([openmc.Cell(fill=lattice, region=-box)])
+
+    def unit_settings(self, geometry: openmc.Geometry) -> openmc.Settings:
+        """ Eigenvalue settings of the CE calculation """
+        settings = openmc.Settings()
+        settings.particles = self.particles
+        settings.batches = self.batches
+        settings.inactive = self.inactive
+        settings.temperature = {'method': 'interpolation'}
+        lower_left, upper_right = geometry.bounding_box
+        settings.source = openmc.IndependentSource(
+            space=openmc.stats.Box((lower_left[0], lower_left[1], plane_zs['FAZ.4']),
+                                   (upper_right[0], upper_right[1], plane_zs['FAZ.3'])),
+            constraints={'fissionable': True})
+        return settings
+
+    def xsdata_names(self, code: str, library: openmc.mgxs.Library) -> list[str]:
+        """ Names of the MGXS data sets of a unit: the code itself, or code:material name """
+        if self.domain_type == 'universe':
+            return [code]
+        return [f'{code}:{m.name}' for m in library.domains]
+
+    def generate(self, code: str, force: bool = False) -> str:
+        """Calculates the cross sections of one lattice unit unless they are cached.
+        Parameters:
+            - code (str): Lattice code, anything LatticeUnitVR1.get() accepts.
+            - force (bool): Recalculate even if cached.
+        Returns:
+            - str: The cached MGXS HDF5 file."""
+        universe = self.builder.get(code)
+        cache_file = self.cache_file(code, universe)
+        if os.path.isfile(cache_file) and not force:
+            return cache_file
+        geometry = self.unit_geometry(code, universe)
+        library = openmc.mgxs.Library(geometry)
+        library.energy_groups = openmc.mgxs.EnergyGroups(self.edges)
+        library.mgxs_types = mgxs_types
+        library.by_nuclide = False
+        library.correction = None
+        library.domain_type = self.domain_type
+        if self.domain_type == 'universe':
+            library.domains = [universe]
+        else:
+            library.domains = list(universe.get_all_materials().values())
+        library.build_library()
+        tallies = openmc.Tallies()
+        library.add_to_tallies_file(tallies, merge=True)
+
+        run_dir = os.path.join(cache_dir('mgxs'), 'work', os.path.basename(cache_file)[:-3])
+        os.makedirs(run_dir, exist_ok=True)
+        settings = self.unit_settings(geometry)
+        model = openmc.Model(geometry=geometry, materials=openmc.Materials(geometry.get_all_materials().values()),
+                             settings=settings, tallies=tallies)
+        model.export_to_model_xml(run_dir)
+        RunMonitor(types.SimpleNamespace(output_dir=run_dir, openmc_settings=settings), name=f'mgxs {code}',
+                   poll_statepoints=False).run(threads=self.threads)
+
+        with openmc.StatePoint(latest_statepoint(run_dir)) as sp:
+            library.load_from_statepoint(sp)
+        mg_library = library.create_mg_library(xs_type='macro', xsdata_names=self.xsdata_names(code, library))
+        mg_library.export_to_hdf5(cache_file)
+        return cache_file
+
+    def library(self, codes: (list[str], set[str])) -> openmc.MGXSLibrary:
+        """ One MGXS library with the cross sections of all given lattice codes, generating missing ones """
+        merged = openmc.MGXSLibrary(openmc.mgxs.EnergyGroups(self.edges))
+        for code in sorted(set(codes)):
+            merged.add_xsdatas(openmc.MGXSLibrary.from_hdf5(self.generate(code)).xsdatas)
+        return merged
+
+    def diffusion_xs(self, codes: (list[str], set[str])) -> dict:
+        """Homogenized cross sections of lattice codes in the form DiffusionSolver takes them.
+        Parameters:
+            - codes (list[str], set[str]): Lattice codes, generated if not cached.
+        Returns:
+            - dict: {code: {'total', 'absorption', 'nu_fission', 'fission', 'chi', 'scatter'}} with P0 nu-scatter [g_in, g_out]."""
+        if self.domain_type != 'universe':
+            raise ValueError('Diffusion needs homogenized (domain_type="universe") cross sections')
+        xs: dict = {}
+        for code in sorted(set(codes)):
+            data = openmc.MGXSLibrary.from_hdf5(self.generate(code)).get_by_name(code)
+            n_groups = data.energy_groups.num_groups
+            fissionable = data.fissionable and data.nu_fission[0] is not None
+            xs[code] = {
+                'total': np.asarray(data.total[0]),
+                'absorption': np.asarray(data.absorption[0]),
+                'nu_fission': np.asarray(data.nu_fission[0]) if fissionable else np.zeros(n_groups),
+                'fission': np.asarray(data.fission[0]) if fissionable else np.zeros(n_groups),
+                'chi': np.nan_to_num(np.asarray(data.chi[0])) if fissionable else np.zeros(n_groups),
+                'scatter': np.asarray(data.scatter_matrix[0])[:, :, 0],
+            }
+        return xs
+
+    def mg_model(self, lattice_str: list[list[str]], settings: openmc.Settings,
+                 filename: str = 'mgxs.h5') -> openmc.Model:
+        """Multigroup model of a core lattice built of homogenized lattice units.
+        Parameters:
+            - lattice_str (list[list[str]]): 8x8 lattice layout, as in Lattice.
+            - settings (openmc.Settings): Run settings, e.g. WriterOpenMC.set_settings(); switched to multi-group mode.
+            - filename (str): Name of the MGXS library file written next to the model.
+        Returns:
+            - openmc.Model: Model to be exported into the directory where `filename` is written by export_library()."""
+        if self.domain_type != 'universe':
+            raise ValueError('A multigroup core model needs homogenized (domain_type="universe") cross sections')
+        codes = sorted({code for row in lattice_str for code in row})
+        unit_materials: dict = {}
+        unit_universes: dict = {}
+        for code in codes:
+            material = openmc.Material(name=f'mgxs {code}')
+            material.set_density('macro', 1.0)
+            material.add_macroscopic(code)
+            unit_materials[code] = material
+            unit_universes[code] = openmc.Universe(cells=[openmc.Cell(fill=material)])
+        n = len(lattice_str)
+        xy_corner = float(n) * lattice_pitch / 2.0
+        lattice = openmc.RectLattice(name='mg lattice')
+        lattice.lower_left = (-xy_corner, -xy_corner)
+        lattice.pitch = (lattice_pitch, lattice_pitch)
+        lattice.universes = [[unit_universes[code] for code in row] for row in lattice_str]
+        box = openmc.model.RectangularParallelepiped(-xy_corner, xy_corner, -xy_corner, xy_corner,
+                                                     plane_zs['H01.sc'], plane_zs['FAZ.2'], boundary_type='vacuum')
+        materials = openmc.Materials(unit_materials.values())
+        materials.cross_sections = filename
+        settings.energy_mode = 'multi-group'
+        settings.temperature = {}
+        return openmc.Model(geometry=openmc.Geometry([openmc.Cell(fill=lattice, region=-box)]),
+                            materials=materials, settings=settings)
+
+    def export_library(self, lattice_str: list[list[str]], output_dir: str, filename: str = 'mgxs.h5') -> str:
+        """ Writes the merged library of all codes of a lattice into output_dir and returns its path """
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, filename)
+        self.library({code for row in lattice_str for code in row}).export_to_hdf5(path)
+        return path
@@ -0,0 +1,392 @@
+""" Batch-level monitor for OpenMC runs of VR1 models """
+
+import glob
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import numpy as np
+
+number_re: str = r'[-+]?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?'
+# OpenMC eigenvalue batch line, e.g. "   12/1    1.02361    6.12345    1.01936 +/- 0.00424"
+batch_line_re = re.compile(rf'^\s*(\d+)/(\d+)\s+({number_re})(?:\s+({number_re}))??'
+                           rf'(?:\s+({number_re})\s+\+/-\s+({number_re}))?\s*$')
+rate_line_re = re.compile(rf'Calculation Rate \((\w+)\)\s*=\s*({number_re})')
+monitor_json_name: str = 'run_monitor.json'
+
+
+def parse_batch_line(line: str) -> (dict, None):
+    """Parse one line of OpenMC eigenvalue output.
+    Parameters:
+        - line (str): A line of OpenMC standard output.
+    Returns:
+        - dict or None: Batch, generation, k, entropy, running average k and its std, or None if not a batch line."""
+    m = batch_line_re.match(line)
+    if m is None:
+        return None
+    batch, gen, k, entropy, k_avg, k_std = m.groups()
+    return {'batch': int(batch), 'gen': int(gen), 'k': float(k),
+            'entropy': float(entropy) if entropy is not None else None,
+            'k_avg': float(k_avg) if k_avg is not None else None,
+            'k_std': float(k_std) if k_std is not None else None}
+
+
+class RunMonitor:
+    """
+    Runs OpenMC on a model written by WriterOpenMC and records its progress batch by batch.
+    Parameters:
+        - writer (WriterOpenMC): Writer whose model XML deck has already been written by write_openmc_XML().
+        - name (str, None): Name of the run in the JSON record; defaults to the writer's output directory.
+        - poll_statepoints (bool): Read intermediate statepoints as they appear to track tally relative errors.
+        - metadata (dict, None): Extra information stored with the record, e.g. the lattice layout.
+        - resume (bool): The run continues from a statepoint; its batches are appended to the existing record.
+    Processing Logic:
+        - Streams OpenMC standard output, timestamps every batch line, and derives particles/s from the spacing.
+        - Estimates how many active batches are needed to reach the k-eff trigger threshold and when that will be.
+        - Writes a compact, column-oriented JSON time series into the output directory.
+        - Statepoints already in the output directory when the run starts belong to an earlier run (or to the part
+            of this one before a restart) and are only read if OpenMC writes them again.
+        - A resumed run keeps the earlier series, shifted so that time runs on across the restart, and lists every
+            restart under 'restarts'.
+    """
+    def __init__(self, writer, name: (str, None) = None, poll_statepoints: bool = True,
+                 metadata: (dict, None) = None, resume: bool = False) -> None:
+        self.writer = writer
+        self.output_dir: str = writer.output_dir
+        self.name: str = name if name is not None else os.path.basename(os.path.abspath(self.output_dir))
+        self.poll_statepoints = poll_statepoints
+        self.metadata: dict = metadata if metadata is not None else {}
+        openmc_settings = writer.openmc_settings
+        self.npg: int = int(openmc_settings.particles)
+        self.batches: int = int(openmc_settings.batches)
+        self.inactive: int = int(openmc_settings.inactive or 0)
+        self.gens_per_batch: int = int(openmc_settings.generations_per_batch or 1)
+        trigger = openmc_settings.keff_trigger
+        self.target_std: (float, None) = float(trigger['threshold']) if trigger else None
+        self.threads: (int, None) = None
+        self.event_based: bool = False
+        self.t_start: float = 0.0
+        self.records: list[dict] = []
+        self.tally_records: list[dict] = []
+        self.final_rates: dict = {}
+        self.max_rss_mb: (float, None) = None
+        self._seen_statepoints: set = set()
+        self._stale_statepoints: dict[str, int] = {}
+        self.previous: (dict, None) = None
+        record = os.path.join(self.output_dir, monitor_json_name)
+        if resume and os.path.isfile(record):
+            with open(record) as f:
+                self.previous = json.load(f)
+
+    def command(self, threads: (int, None) = None, event_based: bool = False,
+                restart_file: (str, None) = None, openmc_exec: str = 'openmc') -> list[str]:
+        """ OpenMC command line for this run """
+        cmd: list[str] = [openmc_exec]
+        if threads:
+            cmd += ['-s', str(threads)]
+        if event_based:
+            cmd.append('-e')
+        if restart_file:
+            cmd += ['-r', restart_file]
+        return cmd
+
+    def run(self, threads: (int, None) = None, event_based: bool = False, restart_file: (str, None) = None,
+            openmc_exec: str = 'openmc', echo: bool = False, command_line: (list[str], None) = None,
+            cancel: (threading.Event, None) = None) -> dict:
+        """Run OpenMC in the writer's output directory while recording the batch time series.
+        Parameters:
+            - threads (int, None): Number of OpenMP threads; OpenMC default if None.
+            - event_based (bool): Use event-based instead of history-based transport.
+            - restart_file (str, None): Statepoint to restart the run from.
+            - openmc_exec (str): OpenMC executable.
+            - echo (bool): Print OpenMC output while it runs.
+            - command_line (list[str], None): Command to run instead of the OpenMC executable, e.g. the CMFD driver.
+            - cancel (threading.Event, None): Terminates OpenMC once set, e.g. when its result is no longer wanted.
+        Returns:
+            - dict: Run summary, also stored in the JSON record."""
+        self.threads = threads
+        self.event_based = event_based
+        self.t_start = time.time()
+        cmd = command_line if command_line else self.command(threads, event_based, restart_file, openmc_exec)
+        self._stale_statepoints = {f: os.stat(f).st_mtime_ns
+                                   for f in glob.glob(os.path.join(self.output_dir, 'statepoint.*.h5'))}
+        with subprocess.Popen(cmd, cwd=self.output_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              text=True, bufsize=1) as proc:
+            done = threading.Event()
+            watcher = None
+            if cancel is not None:
+                watcher = threading.Thread(target=terminate_on, args=(proc, cancel, done), daemon=True)
+                watcher.start()
+            for line in proc.stdout:
+                if echo:
+                    print(line, end='')
+                self.feed(line, time.time() - self.t_start)
+            # The watcher must be finished before the process is reaped, it never signals a reused pid
+            done.set()
+            if watcher is not None:
+                watcher.join()
+            # wait4 gives the resource usage of this child alone, including its peak memory
+            _, status, usage = os.wait4(proc.pid, 0)
+            return_code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+            proc.returncode = return_code
+        self.max_rss_mb = usage.ru_maxrss / (1024.0 ** 2 if sys.platform == 'darwin' else 1024.0)
+        if self.poll_statepoints:
+            self.check_statepoints(time.time() - self.t_start)
+        if return_code != 0:
+            self.write_json()
+            if cancel is not None and cancel.is_set():
+                raise RuntimeError(f'OpenMC run in {self.output_dir} was cancelled')
+            raise RuntimeError(f'OpenMC failed in {self.output_dir} with return code {return_code}')
+        return self.write_json()
+
+    def feed(self, line: str, t: float) -> None:
+        """ Processes one line of OpenMC output seen t seconds after the start """
+        m = rate_line_re.search(line)
+        if m:
+            self.final_rates[m.group(1)] = float(m.group(2))
+            return
+        rec = parse_batch_line(line)
+        if rec is None:
+            return
+        rec['time'] = t
+        # The first batch also carries the initialization time, so it gets no rate
+        t_prev = self.records[-1]['time'] if self.records else None
+        rec['rate'] = self.npg / (t - t_prev) if t_prev is not None and t > t_prev else None
+        self.records.append(rec)
+        if self.poll_statepoints:
+            self.check_statepoints(t)
+
+    def check_statepoints(self, t: float) -> None:
+        """ Reads intermediate statepoints that appeared or were rewritten since the last call """
+        for sp_file in sorted(glob.glob(os.path.join(self.output_dir, 'statepoint.*.h5'))):
+            if sp_file in self._seen_statepoints:
+                continue
+            if self._stale_statepoints.get(sp_file) == os.stat(sp_file).st_mtime_ns:
+                continue
+            self._seen_statepoints.add(sp_file)
+            try:
+                self.tally_records += statepoint_tally_errors(sp_file, t)
+            except (OSError, KeyError):
+                # File still being written by OpenMC, try again later
+                self._seen_statepoints.discard(sp_file)
+
+    def eta(self) -> dict:
+        """Estimate the remaining run time from the current k-eff standard deviation.
+        Returns:
+            - dict: Active batches needed to reach the trigger threshold, and the seconds to the threshold and to the
+                configured end."""
+        active = [r for r in self.records if r['k_std'] is not None]
+        if not active:
+            return {'batches_needed': None, 'seconds_to_target': None, 'seconds_to_end': None}
+        last_batch = self.records[-1]['batch']
+        n_done = max(last_batch - self.inactive, 1)
+        t_per_batch = (active[-1]['time'] - active[0]['time']) / max(active[-1]['batch'] - active[0]['batch'], 1)
+        seconds_to_end = max(self.batches - last_batch, 0) * t_per_batch
+        batches_needed = None
+        seconds_to_target = None
+        if self.target_std and active[-1]['k_std'] > 0:
+            # Standard deviation of the mean falls as 1/sqrt(number of active batches)
+            batches_needed = int(np.ceil(n_done * (active[-1]['k_std'] / self.target_std) ** 2))
+            seconds_to_target = max(batches_needed - n_done, 0) * t_per_batch
+        return {'batches_needed': batches_needed, 'seconds_to_target': seconds_to_target,
+                'seconds_to_end': seconds_to_end}
+
+    def summary(self) -> dict:
+        """ Summary numbers of the run """
+        rates = np.array([r['rate'] for r in self.records if r['rate']], dtype=float)
+        inactive_rates = np.array([r['rate'] for r in self.records if r['rate'] and r['k_std'] is None], dtype=float)
+        active_rates = np.array([r['rate'] for r in self.records if r['rate'] and r['k_std'] is not None],
+                                dtype=float)
+        last = self.records[-1] if self.records else {}
+        summary: dict = {
+            'wall_time': self.records[-1]['time'] if self.records else None,
+            'batches_done': last.get('batch'),
+            'keff': last.get('k_avg'),
+            'keff_std': last.get('k_std'),
+            'rate_mean': float(rates.mean()) if rates.size else None,
+            'rate_inactive': self.final_rates.get('inactive', float(inactive_rates.mean())
+                                                  if inactive_rates.size else None),
+            'rate_active': self.final_rates.get('active', float(active_rates.mean()) if active_rates.size else None),
+            'threads': self.threads,
+            'event_based': self.event_based,
+            'max_rss_mb': self.max_rss_mb,
+        }
+        if summary['rate_active'] and self.threads:
+            summary['rate_per_thread'] = summary['rate_active'] / self.threads
+        summary.update(self.eta())
+        return summary
+
+    def to_dict(self) -> dict:
+        """ Column-oriented record of the run """
+        columns: list[str] = ['batch', 'gen', 'time', 'rate', 'k', 'entropy', 'k_avg', 'k_std']
+        series: dict = {c: [r[c] for r in self.records] for c in columns}
+        tally_columns: list[str] = ['batch', 'time', 'tally', 'max_rel_err', 'mean_rel_err']
+        tally_series: dict = {c: [r[c] for r in self.tally_records] for c in tally_columns}
+        summary = self.summary()
+        metadata = self.metadata
+        restarts: list[dict] = []
+        if self.previous is not None:
+            offset = self.previous['summary'].get('wall_time') or 0.0
+            for columns_now, columns_before in ((series, self.previous['series']),
+                                                (tally_series, self.previous['tally_series'])):
+                columns_now['time'] = [t + offset for t in columns_now['time']]
+                for c in columns_now:
+                    columns_now[c] = columns_before.get(c, [None] * len(columns_before['time'])) + columns_now[c]
+            if summary['wall_time'] is not None:
+                summary['wall_time'] += offset
+            metadata = {**self.previous.get('metadata', {}), **self.metadata}
+            restarts = self.previous.get('restarts', []) + [
+                {'batch': self.records[0]['batch'] if self.records else None,
+                 'restarted_from': self.metadata.get('restarted_from')}]
+        return {
+            'name': self.name,
+            'output_dir': os.path.abspath(self.output_dir),
+            'hostname': os.uname()[1],
+            'settings': {'npg': self.npg, 'batches': self.batches, 'inactive': self.inactive,
+                         'generations_per_batch': self.gens_per_batch, 'target_std': self.target_std},
+            'metadata': metadata,
+            'summary': summary,
+            'series': series,
+            'tally_series': tally_series,
+            'restarts': restarts,
+        }
+
+    def write_json(self, filename: (str, None) = None) -> dict:
+        """ Writes the JSON record into the output directory, returns the run summary """
+        if filename is None:
+            filename = os.path.join(self.output_dir, monitor_json_name)
+        record = self.to_dict()
+        with open(filename, 'w') as f:
+            json.dump(record, f, separators=(',', ':'))
+        return record['summary']
+
+
+def terminate_on(proc: subprocess.Popen, cancel: threading.Event, done: threading.Event,
+                 interval: float = 0.1) -> None:
+    """ Terminates a process once cancel is set, unless done is set first; body of a watcher thread """
+    while not done.is_set():
+        if cancel.wait(interval):
+            proc.terminate()
+            return
+
+
+def statepoint_batch(sp_file: str) -> int:
+    """ Batch number from a statepoint file name such as statepoint.040.h5 """
+    return int(os.path.basename(sp_file).split('.')[1])
+
+
+def latest_statepoint(run_dir: str) -> (str, None):
+    """ Statepoint file with the highest batch number in a run directory, None if there is none """
+    sp_files = glob.glob(os.path.join(run_dir, 'statepoint.*.h5'))
+    if not sp_files:
+        return None
+    return max(sp_files, key=statepoint_batch)
+
+
+def restart_point(run_dir: str, batches: int) -> (str, None):
+    """ Latest statepoint of a run directory that is earlier than batches, i.e. one a run can continue from """
+    sp_files = [f for f in glob.glob(os.path.join(run_dir, 'statepoint.*.h5')) if statepoint_batch(f) < batches]
+    return max(sp_files, key=statepoint_batch) if sp_files else None
+
+
+def statepoint_tally_errors(sp_file: str, t: float) -> list[dict]:
+    """Relative errors of all tallies in a statepoint file.
+    Parameters:
+        - sp_file (str): Path to the statepoint file.
+        - t (float): Time since the start of the run when the file was read.
+    Returns:
+        - list[dict]: One record per tally with its maximum and mean relative error over non-zero bins."""
+    import openmc
+    records: list[dict] = []
+    with openmc.StatePoint(sp_file, autolink=False) as sp:
+        for tally in sp.tallies.values():
+            mean = tally.mean.ravel()
+            std = tally.std_dev.ravel()
+            nonzero = mean > 0
+            if not nonzero.any():
+                continue
+            rel = std[nonzero] / mean[nonzero]
+            records.append({'batch': int(sp.current_batch), 'time': t, 'tally': tally.name or str(tally.id),
+                            'max_rel_err': float(rel.max()), 'mean_rel_err': float(rel.mean())})
+    return records
+
+
+def summarize_sweep(run_dirs: list[str], filename: (str, None) = None) -> dict:
+    """Aggregates the JSON records of several monitored runs.
+    Parameters:
+        - run_dirs (list[str]): Output directories of the runs, or paths to their JSON records.
+        - filename (str, None): If given, the summary is written there as JSON.
+    Returns:
+        - dict: Per-run summaries sorted from the slowest to the fastest active rate, and sweep totals."""
+    runs: list[dict] = []
+    for run_dir in run_dirs:
+        path = run_dir if run_dir.endswith('.json') else os.path.join(run_dir, monitor_json_name)
+        with open(path) as f:
+            record = json.load(f)
+        runs.append({'name': record['name'], 'output_dir': record['output_dir'], **record['settings'],
+                     **record['summary'], 'metadata': record.get('metadata', {})})
+    runs.sort(key=lambda r: r['rate_active'] if r['rate_active'] is not None else -1.0)
+    rates = [r['rate_active'] for r in runs if r['rate_active'] is not None]
+    sweep: dict = {
+        'n_runs': len(runs),
+        'total_wall_time': sum(r['wall_time'] or 0.0 for r in runs),
+        'rate_active_min': min(rates) if rates else None,
+        'rate_active_max': max(rates) if rates else None,
+        'rate_active_median': float(np.median(rates)) if rates else None,
+        'runs': runs,
+    }
+    if filename is not None:
+        with open(filename, 'w') as f:
+            json.dump(sweep, f, indent=1)
+    return sweep
+
+
+def run_or_resume(writer, threads: (int, None) = None, event_based: bool = False) -> dict:
+    """Runs the model of a writer, continues it from its latest statepoint, or skips it if it already finished.
+    A run is finished when it has its final statepoint and its record; a final statepoint without a record (e.g.
+    from a run outside the monitor) has nothing left to restart, so the run is repeated.
+    Parameters:
+        - writer (WriterOpenMC): Writer of the model; its output directory identifies the run.
+        - threads (int, None): Number of OpenMP threads.
+        - event_based (bool): Use event-based transport.
+    Returns:
+        - dict: Summary of the run, read from its JSON record if the run had already finished."""
+    batches = writer.set_settings().batches
+    latest = latest_statepoint(writer.output_dir)
+    record = os.path.join(writer.output_dir, monitor_json_name)
+    if latest is not None and statepoint_batch(latest) >= batches and os.path.isfile(record):
+        with open(record) as f:
+            return json.load(f)['summary']
+    sp_file = restart_point(writer.output_dir, batches)
+    if sp_file is None or latest != sp_file:
+        # Nothing to continue from, or a finished run without a record
+        return writer.run(threads=threads, event_based=event_based)
+    # Interrupted run: keep the deck on disk as it is, the statepoint belongs to it
+    from vr1.cmfd import cmfd_command, read_spec
+    writer.openmc_settings = writer.set_settings()
+    monitor = RunMonitor(writer, metadata={'restarted_from': os.path.basename(sp_file)}, resume=True)
+    command_line = None
+    if read_spec(writer.output_dir) is not None:
+        command_line = cmfd_command(threads=threads, event_based=event_based, restart_file=os.path.basename(sp_file))
+    return monitor.run(threads=threads, event_based=event_based, restart_file=os.path.basename(sp_file),
+                       command_line=command_line)
+
+
+def run_sweep(writers: list, threads: (int, None) = None, event_based: bool = False,
+              filename: (str, None) = 'sweep_summary.json') -> dict:
+    """Writes and runs a list of models one after another under a RunMonitor each.
+    Finished runs are skipped and interrupted ones continue from their latest statepoint, so a preempted
+    sweep can simply be started again.
+    Parameters:
+        - writers (list[WriterOpenMC]): Writers with distinct output directories.
+        - threads (int, None): Number of OpenMP threads per run.
+        - event_based (bool): Use event-based transport.
+        - filename (str, None): Where to write the sweep summary.
+    Returns:
+        - dict: The sweep summary from summarize_sweep()."""
+    for writer in writers:
+        run_or_resume(writer, threads=threads, event_based=event_based)
+    return summarize_sweep([w.output_dir for w in writers], filename)
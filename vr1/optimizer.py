@@ -0,0 +1,243 @@
+""" Evolutionary search of VR1 core loadings with cheap screening and parallel OpenMC confirmation """
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from vr1.surrogate import layout_key
+from vr1.symmetry import deduplicate, expand_batch
+
+
+def excess_reactivity(screen: dict, target_rho: float = 0.003, **kwargs) -> np.ndarray:
+    """ Distance of the excess reactivity (k-1)/k from the target """
+    return np.abs((screen['keff'] - 1.0) / screen['keff'] - target_rho)
+
+
+def power_peaking(screen: dict, **kwargs) -> np.ndarray:
+    """ Largest position power relative to the mean over fuelled positions """
+    if 'power' not in screen:
+        raise ValueError('Power peaking needs a screener that returns power maps, e.g. DiffusionScreener')
+    return screen['power'].reshape(len(screen['keff']), -1).max(axis=1)
+
+
+def channel_flux(screen: dict, channel: tuple[int, int] = (3, 3), group: int = -1, **kwargs) -> np.ndarray:
+    """ Negative flux of one energy group (the thermal one by default) at a lattice position, per fission """
+    if 'flux' not in screen:
+        raise ValueError('Channel flux needs a screener that returns flux maps, e.g. DiffusionScreener')
+    return -screen['flux'][:, group, channel[0], channel[1]]
+
+
+# Objectives to minimize; each takes the screening result of a batch and returns one score per layout
+objectives: dict[str, callable] = {
+    'excess_reactivity': excess_reactivity,
+    'power_peaking': power_peaking,
+    'channel_flux': channel_flux,
+}
+
+
+class DiffusionScreener:
+    """ Screens layouts with DiffusionSolver.solve_batch(): k-eff, power and flux maps """
+    def __init__(self, solver) -> None:
+        self.solver = solver
+
+    def __call__(self, layouts: list) -> dict:
+        return self.solver.solve_batch(layouts)
+
+
+class SurrogateScreener:
+    """ Screens layouts with KeffSurrogate.predict(): k-eff only """
+    def __init__(self, surrogate) -> None:
+        self.surrogate = surrogate
+
+    def __call__(self, layouts: list) -> dict:
+        return self.surrogate.predict(layouts)
+
+
+class LoadingConstraints:
+    """
+    Which positions of a core may change and which lattice units are available.
+    Parameters:
+        - base_layout (list[list[str]]): 8x8 starting layout, as Lattice.lattice_str.
+        - inventory (dict[str, int]): Available number of each movable fuel code, e.g. {'8': 4, '6': 14, '4': 2}.
+        - movable_codes (tuple[str]): Codes in base_layout whose positions may be reloaded.
+        - filler (str): Code of a position without fuel.
+        - min_fuel (int): Smallest number of fuel assemblies in a loading.
+    Processing Logic:
+        - Everything else in base_layout is fixed: the 'wrc' row, control rod assemblies, channels, dummies.
+        - Inventory limits how many of each fuel code a loading may use, not how many it must use.
+    """
+    def __init__(self, base_layout: list[list[str]], inventory: dict[str, int],
+                 movable_codes: tuple = ('w', '8', '6', '4'), filler: str = 'w', min_fuel: int = 1) -> None:
+        self.base = np.asarray(base_layout, dtype=object)
+        if self.base.shape != (8, 8):
+            raise ValueError(f'Base layout must be 8x8, not {self.base.shape}')
+        self.options: list[str] = [filler] + [c for c in inventory if c != filler]
+        self.inventory: np.ndarray = np.array([0] + [inventory[c] for c in self.options[1:]])
+        movable = np.isin(self.base, list(movable_codes))
+        movable[-1, :] &= self.base[-1, :] != 'wrc'
+        self.positions: np.ndarray = np.argwhere(movable)
+        self.min_fuel: int = min_fuel
+        if min_fuel > min(len(self.positions), int(self.inventory.sum())):
+            raise ValueError(f'Cannot load {min_fuel} fuel assemblies into {len(self.positions)} movable positions '
+                             f'with an inventory of {int(self.inventory.sum())}')
+
+    def genome(self, layout: list[list[str]]) -> np.ndarray:
+        """ Option indices of the movable positions of a layout """
+        layout = np.asarray(layout, dtype=object)
+        return np.array([self.options.index(layout[r, c]) if layout[r, c] in self.options else 0
+                         for r, c in self.positions])
+
+    def layout(self, genome: np.ndarray) -> list[list[str]]:
+        """ Full 8x8 layout of a genome """
+        layout = self.base.copy()
+        layout[self.positions[:, 0], self.positions[:, 1]] = np.array(self.options, dtype=object)[genome]
+        return layout.tolist()
+
+    def repair(self, genome: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """ Removes fuel beyond the inventory and adds fuel up to min_fuel at random positions """
+        genome = genome.copy()
+        for option in range(1, len(self.options)):
+            placed = np.nonzero(genome == option)[0]
+            excess = len(placed) - self.inventory[option]
+            if excess > 0:
+                genome[rng.choice(placed, excess, replace=False)] = 0
+        while (genome > 0).sum() < self.min_fuel:
+            left = self.inventory - np.bincount(genome, minlength=len(self.options))
+            left[0] = 0
+            option = rng.choice(np.nonzero(left > 0)[0])
+            genome[rng.choice(np.nonzero(genome == 0)[0])] = option
+        return genome
+
+    def random_genome(self, rng: np.random.Generator) -> np.ndarray:
+        """ Random loading within the constraints """
+        stock = np.repeat(np.arange(len(self.options)), self.inventory)
+        n_fuel = rng.integers(self.min_fuel, min(len(stock), len(self.positions)) + 1)
+        genome = np.zeros(len(self.positions), dtype=int)
+        genome[rng.choice(len(self.positions), n_fuel, replace=False)] = rng.choice(stock, n_fuel, replace=False)
+        return genome
+
+
+class CoreOptimizer:
+    """
+    Genetic algorithm over core loadings.
+    Parameters:
+        - constraints (LoadingConstraints): Movable positions and fuel inventory.
+        - screener (callable): screener(layouts) -> dict with at least 'keff', e.g. DiffusionScreener.
+        - objective (str, callable): Name in `objectives`, or a function of the screening result; lower is better.
+        - objective_params (dict, None): Keyword arguments of the objective, e.g. {'channel': (3, 4)}.
+        - k_bounds (tuple[float, float]): Screened k-eff outside these bounds is penalized.
+        - population (int): Loadings per generation.
+        - seed (int): Random seed.
+        - symmetric (bool): Screen one layout per symmetry class (see vr1.symmetry) and treat mirror images as one.
+    Processing Logic:
+        - Each generation is screened as one batch; tournament selection, uniform crossover over the movable
+          positions, swap and add/remove mutations, and a repair step keep every child within the constraints.
+        - The best distinct loadings seen are kept; confirm() runs OpenMC on the top ones in parallel.
+    """
+    def __init__(self, constraints: LoadingConstraints, screener: callable,
+                 objective: (str, callable) = 'excess_reactivity', objective_params: (dict, None) = None,
+                 k_bounds: tuple = (1.0, 1.01), population: int = 64, seed: int = 1, symmetric: bool = True) -> None:
+        self.constraints = constraints
+        self.screener = screener
+        self.objective = objectives[objective] if isinstance(objective, str) else objective
+        self.objective_params: dict = objective_params or {}
+        self.k_bounds: tuple = k_bounds
+        self.population: int = population
+        self.rng = np.random.default_rng(seed)
+        self.seen: dict[str, dict] = {}
+        self.history: list[float] = []
+        self.symmetric: bool = symmetric
+
+    def evaluate(self, genomes: list[np.ndarray]) -> np.ndarray:
+        """ Scores of genomes; the objective plus a penalty for k-eff outside k_bounds """
+        layouts = [self.constraints.layout(g) for g in genomes]
+        if self.symmetric:
+            dedup = deduplicate(layouts)
+            screen = expand_batch(self.screener(dedup['unique']), dedup)
+            keys = [layout_key(dedup['unique'][i]) for i in dedup['index']]
+        else:
+            screen = self.screener(layouts)
+            keys = [layout_key(layout) for layout in layouts]
+        keff = np.asarray(screen['keff'])
+        score = np.asarray(self.objective(screen, **self.objective_params), dtype=float)
+        k_low, k_high = self.k_bounds
+        score = score + 100.0 * (np.maximum(k_low - keff, 0.0) + np.maximum(keff - k_high, 0.0))
+        score = np.where(np.isfinite(score), score, np.inf)
+        for i, layout in enumerate(layouts):
+            # Mirror images share a key but not necessarily a score, e.g. for the flux at an off-axis channel
+            if keys[i] not in self.seen or score[i] < self.seen[keys[i]]['score']:
+                self.seen[keys[i]] = {'lattice_str': layout, 'score': float(score[i]), 'keff': float(keff[i])}
+        return score
+
+    def mutate(self, genome: np.ndarray, rate: float) -> np.ndarray:
+        """ Swaps two positions, or adds or removes one assembly, each with probability rate """
+        genome = genome.copy()
+        if self.rng.random() < rate:
+            i, j = self.rng.choice(len(genome), 2, replace=False)
+            genome[i], genome[j] = genome[j], genome[i]
+        if self.rng.random() < rate:
+            i = self.rng.integers(len(genome))
+            genome[i] = 0 if genome[i] else self.rng.integers(1, len(self.constraints.options))
+        return genome
+
+    def run(self, generations: int = 100, mutation_rate: float = 0.5, tournament: int = 3, elite: int = 2,
+            verbose: bool = False) -> list[dict]:
+        """Runs the genetic algorithm.
+        Parameters:
+            - generations (int): Number of generations.
+            - mutation_rate (float): Probability of each mutation kind per child.
+            - tournament (int): Tournament size of the parent selection.
+            - elite (int): Best loadings copied unchanged into the next generation.
+            - verbose (bool): Print the best score of every generation.
+        Returns:
+            - list[dict]: Distinct loadings seen, best first, with 'lattice_str', 'score' and screened 'keff'."""
+        c = self.constraints
+        genomes = [c.genome(c.base)] + [c.random_genome(self.rng) for _ in range(self.population - 1)]
+        genomes = [c.repair(g, self.rng) for g in genomes]
+        scores = self.evaluate(genomes)
+        for generation in range(generations):
+            order = np.argsort(scores)
+            children = [genomes[i] for i in order[:elite]]
+            while len(children) < self.population:
+                parents = [genomes[min(self.rng.choice(len(genomes), tournament), key=lambda i: scores[i])]
+                           for _ in range(2)]
+                child = np.where(self.rng.random(len(parents[0])) < 0.5, parents[0], parents[1])
+                children.append(c.repair(self.mutate(child, mutation_rate), self.rng))
+            genomes, scores = children, self.evaluate(children)
+            self.history.append(float(scores.min()))
+            if verbose:
+                print(f'generation {generation + 1}: best score {scores.min():.5g}, {len(self.seen)} loadings seen')
+        return self.best()
+
+    def best(self, n: (int, None) = None) -> list[dict]:
+        """ Best distinct loadings seen so far """
+        ranked = sorted(self.seen.values(), key=lambda s: s['score'])
+        return ranked if n is None else ranked[:n]
+
+    def confirm(self, n_top: int = 4, output_dir: str = 'optimizer_runs', settings=None,
+                threads_per_run: (int, None) = None) -> list[dict]:
+        """Runs OpenMC on the best loadings in parallel.
+        Parameters:
+            - n_top (int): Number of loadings to confirm.
+            - output_dir (str): Parent directory of the runs, one sub-directory per layout hash.
+            - settings (VR1Settings, None): Run settings; VR1Settings() if None.
+            - threads_per_run (int, None): OpenMP threads of each run; the cores are split evenly if None.
+        Returns:
+            - list[dict]: The confirmed loadings with their Monte Carlo 'keff_mc' and 'keff_mc_std'."""
+        from vr1.core import Lattice
+        from vr1.settings import VR1Settings
+        from vr1.writer import WriterOpenMC
+        top = self.best(n_top)
+        if threads_per_run is None:
+            threads_per_run = max((os.cpu_count() or 1) // max(len(top), 1), 1)
+        # Models are built and written one by one, OpenMC object IDs are not thread safe
+        writers: list = []
+        for t in top:
+            writer = WriterOpenMC(settings if settings is not None else VR1Settings(),
+                                  Lattice(lattice_str=t['lattice_str']))
+            writer.output_dir = os.path.join(output_dir, layout_key(t['lattice_str']))
+            writer.write_openmc_XML()
+            writers.append(writer)
+        # The runs are separate OpenMC processes, threads here only wait on them
+        with ThreadPoolExecutor(max_workers=len(top)) as pool:
+            summaries = list(pool.map(lambda w: w.run(threads=threads_per_run, write=False), writers))
+        return [{**t, 'keff_mc': s['keff'], 'keff_mc_std': s['keff_std']} for t, s in zip(top, summaries)]
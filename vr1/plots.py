@@ -102,6 +102,33 @@ class PlotManager:
             plt.show()
 
 
+    def preview(self, deck_dir: (str, None) = None, workers: (int, None) = None, display_plots: bool = True) -> dict:
+        """Renders the plot definitions in-process with vr1.raster, reusing cached renders of the same geometry.
+        Parameters:
+            - deck_dir (str, None): Directory with the model.xml to render; the model's output_dir if None.
+            - workers (int, None): Render processes, see SliceRenderer.
+            - display_plots (bool): Show the material images with matplotlib.
+        Returns:
+            - dict: Plot filename -> (rows, cols, 3) id map of cell IDs, cell instances and material IDs."""
+        from vr1.raster import SliceRenderer, make_view, color_ids
+        if deck_dir is None:
+            deck_dir = getattr(self.model, 'output_dir', '.')
+        views = [make_view(p['basis'], p['origin'], p['width'], (self.resolution, self.resolution))
+                 for p in self.plot_defs]
+        with SliceRenderer(deck_dir, workers=workers) as renderer:
+            maps = renderer.render_many(views)
+        if display_plots:
+            colors = {m.id: c for m, c in self.material_colors.items()}
+            fig, axes = plt.subplots(1, len(views), figsize=(5 * len(views), 5))
+            for ax, p, ids in zip(axes, self.plot_defs, maps):
+                h, v = p['width']
+                ax.imshow(color_ids(ids, colors), extent=(-h / 2, h / 2, -v / 2, v / 2))
+                ax.set_title(f"{p['basis'].upper()} slice through {p['origin']}")
+            plt.tight_layout()
+            plt.show()
+        return {p['filename']: ids for p, ids in zip(self.plot_defs, maps)}
+
+
 def test_plots() -> openmc.Plots:
     """Generate a set of OpenMC plot objects with predefined configurations.
     This function creates a series of 2D plots of a nuclear system using the OpenMC plotting capabilities. The plots are based on both cell and material compositions with specified dimensions and resolutions.
@@ -0,0 +1,288 @@
+""" In-process geometry slice rendering: tiled, progressively refined, parallel and cached by geometry and view """
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from vr1.utils import cache_dir, model_xml_hash
+
+# openmc.lib start-up arguments of the render workers, as openmc-plotter uses them: no transport is run
+raster_openmc_args: list[str] = ['-c']
+# Most recently rendered id maps kept in memory by all renderers of the process
+memory_cache_entries: int = 64
+_memory_cache: OrderedDict = OrderedDict()
+_memory_lock = threading.Lock()
+# Per-process state of a render worker
+_worker: dict = {}
+
+
+def make_view(basis: str = 'xy', origin: tuple = (0.0, 0.0, 0.0), width: tuple = (60.0, 60.0),
+              pixels: tuple = (500, 500)) -> dict:
+    """Slice definition, with the same keys as PlotManager.plot_defs.
+    Parameters:
+        - basis (str): 'xy', 'xz' or 'yz'.
+        - origin (tuple): Center of the slice [cm].
+        - width (tuple): Horizontal and vertical extent [cm].
+        - pixels (tuple): Horizontal and vertical resolution.
+    Returns:
+        - dict: The view."""
+    if basis not in ('xy', 'xz', 'yz'):
+        raise ValueError(f'Unknown basis {basis}, use xy, xz or yz')
+    return {'basis': basis, 'origin': tuple(float(o) for o in origin), 'width': tuple(float(w) for w in width),
+            'pixels': tuple(int(p) for p in pixels)}
+
+
+def scaled_view(view: dict, factor: float) -> dict:
+    """ The view at a fraction of its resolution, at least 1 pixel per axis """
+    pixels = tuple(max(1, int(round(p * factor))) for p in view['pixels'])
+    return make_view(view['basis'], view['origin'], view['width'], pixels)
+
+
+def tile_views(view: dict, tiles: tuple[int, int]) -> list[tuple[slice, slice, dict]]:
+    """Splits a view into sub-views whose pixel centers coincide with those of the full view.
+    Parameters:
+        - view (dict): Slice from make_view().
+        - tiles (tuple[int, int]): Number of tiles horizontally and vertically.
+    Returns:
+        - list[tuple]: (image row slice, image column slice, tile view); image row 0 is the top of the slice."""
+    nh, nv = view['pixels']
+    wh, wv = view['width']
+    axes = {'xy': (0, 1), 'xz': (0, 2), 'yz': (1, 2)}[view['basis']]
+    col_edges = np.linspace(0, nh, min(tiles[0], nh) + 1).round().astype(int)
+    row_edges = np.linspace(0, nv, min(tiles[1], nv) + 1).round().astype(int)
+    result: list = []
+    for r0, r1 in zip(row_edges[:-1], row_edges[1:]):
+        for c0, c1 in zip(col_edges[:-1], col_edges[1:]):
+            origin = list(view['origin'])
+            origin[axes[0]] += ((c0 + c1) / 2.0 - nh / 2.0) * wh / nh
+            origin[axes[1]] -= ((r0 + r1) / 2.0 - nv / 2.0) * wv / nv
+            width = ((c1 - c0) * wh / nh, (r1 - r0) * wv / nv)
+            result.append((slice(r0, r1), slice(c0, c1), make_view(view['basis'], origin, width, (c1 - c0, r1 - r0))))
+    return result
+
+
+class OpenMCBackend:
+    """ Id maps from the geometry of an OpenMC deck through openmc.lib, one initialized model per process """
+    name: str = 'openmc'
+
+    def __init__(self, args: (list[str], None) = None) -> None:
+        self.args = raster_openmc_args if args is None else args
+
+    def setup(self, deck_dir: str) -> None:
+        import openmc.lib
+        if openmc.lib.is_initialized:
+            openmc.lib.finalize()
+        openmc.lib.init(args=self.args + [deck_dir], output=False)
+
+    def id_map(self, view: dict) -> np.ndarray:
+        """ (rows, cols, 3) int32 array of cell IDs, cell instances and material IDs; -1 where there is no cell """
+        import openmc.lib
+        plot = openmc.lib.plot._PlotBase()
+        plot.basis = view['basis']
+        plot.origin = view['origin']
+        plot.width, plot.height = view['width']
+        plot.h_res, plot.v_res = view['pixels']
+        plot.level = -1
+        plot.color_overlaps = False
+        return np.asarray(openmc.lib.id_map(plot))
+
+
+def _init_worker(backend, deck_dir: str) -> None:
+    backend.setup(deck_dir)
+    _worker['backend'] = backend
+
+
+def _render_tile(view: dict) -> np.ndarray:
+    return _worker['backend'].id_map(view)
+
+
+class SliceRenderer:
+    """
+    Renders id maps of geometry slices of one deck, reusing earlier renders.
+    Parameters:
+        - deck_dir (str): Directory with the model.xml to render.
+        - backend (object, None): Object with name, setup(deck_dir) and id_map(view); OpenMCBackend() if None.
+        - workers (int, None): Render processes, each with its own initialized model; 0 renders in this process.
+        - tiles (tuple[int, int]): Tiles per view, rendered in parallel.
+        - disk_cache (bool): Keep renders in cache_dir('raster') across sessions.
+        - geometry_hash (str, None): Hash of the geometry; model_xml_hash(deck_dir) if None.
+    Processing Logic:
+        - Renders are cached under a key of the geometry hash, the backend and the view, first in a process-wide LRU
+            memory cache, then on disk; a cache hit never starts the backend.
+        - Uncached views are split into tiles and all tiles of all requested views go to the worker pool together,
+            so render_many() is parallel across both tiles and slices.
+        - progressive() yields coarse renders first, each cached, so previews appear at once and sharpen.
+    """
+    def __init__(self, deck_dir: str, backend=None, workers: (int, None) = None, tiles: tuple[int, int] = (2, 2),
+                 disk_cache: bool = True, geometry_hash: (str, None) = None) -> None:
+        self.deck_dir = deck_dir
+        self.backend = OpenMCBackend() if backend is None else backend
+        self.workers = min(4, os.cpu_count()) if workers is None else workers
+        self.tiles = tiles
+        self.disk_cache = disk_cache
+        self.geometry_hash = model_xml_hash(deck_dir) if geometry_hash is None else geometry_hash
+        self.executor = None
+        self.local_ready = False
+
+    def key(self, view: dict) -> str:
+        """ Cache key of a view of this geometry """
+        return hashlib.sha256(json.dumps([self.geometry_hash, self.backend.name, view], sort_keys=True).encode()
+                              ).hexdigest()[:24]
+
+    def cache_file(self, view: dict) -> str:
+        return os.path.join(cache_dir('raster'), f'{self.key(view)}.npy')
+
+    def cached(self, view: dict) -> (np.ndarray, None):
+        """ Id map of a view from the memory or disk cache, None if it was never rendered """
+        key = self.key(view)
+        with _memory_lock:
+            if key in _memory_cache:
+                _memory_cache.move_to_end(key)
+                return _memory_cache[key]
+        if self.disk_cache and os.path.isfile(self.cache_file(view)):
+            ids = np.load(self.cache_file(view))
+            self.remember(key, ids)
+            return ids
+        return None
+
+    @staticmethod
+    def remember(key: str, ids: np.ndarray) -> None:
+        """ Adds an id map to the memory cache; it becomes read-only as it is shared by all callers """
+        ids.setflags(write=False)
+        with _memory_lock:
+            _memory_cache[key] = ids
+            _memory_cache.move_to_end(key)
+            while len(_memory_cache) > memory_cache_entries:
+                _memory_cache.popitem(last=False)
+
+    def store(self, view: dict, ids: np.ndarray) -> None:
+        self.remember(self.key(view), ids)
+        if self.disk_cache:
+            np.save(self.cache_file(view), ids)
+
+    def map_tiles(self, views: list[dict]) -> list[np.ndarray]:
+        """ Id maps of tile views, in the worker pool or in this process """
+        if self.workers == 0:
+            if not self.local_ready:
+                self.backend.setup(self.deck_dir)
+                self.local_ready = True
+            return [self.backend.id_map(v) for v in views]
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                initargs=(self.backend, self.deck_dir))
+        return list(self.executor.map(_render_tile, views))
+
+    def render_many(self, views: list[dict]) -> list[np.ndarray]:
+        """Id maps of several views.
+        Parameters:
+            - views (list[dict]): Slices from make_view().
+        Returns:
+            - list[np.ndarray]: (rows, cols, 3) int32 cell ID, cell instance and material ID per pixel."""
+        results: list = [self.cached(v) for v in views]
+        missing = [i for i, r in enumerate(results) if r is None]
+        jobs = [(i, rows, cols, tile) for i in missing for rows, cols, tile in tile_views(views[i], self.tiles)]
+        maps = self.map_tiles([tile for _, _, _, tile in jobs]) if jobs else []
+        for i in missing:
+            nh, nv = views[i]['pixels']
+            results[i] = np.full((nv, nh, 3), -1, dtype=np.int32)
+        for (i, rows, cols, _), ids in zip(jobs, maps):
+            results[i][rows, cols] = ids
+        for i in missing:
+            self.store(views[i], results[i])
+        return results
+
+    def render(self, view: dict) -> np.ndarray:
+        """ Id map of one view, see render_many() """
+        return self.render_many([view])[0]
+
+    def progressive(self, view: dict, levels: tuple = (0.125, 0.5, 1.0)):
+        """Renders a view at increasing resolution.
+        Parameters:
+            - view (dict): Slice at full resolution.
+            - levels (tuple): Fractions of the full resolution, in order.
+        Returns:
+            - generator: (level, id map) per level; levels already cached come at once."""
+        for level in levels:
+            yield level, self.render(scaled_view(view, level))
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self) -> 'SliceRenderer':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def color_ids(ids: np.ndarray, colors: (dict, None) = None, color_by: str = 'material',
+              background: tuple = (255, 255, 255)) -> np.ndarray:
+    """RGB image of an id map.
+    Parameters:
+        - ids (np.ndarray): (rows, cols, 3) id map from SliceRenderer.
+        - colors (dict, None): ID -> color as a matplotlib color name or a 0-255 RGB tuple, as in openmc.Plot.colors;
+            IDs without a color get a fixed pseudo-random one.
+        - color_by (str): 'material' or 'cell'.
+        - background (tuple): RGB of pixels without a cell or material.
+    Returns:
+        - np.ndarray: (rows, cols, 3) uint8 image."""
+    channel = {'cell': 0, 'material': 2}[color_by]
+    values = ids[..., channel]
+    unique, inverse = np.unique(values, return_inverse=True)
+    table = np.empty((len(unique), 3), dtype=np.uint8)
+    for k, value in enumerate(unique):
+        if value < 0:
+            table[k] = background
+        elif colors is not None and value in colors:
+            c = colors[value]
+            if isinstance(c, str):
+                from matplotlib.colors import to_rgb
+                c = np.round(np.array(to_rgb(c)) * 255)
+            table[k] = c[:3]
+        else:
+            table[k] = np.random.default_rng(int(value)).integers(40, 256, 3)
+    return table[inverse.reshape(values.shape)]
+
+
+def layout_deck(layout: list[list[str]], settings=None) -> str:
+    """Deck directory of a layout for previews, written once per layout into cache_dir('raster_decks').
+    Parameters:
+        - layout (list[list[str]]): 8x8 layout.
+        - settings (VR1Settings, None): Settings of the written deck; VR1Settings() if None.
+    Returns:
+        - str: Directory with the layout's model.xml."""
+    from vr1.surrogate import layout_key
+    deck_dir = os.path.join(cache_dir('raster_decks'), layout_key(layout))
+    if not os.path.isfile(os.path.join(deck_dir, 'model.xml')):
+        from vr1.core import Lattice
+        from vr1.settings import VR1Settings
+        from vr1.writer import WriterOpenMC
+        writer = WriterOpenMC(settings if settings is not None else VR1Settings(), Lattice(lattice_str=layout))
+        writer.output_dir = deck_dir
+        writer.write_openmc_XML()
+    return deck_dir
+
+
+def preview_estimator(view: (dict, None) = None, levels: tuple = (0.25, 1.0), workers: int = 0,
+                      colors: (dict, None) = None) -> callable:
+    """Estimator for BackgroundEvaluator streaming progressively refined material images of a layout.
+    Parameters:
+        - view (dict, None): Slice to show; an axial mid-plane xy slice of the lattice at 400x400 pixels if None.
+        - levels (tuple): Resolution fractions, see SliceRenderer.progressive().
+        - workers (int): Render processes, 0 renders in the evaluator's thread.
+        - colors (dict, None): Material ID -> color, see color_ids().
+    Returns:
+        - callable: estimator(layout) yielding {'image': (rows, cols, 3) uint8, 'level': float}."""
+    if view is None:
+        view = make_view('xy', (0.0, 0.0, 37.0), (60.0, 60.0), (400, 400))
+
+    def estimate(layout: list[list[str]]):
+        with SliceRenderer(layout_deck(layout), workers=workers) as renderer:
+            for level, ids in renderer.progressive(view, levels):
+                yield {'image': color_ids(ids, colors), 'level': level}
+    return estimate
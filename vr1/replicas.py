@@ -0,0 +1,170 @@
+""" Independent seeded replicas of one VR1 model, run in parallel and merged statistically """
+
+import copy
+import os
+import types
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from vr1.monitor import RunMonitor, latest_statepoint
+
+
+def replica_seeds(n_replicas: int, base_seed: int = 1) -> list[int]:
+    """ Well separated random number seeds for n replicas, reproducible from base_seed """
+    state = np.random.SeedSequence(base_seed).generate_state(n_replicas, dtype=np.uint32)
+    return [int(s) + 1 for s in state]
+
+
+def merge_keff(keffs: np.ndarray, stds: np.ndarray) -> tuple[float, float, float]:
+    """Inverse-variance weighted k-eff of independent replicas.
+    Parameters:
+        - keffs (np.ndarray): k-eff of each replica.
+        - stds (np.ndarray): Standard deviation of each replica's k-eff.
+    Returns:
+        - tuple: Combined k-eff, its standard deviation, and the chi^2 per degree of freedom of the replicas
+            around the combined value (about 1 for statistically consistent replicas)."""
+    keffs = np.asarray(keffs, dtype=float)
+    w = 1.0 / np.asarray(stds, dtype=float) ** 2
+    k = float(np.sum(w * keffs) / np.sum(w))
+    chi2 = float(np.sum(w * (keffs - k) ** 2) / max(len(keffs) - 1, 1))
+    return k, float(1.0 / np.sqrt(np.sum(w))), chi2
+
+
+def pool_results(means: np.ndarray, std_devs: np.ndarray, realizations: np.ndarray) -> tuple:
+    """Mean and standard deviation of the mean of several runs' batches pooled into one run.
+    Parameters:
+        - means (np.ndarray): (K, ...) mean of every run, as Tally.mean.
+        - std_devs (np.ndarray): (K, ...) standard deviation of the mean, as Tally.std_dev.
+        - realizations (np.ndarray): (K,) active batches of every run.
+    Returns:
+        - tuple: (mean, std_dev, realizations) of one run with all batches. Each run's sum and sum of squares are
+            recovered from its mean and std_dev = sqrt((sum_sq/n - mean^2)/(n - 1)), as OpenMC computes them."""
+    means, std_devs = np.asarray(means, dtype=float), np.asarray(std_devs, dtype=float)
+    n = np.asarray(realizations, dtype=float).reshape((-1,) + (1,) * (means.ndim - 1))
+    total = float(n.sum())
+    if total < 2:
+        raise ValueError('Pooling needs at least two realizations')
+    mean = np.sum(n * means, axis=0) / total
+    sum_sq = np.sum(n * (means ** 2 + (n - 1.0) * std_devs ** 2), axis=0)
+    var = np.maximum(sum_sq / total - mean ** 2, 0.0) / (total - 1.0)
+    return mean, np.sqrt(var), int(total)
+
+
+def _set_results(tally, mean: np.ndarray, std_dev: np.ndarray, realizations: int) -> None:
+    """Replaces the results of a statepoint tally.
+    openmc.Tally has no public setters for mean and std_dev; this is the only place that writes its internals,
+    as OpenMC's own derived tallies do, with sum and sum_sq kept consistent.
+    Parameters:
+        - tally (openmc.Tally): Tally to overwrite.
+        - mean (np.ndarray): New mean.
+        - std_dev (np.ndarray): New standard deviation of the mean.
+        - realizations (int): New number of realizations."""
+    tally.num_realizations = realizations
+    tally._mean = mean
+    tally._std_dev = std_dev
+    tally._sum = mean * realizations
+    tally._sum_sq = realizations * (mean ** 2 + (realizations - 1) * std_dev ** 2)
+
+
+def merge_tallies(tallies: list):
+    """Pools the batch statistics of the same tally from several replicas.
+    Parameters:
+        - tallies (list[openmc.Tally]): One tally per replica, read from the replicas' statepoints.
+    Returns:
+        - openmc.Tally: Copy of the first tally with the pool_results() of all replicas, so mean and std_dev are
+            those of one run with all the replicas' active batches."""
+    mean, std_dev, n = pool_results([t.mean for t in tallies], [t.std_dev for t in tallies],
+                                    [t.num_realizations for t in tallies])
+    merged = copy.deepcopy(tallies[0])
+    _set_results(merged, mean, std_dev, n)
+    return merged
+
+
+class ReplicaResult:
+    """
+    Merged result of a set of replica runs.
+    Parameters:
+        - statepoints (list[str]): Final statepoint of every replica.
+        - seeds (list[int]): Seed of every replica.
+        - summaries (list[dict]): RunMonitor summary of every replica.
+    Processing Logic:
+        - k-eff is the inverse-variance weighted mean of the replicas' k-eff.
+        - Tallies are merged by pooling the batches of all replicas (pool_results); the per-replica data stay in
+            `replicas`.
+    """
+    def __init__(self, statepoints: list[str], seeds: list[int], summaries: list[dict]) -> None:
+        import openmc
+        self.replicas: list[dict] = []
+        replica_tallies: list[dict] = []
+        for sp_file, seed, summary in zip(statepoints, seeds, summaries):
+            with openmc.StatePoint(sp_file, autolink=False) as sp:
+                keff = sp.keff
+                for t in sp.tallies.values():
+                    _ = t.mean, t.std_dev  # read the results before the file is closed
+                replica_tallies.append(dict(sp.tallies))
+            self.replicas.append({'statepoint': sp_file, 'seed': seed, 'keff': keff.nominal_value,
+                                  'keff_std': keff.std_dev, 'summary': summary, 'tallies': replica_tallies[-1]})
+        self.keff, self.keff_std, self.keff_chi2 = merge_keff([r['keff'] for r in self.replicas],
+                                                              [r['keff_std'] for r in self.replicas])
+        self.tallies: dict = {
+            tally_id: merge_tallies([rt[tally_id] for rt in replica_tallies]) for tally_id in replica_tallies[0]}
+
+    def get_tally(self, name: str):
+        """ Merged tally by name """
+        for t in self.tallies.values():
+            if t.name == name:
+                return t
+        raise ValueError(f'No tally named {name}')
+
+    def __repr__(self) -> str:
+        return f'ReplicaResult({len(self.replicas)} replicas, keff = {self.keff:.5f} +/- {self.keff_std:.5f})'
+
+
+class ReplicaRunner:
+    """
+    Runs K copies of the model of a WriterOpenMC with distinct seeds in parallel.
+    Parameters:
+        - writer (WriterOpenMC): Writer of the model.
+        - n_replicas (int): Number of independent replicas.
+        - base_seed (int): Seed from which the replica seeds are derived.
+        - threads_per_replica (int, None): OpenMP threads of each replica; the cores are split evenly if None.
+    Processing Logic:
+        - Each replica is exported into output_dir/replica_<k> with its own seed and run under a RunMonitor.
+        - After all replicas finish, their final statepoints are merged into a ReplicaResult.
+    """
+    def __init__(self, writer, n_replicas: int = 4, base_seed: int = 1,
+                 threads_per_replica: (int, None) = None) -> None:
+        if n_replicas < 2:
+            raise ValueError('Replica mode needs at least 2 replicas')
+        self.writer = writer
+        self.n_replicas: int = n_replicas
+        self.seeds: list[int] = replica_seeds(n_replicas, base_seed)
+        if threads_per_replica is None:
+            threads_per_replica = max((os.cpu_count() or 1) // n_replicas, 1)
+        self.threads_per_replica: int = threads_per_replica
+        self.replica_dirs: list[str] = [os.path.join(writer.output_dir, f'replica_{k}') for k in range(n_replicas)]
+
+    def export(self) -> None:
+        """ Writes the model once and exports one copy per replica with its own seed """
+        self.writer.write_openmc_XML()
+        for seed, run_dir in zip(self.seeds, self.replica_dirs):
+            os.makedirs(run_dir, exist_ok=True)
+            model = copy.copy(self.writer.openmc_model)
+            model.settings = copy.deepcopy(self.writer.openmc_model.settings)
+            model.settings.seed = seed
+            model.export_to_model_xml(run_dir)
+
+    def run_replica(self, k: int) -> dict:
+        """ Runs replica k and returns its monitor summary """
+        settings = copy.deepcopy(self.writer.openmc_model.settings)
+        monitor = RunMonitor(types.SimpleNamespace(output_dir=self.replica_dirs[k], openmc_settings=settings),
+                             name=f'replica_{k}', metadata={'seed': self.seeds[k]})
+        return monitor.run(threads=self.threads_per_replica, event_based=self.writer.settings.event_based)
+
+    def run(self) -> ReplicaResult:
+        """ Exports and runs all replicas, then merges them """
+        self.export()
+        # The replicas are separate OpenMC processes, threads here only wait on them
+        with ThreadPoolExecutor(max_workers=self.n_replicas) as pool:
+            summaries = list(pool.map(self.run_replica, range(self.n_replicas)))
+        statepoints = [latest_statepoint(d) for d in self.replica_dirs]
+        return ReplicaResult(statepoints, self.seeds, summaries)
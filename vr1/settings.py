@@ -4,6 +4,8 @@ import os
 import openmc
 from datetime import datetime
 MY_TIME_NOW: str = datetime.isoformat(datetime.now(), "#", "seconds")
+# Cross-section libraries: directory of the HDF5 library under xs_xml_root_path
+xs_libraries: dict[str, str] = {'endf7.1': 'endfb-vii.1-hdf5', 'endf8.0': 'endfb-viii.0-hdf5'}
 
 
 class VR1Settings:
@@ -12,40 +14,79 @@ class VR1Settings:
     Parameters:
         - name (str): The name of the simulation; defaults to 'openmc deck'.
         - xs_lib (str): The cross-section library to use, either 'endf7.1' or 'endf8.0'; defaults to 'endf7.1'.
-        - xs_xml_root_path (str): The root path for cross-section XML files; defaults to '/opt/OpenMC_DATA'.
+        - xs_xml_root_path (str, None): The root path for cross-section XML files; defaults to '/opt/OpenMC_DATA'.
+            None uses the library configured in OpenMC (OPENMC_CROSS_SECTIONS).
         - tallies (list, None): A list of tallies to use in the simulation, if applicable.
         - plots (list, None): A list of plots to generate, if applicable.
         - parm (dict, None): Simulation parameters such as number of particles and generations.
         - rotation (float): The rotation angle for the simulation setup; defaults to 0.0.
         - sources (None, list): A list of source terms for the simulation.
         - power (None, float): The power level in Watts for thermal simulations.
+        - threads (int, None): Number of OpenMP threads for the run.
+        - event_based (bool): Event-based instead of history-based transport.
+        - checkpoint_interval (int, None): Batches between restartable statepoints.
+        - cmfd (bool, dict): CMFD acceleration on the lattice-aligned coarse mesh, with optional option overrides.
+        - fuel_source (bool): Sample the initial source directly in the fuel meat instead of a rejection box.
+        - weight_windows (list, None): openmc.WeightWindows for variance reduction.
+        - create_fission_neutrons (bool): Follow fission neutrons; False treats fission as capture in shielding runs.
+        - surf_source_write (dict, None): OpenMC surface source recording, see vr1.surface_source.
+        - multipole (bool): Use windowed multipole data for resolved resonances, needed by temperature derivatives.
+        - ifp_n_generation (int, None): Generations of iterated fission probability for kinetics tallies.
     Processing Logic:
         - Sets the cross-section XML path based on the chosen library.
         - Initializes default particle generation parameters if none are provided.
         - Retrieves the current host name for record keeping.
         - Checks and enforces valid cross-section library choice.
     """
-    def __init__(self, xs_xml_root_path: str = 'unga', name: str = 'openmc deck', run_mode = 'eigenvalue',
+    def __init__(self, xs_xml_root_path: (str, None) = '/opt/OpenMC_DATA', name: str = 'openmc deck',
+                 run_mode = 'eigenvalue',
                  tallies: (list, None) = None, plots: (list, None) = None, parm: (dict, None) = None,
                  rotation: float = 0.0, ext_sources: (None, list) = None, power: (None, float) = None,
-                 photon_transport = False):
+                 photon_transport = False, threads: (int, None) = None, event_based: bool = False,
+                 checkpoint_interval: (int, None) = None, cmfd: (bool, dict) = False,
+                 fuel_source: bool = False, weight_windows: (list, None) = None,
+                 create_fission_neutrons: bool = True, surf_source_write: (dict, None) = None,
+                 multipole: bool = False, ifp_n_generation: (int, None) = None,
+                 xs_lib: str = 'endf7.1'):
         """Initializes an instance with various simulation parameters for the OpenMC nuclear simulation.
         Parameters:
             - name (str): The name of the simulation; defaults to 'openmc deck'.
             - xs_lib (str): The cross-section library to use, either 'endf7.1' or 'endf8.0'; defaults to 'endf7.1'.
-            - xs_xml_root_path (str): The root path for cross-section XML files; defaults to '/opt/OpenMC_DATA'.
+            - xs_xml_root_path (str, None): The root path for cross-section XML files; defaults to '/opt/OpenMC_DATA'.
+                None leaves the choice to OpenMC's configured cross_sections.xml.
             - tallies (list, None): A list of tallies to use in the simulation, if applicable.
             - plots (list, None): A list of plots to generate, if applicable.
             - parm (dict, None): Simulation parameters such as the number of particles and generations.
             - rotation (float): The rotation angle for the simulation setup; defaults to 0.0.
             - sources (None, list): A list of source terms for the simulation.
             - power (None, float): The power level in Watts for thermal simulations.
+            - threads (int, None): Number of OpenMP threads for the run; OpenMC default if None.
+            - event_based (bool): Use event-based instead of history-based transport.
+            - checkpoint_interval (int, None): Write a restartable statepoint every this many batches.
+            - cmfd (bool, dict): Accelerate eigenvalue runs with CMFD; a dict overrides vr1.cmfd.cmfd_defaults.
+            - fuel_source (bool): Start from vr1.sources.fuel_source() of a Lattice core, sampled inside the fuel
+                meat without rejection, instead of the fissionable-constrained box.
+            - weight_windows (list, None): openmc.WeightWindows applied to the run, e.g. from vr1.fixed_source.
+            - create_fission_neutrons (bool): False makes fixed-source runs treat fission as capture, for
+                shielding calculations driven by a given fission source.
+            - surf_source_write (dict, None): openmc.Settings.surf_source_write, e.g. {'surface_ids': [...],
+                'max_particles': n}, to record particles crossing a boundary for later replay.
+            - multipole (bool): Windowed multipole cross sections on top of temperature interpolation; OpenMC
+                tally derivatives with respect to temperature need them.
+            - ifp_n_generation (int, None): Generations over which iterated fission probability (IFP) scores are
+                accumulated, at most the number of inactive batches; see vr1.kinetics.
         Returns:
             - None: This is an initializer function and does not return a value."""
         self.supported_code: str = "OpenMC"
         self.name = name
         self.my_time_now = MY_TIME_NOW
+        if xs_lib not in xs_libraries:
+            raise ValueError(f'Unknown cross-section library {xs_lib}, use one of {list(xs_libraries)}')
+        self.xs_lib = xs_lib
         self.xs_xml_root_path = xs_xml_root_path
+        self.xs_xml: (str, None) = None
+        if xs_xml_root_path is not None:
+            self.xs_xml = os.path.join(xs_xml_root_path, xs_libraries[xs_lib], 'cross_sections.xml')
 
         self.hostname = os.uname()[1]
         self.power = power  # [W_th]
@@ -57,6 +98,16 @@ class VR1Settings:
 
         self.photon_transport = photon_transport
         self.run_mode = run_mode
+        self.threads = threads
+        self.event_based = event_based
+        self.checkpoint_interval = checkpoint_interval
+        self.cmfd = cmfd
+        self.fuel_source = fuel_source
+        self.weight_windows = weight_windows
+        self.create_fission_neutrons = create_fission_neutrons
+        self.surf_source_write = surf_source_write
+        self.multipole = multipole
+        self.ifp_n_generation = ifp_n_generation
 
         if parm is None:
             """ npg: Number of particles per generation
@@ -0,0 +1,179 @@
+""" Source distributions sampling sites directly inside the fuel meat of the VR1 core """
+
+import numpy as np
+
+
+def fuel_tubes(code: str) -> int:
+    """Number of fuel tubes of a lattice unit, as LatticeUnitVR1.get() builds it.
+    Parameters:
+        - code (str): Lattice code.
+    Returns:
+        - int: Fuel tubes; 0 for units without fuel. Channels hold fuel only inside a 6-tube assembly ('v12_6')."""
+    from vr1.surrogate import unit_properties
+    tubes = unit_properties(code)[1]
+    if code.startswith('v') and not code.endswith('_6'):
+        return 0
+    return tubes
+
+
+def fuel_geometry() -> dict:
+    """Fuel meat geometry of the IRT4M tubes from vr1.lattice_units.
+    Returns:
+        - dict: 'pitch' [cm], 'z' (bottom, top of the active fuel) [cm] and 'tubes': tube number -> {'shape': 'square',
+            'outer': (width, corner radius), 'inner': (width, corner radius)} or {'shape': 'cylinder', 'outer': radius,
+            'inner': radius}, bounded by the nFT.2 and nFT.3 surfaces."""
+    from vr1.lattice_units import lattice_pitch, plane_zs, sqcs, cyl_zs
+    tubes: dict = {}
+    for i in range(1, 9):
+        outer, inner = f'{i}FT.2', f'{i}FT.3'
+        if outer in sqcs:
+            tubes[i] = {'shape': 'square', 'outer': (sqcs[outer]['wh'], sqcs[outer]['corner_r']),
+                        'inner': (sqcs[inner]['wh'], sqcs[inner]['corner_r'])}
+        else:
+            tubes[i] = {'shape': 'cylinder', 'outer': cyl_zs[outer], 'inner': cyl_zs[inner]}
+    return {'pitch': lattice_pitch, 'z': (plane_zs['FAZ.4'], plane_zs['FAZ.3']), 'tubes': tubes}
+
+
+def position_center(row: int, col: int, pitch: float, n: int = 8) -> tuple[float, float]:
+    """ (x, y) of the center of a lattice position; row 0 is the top row """
+    half = n * pitch / 2.0
+    return -half + (col + 0.5) * pitch, half - (row + 0.5) * pitch
+
+
+def tube_pieces(tube: dict, center: tuple[float, float], z: tuple[float, float]) -> list[dict]:
+    """Splits the fuel meat of one tube into pieces that can be sampled uniformly without rejection.
+    Parameters:
+        - tube (dict): Tube entry of fuel_geometry().
+        - center (tuple): (x, y) of the assembly center [cm].
+        - z (tuple): Axial extent [cm].
+    Returns:
+        - list[dict]: {'kind': 'box', 'lower', 'upper'} straight strips and {'kind': 'arc', 'center', 'r', 'phi', 'z'}
+            annular sectors, each with its 'volume' [cm3]."""
+    cx, cy = center
+    height = z[1] - z[0]
+    if tube['shape'] == 'cylinder':
+        r0, r1 = tube['inner'], tube['outer']
+        return [{'kind': 'arc', 'center': (cx, cy), 'r': (r0, r1), 'phi': (0.0, 2 * np.pi), 'z': tuple(z),
+                 'volume': np.pi * (r1 ** 2 - r0 ** 2) * height}]
+    (w1, r1), (w0, r0) = tube['outer'], tube['inner']
+    # Half length of the straight sides; the rounded corners of both squares share their centers
+    a = w1 / 2.0 - r1
+    if not np.isclose(a, w0 / 2.0 - r0):
+        raise ValueError(f'Fuel layer between squares {tube["outer"]} and {tube["inner"]} is not of uniform thickness')
+    h0, h1 = w0 / 2.0, w1 / 2.0
+    strips = [((-a, h0), (a, h1)), ((-a, -h1), (a, -h0)), ((h0, -a), (h1, a)), ((-h1, -a), (-h0, a))]
+    pieces = [{'kind': 'box', 'lower': (cx + x0, cy + y0, z[0]), 'upper': (cx + x1, cy + y1, z[1]),
+               'volume': (x1 - x0) * (y1 - y0) * height} for (x0, y0), (x1, y1) in strips]
+    for k, (sx, sy) in enumerate([(1, 1), (-1, 1), (-1, -1), (1, -1)]):
+        pieces.append({'kind': 'arc', 'center': (cx + sx * a, cy + sy * a), 'r': (r0, r1),
+                       'phi': (k * np.pi / 2, (k + 1) * np.pi / 2), 'z': tuple(z),
+                       'volume': np.pi / 4 * (r1 ** 2 - r0 ** 2) * height})
+    return pieces
+
+
+def fuel_pieces(lattice_str: list[list[str]], weights: (np.ndarray, None) = None,
+                geometry: (dict, None) = None) -> list[dict]:
+    """Uniformly sampleable pieces of all fuel meat in a core layout.
+    Parameters:
+        - lattice_str (list[list[str]]): 8x8 layout.
+        - weights (np.ndarray, None): 8x8 relative source density per position, e.g. a power map; uniform if None.
+        - geometry (dict, None): Fuel geometry as fuel_geometry(); from vr1.lattice_units if None.
+    Returns:
+        - list[dict]: Pieces of tube_pieces() with their 'position' (row, col) and 'strength' (volume times weight);
+            positions of zero weight are left out."""
+    geometry = fuel_geometry() if geometry is None else geometry
+    pieces: list[dict] = []
+    for row, codes in enumerate(lattice_str):
+        for col, code in enumerate(codes):
+            weight = 1.0 if weights is None else float(weights[row][col])
+            n_tubes = fuel_tubes(code)
+            if n_tubes == 0 or weight <= 0.0:
+                continue
+            center = position_center(row, col, geometry['pitch'], len(lattice_str))
+            for i in range(1, n_tubes + 1):
+                for piece in tube_pieces(geometry['tubes'][i], center, geometry['z']):
+                    pieces.append({**piece, 'position': (row, col), 'strength': piece['volume'] * weight})
+    if not pieces:
+        raise ValueError('Layout has no fuel to place a source in')
+    return pieces
+
+
+def sample_pieces(pieces: list[dict], n: int, rng: (np.random.Generator, None) = None) -> np.ndarray:
+    """ (n, 3) points sampled from the pieces with probabilities proportional to their strength, as OpenMC does """
+    rng = np.random.default_rng() if rng is None else rng
+    strength = np.array([p['strength'] for p in pieces])
+    choice = rng.choice(len(pieces), size=n, p=strength / strength.sum())
+    points = np.empty((n, 3))
+    for k in np.unique(choice):
+        members = np.flatnonzero(choice == k)
+        p, m = pieces[k], len(members)
+        if p['kind'] == 'box':
+            points[members] = rng.uniform(p['lower'], p['upper'], (m, 3))
+            continue
+        (r0, r1), (phi0, phi1) = p['r'], p['phi']
+        r = np.sqrt(rng.uniform(r0 ** 2, r1 ** 2, m))
+        phi = rng.uniform(phi0, phi1, m)
+        points[members] = np.column_stack([p['center'][0] + r * np.cos(phi), p['center'][1] + r * np.sin(phi),
+                                           rng.uniform(p['z'][0], p['z'][1], m)])
+    return points
+
+
+def _inside_tube_surface(x: np.ndarray, y: np.ndarray, shape: str, size) -> np.ndarray:
+    """ True inside a rounded square (width, corner radius) or a cylinder (radius) centered at the origin """
+    if shape == 'cylinder':
+        return x ** 2 + y ** 2 <= size ** 2
+    width, radius = size
+    dx, dy = np.abs(x) - (width / 2 - radius), np.abs(y) - (width / 2 - radius)
+    return (dx <= radius) & (dy <= radius) & ((dx <= 0) | (dy <= 0) | (dx ** 2 + dy ** 2 <= radius ** 2))
+
+
+def in_fuel(points: np.ndarray, lattice_str: list[list[str]], geometry: (dict, None) = None) -> np.ndarray:
+    """Whether points lie in fuel meat of the layout, e.g. the acceptance of a source under the fissionable constraint.
+    Parameters:
+        - points (np.ndarray): (N, 3) coordinates [cm].
+        - lattice_str (list[list[str]]): 8x8 layout.
+        - geometry (dict, None): Fuel geometry as fuel_geometry(); from vr1.lattice_units if None.
+    Returns:
+        - np.ndarray: (N,) booleans."""
+    geometry = fuel_geometry() if geometry is None else geometry
+    points = np.asarray(points, dtype=float)
+    n, pitch = len(lattice_str), geometry['pitch']
+    col = np.floor(points[:, 0] / pitch + n / 2).astype(int)
+    row = np.floor(n / 2 - points[:, 1] / pitch).astype(int)
+    on_lattice = (row >= 0) & (row < n) & (col >= 0) & (col < n)
+    tubes = np.zeros(len(points), dtype=int)
+    tubes[on_lattice] = np.array([[fuel_tubes(c) for c in codes] for codes in lattice_str])[row[on_lattice],
+                                                                                           col[on_lattice]]
+    x = points[:, 0] - (-n * pitch / 2 + (col + 0.5) * pitch)
+    y = points[:, 1] - (n * pitch / 2 - (row + 0.5) * pitch)
+    result = np.zeros(len(points), dtype=bool)
+    for i, tube in geometry['tubes'].items():
+        layer = _inside_tube_surface(x, y, tube['shape'], tube['outer'])
+        layer &= ~_inside_tube_surface(x, y, tube['shape'], tube['inner'])
+        result |= layer & (tubes >= i)
+    return result & (points[:, 2] >= geometry['z'][0]) & (points[:, 2] <= geometry['z'][1])
+
+
+def fuel_source(lattice_str: list[list[str]], weights: (np.ndarray, None) = None, energy=None,
+                geometry: (dict, None) = None) -> list:
+    """OpenMC sources sampling directly in the fuel meat of every fuelled position, needing no rejection.
+    Parameters:
+        - lattice_str (list[list[str]]): 8x8 layout.
+        - weights (np.ndarray, None): 8x8 relative source density per position; uniform over the fuel if None.
+        - energy (openmc.stats.Univariate, None): Energy distribution, e.g. for fixed-source runs; Watt fission
+            spectrum if None.
+        - geometry (dict, None): Fuel geometry as fuel_geometry(); from vr1.lattice_units if None.
+    Returns:
+        - list[openmc.IndependentSource]: One source per strip and corner of every fuel layer, weighted by volume."""
+    import openmc
+    energy = openmc.stats.Watt() if energy is None else energy
+    sources: list = []
+    for piece in fuel_pieces(lattice_str, weights, geometry):
+        if piece['kind'] == 'box':
+            space = openmc.stats.Box(piece['lower'], piece['upper'])
+        else:
+            space = openmc.stats.CylindricalIndependent(
+                r=openmc.stats.PowerLaw(piece['r'][0], piece['r'][1], 1), phi=openmc.stats.Uniform(*piece['phi']),
+                z=openmc.stats.Uniform(*piece['z']), origin=(piece['center'][0], piece['center'][1], 0.0))
+        sources.append(openmc.IndependentSource(space=space, energy=energy, strength=piece['strength']))
+    return sources
@@ -0,0 +1,301 @@
+""" Two-step calculations: record a surface source at an out-of-core boundary, replay it in shielding-only runs """
+
+import copy
+import hashlib
+import json
+import os
+from datetime import datetime
+import numpy as np
+from vr1.utils import cache_dir, model_xml_hash
+
+# Recording boundaries: the surface component crossed and the outward direction, a vector or 'radial' (from the z axis)
+surface_boundaries: dict[str, dict] = {
+    'wrc row': {'surface': ('RCcy.1', 'top'), 'outward': (0.0, -1.0, 0.0),
+                'description': 'plane y = -21.45 between the last fuel row and the wrc row in front of the channel'},
+    'channel entrance': {'surface': ('RCcy.2', 'top'), 'outward': (0.0, -1.0, 0.0),
+                         'description': 'front face y = -22.45 of the radial channel cavity'},
+    'pool wall': {'surface': ('H01.1', None), 'outward': 'radial',
+                  'description': 'inner side of the H01 vessel, r = 115'},
+}
+# Site layout of OpenMC source files (source_bank dataset of surface_source.h5 and of replay files)
+position_dtype = np.dtype([('x', '<f8'), ('y', '<f8'), ('z', '<f8')])
+source_dtype = np.dtype([('r', position_dtype), ('u', position_dtype), ('E', '<f8'), ('time', '<f8'),
+                         ('wgt', '<f8'), ('delayed_group', '<i4'), ('surf_id', '<i4'), ('particle', '<i4')])
+surface_source_name: str = 'surface_source.h5'
+replay_source_name: str = 'replay_source.h5'
+index_name: str = 'index.json'
+# Replayed sites are moved this far [cm] along their direction, off the boundary that is a vacuum surface then
+replay_offset: float = 1.0e-6
+
+
+def boundary_surface(boundary: str):
+    """ openmc surface recorded for a named boundary, a component of composite surfaces """
+    from vr1.lattice_units import surfaces
+    if boundary not in surface_boundaries:
+        raise ValueError(f'Unknown surface source boundary "{boundary}", use one of {list(surface_boundaries)}')
+    name, component = surface_boundaries[boundary]['surface']
+    return getattr(surfaces[name], component) if component else surfaces[name]
+
+
+def outgoing(bank: np.ndarray, outward: (tuple, str)) -> np.ndarray:
+    """Mask of sites leaving the upstream side of a boundary.
+    Parameters:
+        - bank (np.ndarray): Sites with source_dtype fields 'r' and 'u'.
+        - outward (tuple, str): Outward normal vector, or 'radial' for a z-axis cylinder.
+    Returns:
+        - np.ndarray: True where the direction points outward; OpenMC records crossings in both directions."""
+    if isinstance(outward, str):
+        if outward != 'radial':
+            raise ValueError(f'Outward direction "{outward}" is not a vector or "radial"')
+        return bank['r']['x'] * bank['u']['x'] + bank['r']['y'] * bank['u']['y'] > 0.0
+    nx, ny, nz = outward
+    return nx * bank['u']['x'] + ny * bank['u']['y'] + nz * bank['u']['z'] > 0.0
+
+
+def compact(bank: np.ndarray) -> dict:
+    """Compact arrays of a site bank for storage.
+    Parameters:
+        - bank (np.ndarray): Sites with source_dtype.
+    Returns:
+        - dict: 'r' float64 (n, 3) positions, kept exact so replayed sites stay on the boundary; 'u' float32 (n, 3);
+            'E' and 'wgt' float32; 'particle' int8. Time, delayed group and surface ID are dropped."""
+    return {
+        'r': np.stack([bank['r'][c] for c in 'xyz'], axis=1).astype(np.float64),
+        'u': np.stack([bank['u'][c] for c in 'xyz'], axis=1).astype(np.float32),
+        'E': bank['E'].astype(np.float32),
+        'wgt': bank['wgt'].astype(np.float32),
+        'particle': bank['particle'].astype(np.int8),
+    }
+
+
+def expand(data: dict, offset: float = replay_offset) -> np.ndarray:
+    """Site bank in OpenMC source layout from compact arrays.
+    Parameters:
+        - data (dict): Arrays from compact() or resample().
+        - offset (float): Distance [cm] every site is moved along its (renormalized) direction.
+    Returns:
+        - np.ndarray: Sites with source_dtype, surface ID 0 so OpenMC locates them by position."""
+    u = data['u'].astype(np.float64)
+    u /= np.linalg.norm(u, axis=1, keepdims=True)
+    r = data['r'] + offset * u
+    bank = np.zeros(len(u), dtype=source_dtype)
+    for i, c in enumerate('xyz'):
+        bank['r'][c] = r[:, i]
+        bank['u'][c] = u[:, i]
+    bank['E'] = data['E']
+    bank['wgt'] = data['wgt']
+    bank['particle'] = data['particle']
+    return bank
+
+
+def resample(data: dict, n: int, rng: (np.random.Generator, None) = None) -> dict:
+    """Weight-proportional resampling of a stored source to n equal-weight sites.
+    Parameters:
+        - data (dict): Compact arrays.
+        - n (int): Number of sites to draw, more or fewer than stored.
+        - rng (np.random.Generator, None): Random generator; a fresh default one if None.
+    Returns:
+        - dict: Compact arrays of n sites, each with the total weight / n, so the total weight is preserved."""
+    if n < 1:
+        raise ValueError(f'Cannot resample a surface source to {n} sites')
+    rng = np.random.default_rng() if rng is None else rng
+    wgt = data['wgt'].astype(np.float64)
+    total = wgt.sum()
+    if total <= 0.0:
+        raise ValueError('Cannot resample a surface source without weight')
+    idx = rng.choice(len(wgt), size=n, p=wgt / total)
+    sample = {k: v[idx] for k, v in data.items()}
+    sample['wgt'] = np.full(n, total / n, dtype=np.float32)
+    return sample
+
+
+def read_source_file(path: str) -> np.ndarray:
+    """ Site bank of an OpenMC source or surface source file """
+    import h5py
+    with h5py.File(path, 'r') as f:
+        return f['source_bank'][()]
+
+
+def write_source_file(bank: np.ndarray, path: str) -> str:
+    """ Writes sites as an OpenMC source file, readable by openmc.FileSource """
+    import h5py
+    with h5py.File(path, 'w') as f:
+        f.attrs['filetype'] = np.bytes_('source')
+        f.create_dataset('source_bank', data=bank.astype(source_dtype))
+    return path
+
+
+class SurfaceSourceStore:
+    """
+    Compressed surface sources with a JSON index, in cache_dir('surface_sources') by default.
+    Parameters:
+        - root (str, None): Store directory.
+    Processing Logic:
+        - Each source is one .npz of compact() arrays; the index records the model hash, the boundary, the number
+            of recorded sites and of the step-one source particles they came from, for tally normalization.
+    """
+    def __init__(self, root: (str, None) = None) -> None:
+        self.root = root if root is not None else cache_dir('surface_sources')
+        os.makedirs(self.root, exist_ok=True)
+
+    @property
+    def index_file(self) -> str:
+        return os.path.join(self.root, index_name)
+
+    def index(self) -> dict:
+        if not os.path.isfile(self.index_file):
+            return {}
+        with open(self.index_file) as f:
+            return json.load(f)
+
+    def add(self, key: str, data: dict, meta: dict) -> dict:
+        """ Stores compact arrays under key, returns the index entry """
+        np.savez_compressed(os.path.join(self.root, f'{key}.npz'), **data)
+        entry = {**meta, 'file': f'{key}.npz', 'n_sites': int(len(data['wgt'])),
+                 'total_weight': float(data['wgt'].astype(np.float64).sum()),
+                 'created': datetime.isoformat(datetime.now(), ' ', 'seconds')}
+        index = self.index()
+        index[key] = entry
+        with open(self.index_file, 'w') as f:
+            json.dump(index, f, indent=2)
+        return entry
+
+    def get(self, key: str) -> tuple:
+        """ (compact arrays, index entry) of a stored source """
+        index = self.index()
+        if key not in index:
+            raise ValueError(f'No surface source "{key}" in {self.root}')
+        with np.load(os.path.join(self.root, index[key]['file'])) as data:
+            return {k: data[k] for k in data.files}, index[key]
+
+    def find(self, **meta) -> list[str]:
+        """ Keys of stored sources whose index entries match all given values, e.g. boundary='pool wall' """
+        return [k for k, e in self.index().items() if all(e.get(m) == v for m, v in meta.items())]
+
+
+class SurfaceSource:
+    """
+    Two-step transport through a boundary outside the core.
+    Parameters:
+        - lattice_str (list[list[str]]): Core layout of the recording run.
+        - boundary (str): Key of surface_boundaries.
+        - settings (VR1Settings, None): Settings of the recording run (an eigenvalue run of the facility by default).
+        - max_particles (int): Largest number of crossings OpenMC records.
+        - output_root (str): Directory of the recording and replay decks.
+        - store (SurfaceSourceStore, None): Where sources are kept; the default cache store if None.
+        - threads (int, None): OpenMP threads.
+    Processing Logic:
+        - record() runs the Reactor once with surf_source_write on the boundary, keeps the outgoing crossings and
+            stores them under a key of the written geometry, the boundary and the history count. A later record()
+            of the same model returns the stored key without transport.
+        - replay() writes a shielding-only fixed-source deck starting from the stored (optionally resampled) sites.
+            The boundary is a vacuum surface there, so particles going back upstream are not followed twice;
+            fission is treated as capture. The downstream model (e.g. a new experiment in the channel) may differ.
+        - Replay tallies are per replayed site; scale() converts them to per step-one source particle.
+    """
+    def __init__(self, lattice_str: list[list[str]], boundary: str = 'channel entrance', settings=None,
+                 max_particles: int = 10 ** 7, output_root: str = 'surface_source',
+                 store: (SurfaceSourceStore, None) = None, threads: (int, None) = None) -> None:
+        if boundary not in surface_boundaries:
+            raise ValueError(f'Unknown surface source boundary "{boundary}", use one of {list(surface_boundaries)}')
+        self.lattice_str = [list(row) for row in lattice_str]
+        self.boundary = boundary
+        self.settings = settings
+        self.max_particles = max_particles
+        self.output_root = output_root
+        self.store = store if store is not None else SurfaceSourceStore()
+        self.threads = threads
+        self.key: (str, None) = None
+
+    def source_particles(self, settings) -> int:
+        """ Step-one histories the recorded crossings come from: active batches only in eigenvalue runs """
+        parm = settings.parm
+        batches = parm['batches'] if 'batches' in parm else parm['gen']
+        inactive = parm['inactive'] if 'inactive' in parm else parm.get('nsk', 0)
+        active = batches - inactive if settings.run_mode == 'eigenvalue' else batches
+        return int(parm['npg'] * active)
+
+    def record(self, force: bool = False) -> str:
+        """Runs (or finds) the recording step.
+        Parameters:
+            - force (bool): Record again even if the store has this model and boundary.
+        Returns:
+            - str: Store key of the surface source."""
+        from vr1.core import Reactor
+        from vr1.settings import VR1Settings
+        from vr1.writer import WriterOpenMC
+        settings = copy.copy(self.settings) if self.settings is not None else VR1Settings()
+        settings.surf_source_write = {'surface_ids': [boundary_surface(self.boundary).id],
+                                      'max_particles': self.max_particles}
+        writer = WriterOpenMC(settings, Reactor(lattice_str=self.lattice_str))
+        writer.output_dir = os.path.join(self.output_root, 'record')
+        writer.write_openmc_XML()
+        meta = {'boundary': self.boundary, 'model_hash': model_xml_hash(writer.output_dir),
+                'lattice_str': self.lattice_str, 'run_mode': settings.run_mode,
+                'source_particles': self.source_particles(settings)}
+        description = {k: meta[k] for k in ('boundary', 'model_hash', 'run_mode', 'source_particles')}
+        self.key = hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()[:20]
+        if self.key in self.store.index() and not force:
+            return self.key
+        writer.run(threads=self.threads, write=False)
+        bank = read_source_file(os.path.join(writer.output_dir, surface_source_name))
+        if len(bank) >= self.max_particles:
+            raise ValueError(f'Surface source reached max_particles = {self.max_particles}, so it does not cover '
+                             f'all {meta["source_particles"]} histories; increase max_particles')
+        bank = bank[outgoing(bank, surface_boundaries[self.boundary]['outward'])]
+        self.store.add(self.key, compact(bank), meta)
+        return self.key
+
+    def replay(self, name: str = 'replay', core=None, settings=None, n: (int, None) = None,
+               seed: (int, None) = None):
+        """Writes a shielding-only run from the recorded source.
+        Parameters:
+            - name (str): Run directory under output_root.
+            - core (VR1core, None): Downstream model, e.g. a Reactor with a modified channel; the recording layout's
+                Reactor if None.
+            - settings (VR1Settings, None): Replay settings with the downstream tallies; 'npg' x 'batches' histories.
+            - n (int, None): Resample the stored sites to this many equal-weight sites; the stored sites if None.
+            - seed (int, None): Seed of the resampling.
+        Returns:
+            - WriterOpenMC: Writer whose deck and replay source file are written."""
+        import openmc
+        from vr1.core import Reactor
+        from vr1.settings import VR1Settings
+        from vr1.writer import WriterOpenMC
+        if self.key is None:
+            self.record()
+        data, _ = self.store.get(self.key)
+        if n is not None:
+            data = resample(data, n, np.random.default_rng(seed))
+        settings = copy.copy(settings) if settings is not None else VR1Settings()
+        settings.parm = {**settings.parm, 'inactive': 0}
+        settings.run_mode = 'fixed source'
+        settings.cmfd = False
+        settings.create_fission_neutrons = False
+        settings.surf_source_write = None
+        output_dir = os.path.join(self.output_root, name)
+        os.makedirs(output_dir, exist_ok=True)
+        source_file = write_source_file(expand(data), os.path.join(output_dir, replay_source_name))
+        settings.ext_sources = [openmc.FileSource(path=os.path.abspath(source_file))]
+        writer = WriterOpenMC(settings, core if core is not None else Reactor(lattice_str=self.lattice_str))
+        writer.output_dir = output_dir
+        surface = boundary_surface(self.boundary)
+        boundary_type = surface.boundary_type
+        surface.boundary_type = 'vacuum'
+        try:
+            writer.write_openmc_XML()
+        finally:
+            surface.boundary_type = boundary_type
+        return writer
+
+    def scale(self, n_sites: (int, None) = None) -> float:
+        """Factor from replay tallies (per replayed site) to the recording run's normalization.
+        Parameters:
+            - n_sites (int, None): Sites of the replay file, the n of replay(); the stored sites if None.
+        Returns:
+            - float: Sites per step-one source particle, as each site carries its own weight; with the same
+                total weight for resampled sites."""
+        if self.key is None:
+            raise ValueError('No surface source recorded yet')
+        entry = self.store.index()[self.key]
+        return (entry['n_sites'] if n_sites is None else n_sites) / entry['source_particles']
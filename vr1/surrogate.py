@@ -0,0 +1,287 @@
+""" k-eff surrogate model of VR1 lattice layouts trained on finished transport runs """
+
+import hashlib
+import json
+import os
+import numpy as np
+
+# Height of a fully withdrawn absorption rod, as 'O' in LatticeUnitVR1.load()
+rod_full_out: float = 84.7
+# Lattice codes counted as one feature each; other codes are counted under their first letter ('v56' -> 'v')
+feature_codes: list[str] = ['8', '6', '4', 'rod', 'd', 'w', 'wrc', 'v', 'rt']
+feature_names: list[str] = [f'n_{c}' for c in feature_codes] + [
+    'fuel_tubes', 'fuel_x', 'fuel_y', 'fuel_r2', 'fuel_importance', 'wrc_dist_mean', 'wrc_dist_min',
+    'rod_inserted', 'rod_importance']
+
+_rows, _cols = np.indices((8, 8))
+# Lattice position coordinates in pitches from the core center, y pointing up (row 0 is the top)
+_x = (_cols - 3.5).ravel()
+_y = (3.5 - _rows).ravel()
+# Fundamental mode shape of a bare 8x8 square, the weight of a position in first-order perturbation theory
+_importance = (np.cos(np.pi * _x / 9.0) * np.cos(np.pi * _y / 9.0)) ** 2
+_distance = np.hypot(_x[:, None] - _x[None, :], _y[:, None] - _y[None, :])
+
+
+def unit_properties(code: str) -> tuple[str, int, (float, None)]:
+    """Feature category, number of fuel tubes and absorption rod height of one lattice code.
+    Parameters:
+        - code (str): Lattice code as accepted by LatticeUnitVR1.get().
+    Returns:
+        - tuple: (category in `feature_codes`, fuel tubes, rod height [cm] or None if the unit has no rod)."""
+    if code in ('8', '6', '4'):
+        return code, int(code), None
+    if code == 'X':
+        return 'rod', 6, 0.0
+    if code == 'O':
+        return 'rod', 6, rod_full_out
+    if code.startswith('6_'):
+        return 'rod', 6, float(code[2:])
+    if code.startswith('v'):
+        # 'v12_6' is a 12 mm channel in a 6-tube assembly
+        tubes = int(code[4]) if '_' in code and code[4:5].isdigit() else 0
+        return 'v', tubes, None
+    if code in feature_codes:
+        return code, 0, None
+    raise ValueError(f'Unknown lattice code "{code}"')
+
+
+def featurize(layouts: (list, np.ndarray)) -> np.ndarray:
+    """Feature vectors of 8x8 lattice layouts.
+    Parameters:
+        - layouts (list, np.ndarray): One 8x8 layout (as Lattice.lattice_str) or a list of them.
+    Returns:
+        - np.ndarray: (B, len(feature_names)) features: counts by unit type, tube-weighted fuel centroid, spread and
+            fundamental-mode importance, fuel distance to the radial channel 'wrc', and rod insertion."""
+    layouts = np.asarray(layouts, dtype=object)
+    if layouts.ndim == 2:
+        layouts = layouts[None]
+    if layouts.shape[1:] != (8, 8):
+        raise ValueError(f'Layouts must be 8x8, not {layouts.shape[1:]}')
+    unique, inverse = np.unique(layouts, return_inverse=True)
+    return featurize_ids(inverse.reshape(layouts.shape), list(unique))
+
+
+def featurize_ids(ids: np.ndarray, codes: list[str]) -> np.ndarray:
+    """Feature vectors of layouts given as indices into a code table, as stored by latlib.LatticeLibrary.
+    Parameters:
+        - ids (np.ndarray): (B, 8, 8) integer code indices.
+        - codes (list[str]): Code table.
+    Returns:
+        - np.ndarray: (B, len(feature_names)) features, as featurize()."""
+    ids = np.asarray(ids).reshape(len(ids), 64)
+    # Per-code lookup tables indexed by code ID
+    used = np.zeros(len(codes), dtype=bool)
+    used[np.unique(ids)] = True
+    # Unused entries of the table may be codes featurize() rejects
+    props = [unit_properties(c) if u else ('w', 0, None) for c, u in zip(codes, used)]
+    category = np.array([feature_codes.index(p[0]) for p in props])[ids]
+    tubes = np.array([p[1] for p in props], dtype=float)[ids]
+    height = np.array([np.nan if p[2] is None else p[2] for p in props])[ids]
+
+    counts = np.stack([(category == i).sum(axis=1) for i in range(len(feature_codes))], axis=1).astype(float)
+    total = tubes.sum(axis=1)
+    safe_total = np.where(total > 0, total, 1.0)
+    fuel_x = (tubes * _x).sum(axis=1) / safe_total
+    fuel_y = (tubes * _y).sum(axis=1) / safe_total
+    fuel_r2 = (tubes * (_x ** 2 + _y ** 2)).sum(axis=1) / safe_total
+    importance = (tubes * _importance).sum(axis=1)
+
+    wrc = category == feature_codes.index('wrc')
+    # Distance of every position to the nearest 'wrc' position, 8 pitches if the layout has none
+    to_wrc = np.where(wrc[:, None, :], _distance[None], np.inf).min(axis=2)
+    to_wrc = np.where(np.isfinite(to_wrc), to_wrc, 8.0)
+    fuelled = tubes > 0
+    wrc_mean = (tubes * to_wrc).sum(axis=1) / safe_total
+    wrc_min = np.where(fuelled, to_wrc, np.inf).min(axis=1)
+    wrc_min = np.where(np.isfinite(wrc_min), wrc_min, 8.0)
+
+    inserted = np.where(np.isnan(height), 0.0, 1.0 - np.clip(height / rod_full_out, 0.0, 1.0))
+    return np.column_stack([counts, total, fuel_x, fuel_y, fuel_r2, importance, wrc_mean, wrc_min,
+                            inserted.sum(axis=1), (inserted * _importance).sum(axis=1)])
+
+
+def layout_key(lattice_str: list[list[str]]) -> str:
+    """ Short hash of a layout, e.g. for its run directory """
+    return hashlib.sha256(json.dumps(lattice_str).encode()).hexdigest()[:12]
+
+
+def load_runs(paths: list[str]) -> list[dict]:
+    """Training samples from finished runs.
+    Parameters:
+        - paths (list[str]): Run directories or files: run_monitor.json records, sweep summaries, or JSONL files
+            with one {"lattice_str", "keff", "keff_std"} object per line.
+    Returns:
+        - list[dict]: Samples with 'lattice_str', 'keff' and 'keff_std'; runs without a layout or k-eff are skipped."""
+    from vr1.monitor import monitor_json_name
+    samples: list[dict] = []
+    for path in paths:
+        if os.path.isdir(path):
+            path = os.path.join(path, monitor_json_name)
+        with open(path) as f:
+            if path.endswith('.jsonl'):
+                records = [json.loads(line) for line in f if line.strip()]
+            else:
+                data = json.load(f)
+                runs = data['runs'] if 'runs' in data else [{**data['summary'], 'metadata': data['metadata']}]
+                records = [{'lattice_str': r['metadata'].get('lattice_str'), 'keff': r['keff'],
+                            'keff_std': r['keff_std']} for r in runs]
+        samples += [r for r in records if r.get('lattice_str') is not None and r.get('keff') is not None]
+    return samples
+
+
+def save_samples(samples: list[dict], filename: str) -> None:
+    """ Appends samples to a JSONL training file """
+    with open(filename, 'a') as f:
+        for s in samples:
+            f.write(json.dumps({'lattice_str': s['lattice_str'], 'keff': s['keff'],
+                                'keff_std': s.get('keff_std')}) + '\n')
+
+
+class KeffSurrogate:
+    """
+    Gaussian-process regression of k-eff on layout features, with a linear trend.
+    Parameters:
+        - max_std (float): Predictions with a larger standard deviation are treated as extrapolation.
+        - distance_margin (float): Layouts whose Mahalanobis distance from the training features exceeds
+            this multiple of the largest training distance are treated as extrapolation.
+        - length_scales (tuple[float]): Candidate RBF length scales, in standardized feature units per sqrt(feature).
+    Processing Logic:
+        - Features are standardized; a ridge-regularized linear trend is fitted first and the GP models its residual.
+        - The length scale maximizes the marginal likelihood, the signal variance is that of the trend residual,
+          and the noise of every sample is its run's k-eff std.
+        - Prediction is a matrix product with precomputed weights, so batches of layouts cost microseconds each.
+    """
+    def __init__(self, max_std: float = 0.003, distance_margin: float = 1.2,
+                 length_scales: tuple = (0.25, 0.5, 1.0, 2.0, 4.0)) -> None:
+        self.max_std: float = max_std
+        self.distance_margin: float = distance_margin
+        self.length_scales: tuple = length_scales
+        self.samples: list[dict] = []
+        self.x_mean = self.x_scale = self.trend = self.x_train = self.alpha = self.chol = None
+        self.cov_inv = None
+        self.length_scale: float = 1.0
+        self.signal_var: float = 1.0
+        self.max_distance: float = np.inf
+
+    def kernel(self, a: np.ndarray, b: np.ndarray, length_scale: (float, None) = None) -> np.ndarray:
+        """ RBF kernel between standardized feature sets """
+        ell = (length_scale or self.length_scale) * np.sqrt(a.shape[1])
+        d2 = (a ** 2).sum(axis=1)[:, None] + (b ** 2).sum(axis=1)[None, :] - 2.0 * a @ b.T
+        return np.exp(-0.5 * np.maximum(d2, 0.0) / ell ** 2)
+
+    def standardize(self, features: np.ndarray) -> np.ndarray:
+        """ Features in units of the training standard deviation around the training mean """
+        return (features - self.x_mean) / self.x_scale
+
+    def fit(self, samples: list[dict], ridge: float = 1.0e-3) -> 'KeffSurrogate':
+        """Trains the surrogate.
+        Parameters:
+            - samples (list[dict]): Samples with 'lattice_str', 'keff' and optionally 'keff_std', e.g. from load_runs().
+            - ridge (float): Regularization of the linear trend.
+        Returns:
+            - KeffSurrogate: self."""
+        if len(samples) < 2:
+            raise ValueError('The surrogate needs at least 2 training samples')
+        self.samples = list(samples)
+        features = featurize([s['lattice_str'] for s in samples])
+        keff = np.array([s['keff'] for s in samples], dtype=float)
+        noise = np.array([s.get('keff_std') or 1.0e-4 for s in samples], dtype=float) ** 2
+        self.x_mean = features.mean(axis=0)
+        self.x_scale = np.where(features.std(axis=0) > 0, features.std(axis=0), 1.0)
+        x = self.standardize(features)
+        design = np.column_stack([np.ones(len(x)), x])
+        penalty = ridge * np.eye(design.shape[1])
+        penalty[0, 0] = 0.0
+        self.trend = np.linalg.solve(design.T @ design + penalty, design.T @ keff)
+        residual = keff - design @ self.trend
+
+        best = None
+        for ell in self.length_scales:
+            k = self.kernel(x, x, ell)
+            # Signal variance from the residual spread, then the marginal likelihood of this length scale
+            signal_var = max(residual.var(), 1.0e-10)
+            chol = np.linalg.cholesky(signal_var * k + np.diag(noise + 1.0e-10))
+            alpha = np.linalg.solve(chol.T, np.linalg.solve(chol, residual))
+            log_likelihood = -0.5 * residual @ alpha - np.log(np.diag(chol)).sum()
+            if best is None or log_likelihood > best[0]:
+                best = (log_likelihood, ell, signal_var, chol, alpha)
+        _, self.length_scale, self.signal_var, self.chol, self.alpha = best
+        self.x_train = x
+        cov = np.cov(x, rowvar=False) + 1.0e-6 * np.eye(x.shape[1])
+        self.cov_inv = np.linalg.pinv(cov)
+        self.max_distance = float(self.mahalanobis(x).max()) * self.distance_margin
+        return self
+
+    def mahalanobis(self, x: np.ndarray) -> np.ndarray:
+        """ Mahalanobis distance of standardized features from the training set """
+        return np.sqrt(np.einsum('bi,ij,bj->b', x, self.cov_inv, x))
+
+    def predict(self, layouts: (list, np.ndarray)) -> dict:
+        """Predicted k-eff of one layout or a batch.
+        Parameters:
+            - layouts (list, np.ndarray): One 8x8 layout or a list of them.
+        Returns:
+            - dict: 'keff' and 'std' arrays, 'distance' (Mahalanobis) and the boolean 'extrapolating'."""
+        if self.alpha is None:
+            raise RuntimeError('The surrogate is not trained, call fit() first')
+        x = self.standardize(featurize(layouts))
+        k_star = self.signal_var * self.kernel(x, self.x_train)
+        mean = np.column_stack([np.ones(len(x)), x]) @ self.trend + k_star @ self.alpha
+        v = np.linalg.solve(self.chol, k_star.T)
+        std = np.sqrt(np.maximum(self.signal_var - (v ** 2).sum(axis=0), 0.0))
+        distance = self.mahalanobis(x)
+        return {'keff': mean, 'std': std, 'distance': distance,
+                'extrapolating': (std > self.max_std) | (distance > self.max_distance)}
+
+    def predict_or_run(self, layouts: list, runner: callable, update: bool = True) -> dict:
+        """Predicts k-eff and sends the layouts the surrogate would extrapolate to a transport run.
+        Parameters:
+            - layouts (list): 8x8 layouts.
+            - runner (callable): runner(lattice_str) -> (keff, keff_std), e.g. openmc_runner().
+            - update (bool): Add the new runs to the training samples and refit.
+        Returns:
+            - dict: 'keff', 'std' and 'source' ('surrogate' or 'transport') of every layout."""
+        pred = self.predict(layouts)
+        keff, std = pred['keff'].copy(), pred['std'].copy()
+        source = np.where(pred['extrapolating'], 'transport', 'surrogate')
+        new_samples: list[dict] = []
+        for i in np.nonzero(pred['extrapolating'])[0]:
+            keff[i], std[i] = runner(layouts[i])
+            new_samples.append({'lattice_str': layouts[i], 'keff': float(keff[i]), 'keff_std': float(std[i])})
+        if update and new_samples:
+            self.fit(self.samples + new_samples)
+        return {'keff': keff, 'std': std, 'source': source}
+
+    def save(self, filename: str) -> None:
+        """ Writes the training samples and settings; load() refits from them """
+        with open(filename, 'w') as f:
+            json.dump({'max_std': self.max_std, 'distance_margin': self.distance_margin,
+                       'length_scales': list(self.length_scales), 'samples': self.samples}, f)
+
+    @classmethod
+    def load(cls, filename: str) -> 'KeffSurrogate':
+        """ Surrogate trained on the samples written by save() """
+        with open(filename) as f:
+            data = json.load(f)
+        return cls(data['max_std'], data['distance_margin'], tuple(data['length_scales'])).fit(data['samples'])
+
+
+def openmc_runner(output_dir: str = 'surrogate_runs', settings=None, threads: (int, None) = None) -> callable:
+    """Runner for KeffSurrogate.predict_or_run() that runs OpenMC on a layout.
+    Parameters:
+        - output_dir (str): Parent directory of the runs, one sub-directory per layout hash.
+        - settings (VR1Settings, None): Run settings; VR1Settings() if None.
+        - threads (int, None): OpenMP threads.
+    Returns:
+        - callable: runner(lattice_str) -> (keff, keff_std)."""
+    from vr1.core import Lattice
+    from vr1.monitor import run_or_resume
+    from vr1.settings import VR1Settings
+    from vr1.writer import WriterOpenMC
+
+    def run(lattice_str: list[list[str]]) -> tuple[float, float]:
+        writer = WriterOpenMC(settings if settings is not None else VR1Settings(), Lattice(lattice_str=lattice_str))
+        writer.output_dir = os.path.join(output_dir, layout_key(lattice_str))
+        summary = run_or_resume(writer, threads=threads)
+        return summary['keff'], summary['keff_std']
+    return run
@@ -0,0 +1,116 @@
+""" Rotation/reflection symmetry of VR1 lattice layouts: canonical forms and deduplication of sweeps """
+
+import numpy as np
+
+# Symmetries of the square (D4) acting on the last two axes (rows, columns) of an array
+d4_transforms: dict[str, callable] = {
+    'identity': lambda a: a,
+    'rot90': lambda a: np.rot90(a, 1, axes=(-2, -1)),
+    'rot180': lambda a: np.rot90(a, 2, axes=(-2, -1)),
+    'rot270': lambda a: np.rot90(a, 3, axes=(-2, -1)),
+    'flip_rows': lambda a: a[..., ::-1, :],
+    'flip_cols': lambda a: a[..., :, ::-1],
+    'transpose': lambda a: np.swapaxes(a, -2, -1),
+    'antitranspose': lambda a: np.swapaxes(a, -2, -1)[..., ::-1, ::-1],
+}
+d4_inverse: dict[str, str] = {'identity': 'identity', 'rot90': 'rot270', 'rot180': 'rot180', 'rot270': 'rot90',
+                              'flip_rows': 'flip_rows', 'flip_cols': 'flip_cols', 'transpose': 'transpose',
+                              'antitranspose': 'antitranspose'}
+# Lattice codes (by prefix) of structures that do not move with the fuel: radial channel, rabbit tube, channels
+fixed_prefixes: tuple = ('wrc', 'rt', 'v')
+
+
+def transform(layout: (list, np.ndarray), name: str) -> np.ndarray:
+    """ Layout (or any array with 8x8 in its last two axes) transformed by one D4 element """
+    return d4_transforms[name](np.asarray(layout, dtype=object) if isinstance(layout, list) else layout)
+
+
+def fixed_structure(layout: (list, np.ndarray), prefixes: tuple = fixed_prefixes) -> np.ndarray:
+    """ Layout with every movable position blanked, only the fixed structures remain """
+    layout = np.asarray(layout, dtype=object)
+    fixed = np.vectorize(lambda c: c.startswith(prefixes), otypes=[bool])(layout)
+    return np.where(fixed, layout, '')
+
+
+def symmetry_group(layout: (list, np.ndarray), prefixes: tuple = fixed_prefixes) -> list[str]:
+    """Subgroup of D4 that maps the fixed structures of a layout onto themselves.
+    Parameters:
+        - layout (list, np.ndarray): 8x8 layout, as Lattice.lattice_str.
+        - prefixes (tuple): Code prefixes of the fixed structures.
+    Returns:
+        - list[str]: Names of the D4 elements in the group; ['identity', 'flip_cols'] for a core with the 'wrc' row."""
+    fixed = fixed_structure(layout, prefixes)
+    return [name for name, f in d4_transforms.items() if np.array_equal(f(fixed), fixed)]
+
+
+def canonical(layout: (list, np.ndarray), group: (list[str], None) = None) -> tuple[tuple, str]:
+    """Canonical form of a layout: the lexicographically smallest of its images under the symmetry group.
+    Parameters:
+        - layout (list, np.ndarray): 8x8 layout.
+        - group (list[str], None): D4 elements to use; symmetry_group(layout) if None.
+    Returns:
+        - tuple: (canonical layout as a flat tuple of codes, name of the element mapping the layout onto it)."""
+    layout = np.asarray(layout, dtype=object)
+    if group is None:
+        group = symmetry_group(layout)
+    images = [(tuple(d4_transforms[name](layout).ravel()), name) for name in group]
+    return min(images)
+
+
+def deduplicate(layouts: list, group: (list[str], None) = None) -> dict:
+    """Reduces a list of layouts to one representative per symmetry class.
+    Parameters:
+        - layouts (list): 8x8 layouts.
+        - group (list[str], None): D4 elements to use for all layouts; each layout's own symmetry_group() if None.
+    Returns:
+        - dict: 'unique' canonical layouts (list[list[str]]), and for every input layout its 'index' into 'unique'
+            and the 'transform' that maps it onto that canonical layout."""
+    unique: list = []
+    keys: dict[tuple, int] = {}
+    index = np.empty(len(layouts), dtype=int)
+    transforms: list[str] = []
+    for i, layout in enumerate(layouts):
+        key, name = canonical(layout, group)
+        if key not in keys:
+            keys[key] = len(unique)
+            unique.append(np.array(key, dtype=object).reshape(8, 8).tolist())
+        index[i] = keys[key]
+        transforms.append(name)
+    return {'unique': unique, 'index': index, 'transform': transforms}
+
+
+def map_back(value, name: str):
+    """ Result of a canonical layout expressed for a layout that maps onto it by `name`; 8x8 maps are transformed """
+    if isinstance(value, np.ndarray) and value.ndim >= 2 and value.shape[-2:] == (8, 8):
+        return d4_transforms[d4_inverse[name]](value).copy()
+    if isinstance(value, dict):
+        return {k: map_back(v, name) for k, v in value.items()}
+    return value
+
+
+def expand_results(results: list, dedup: dict) -> list:
+    """ Results of deduplicate()['unique'] expanded to every original layout """
+    return [map_back(results[i], name) for i, name in zip(dedup['index'], dedup['transform'])]
+
+
+def expand_batch(batch: dict, dedup: dict) -> dict:
+    """ Batched results {name: array (B_unique, ...)} of deduplicate()['unique'] expanded to every original layout """
+    expanded: dict = {}
+    for key, value in batch.items():
+        if isinstance(value, np.ndarray) and value.ndim >= 1 and len(value) == len(dedup['unique']):
+            expanded[key] = np.stack([map_back(value[i], name) for i, name in zip(dedup['index'], dedup['transform'])])
+        else:
+            expanded[key] = value
+    return expanded
+
+
+def run_unique(layouts: list, run: callable, group: (list[str], None) = None) -> list:
+    """Evaluates only one layout per symmetry class and maps the results back to all layouts.
+    Parameters:
+        - layouts (list): 8x8 layouts.
+        - run (callable): run(list of layouts) -> list of results, one per layout.
+        - group (list[str], None): D4 elements to use; each layout's own symmetry_group() if None.
+    Returns:
+        - list: One result per input layout."""
+    dedup = deduplicate(layouts, group)
+    return expand_results(run(dedup['unique']), dedup)
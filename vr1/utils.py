@@ -52,26 +52,29 @@ def mat_s2open(s2mat: str):
         ele = f'{vr1.ELEMENTS[Z]}'.capitalize() + str(A)
         print(f'"{ele}": {wo},')
 
+import hashlib
 import os
 import subprocess
+import xml.etree.ElementTree as ET
 
 def plot_vr1():
     subprocess.run(["openmc-plotter"])
 
 
-def launch_lattice_builder():
+def launch_lattice_builder(estimator=None):
     """Launch the VR-1 lattice builder GUI application.
     
     This function starts the interactive GUI for creating and editing
     VR-1 reactor lattice configurations using tkinter.
     
+    Parameters:
+        - estimator (callable, None): Background estimator of edited layouts, see vr1.evaluator.default_estimator().
     Returns:
         None
     """
     try:
-        from vr1.gui import VR1LatticeBuilder
-        app = VR1LatticeBuilder()
-        app.run()
+        from vr1.gui import main
+        main(estimator)
     except ImportError as e:
         print(f"Error importing GUI module: {e}")
         print("Make sure all required dependencies are installed.")
@@ -79,5 +82,28 @@ def launch_lattice_builder():
         print(f"Error launching lattice builder: {e}")
 
 
+def model_xml_hash(output_dir: str) -> str:
+    """ SHA-256 of the materials and geometry in output_dir/model.xml, independent of the run settings """
+    tree = ET.parse(os.path.join(output_dir, 'model.xml'))
+    digest = hashlib.sha256()
+    for tag in ('materials', 'geometry'):
+        element = tree.getroot().find(tag)
+        if element is not None:
+            digest.update(ET.tostring(element))
+    return digest.hexdigest()
+
+
+def cache_dir(subdir: str = '') -> str:
+    """Directory for persistent VR1 caches, created if needed.
+    Parameters:
+        - subdir (str): Sub-directory for one kind of cached data.
+    Returns:
+        - str: $VR1_CACHE_DIR/subdir, or ~/.cache/vr1/subdir if the variable is not set."""
+    root = os.environ.get('VR1_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'vr1'))
+    path = os.path.join(root, subdir)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
 if __name__ == '__main__':
     mat_s2open(my_mat)
@@ -0,0 +1,252 @@
+""" Weight windows for deep-penetration calculations of the VR1 facility: MAGIC iteration, cache and FOM gain """
+
+import copy
+import hashlib
+import json
+import os
+import numpy as np
+from vr1.utils import cache_dir, model_xml_hash
+
+# Mesh over the facility: the BOX.rec concrete block in x-y and the H01.zd to H01.zt height, about 10 cm cells
+facility_mesh_defaults: dict = {
+    'lower_left': [-130.0, -215.0, -50.0],
+    'upper_right': [130.0, 130.0, 372.0],
+    'dimension': [26, 35, 42],
+}
+ww_energy_bounds: list[float] = [0.0, 0.625, 1.0e5, 2.0e7]
+# Deep-penetration tallies: facility cells whose flux the weight windows are for. The concrete block is the
+# outermost material inside the BOX.rec vacuum boundary; the air beyond it (OUT.1) is never reached.
+deep_tally_cells: dict[str, list[str]] = {
+    'radial channel exit': ['air.2'],
+    'vertical channel P1': ['OUTrk62P1'],
+    'vertical channel P2': ['OUTrk62P2'],
+    'concrete shielding': ['SHIELD1', 'SHIELD2'],
+}
+ww_flux_tally_name: str = 'weight window flux'
+
+
+def mesh_flux(mean: np.ndarray, std_dev: np.ndarray, dimension: (list, tuple), n_groups: int) -> tuple:
+    """Flux and relative error of a [MeshFilter, EnergyFilter] tally as [ix, iy, iz, group] arrays.
+    Parameters:
+        - mean (np.ndarray): Tally mean, any shape with mesh bins (x fastest) times groups entries.
+        - std_dev (np.ndarray): Tally standard deviation, same shape.
+        - dimension (list, tuple): Mesh (nx, ny, nz).
+        - n_groups (int): Energy groups.
+    Returns:
+        - tuple: (flux, relative error), relative error inf where the flux is zero."""
+    nx, ny, nz = dimension
+    flux = np.asarray(mean, dtype=float).reshape(nz, ny, nx, n_groups).transpose(2, 1, 0, 3)
+    std = np.asarray(std_dev, dtype=float).reshape(nz, ny, nx, n_groups).transpose(2, 1, 0, 3)
+    rel = np.full(flux.shape, np.inf)
+    np.divide(std, flux, out=rel, where=flux > 0)
+    return flux, rel
+
+
+def magic_bounds(flux: np.ndarray, rel_err: np.ndarray, previous: (np.ndarray, None) = None, ratio: float = 5.0,
+                 threshold: float = 0.5) -> np.ndarray:
+    """One MAGIC update of lower weight window bounds from a forward flux estimate.
+    Parameters:
+        - flux (np.ndarray): [ix, iy, iz, group] mesh flux.
+        - rel_err (np.ndarray): Its relative error.
+        - previous (np.ndarray, None): Bounds of the previous iteration, kept where the new flux is unreliable.
+        - ratio (float): Upper to lower bound ratio.
+        - threshold (float): Largest relative error of a flux estimate that is used.
+    Returns:
+        - np.ndarray: Lower bounds proportional to the flux, normalized per group so that the window around the
+            highest flux is centered on weight 1; -1 (no window) where the flux is unknown."""
+    reliable = (flux > 0) & (rel_err <= threshold)
+    peak = np.where(reliable, flux, 0.0).max(axis=(0, 1, 2))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lower = np.where(reliable & (peak > 0), flux / peak * 2.0 / (ratio + 1.0), -1.0)
+    if previous is not None:
+        lower = np.where(lower > 0, lower, previous)
+    return lower
+
+
+def coverage(lower: np.ndarray) -> float:
+    """ Fraction of mesh cells and groups that have a weight window """
+    return float(np.mean(np.asarray(lower) > 0))
+
+
+class FacilityWeightWindows:
+    """
+    Generates, caches and applies weight windows for shielding and channel flux calculations of the facility.
+    Parameters:
+        - lattice_str (list[list[str]]): Core layout.
+        - settings (VR1Settings, None): Base settings; 'npg' particles per batch and 'batches' are used by every run.
+        - power (np.ndarray, None): 8x8 relative power map weighting the fission source; uniform in the fuel if None.
+        - mesh (dict, None): 'lower_left', 'upper_right' and 'dimension' of the weight window mesh;
+            facility_mesh_defaults if None.
+        - energy_bounds (list, None): Group boundaries of the windows [eV]; ww_energy_bounds if None.
+        - iterations (int): MAGIC iterations.
+        - ratio (float): Upper to lower bound ratio.
+        - threshold (float): Largest relative error of mesh fluxes used by MAGIC.
+        - output_root (str): Directory of the run decks.
+        - threads (int, None): OpenMP threads.
+    Processing Logic:
+        - Runs are fixed-source runs from vr1.sources.fuel_source() with fission treated as capture, so the core
+            acts as a given fission source for transport through water, steel, lead and concrete.
+        - MAGIC: the first run is analog, each further run uses the windows from the mesh flux of the previous one;
+            windows spread outward through the shielding with every iteration.
+        - The result is cached in cache_dir('weight_windows') under a key of the facility materials and geometry,
+            the normalized power map, the mesh, the groups, the MAGIC parameters (iterations, ratio, threshold) and
+            the particles and batches per run, and reused by later runs of the same model.
+    """
+    def __init__(self, lattice_str: list[list[str]], settings=None, power: (np.ndarray, None) = None,
+                 mesh: (dict, None) = None, energy_bounds: (list, None) = None, iterations: int = 3,
+                 ratio: float = 5.0, threshold: float = 0.5, output_root: str = 'facility_ww',
+                 threads: (int, None) = None) -> None:
+        self.lattice_str = [list(row) for row in lattice_str]
+        self.settings = settings
+        self.power = power
+        self.mesh_spec: dict = dict(facility_mesh_defaults if mesh is None else mesh)
+        self.energy_bounds: list[float] = list(ww_energy_bounds if energy_bounds is None else energy_bounds)
+        self.iterations = iterations
+        self.ratio = ratio
+        self.threshold = threshold
+        self.output_root = output_root
+        self.threads = threads
+        self.universe_cache: dict = {}
+        self.history: list[dict] = []
+
+    @property
+    def n_groups(self) -> int:
+        return len(self.energy_bounds) - 1
+
+    def mesh(self):
+        """ openmc.RegularMesh of the windows """
+        import openmc
+        mesh = openmc.RegularMesh()
+        mesh.lower_left = self.mesh_spec['lower_left']
+        mesh.upper_right = self.mesh_spec['upper_right']
+        mesh.dimension = self.mesh_spec['dimension']
+        return mesh
+
+    def tallies(self, core, flux_mesh: bool = False) -> list:
+        """ Deep-penetration tallies of a Reactor core, and the MAGIC mesh flux tally if flux_mesh """
+        import openmc
+        tallies: list = []
+        for name, cell_names in deep_tally_cells.items():
+            tally = openmc.Tally(name=name)
+            tally.filters = [openmc.CellFilter([core.cells[c] for c in cell_names]),
+                             openmc.EnergyFilter(self.energy_bounds)]
+            tally.scores = ['flux']
+            tallies.append(tally)
+        if flux_mesh:
+            tally = openmc.Tally(name=ww_flux_tally_name)
+            tally.filters = [openmc.MeshFilter(self.mesh()), openmc.EnergyFilter(self.energy_bounds)]
+            tally.scores = ['flux']
+            tallies.append(tally)
+        return tallies
+
+    def writer(self, name: str, lower: (np.ndarray, None) = None, flux_mesh: bool = False):
+        """Writes the deck of one run.
+        Parameters:
+            - name (str): Run directory under output_root.
+            - lower (np.ndarray, None): [ix, iy, iz, group] lower bounds to apply; analog if None.
+            - flux_mesh (bool): Add the mesh flux tally for a MAGIC update.
+        Returns:
+            - WriterOpenMC: Writer whose deck is written."""
+        from vr1.core import Reactor
+        from vr1.settings import VR1Settings
+        from vr1.sources import fuel_source
+        from vr1.writer import WriterOpenMC
+        settings = copy.copy(self.settings) if self.settings is not None else VR1Settings()
+        settings.parm = {**settings.parm, 'inactive': 0}
+        settings.run_mode = 'fixed source'
+        settings.cmfd = False
+        settings.create_fission_neutrons = False
+        settings.ext_sources = fuel_source(self.lattice_str, self.power)
+        core = Reactor(lattice_str=self.lattice_str, universe_cache=self.universe_cache)
+        settings.tallies = list(settings.tallies or []) + self.tallies(core, flux_mesh)
+        settings.weight_windows = [self.weight_windows(lower)] if lower is not None else None
+        writer = WriterOpenMC(settings, core)
+        writer.output_dir = os.path.join(self.output_root, name)
+        writer.write_openmc_XML()
+        return writer
+
+    def weight_windows(self, lower: np.ndarray):
+        """ openmc.WeightWindows from [ix, iy, iz, group] lower bounds """
+        import openmc
+        return openmc.WeightWindows(self.mesh(), lower_ww_bounds=lower, upper_bound_ratio=self.ratio,
+                                    energy_bounds=self.energy_bounds, particle_type='neutron')
+
+    def key(self, model_hash: str) -> str:
+        """ Cache key of the windows of a model """
+        power = None
+        if self.power is not None:
+            power = np.asarray(self.power, dtype=float)
+            power = np.round(power / power.sum(), 8).tolist()
+        # The VR1Settings defaults if no settings are given
+        parm = self.settings.parm if self.settings is not None else {}
+        description = {'model': model_hash, 'power': power, 'mesh': self.mesh_spec,
+                       'energy_bounds': self.energy_bounds, 'ratio': self.ratio, 'iterations': self.iterations,
+                       'threshold': self.threshold, 'npg': parm.get('npg'),
+                       'batches': parm.get('batches', parm.get('gen'))}
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()[:20]
+
+    def cache_file(self, model_hash: str) -> str:
+        return os.path.join(cache_dir('weight_windows'), f'{self.key(model_hash)}.npz')
+
+    def run(self, writer) -> dict:
+        """ Runs a written deck, returns its monitor summary with the final statepoint """
+        from vr1.monitor import latest_statepoint
+        summary = writer.run(threads=self.threads, write=False)
+        return {**summary, 'statepoint': latest_statepoint(writer.output_dir)}
+
+    def generate(self, force: bool = False) -> np.ndarray:
+        """Lower bounds of the facility model, from the cache or by MAGIC iteration.
+        Parameters:
+            - force (bool): Iterate even if cached.
+        Returns:
+            - np.ndarray: [ix, iy, iz, group] lower bounds."""
+        import openmc
+        writer = self.writer('magic_0', flux_mesh=True)
+        cache_file = self.cache_file(model_xml_hash(writer.output_dir))
+        if os.path.isfile(cache_file) and not force:
+            with np.load(cache_file) as data:
+                self.history = json.loads(str(data['history']))
+                return data['lower']
+        lower = None
+        self.history = []
+        for i in range(self.iterations):
+            if i > 0:
+                writer = self.writer(f'magic_{i}', lower, flux_mesh=True)
+            summary = self.run(writer)
+            with openmc.StatePoint(summary['statepoint']) as sp:
+                tally = sp.get_tally(name=ww_flux_tally_name)
+                flux, rel = mesh_flux(tally.mean, tally.std_dev, self.mesh_spec['dimension'], self.n_groups)
+            lower = magic_bounds(flux, rel, lower, self.ratio, self.threshold)
+            self.history.append({'iteration': i, 'coverage': coverage(lower), 'wall_time': summary.get('wall_time')})
+        np.savez_compressed(cache_file, lower=lower, history=json.dumps(self.history))
+        return lower
+
+    def apply(self, settings, force: bool = False):
+        """ Adds the (cached or generated) windows to VR1Settings of a later run of the same model """
+        settings.weight_windows = [self.weight_windows(self.generate(force))]
+        return settings
+
+    def compare(self, force: bool = False) -> dict:
+        """Figure-of-merit gain of the weight windows on the deep-penetration tallies.
+        Parameters:
+            - force (bool): Regenerate the windows even if cached.
+        Returns:
+            - dict: 'reports' (TallyFOM.report() of the analog and the weighted run), 'fom_gain' ({tally: ratio}
+                from fom.compare_runs), 'unscored' (deep tallies without a score in either run, hence without a gain)
+                and 'history' of the MAGIC iterations; also written to output_root/ww_fom.json."""
+        from vr1.fom import TallyFOM, compare_runs
+        lower = self.generate(force)
+        reports: dict = {}
+        for name, bounds in (('analog', None), ('weight windows', lower)):
+            summary = self.run(self.writer(name.replace(' ', '_'), bounds))
+            report = TallyFOM(summary['statepoint']).report()
+            report['tallies'] = {t: v for t, v in report['tallies'].items() if t in deep_tally_cells}
+            reports[name] = report
+        fom_gain = compare_runs(reports)['weight windows']
+        unscored = [t for t in deep_tally_cells if t not in fom_gain]
+        if unscored:
+            print(f'No FOM gain for {unscored}: not scored in the analog or the weighted run')
+        result = {'reports': reports, 'fom_gain': fom_gain, 'unscored': unscored, 'history': self.history}
+        with open(os.path.join(self.output_root, 'ww_fom.json'), 'w') as f:
+            json.dump(result, f, indent=2, default=str)
+        return result
@@ -5,21 +5,28 @@ import os
 from vr1.core import VR1core
 from vr1.materials import vr1_materials
 from vr1.settings import VR1Settings
+from vr1.monitor import RunMonitor
+from vr1.checkpoint import checkpoint_batches, register_checkpoint_dir
+from vr1.cmfd import cmfd_spec, cmfd_command, entropy_mesh, write_spec
+from vr1.utils import model_xml_hash
+from vr1.sources import fuel_source
 
 
 class WriterOpenMC:
     """ OpenMC writer for the VR1 models """
-    def __init__(self, settings: VR1Settings, core: VR1core) -> None:
+    def __init__(self, settings: VR1Settings, core: VR1core, materials: (openmc.Materials, None) = None) -> None:
         """Initializes a class with settings and core parameters to set up the OpenMC model.
         Parameters:
             - settings (VR1Settings): Configuration settings for the OpenMC simulation.
             - core (VR1core): The core specification for the VR1 reactor model.
+            - materials (openmc.Materials, None): Materials to reuse, e.g. across a batch of decks; from vr1_materials
+                if None.
         Returns:
             - None: This constructor does not return a value."""
         self.output_dir: str = 'vr1'
         self.core: VR1core = core
         self.settings = settings
-        self.openmc_materials = vr1_materials.get_materials()
+        self.openmc_materials = vr1_materials.get_materials() if materials is None else materials
         self.openmc_geometry = openmc.Geometry()
         self.openmc_settings = openmc.Settings()
         self.openmc_tallies = openmc.Tallies()
@@ -28,22 +35,53 @@ class WriterOpenMC:
     def set_settings(self) -> openmc.Settings:
         """ Creates OpenMC settings object """
         settings = openmc.Settings()
-        settings.batches = self.settings.parm['gen']
-        settings.particles = self.settings.parm['npg']
+        settings.run_mode = self.settings.run_mode
+        parm = self.settings.parm
+        settings.batches = parm['batches'] if 'batches' in parm else parm['gen']
+        settings.particles = parm['npg']
         settings.generations_per_batch = self.settings.generations_per_batch
-        settings.inactive = self.settings.parm['nsk']
+        settings.inactive = parm['inactive'] if 'inactive' in parm else parm['nsk']
         if 'sig' in self.settings.parm:
             settings.keff_trigger = {
             'type': 'std_dev',
             'threshold': self.settings.parm['sig']  # Ensure k-effective converges to this precision
         }
+        settings.event_based = self.settings.event_based
+        if self.settings.checkpoint_interval:
+            settings.statepoint = {'batches': checkpoint_batches(settings.batches, self.settings.checkpoint_interval)}
+        if self.settings.cmfd:
+            settings.entropy_mesh = entropy_mesh(self.cmfd_spec())
         settings.temperature = {'method': 'interpolation'}
-        settings.source = openmc.IndependentSource(
-            space=openmc.stats.Box(self.core.source_lower_left, self.core.source_upper_right),
-            constraints={'fissionable': True}
-        )
+        if self.settings.multipole:
+            settings.temperature['multipole'] = True
+        if self.settings.ext_sources:
+            settings.source = self.settings.ext_sources
+        elif self.settings.fuel_source:
+            if not hasattr(self.core, 'lattice_str'):
+                raise ValueError(f'A fuel source needs a Lattice core, not {type(self.core).__name__}')
+            settings.source = fuel_source(self.core.lattice_str)
+        else:
+            settings.source = openmc.IndependentSource(
+                space=openmc.stats.Box(self.core.source_lower_left, self.core.source_upper_right),
+                constraints={'fissionable': True}
+            )
+        if self.settings.weight_windows:
+            settings.weight_windows = self.settings.weight_windows
+            settings.weight_windows_on = True
+        if not self.settings.create_fission_neutrons:
+            settings.create_fission_neutrons = False
+        if self.settings.surf_source_write:
+            settings.surf_source_write = self.settings.surf_source_write
+        if self.settings.ifp_n_generation:
+            settings.ifp_n_generation = self.settings.ifp_n_generation
         return settings
 
+    def cmfd_spec(self) -> dict:
+        """ CMFD setup of the core, see vr1.cmfd.cmfd_spec() """
+        if not hasattr(self.core, 'lattice_str'):
+            raise ValueError(f'CMFD needs a Lattice core, not {type(self.core).__name__}')
+        return cmfd_spec(self.core.lattice_str, self.settings.cmfd if isinstance(self.settings.cmfd, dict) else None)
+
     def set_tallies(self) -> openmc.tallies:
         """ Creates OpenMC tallies object """
         my_tallies: list = []
@@ -88,4 +126,34 @@ class WriterOpenMC:
         self.openmc_model.tallies = self.openmc_tallies
         self.openmc_model.plots = self.set_plots()
         self.openmc_model.export_to_model_xml(self.output_dir)
+        if self.settings.cmfd:
+            write_spec(self.cmfd_spec(), self.output_dir)
+        if self.settings.checkpoint_interval:
+            register_checkpoint_dir(model_xml_hash(self.output_dir), self.output_dir)
         return 0
+
+    def run(self, threads: (int, None) = None, event_based: (bool, None) = None, echo: bool = False,
+            write: bool = True, poll_statepoints: bool = True, cancel=None) -> dict:
+        """Writes the XML deck and runs OpenMC on it under a RunMonitor.
+        Parameters:
+            - threads (int, None): Number of OpenMP threads; VR1Settings.threads if None.
+            - event_based (bool, None): Use event-based transport; VR1Settings.event_based if None.
+            - echo (bool): Print OpenMC output while it runs.
+            - write (bool): Write the XML deck first; False runs the deck already written by write_openmc_XML().
+            - poll_statepoints (bool): Let the monitor read statepoints for tally errors, see RunMonitor.
+            - cancel (threading.Event, None): Terminates OpenMC once set, see RunMonitor.run().
+        Returns:
+            - dict: Run summary written by the monitor into the output directory."""
+        if threads is None:
+            threads = self.settings.threads
+        if event_based is None:
+            event_based = self.settings.event_based
+        if write:
+            self.write_openmc_XML()
+        metadata: dict = {}
+        if hasattr(self.core, 'lattice_str'):
+            metadata['lattice_str'] = self.core.lattice_str
+        monitor = RunMonitor(self, poll_statepoints=poll_statepoints, metadata=metadata)
+        command_line = cmfd_command(threads=threads, event_based=event_based) if self.settings.cmfd else None
+        return monitor.run(threads=threads, event_based=event_based, echo=echo, command_line=command_line,
+                           cancel=cancel)